@@ -0,0 +1,103 @@
+"""
+Microbenchmark for duplicate detection in `Environment.add_objects`.
+
+Adds `n` objects to a single `tool_name`/`name` in batches of 100 (as a retrieval tool would),
+with 10% of each batch being repeats of earlier objects, and reports the time taken.
+For comparison, the previous linear scan over all stored objects is timed for the smaller sizes.
+
+Usage:
+    python benchmarks/environment_add_objects.py
+    python benchmarks/environment_add_objects.py --sizes 1000 10000 100000 --linear-max 10000
+"""
+
+import argparse
+import random
+import time
+
+from elysia.tree.objects import Environment
+
+
+def make_batches(n: int, batch_size: int = 100, repeat_fraction: float = 0.1):
+    rng = random.Random(0)
+    seen = []
+    batches = []
+    for start in range(0, n, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, n)):
+            if seen and rng.random() < repeat_fraction:
+                batch.append(dict(rng.choice(seen)))
+            else:
+                obj = {
+                    "uuid": f"object-{i}",
+                    "title": f"Title {i}",
+                    "content": f"Some retrieved text for object {i}. " * 5,
+                    "price": i * 0.5,
+                    "tags": ["a", "b", str(i % 7)],
+                }
+                seen.append(obj)
+                batch.append(dict(obj))
+        batches.append(batch)
+    return batches
+
+
+def add_objects_linear(environment: dict, tool_name: str, name: str, objects: list):
+    # duplicate detection as previously implemented, scanning every stored object
+    results = environment.setdefault(tool_name, {}).setdefault(name, [])
+    results.append({"metadata": {}, "objects": []})
+    for i, obj in enumerate(objects):
+        _REF_ID = None
+        for env_item in results:
+            if obj in env_item["objects"]:
+                _REF_ID = env_item["objects"][env_item["objects"].index(obj)]["_REF_ID"]
+                break
+        if _REF_ID is not None:
+            results[-1]["objects"].append(
+                {"object_info": "[repeat]", "_REF_ID": _REF_ID}
+            )
+        else:
+            _REF_ID = f"{tool_name}_{name}_{len(results)}_{i}"
+            results[-1]["objects"].append({"_REF_ID": _REF_ID, **obj})
+
+
+def bench_indexed(batches: list) -> float:
+    environment = Environment()
+    start = time.perf_counter()
+    for batch in batches:
+        environment.add_objects("query", "Collection", batch)
+    return time.perf_counter() - start
+
+
+def bench_linear(batches: list) -> float:
+    environment = {}
+    start = time.perf_counter()
+    for batch in batches:
+        add_objects_linear(environment, "query", "Collection", batch)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--linear-max",
+        type=int,
+        default=10000,
+        help="Largest size to also time the linear scan for (it is quadratic).",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'objects':>10} {'indexed (s)':>12} {'per object (us)':>16} {'linear (s)':>12}"
+    )
+    for n in args.sizes:
+        batches = make_batches(n)
+        indexed = bench_indexed(batches)
+        linear = bench_linear(batches) if n <= args.linear_max else None
+        print(
+            f"{n:>10} {indexed:>12.3f} {indexed / n * 1e6:>16.1f} "
+            f"{(f'{linear:.3f}' if linear is not None else '-'):>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
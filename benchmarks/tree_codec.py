@@ -0,0 +1,103 @@
+"""
+Benchmark of the codecs for saved trees (see `elysia.tree.codec`).
+
+Builds saved conversations of increasing length, where each turn retrieves `objects-per-turn` objects
+(which are stored in both the environment and the frontend payloads, as in a real saved tree),
+and reports the encoded size and the encode/decode time of each codec.
+The binary codec uses msgpack and zstd if installed (`pip install elysia-ai[binary]`), and otherwise JSON and zlib.
+
+Usage:
+    python benchmarks/tree_codec.py
+    python benchmarks/tree_codec.py --turns 1 10 50 --objects-per-turn 100
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from elysia.objects import Retrieval
+from elysia.tree.codec import decode_tree_data, encode_tree_data
+from elysia.tree.tree import Tree
+
+CODECS = ["json", "binary"]
+
+
+def make_objects(rng: random.Random, turn: int, n: int) -> list[dict]:
+    words = ["waterproof", "jacket", "trail", "lightweight", "cotton", "summer"]
+    return [
+        {
+            "uuid": f"{turn:04d}-{i:04d}-{rng.getrandbits(64):016x}",
+            "product_name": f"{rng.choice(words).title()} {rng.choice(words)} {i}",
+            "description": " ".join(rng.choice(words) for _ in range(40)),
+            "price": round(rng.uniform(5, 500), 2),
+            "category": rng.choice(["Outdoor", "Clothing", "Footwear"]),
+            "in_stock": rng.random() < 0.8,
+            "tags": rng.sample(words, 3),
+        }
+        for i in range(n)
+    ]
+
+
+def make_conversation(turns: int, objects_per_turn: int) -> dict:
+    rng = random.Random(0)
+    tree = Tree(conversation_id="benchmark_conversation", user_id="benchmark_user")
+
+    for turn in range(turns):
+        query_id = f"query-{turn}"
+        prompt = f"Find me some waterproof jackets under ${turn + 50}"
+        tree.tree_data.conversation_history.append({"role": "user", "content": prompt})
+        tree.returner.add_prompt(prompt, query_id)
+
+        objects = make_objects(rng, turn, objects_per_turn)
+        metadata = {"collection_name": "Products", "query_type": "hybrid"}
+        tree.tree_data.environment.add_objects("query", "Products", objects, metadata)
+        asyncio.run(tree.returner(Retrieval(objects, metadata), query_id))
+
+        tree.tree_data.conversation_history.append(
+            {"role": "assistant", "content": f"I found {objects_per_turn} jackets."}
+        )
+
+    return json.loads(json.dumps(tree.export_to_json()))
+
+
+def bench(tree_json: dict, codec: str, repeats: int) -> tuple[int, float, float]:
+    encode_time = decode_time = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data = encode_tree_data(tree_json, codec)  # type: ignore
+        encode_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        decode_tree_data(data)
+        decode_time += time.perf_counter() - start
+
+    return len(data), encode_time / repeats, decode_time / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--objects-per-turn", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'turns':>6} {'codec':>8} {'size (KB)':>10} {'ratio':>7} "
+        f"{'encode (ms)':>12} {'decode (ms)':>12}"
+    )
+    for turns in args.turns:
+        tree_json = make_conversation(turns, args.objects_per_turn)
+        json_size = None
+        for codec in CODECS:
+            size, encode_time, decode_time = bench(tree_json, codec, args.repeats)
+            json_size = json_size or size
+            print(
+                f"{turns:>6} {codec:>8} {size / 1024:>10.1f} {json_size / size:>7.1f} "
+                f"{encode_time * 1000:>12.1f} {decode_time * 1000:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
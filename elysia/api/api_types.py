@@ -66,6 +66,13 @@ class ProcessCollectionData(BaseModel):
     collection_name: str
 
 
+class PreprocessingJobData(BaseModel):
+    collection_names: list[str]
+    force: bool = True
+    incremental: bool = False
+    sample_group_by: Optional[str] = None
+
+
 class DebugData(BaseModel):
     conversation_id: str
     user_id: str
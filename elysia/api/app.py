@@ -9,12 +9,16 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from elysia.api.core.log import logger, set_log_level
-from elysia.api.dependencies.common import get_user_manager
+from elysia.api.dependencies.common import (
+    close_preprocessing_job_manager,
+    get_user_manager,
+)
 from elysia.api.middleware.error_handlers import register_error_handlers
 from elysia.api.routes import (
     collections,
     feedback,
     init,
+    preprocessing,
     processor,
     query,
     user_config,
@@ -61,6 +65,8 @@ async def lifespan(app: FastAPI):
     yield
     scheduler.shutdown()
 
+    # running preprocessing jobs are resumed after a restart
+    await close_preprocessing_job_manager()
     await user_manager.close_all_clients()
 
 
@@ -84,6 +90,9 @@ app.include_router(init.router, prefix="/init", tags=["init"])
 app.include_router(query.router, prefix="/ws", tags=["websockets"])
 app.include_router(processor.router, prefix="/ws", tags=["websockets"])
 app.include_router(collections.router, prefix="/collections", tags=["collections"])
+app.include_router(
+    preprocessing.router, prefix="/preprocessing", tags=["preprocessing"]
+)
 app.include_router(user_config.router, prefix="/user/config", tags=["user config"])
 app.include_router(tree_config.router, prefix="/tree/config", tags=["tree config"])
 app.include_router(feedback.router, prefix="/feedback", tags=["feedback"])
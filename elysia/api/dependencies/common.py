@@ -1,9 +1,29 @@
+from elysia.api.services.preprocessing import PreprocessingJobManager
 from elysia.api.services.user import UserManager
 
 # Create the singleton instance at module level
 user_manager = UserManager()
 
+# Created on first use, as it opens the preprocessing jobs database
+preprocessing_job_manager: PreprocessingJobManager | None = None
+
 
 def get_user_manager() -> UserManager:
     """Get the singleton UserManager instance."""
     return user_manager
+
+
+def get_preprocessing_job_manager() -> PreprocessingJobManager:
+    """Get the singleton PreprocessingJobManager instance."""
+    global preprocessing_job_manager
+    if preprocessing_job_manager is None:
+        preprocessing_job_manager = PreprocessingJobManager()
+    return preprocessing_job_manager
+
+
+async def close_preprocessing_job_manager() -> None:
+    """Stop the running preprocessing jobs (to be resumed later), if the PreprocessingJobManager has been created."""
+    global preprocessing_job_manager
+    if preprocessing_job_manager is not None:
+        await preprocessing_job_manager.close()
+        preprocessing_job_manager = None
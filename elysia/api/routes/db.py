@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.responses import JSONResponse
 
 from elysia.api.dependencies.common import get_user_manager
 from elysia.api.services.user import UserManager
+from elysia.tree.util import decode_saved_trees_page_token
 
 # Logging
 from elysia.api.core.log import logger
@@ -47,6 +48,59 @@ async def get_saved_trees(
         )
 
 
+@router.get("/{user_id}/saved_trees/page")
+async def get_saved_trees_page(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=1000),
+    page_token: str | None = None,
+    user_manager: UserManager = Depends(get_user_manager),
+):
+
+    headers = {"Cache-Control": "no-cache"}
+
+    if page_token is not None:
+        try:
+            decode_saved_trees_page_token(page_token)
+        except ValueError as e:
+            return JSONResponse(
+                content={"trees": [], "next_page_token": None, "error": str(e)},
+                status_code=400,
+                headers=headers,
+            )
+
+    user = await user_manager.get_user_local(user_id)
+    save_location_client_manager = user["frontend_config"].save_location_client_manager
+    if not save_location_client_manager.is_client:
+        logger.warning(
+            "In /saved_trees/page API, "
+            "no valid destination for trees location found. "
+            "Returning no error but an empty list of trees."
+        )
+        return JSONResponse(
+            content={"trees": [], "next_page_token": None, "error": ""},
+            status_code=200,
+            headers=headers,
+        )
+
+    try:
+        trees, next_page_token = await user_manager.get_saved_trees_page(
+            user_id, limit, page_token
+        )
+        return JSONResponse(
+            content={"trees": trees, "next_page_token": next_page_token, "error": ""},
+            status_code=200,
+            headers=headers,
+        )
+
+    except Exception as e:
+        logger.error(f"Error getting saved trees page: {str(e)}")
+        return JSONResponse(
+            content={"trees": [], "next_page_token": None, "error": str(e)},
+            status_code=500,
+            headers=headers,
+        )
+
+
 @router.get("/{user_id}/load_tree/{conversation_id}")
 async def load_tree(
     user_id: str,
@@ -0,0 +1,193 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+# API Types
+from elysia.api.api_types import PreprocessingJobData
+
+# Logging
+from elysia.api.core.log import logger
+
+# Services
+from elysia.api.dependencies.common import (
+    get_preprocessing_job_manager,
+    get_user_manager,
+)
+from elysia.api.services.preprocessing import PreprocessingJobManager
+from elysia.api.services.user import UserManager
+
+router = APIRouter()
+
+
+async def resume_user_jobs(
+    user_id: str,
+    user_manager: UserManager,
+    job_manager: PreprocessingJobManager,
+) -> list[str]:
+    # jobs interrupted by a restart need the user's settings and clients to resume
+    user = await user_manager.get_user_local(user_id)
+    return await job_manager.resume_jobs(
+        user_id, user["tree_manager"].settings, user["client_manager"]
+    )
+
+
+@router.post("/{user_id}/jobs")
+async def create_job(
+    user_id: str,
+    data: PreprocessingJobData,
+    user_manager: UserManager = Depends(get_user_manager),
+    job_manager: PreprocessingJobManager = Depends(get_preprocessing_job_manager),
+) -> JSONResponse:
+    """
+    Start a job to preprocess a batch of collections in the background.
+    Progress can be followed via the `/ws/preprocessing_job` websocket, or by polling `/preprocessing/{user_id}/jobs/{job_id}`.
+
+    Args:
+        user_id (str): The ID of the user.
+        data (PreprocessingJobData): The data for the request, containing:
+            - collection_names (list[str]): The collections to preprocess.
+            - force (bool): Whether to preprocess collections that have already been preprocessed. Defaults to True.
+            - incremental (bool): Whether to only recompute what has changed for collections that have already been preprocessed.
+                Defaults to False.
+            - sample_group_by (str | None): A property to stratify the sample of objects of each collection by. Defaults to None.
+        user_manager (UserManager): The user manager.
+        job_manager (PreprocessingJobManager): The preprocessing job manager.
+
+    Returns:
+        (JSONResponse): A JSON response containing:
+            - job_id (str): The ID of the job.
+            - error (str): An error message if there is an error, otherwise an empty string.
+    """
+    logger.debug(f"/preprocessing/jobs API request received")
+    logger.debug(f"User ID: {user_id}")
+    logger.debug(f"Collection names: {data.collection_names}")
+
+    try:
+        await resume_user_jobs(user_id, user_manager, job_manager)
+        user = await user_manager.get_user_local(user_id)
+        job_id = await job_manager.submit(
+            user_id,
+            data.collection_names,
+            user["tree_manager"].settings,
+            user["client_manager"],
+            force=data.force,
+            incremental=data.incremental,
+            sample_group_by=data.sample_group_by,
+        )
+    except Exception as e:
+        logger.exception(f"Error in /preprocessing/jobs API")
+        return JSONResponse(content={"job_id": "", "error": str(e)}, status_code=500)
+
+    return JSONResponse(content={"job_id": job_id, "error": ""}, status_code=200)
+
+
+@router.post("/{user_id}/jobs/resume")
+async def resume_jobs(
+    user_id: str,
+    user_manager: UserManager = Depends(get_user_manager),
+    job_manager: PreprocessingJobManager = Depends(get_preprocessing_job_manager),
+) -> JSONResponse:
+    """
+    Resume any unfinished preprocessing jobs of a user that are not running, e.g. jobs interrupted by a restart.
+    Jobs are also resumed when the user starts a new job, or follows a job via the `/ws/preprocessing_job` websocket.
+
+    Args:
+        user_id (str): The ID of the user.
+        user_manager (UserManager): The user manager.
+        job_manager (PreprocessingJobManager): The preprocessing job manager.
+
+    Returns:
+        (JSONResponse): A JSON response containing:
+            - job_ids (list[str]): The IDs of the resumed jobs.
+            - error (str): An error message if there is an error, otherwise an empty string.
+    """
+    logger.debug(f"/preprocessing/jobs/resume API request received")
+    logger.debug(f"User ID: {user_id}")
+
+    try:
+        job_ids = await resume_user_jobs(user_id, user_manager, job_manager)
+    except Exception as e:
+        logger.exception(f"Error in /preprocessing/jobs/resume API")
+        return JSONResponse(content={"job_ids": [], "error": str(e)}, status_code=500)
+
+    return JSONResponse(content={"job_ids": job_ids, "error": ""}, status_code=200)
+
+
+@router.get("/{user_id}/jobs")
+async def get_jobs(
+    user_id: str,
+    user_manager: UserManager = Depends(get_user_manager),
+    job_manager: PreprocessingJobManager = Depends(get_preprocessing_job_manager),
+) -> JSONResponse:
+    """
+    Get the status of all preprocessing jobs of a user, oldest first.
+    Jobs interrupted by a restart are not resumed by this (see `/preprocessing/{user_id}/jobs/resume`).
+
+    Args:
+        user_id (str): The ID of the user.
+        user_manager (UserManager): The user manager.
+        job_manager (PreprocessingJobManager): The preprocessing job manager.
+
+    Returns:
+        (JSONResponse): A JSON response containing:
+            - jobs (list[dict]): The status of each job (see `get_job`).
+            - error (str): An error message if there is an error, otherwise an empty string.
+    """
+    headers = {"Cache-Control": "no-cache"}
+
+    try:
+        jobs = job_manager.get_jobs(user_id)
+    except Exception as e:
+        logger.exception(f"Error in /preprocessing/jobs API")
+        return JSONResponse(
+            content={"jobs": [], "error": str(e)}, status_code=500, headers=headers
+        )
+
+    return JSONResponse(
+        content={"jobs": jobs, "error": ""}, status_code=200, headers=headers
+    )
+
+
+@router.get("/{user_id}/jobs/{job_id}")
+async def get_job(
+    user_id: str,
+    job_id: str,
+    user_manager: UserManager = Depends(get_user_manager),
+    job_manager: PreprocessingJobManager = Depends(get_preprocessing_job_manager),
+) -> JSONResponse:
+    """
+    Get the status of a preprocessing job.
+    Jobs interrupted by a restart are not resumed by this (see `/preprocessing/{user_id}/jobs/resume`).
+
+    Args:
+        user_id (str): The ID of the user.
+        job_id (str): The ID of the job.
+        user_manager (UserManager): The user manager.
+        job_manager (PreprocessingJobManager): The preprocessing job manager.
+
+    Returns:
+        (JSONResponse): A JSON response containing:
+            - job (dict): The status of the job, with keys
+                - job_id (str), user_id (str), options (dict), created (float), updated (float)
+                - status (str): "queued", "running", "completed" or "failed"
+                - collections (list[dict]): For each collection, its collection_name, status, progress (0 to 1), latest message and error.
+            - error (str): An error message if there is an error, otherwise an empty string.
+    """
+    headers = {"Cache-Control": "no-cache"}
+
+    try:
+        job = job_manager.get_job(job_id)
+        if job is None or job["user_id"] != user_id:
+            return JSONResponse(
+                content={"job": {}, "error": f"Job {job_id} not found"},
+                status_code=404,
+                headers=headers,
+            )
+    except Exception as e:
+        logger.exception(f"Error in /preprocessing/jobs/{job_id} API")
+        return JSONResponse(
+            content={"job": {}, "error": str(e)}, status_code=500, headers=headers
+        )
+
+    return JSONResponse(
+        content={"job": job, "error": ""}, status_code=200, headers=headers
+    )
@@ -10,7 +10,11 @@ import time
 from elysia.api.core.log import logger
 
 # User manager
-from elysia.api.dependencies.common import get_user_manager
+from elysia.api.dependencies.common import (
+    get_preprocessing_job_manager,
+    get_user_manager,
+)
+from elysia.api.services.preprocessing import PreprocessingJobManager
 from elysia.api.services.user import UserManager
 
 # Websocket
@@ -37,6 +41,7 @@ async def process_collection(
         client_manager=user["client_manager"],
         force=True,
         settings=settings,
+        incremental=data.get("incremental", False),
     ):
         try:
             logger.debug(
@@ -57,3 +62,46 @@ async def process_collection_websocket(
     await help_websocket(
         websocket, lambda data, ws: process_collection(data, ws, user_manager)
     )
+
+
+async def follow_preprocessing_job(
+    data: dict,
+    websocket: WebSocket,
+    user_manager: UserManager,
+    job_manager: PreprocessingJobManager,
+):
+    logger.debug(f"/preprocessing_job API request received")
+    logger.debug(f"User ID: {data['user_id']}")
+    logger.debug(f"Job ID: {data['job_id']}")
+
+    # jobs interrupted by a restart need the user's settings and clients to resume
+    user = await user_manager.get_user_local(data["user_id"])
+    await job_manager.resume_jobs(
+        data["user_id"], user["tree_manager"].settings, user["client_manager"]
+    )
+
+    job = job_manager.get_job(data["job_id"])
+    if job is None or job["user_id"] != data["user_id"]:
+        raise Exception(f"Job {data['job_id']} not found")
+
+    # the job keeps running if the websocket disconnects, and can be followed again
+    async for update in job_manager.subscribe(data["job_id"]):
+        try:
+            await websocket.send_json(update)
+        except WebSocketDisconnect:
+            logger.info("Client disconnected during preprocessing_job")
+            break
+        await asyncio.sleep(0.001)
+    logger.debug(f"(preprocessing_job) FINISHED!")
+
+
+@router.websocket("/preprocessing_job")
+async def preprocessing_job_websocket(
+    websocket: WebSocket,
+    user_manager: UserManager = Depends(get_user_manager),
+    job_manager: PreprocessingJobManager = Depends(get_preprocessing_job_manager),
+):
+    await help_websocket(
+        websocket,
+        lambda data, ws: follow_preprocessing_job(data, ws, user_manager, job_manager),
+    )
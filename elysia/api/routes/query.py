@@ -1,5 +1,6 @@
 import asyncio
 import uuid
+from contextlib import aclosing
 
 from fastapi import APIRouter, Depends, WebSocket
 from starlette.websockets import WebSocketDisconnect
@@ -8,7 +9,11 @@ from elysia.tree.tree import Tree
 from elysia.api.core.log import logger
 from elysia.api.dependencies.common import get_user_manager
 from elysia.api.services.user import UserManager
-from elysia.api.utils.websocket import help_websocket
+from elysia.api.utils.websocket import (
+    help_websocket,
+    is_disconnected_error,
+    run_until_disconnect,
+)
 from elysia.api.utils.ner import named_entity_recognition
 from elysia.util.collection import retrieve_all_collection_names
 from elysia.api.utils.default_payloads import error_payload
@@ -89,57 +94,72 @@ async def process(data: dict, websocket: WebSocket, user_manager: UserManager):
             )
         )
 
-        async for yielded_result in user_manager.process_tree(
-            user_id=data["user_id"],
-            conversation_id=data["conversation_id"],
-            query=data["query"],
-            query_id=data["query_id"],
-            training_route=route,
-            collection_names=data["collection_names"],
-        ):
-            if asyncio.iscoroutine(yielded_result):
-                yielded_result = await yielded_result
-            try:
-                if (
-                    yielded_result is not None
-                    and "type" in yielded_result
-                    and yielded_result["type"] != "training_update"
-                    and yielded_result["type"] != "timer"
-                    and yielded_result["type"] != "completed"
-                ):
-                    await websocket.send_json(yielded_result)
-
-                # before the completed, send title of conversation
-                elif (
-                    yielded_result is not None
-                    and "type" in yielded_result
-                    and yielded_result["type"] == "completed"
-                ):
-                    tree: Tree = await user_manager.get_tree(
-                        user_id=data["user_id"],
-                        conversation_id=data["conversation_id"],
-                    )
-
-                    # only send if it's the first prompt
-                    if tree.tree_index == 0:
-                        await websocket.send_json(
-                            await format_title_response(
-                                tree=tree,
+        async def send_results():
+            # closing the results stops the query, e.g. when the client disconnects
+            async with aclosing(
+                user_manager.process_tree(
+                    user_id=data["user_id"],
+                    conversation_id=data["conversation_id"],
+                    query=data["query"],
+                    query_id=data["query_id"],
+                    training_route=route,
+                    collection_names=data["collection_names"],
+                )
+            ) as results:
+                async for yielded_result in results:
+                    if asyncio.iscoroutine(yielded_result):
+                        yielded_result = await yielded_result
+                    try:
+                        if (
+                            yielded_result is not None
+                            and "type" in yielded_result
+                            and yielded_result["type"] != "training_update"
+                            and yielded_result["type"] != "timer"
+                            and yielded_result["type"] != "completed"
+                        ):
+                            await websocket.send_json(yielded_result)
+
+                        # before the completed, send title of conversation
+                        elif (
+                            yielded_result is not None
+                            and "type" in yielded_result
+                            and yielded_result["type"] == "completed"
+                        ):
+                            tree: Tree = await user_manager.get_tree(
                                 user_id=data["user_id"],
                                 conversation_id=data["conversation_id"],
-                                query_id=data["query_id"],
                             )
-                        )
-
-                    # send the completed payload
-                    await websocket.send_json(yielded_result)
 
-            except WebSocketDisconnect:
-                logger.info("Client disconnected during processing")
-                break
-            # Add a small delay between messages to prevent overwhelming
-            await asyncio.sleep(0.005)
-            # logger.debug(f"Sent message to client: {yielded_result}")
+                            # only send if it's the first prompt
+                            if tree.tree_index == 0:
+                                await websocket.send_json(
+                                    await format_title_response(
+                                        tree=tree,
+                                        user_id=data["user_id"],
+                                        conversation_id=data["conversation_id"],
+                                        query_id=data["query_id"],
+                                    )
+                                )
+
+                            # send the completed payload
+                            await websocket.send_json(yielded_result)
+
+                    except (WebSocketDisconnect, RuntimeError) as e:
+                        if not is_disconnected_error(e):
+                            raise
+                        logger.info(
+                            f"Client disconnected during processing, cancelling query {data['query_id']}"
+                        )
+                        break
+                    # Add a small delay between messages to prevent overwhelming
+                    await asyncio.sleep(0.005)
+                    # logger.debug(f"Sent message to client: {yielded_result}")
+
+        # the query is also cancelled if the client disconnects while it is waiting (e.g. in the queue, or for the LLM)
+        if not await run_until_disconnect(websocket, send_results()):
+            logger.info(
+                f"Client disconnected during processing, cancelling query {data['query_id']}"
+            )
 
     except Exception as e:
         logger.exception(f"Error in /query API")
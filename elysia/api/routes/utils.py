@@ -191,6 +191,24 @@ async def follow_up_suggestions(
         )
 
 
+@router.get("/queue_metrics")
+async def queue_metrics(user_manager: UserManager = Depends(get_user_manager)):
+    """
+    The number of running and waiting queries, how long queries waited to run and the LM calls in flight,
+    for this process and for each conversation.
+    """
+    logger.debug(f"/queue_metrics API request received")
+
+    try:
+        return JSONResponse(
+            content={"metrics": user_manager.get_queue_metrics(), "error": ""},
+            status_code=200,
+        )
+    except Exception as e:
+        logger.exception(f"Error in /queue_metrics API")
+        return JSONResponse(content={"metrics": {}, "error": str(e)}, status_code=500)
+
+
 @router.post("/debug")
 async def debug(data: DebugData, user_manager: UserManager = Depends(get_user_manager)):
     logger.debug(f"/debug API request received")
@@ -0,0 +1,370 @@
+import asyncio
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncGenerator
+
+from elysia.api.core.log import logger
+from elysia.api.utils.jobs import PreprocessingJobStore
+from elysia.api.utils.queues import WorkQueue
+from elysia.config import Settings
+from elysia.preprocessing.collection import preprocess_async
+from elysia.util.client import ClientManager
+
+FINISHED_STATUSES = ["completed", "failed"]
+
+
+class PreprocessingJobManager:
+    """
+    Runs preprocessing jobs (batches of collections to preprocess) in the background, independently of any request or websocket.
+
+    Collections from all jobs share a queue, so that at most `max_running` collections are preprocessed at once.
+    The state of each job, and a checkpoint of the completed stages of each collection, is kept in a SQLite file (see `PreprocessingJobStore`),
+    written to from a thread so that the event loop is not blocked, with checkpoints only written when they change.
+    Jobs interrupted by a restart are resumed (from the last completed stage of each collection) by `resume_jobs`,
+    which needs the settings and client manager of the user, so is called when the user next starts or follows a job (or asks to resume them).
+    Each manager (worker) holds a lease on the jobs it runs, renewed while they run, so that with several workers sharing the file
+    a job is only resumed by another worker once the lease is released or has expired.
+
+    Progress updates of a running job can be followed with `subscribe`.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_running: int | None = None,
+        lease: float | None = None,
+    ):
+        """
+        Args:
+            path (str | None): Optional. The path to the SQLite file the jobs are kept in.
+                Defaults to the value of the `PREPROCESSING_JOBS_PATH` environment variable,
+                or `preprocessing_jobs.db` in the `elysia/api/user_configs` directory if not set.
+            max_running (int | None): Optional. The maximum number of collections preprocessed at once, across all jobs.
+                Defaults to the value of the `PREPROCESSING_MAX_CONCURRENT_COLLECTIONS` environment variable, or 4 if not set.
+            lease (float | None): Optional. How long (in seconds) a job stays claimed by this manager without being renewed,
+                i.e. how long before a job of a worker that has stopped can be resumed by another.
+                Defaults to the value of the `PREPROCESSING_JOB_LEASE` environment variable, or 60 if not set.
+        """
+        if path is None:
+            path = os.environ.get(
+                "PREPROCESSING_JOBS_PATH",
+                str(
+                    Path(__file__).parent.parent
+                    / "user_configs"
+                    / "preprocessing_jobs.db"
+                ),
+            )
+        if max_running is None:
+            max_running = int(
+                os.environ.get("PREPROCESSING_MAX_CONCURRENT_COLLECTIONS", 4)
+            )
+        if lease is None:
+            lease = float(os.environ.get("PREPROCESSING_JOB_LEASE", 60))
+
+        self.owner = str(uuid.uuid4())
+        self.lease = lease
+        self.store = PreprocessingJobStore(path)
+        self.queue = WorkQueue(max_running=max_running)
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    async def submit(
+        self,
+        user_id: str,
+        collection_names: list[str],
+        settings: Settings,
+        client_manager: ClientManager,
+        force: bool = True,
+        incremental: bool = False,
+        sample_group_by: str | None = None,
+    ) -> str:
+        """
+        Add a job to preprocess a batch of collections, and start running it in the background.
+
+        Args:
+            user_id (str): The ID of the user the job belongs to.
+            collection_names (list[str]): The collections to preprocess.
+            settings (Settings): The settings to preprocess with (not saved with the job).
+            client_manager (ClientManager): The client manager to preprocess with (not saved with the job).
+            force (bool): Whether to preprocess collections that have already been preprocessed. Optional, defaults to True.
+            incremental (bool): Whether to only recompute what has changed for collections that have already been preprocessed.
+                Optional, defaults to False.
+            sample_group_by (str | None): A property to stratify the sample of objects of each collection by. Optional, defaults to None.
+
+        Returns:
+            (str): The ID of the job.
+        """
+        job_id = str(uuid.uuid4())
+        await asyncio.to_thread(
+            self.store.create_job,
+            job_id,
+            user_id,
+            list(dict.fromkeys(collection_names)),
+            {
+                "force": force,
+                "incremental": incremental,
+                "sample_group_by": sample_group_by,
+            },
+            owner=self.owner,
+            lease=self.lease,
+        )
+        self._start(job_id, settings, client_manager)
+        return job_id
+
+    async def resume_jobs(
+        self, user_id: str, settings: Settings, client_manager: ClientManager
+    ) -> list[str]:
+        """
+        Start running any unfinished jobs of a user that are not running, e.g. jobs interrupted by a restart.
+        Jobs whose lease is held by another worker are left to that worker.
+
+        Returns:
+            (list[str]): The IDs of the resumed jobs.
+        """
+        resumed = []
+        job_ids = await asyncio.to_thread(
+            self.store.get_job_ids, user_id, ["queued", "running"]
+        )
+        for job_id in job_ids:
+            if job_id not in self.tasks and await asyncio.to_thread(
+                self.store.claim_job, job_id, self.owner, self.lease
+            ):
+                logger.info(f"Resuming preprocessing job {job_id}")
+                self._start(job_id, settings, client_manager)
+                resumed.append(job_id)
+        return resumed
+
+    def get_job(self, job_id: str) -> dict | None:
+        return self.store.get_job(job_id)
+
+    def get_jobs(self, user_id: str) -> list[dict]:
+        return [
+            self.store.get_job(job_id)  # type: ignore
+            for job_id in self.store.get_job_ids(user_id)
+        ]
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self.tasks
+
+    async def subscribe(self, job_id: str) -> AsyncGenerator[dict, None]:
+        """
+        Follow the progress of a job.
+        First yields the current status of the job (type `"job_status"`),
+        then each progress update of its collections as they happen (the payloads of `preprocess_async` with the `job_id` added),
+        until the job finishes (type `"job_completed"`).
+        If the job is not running, only its current status is yielded.
+        """
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await asyncio.to_thread(self.store.get_job, job_id)
+            if job is None:
+                return
+            yield {"type": "job_status", **job}
+
+            if job["status"] in FINISHED_STATUSES or not self.is_running(job_id):
+                return
+
+            while True:
+                update = await queue.get()
+                yield update
+                if update["type"] == "job_completed":
+                    return
+        finally:
+            self.subscribers[job_id].discard(queue)
+            if len(self.subscribers[job_id]) == 0:
+                del self.subscribers[job_id]
+
+    async def close(self) -> None:
+        """
+        Stop all running jobs. They are left unfinished (and their leases released), to be resumed by `resume_jobs`.
+        """
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.store.close()
+
+    def _start(
+        self, job_id: str, settings: Settings, client_manager: ClientManager
+    ) -> None:
+        task = asyncio.create_task(self._run_job(job_id, settings, client_manager))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(
+                self.store.claim_job, job_id, self.owner, self.lease
+            ):
+                # another worker has taken over the job
+                logger.warning(
+                    f"Lost the lease of preprocessing job {job_id}, stopping it"
+                )
+                self.tasks[job_id].cancel()
+                return
+
+    def _publish(self, job_id: str, update: dict) -> None:
+        for queue in self.subscribers.get(job_id, set()):
+            queue.put_nowait(update)
+
+    async def _run_job(
+        self, job_id: str, settings: Settings, client_manager: ClientManager
+    ) -> None:
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is None:
+            return
+
+        renew_lease = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            await asyncio.to_thread(self.store.set_job_status, job_id, "running")
+            await asyncio.gather(
+                *[
+                    self._run_collection(
+                        job_id,
+                        collection["collection_name"],
+                        job["options"],
+                        settings,
+                        client_manager,
+                    )
+                    for collection in job["collections"]
+                    if collection["status"] != "completed"
+                ]
+            )
+
+            job = await asyncio.to_thread(self.store.get_job, job_id)
+            status = (
+                "completed"
+                if all(c["status"] == "completed" for c in job["collections"])  # type: ignore
+                else "failed"
+            )
+            await asyncio.to_thread(self.store.set_job_status, job_id, status)
+        finally:
+            renew_lease.cancel()
+            await asyncio.to_thread(self.store.release_job, job_id, self.owner)
+
+        self._publish(
+            job_id, {"type": "job_completed", "job_id": job_id, "status": status}
+        )
+
+    async def _update_collection(
+        self,
+        job_id: str,
+        collection_name: str,
+        status: str,
+        progress: float,
+        checkpoint: dict | None,
+        saved_checkpoint: str | None,
+        **kwargs,
+    ) -> str | None:
+        """
+        Update the status of a collection in the store (off the event loop), only writing the checkpoint if it has changed
+        since `saved_checkpoint` (the JSON of the last checkpoint written).
+
+        Returns:
+            (str | None): The JSON of the checkpoint now stored.
+        """
+        dumped = json.dumps(checkpoint) if checkpoint is not None else None
+        await asyncio.to_thread(
+            self.store.update_collection,
+            job_id,
+            collection_name,
+            status,
+            progress,
+            checkpoint=checkpoint,
+            keep_checkpoint=dumped == saved_checkpoint,
+            **kwargs,
+        )
+        return dumped
+
+    async def _run_collection(
+        self,
+        job_id: str,
+        collection_name: str,
+        options: dict,
+        settings: Settings,
+        client_manager: ClientManager,
+    ) -> None:
+        checkpoint = (
+            await asyncio.to_thread(self.store.get_checkpoint, job_id, collection_name)
+            or {}
+        )
+        saved_checkpoint = json.dumps(checkpoint) if checkpoint else None
+        progress = 0.0
+
+        async with self.queue.slot():
+            try:
+                num_results = 0
+                async for result in preprocess_async(
+                    collection_name=collection_name,
+                    client_manager=client_manager,
+                    force=options["force"],
+                    settings=settings,
+                    sample_group_by=options["sample_group_by"],
+                    incremental=options["incremental"],
+                    checkpoint=checkpoint,
+                ):
+                    num_results += 1
+                    progress = result["progress"]
+                    if result["error"] != "":
+                        saved_checkpoint = await self._update_collection(
+                            job_id,
+                            collection_name,
+                            "failed",
+                            progress,
+                            checkpoint,
+                            saved_checkpoint,
+                            error=result["error"],
+                        )
+                    else:
+                        completed = result["type"] == "completed"
+                        saved_checkpoint = await self._update_collection(
+                            job_id,
+                            collection_name,
+                            "completed" if completed else "running",
+                            progress,
+                            checkpoint if not completed else None,
+                            saved_checkpoint,
+                            message=result["message"],
+                        )
+                    self._publish(job_id, {**result, "job_id": job_id})
+
+                # nothing is yielded if the collection has already been preprocessed (and force is False)
+                if num_results == 0:
+                    await self._update_collection(
+                        job_id,
+                        collection_name,
+                        "completed",
+                        1.0,
+                        None,
+                        saved_checkpoint,
+                        message="Preprocessed metadata already exists",
+                    )
+
+            except Exception as e:
+                logger.exception(
+                    f"Error in preprocessing job {job_id} for {collection_name}"
+                )
+                await self._update_collection(
+                    job_id,
+                    collection_name,
+                    "failed",
+                    progress,
+                    checkpoint,
+                    saved_checkpoint,
+                    error=str(e),
+                )
+                self._publish(
+                    job_id,
+                    {
+                        "type": "update",
+                        "collection_name": collection_name,
+                        "progress": progress,
+                        "message": "",
+                        "error": str(e),
+                        "job_id": job_id,
+                    },
+                )
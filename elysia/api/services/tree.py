@@ -1,6 +1,8 @@
 import asyncio
 import datetime
+import hashlib
 import os
+from contextlib import aclosing
 from typing import Any
 import uuid
 from dotenv import load_dotenv
@@ -10,9 +12,15 @@ from weaviate.util import generate_uuid5
 load_dotenv(override=True)
 
 from elysia.tree.tree import Tree
+from elysia.tree.codec import TreeCodec
 from elysia.util.client import ClientManager
-from elysia.tree.util import delete_tree_from_weaviate
+from elysia.tree.util import (
+    SavedTreeIndex,
+    delete_tree_from_weaviate,
+    get_saved_tree_update_time,
+)
 from elysia.api.utils.config import Config, BranchInitType
+from elysia.api.utils.queues import WorkQueue, get_run_queue
 from elysia.config import Settings
 
 
@@ -24,7 +32,8 @@ class TreeManager:
     You can initialise the TreeManager with particular config options.
     Or, upon adding a tree, you can set a specific style, description and end goal for that tree.
 
-    Each tree has separate elements: the tree itself, the last request time, and the asyncio event.
+    Each tree has separate elements: the tree itself, the last request time, the asyncio event (cleared while the tree is running),
+    and a queue of the queries waiting to run on the tree, which run one at a time in the order they were received.
     """
 
     def __init__(
@@ -32,6 +41,9 @@ class TreeManager:
         user_id: str,
         config: Config | None = None,
         tree_timeout: datetime.timedelta | int | None = None,
+        tree_codec: TreeCodec | None = None,
+        max_queue_depth: int | None = None,
+        saved_tree_index_ttl: int | None = None,
     ):
         """
         Args:
@@ -43,10 +55,22 @@ class TreeManager:
                 Defaults to the value of the `TREE_TIMEOUT` environment variable.
                 If an integer is passed, it will be interpreted as minutes.
                 If set to 0, trees will not be automatically removed.
+            tree_codec (TreeCodec | None): Optional. The codec trees are saved to Weaviate with, `"json"` or `"binary"`.
+                Defaults to the value of the `TREE_CODEC` environment variable, or `"json"` if not set.
+                Trees saved with either codec can always be loaded.
+            max_queue_depth (int | None): Optional. The maximum number of queries waiting to run on a single tree,
+                while another query is running on it. Further queries are rejected (see `process_tree`).
+                Defaults to the value of the `TREE_QUEUE_DEPTH` environment variable, or 4 if not set.
+            saved_tree_index_ttl (int | None): Optional. The number of seconds the index of the user's saved trees is kept,
+                before it is loaded from Weaviate again (to include trees saved or deleted elsewhere, e.g. by another process).
+                Defaults to the value of the `SAVED_TREE_INDEX_TTL` environment variable, or 300 if not set.
         """
         self.trees = {}
         self.user_id = user_id
 
+        # saved trees of the user, per Weaviate instance (and API key) they are saved in
+        self.saved_tree_indexes: dict[tuple[str, str], SavedTreeIndex] = {}
+
         if tree_timeout is None:
             self.tree_timeout = datetime.timedelta(
                 minutes=int(os.environ.get("TREE_TIMEOUT", 10))
@@ -56,6 +80,21 @@ class TreeManager:
         else:
             self.tree_timeout = tree_timeout
 
+        if tree_codec is None:
+            self.tree_codec = os.environ.get("TREE_CODEC", "json")
+        else:
+            self.tree_codec = tree_codec
+
+        if max_queue_depth is None:
+            self.max_queue_depth = int(os.environ.get("TREE_QUEUE_DEPTH", 4))
+        else:
+            self.max_queue_depth = max_queue_depth
+
+        if saved_tree_index_ttl is None:
+            self.saved_tree_index_ttl = int(os.environ.get("SAVED_TREE_INDEX_TTL", 300))
+        else:
+            self.saved_tree_index_ttl = saved_tree_index_ttl
+
         if config is None:
             self.config = Config()
         else:
@@ -127,6 +166,7 @@ class TreeManager:
                 ),
                 "last_request": datetime.datetime.now(),
                 "event": asyncio.Event(),
+                "queue": WorkQueue(max_running=1, max_waiting=self.max_queue_depth),
             }
             self.trees[conversation_id]["event"].set()
 
@@ -142,7 +182,19 @@ class TreeManager:
             client_manager (ClientManager): The client manager to use for the tree.
         """
         tree: Tree = self.get_tree(conversation_id)
-        await tree.export_to_weaviate("ELYSIA_TREES__", client_manager)
+        await tree.export_to_weaviate(
+            "ELYSIA_TREES__", client_manager, codec=self.tree_codec
+        )
+
+        index_key = self._saved_tree_index_key(client_manager)
+        if index_key in self.saved_tree_indexes:
+            # the update time recorded by Weaviate, so the trees in the index are ordered the same as in Weaviate
+            last_update_time = await get_saved_tree_update_time(
+                conversation_id, "ELYSIA_TREES__", client_manager
+            )
+            self.saved_tree_indexes[index_key].update(
+                conversation_id, tree.conversation_title, last_update_time
+            )
 
     async def check_tree_exists_weaviate(
         self, conversation_id: str, client_manager: ClientManager
@@ -192,6 +244,7 @@ class TreeManager:
                 "tree": None,
                 "event": asyncio.Event(),
                 "last_request": datetime.datetime.now(),
+                "queue": WorkQueue(max_running=1, max_waiting=self.max_queue_depth),
             }
         self.trees[conversation_id]["tree"] = tree
         self.trees[conversation_id]["event"].set()
@@ -211,6 +264,41 @@ class TreeManager:
         await delete_tree_from_weaviate(
             conversation_id, "ELYSIA_TREES__", client_manager
         )
+        index_key = self._saved_tree_index_key(client_manager)
+        if index_key in self.saved_tree_indexes:
+            self.saved_tree_indexes[index_key].remove(conversation_id)
+
+    def _saved_tree_index_key(self, client_manager: ClientManager) -> tuple[str, str]:
+        # the same instance can be accessed with API keys of different permissions
+        return (
+            client_manager.wcd_url,
+            hashlib.sha256(client_manager.wcd_api_key.encode()).hexdigest(),
+        )
+
+    async def get_saved_tree_index(
+        self, client_manager: ClientManager
+    ) -> SavedTreeIndex:
+        """
+        Get the index of the trees this user has saved in Weaviate (collection ELYSIA_TREES__).
+        The index is loaded from Weaviate the first time, and is then updated when trees are saved or deleted via this TreeManager.
+        It is loaded again once it is older than `saved_tree_index_ttl` seconds.
+
+        Args:
+            client_manager (ClientManager): The client manager pointing to the Weaviate instance containing the trees.
+
+        Returns:
+            (SavedTreeIndex): The index of the saved trees.
+        """
+        index_key = self._saved_tree_index_key(client_manager)
+        if index_key not in self.saved_tree_indexes:
+            self.saved_tree_indexes[index_key] = SavedTreeIndex(
+                ttl=self.saved_tree_index_ttl
+            )
+
+        index = self.saved_tree_indexes[index_key]
+        if index.is_stale():
+            await index.load("ELYSIA_TREES__", client_manager, self.user_id)
+        return index
 
     def delete_tree_local(self, conversation_id: str):
         """
@@ -402,6 +490,11 @@ class TreeManager:
         Process a tree in the TreeManager.
         This is an async generator which yields results from the tree.async_run() method.
 
+        Queries on the same tree run one at a time, in the order they were received.
+        At most `max_queue_depth` queries can wait for a tree, otherwise a `QueueFullError` is raised before waiting.
+        The number of trees running at once in this process is limited by the `MAX_CONCURRENT_TREE_RUNS` environment variable.
+        Closing the generator (e.g. when the client disconnects) stops the query and frees the tree for the next one.
+
         Args:
             query (str): Required. The user input/prompt to process in the decision tree.
             conversation_id (str): Required. The conversation ID which contains the tree.
@@ -421,27 +514,48 @@ class TreeManager:
         tree: Tree = self.get_tree(conversation_id)
         self.update_tree_last_request(conversation_id)
 
-        # wait for the tree to be idle
-        await self.trees[conversation_id]["event"].wait()
-
-        # clear the event, set it to working
-        self.trees[conversation_id]["event"].clear()
-
-        try:
-            async for yielded_result in tree.async_run(
-                query,
-                collection_names=collection_names,
-                client_manager=client_manager,
-                query_id=query_id,
-                training_route=training_route,
-                close_clients_after_completion=False,
-            ):
-                yield yielded_result
-                self.update_tree_last_request(conversation_id)
-
-        finally:
-            # set the event to idle
-            self.trees[conversation_id]["event"].set()
+        # wait for the earlier queries on this tree, then for a free slot in this process
+        async with self.trees[conversation_id]["queue"].slot() as tree_wait_seconds:
+            async with get_run_queue().slot() as run_wait_seconds:
+                self.settings.logger.debug(
+                    f"Query {query_id} waited {tree_wait_seconds + run_wait_seconds:.2f} seconds to run "
+                    f"({tree_wait_seconds:.2f} seconds for conversation {conversation_id})"
+                )
+
+                # clear the event, set it to working
+                self.trees[conversation_id]["event"].clear()
+
+                try:
+                    async with aclosing(
+                        tree.async_run(
+                            query,
+                            collection_names=collection_names,
+                            client_manager=client_manager,
+                            query_id=query_id,
+                            training_route=training_route,
+                            close_clients_after_completion=False,
+                        )
+                    ) as results:
+                        async for yielded_result in results:
+                            yield yielded_result
+                            self.update_tree_last_request(conversation_id)
+
+                finally:
+                    # set the event to idle
+                    self.trees[conversation_id]["event"].set()
+
+    def get_queue_metrics(self) -> dict:
+        """
+        Get the queue depth and wait times of the queries for each tree in the TreeManager.
+
+        Returns:
+            (dict): A dictionary whose keys are the conversation IDs and whose values are the metrics of the queue of that tree.
+                See `WorkQueue.metrics()`.
+        """
+        return {
+            conversation_id: tree["queue"].metrics()
+            for conversation_id, tree in self.trees.items()
+        }
 
     def check_tree_timeout(self, conversation_id: str):
         """
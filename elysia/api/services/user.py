@@ -3,6 +3,7 @@ import os
 import random
 import json
 
+from contextlib import aclosing
 from dotenv import load_dotenv
 from typing import Any
 from pathlib import Path
@@ -12,11 +13,12 @@ load_dotenv(override=True)
 
 from elysia.api.services.tree import TreeManager
 from elysia.objects import Update
-from elysia.util.client import ClientManager
+from elysia.util.client import ClientManager, get_async_client_pool
+from elysia.util.lm_pool import get_lm_pool_metrics
 from elysia.api.core.log import logger
 from elysia.api.utils.config import Config
 from elysia.api.utils.config import FrontendConfig
-from elysia.tree.util import get_saved_trees_weaviate
+from elysia.api.utils.queues import QueueFullError, get_run_queue
 
 
 class TreeTimeoutError(Update):
@@ -29,6 +31,16 @@ class TreeTimeoutError(Update):
         )
 
 
+class TreeQueueFullError(Update):
+    def __init__(self):
+        super().__init__(
+            "tree_queue_full_error",
+            {
+                "text": "Too many requests are waiting for this conversation. Please wait for the current requests to finish."
+            },
+        )
+
+
 class UserTimeoutError(Update):
     def __init__(self):
         super().__init__(
@@ -212,6 +224,28 @@ class UserManager:
         local_user = await self.get_user_local(user_id)
         return local_user["tree_manager"].get_tree(conversation_id)
 
+    def get_queue_metrics(self):
+        """
+        Get the number of running and waiting queries in this process, and for each conversation of each user.
+
+        Returns:
+            (dict): A dictionary with the metrics of all queries in this process (`"runs"`),
+                and of each conversation, keyed by user ID and conversation ID (`"users"`).
+                See `WorkQueue.metrics()`.
+                Also the number of pooled LMs and the LM calls in flight to each provider (`"lms"`),
+                and the number of pooled Weaviate clients (`"weaviate_clients"`, see `AsyncClientPool.metrics()`).
+        """
+        return {
+            "runs": get_run_queue().metrics(),
+            "lms": get_lm_pool_metrics(),
+            "weaviate_clients": get_async_client_pool().metrics(),
+            "users": {
+                user_id: user["tree_manager"].get_queue_metrics()
+                for user_id, user in self.users.items()
+                if "tree_manager" in user
+            },
+        }
+
     async def check_all_trees_timeout(self):
         """
         Check all trees in all TreeManagers across all users and remove any that have not been active in the last tree_timeout.
@@ -258,6 +292,7 @@ class UserManager:
         """
         Check all clients in all ClientManagers across all users and run the restart_client() method (for sync and async clients).
         The restart_client() methods will check if the client has been inactive for the last client_timeout minutes (set in init).
+        Clients that have not been created (e.g. the sync client, which is created on first use) are skipped.
         """
         for user_id in self.users:
             if (
@@ -500,9 +535,64 @@ class UserManager:
                 wcd_api_key=wcd_api_key,
             )
 
-        return await get_saved_trees_weaviate(
-            "ELYSIA_TREES__", save_location_client_manager, user_id
-        )
+        tree_manager: TreeManager = local_user["tree_manager"]
+        index = await tree_manager.get_saved_tree_index(save_location_client_manager)
+        return index.to_dict()
+
+    async def get_saved_trees_page(
+        self,
+        user_id: str,
+        limit: int = 50,
+        page_token: str | None = None,
+        wcd_url: str | None = None,
+        wcd_api_key: str | None = None,
+    ):
+        """
+        Get a page of the saved trees from a Weaviate instance (set in the frontend config), newest first.
+        Only the conversation IDs, titles and last update times are retrieved, and they are kept in memory after the first request.
+
+        Args:
+            user_id (str): Required. The unique identifier for the user stored in the UserManager.
+            limit (int): Optional. The maximum number of trees in the page. Defaults to 50.
+            page_token (str | None): Optional. The `next_page_token` returned with the previous page.
+                Defaults to None, for the first page.
+            wcd_url (str | None): Required. The URL of the Weaviate Cloud Database instance used to save the tree.
+                Defaults to the value of the `wcd_url` setting in the frontend config.
+            wcd_api_key (str | None): Required. The API key for the Weaviate Cloud Database instance used to save the tree.
+                Defaults to the value of the `wcd_api_key` setting in the frontend config.
+
+        Returns:
+            (tuple[list[dict], str | None]): The page of trees and the token for the next page (None if this is the last page).
+                E.g.
+                ```
+                (
+                    [
+                        {
+                            "conversation_id": "12345678-XXX-YYYY-ZZZZ",
+                            "title": "Query Request",
+                            "last_update_time": "2025-06-07T10:06:47.376000Z"
+                        }
+                    ],
+                    "eyJ0IjogIjIwMjUtMDYtMDdUMTA6MDY6NDcu..."
+                )
+                ```
+        """
+        local_user = await self.get_user_local(user_id)
+        tree_manager: TreeManager = local_user["tree_manager"]
+
+        if wcd_url is None or wcd_api_key is None:
+            save_location_client_manager = local_user[
+                "frontend_config"
+            ].save_location_client_manager
+        else:
+            save_location_client_manager = ClientManager(
+                logger=logger,
+                wcd_url=wcd_url,
+                wcd_api_key=wcd_api_key,
+            )
+
+        index = await tree_manager.get_saved_tree_index(save_location_client_manager)
+        return index.page(limit, page_token)
 
     async def update_user_last_request(self, user_id: str):
         self.users[user_id]["last_request"] = datetime.datetime.now()
@@ -530,7 +620,8 @@ class UserManager:
         Wrapper for the TreeManager.process_tree() method.
         Which itself is a wrapper for the Tree.async_run() method.
         This is an async generator which yields results from the tree.async_run() method.
-        Automatically sends error payloads if the user or tree has been timed out.
+        Automatically sends error payloads if the user or tree has been timed out,
+        or if too many queries are already waiting for the tree (see `TreeManager.process_tree`).
 
         Args:
             query (str): Required. The user input/prompt to process in the decision tree.
@@ -575,16 +666,27 @@ class UserManager:
 
         tree_manager: TreeManager = local_user["tree_manager"]
 
-        async for yielded_result in tree_manager.process_tree(
-            query,
-            conversation_id,
-            query_id,
-            training_route,
-            collection_names,
-            local_user["client_manager"],
-        ):
-            yield yielded_result
-            await self.update_user_last_request(user_id)
+        try:
+            async with aclosing(
+                tree_manager.process_tree(
+                    query,
+                    conversation_id,
+                    query_id,
+                    training_route,
+                    collection_names,
+                    local_user["client_manager"],
+                )
+            ) as results:
+                async for yielded_result in results:
+                    yield yielded_result
+                    await self.update_user_last_request(user_id)
+        except QueueFullError:
+            logger.warning(
+                f"Rejected query {query_id}, the queue for conversation {conversation_id} is full"
+            )
+            queue_full_error = TreeQueueFullError()
+            yield await queue_full_error.to_frontend(user_id, conversation_id, query_id)
+            return
 
         if save_trees_to_weaviate is None:
             frontend_config: FrontendConfig = local_user["frontend_config"]
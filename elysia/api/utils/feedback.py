@@ -6,9 +6,11 @@ from weaviate.collections.classes.aggregate import (
 )
 from weaviate.classes.aggregate import GroupByAggregate
 from weaviate.classes.query import Filter, Metrics
+from weaviate.collections.classes.data import DataObject
 from weaviate.util import generate_uuid5
 
 from elysia.tree.tree import Tree
+from elysia.util.batch_writer import BatchWriter
 from elysia.util.parsing import format_datetime
 from elysia.api.core.log import logger
 import weaviate.classes.config as wc
@@ -205,7 +207,9 @@ async def create_feedback(
     #     ]
 
     # ensure "action" is a bool in tasks_completed
-    for task_prompt in history["tree_data"].tasks_completed:
+    tasks_completed = history.tasks_completed
+    training_updates = history.training_updates
+    for task_prompt in tasks_completed:
         for task in task_prompt["task"]:
             task["action"] = bool(task["action"])
 
@@ -217,15 +221,13 @@ async def create_feedback(
         "conversation_id": conversation_id,
         "query_id": query_id,
         "feedback": int(feedback),
-        "modules_used": list(
-            set([h["module_name"] for h in history["training_updates"]])
-        ),
-        "user_prompt": history["tree_data"].user_prompt,
-        "conversation_history": history["tree_data"].conversation_history,
-        "tasks_completed": history["tree_data"].tasks_completed,
-        "route": history["decision_history"],
-        "action_information": history["action_information"],
-        "time_taken_seconds": history["time_taken_seconds"],
+        "modules_used": list(set([h["module_name"] for h in training_updates])),
+        "user_prompt": history.user_prompt,
+        "conversation_history": history.conversation_history,
+        "tasks_completed": tasks_completed,
+        "route": history.decision_history,
+        "action_information": history.action_information,
+        "time_taken_seconds": history.time_taken_seconds,
         "decision_time": tree.tracker.get_average_time("decision_node"),
         "base_lm_used": tree.base_lm.model,
         "complex_lm_used": tree.complex_lm.model,
@@ -233,8 +235,8 @@ async def create_feedback(
         "feedback_date": format_datetime(
             date_now.replace(hour=0, minute=0, second=0, microsecond=0)
         ),
-        "training_updates": json.dumps(history["training_updates"]),
-        "initialisation": history["initialisation"],
+        "training_updates": json.dumps(training_updates),
+        "initialisation": history.initialisation,
     }
 
     # uuid is generated based on the user_id, conversation_id, query_id ONLY
@@ -247,17 +249,15 @@ async def create_feedback(
         }
     )
 
-    try:
-        if await feedback_collection.data.exists(session_uuid):
-            await feedback_collection.data.update(
-                properties=properties, uuid=session_uuid
-            )
-        else:
-            await feedback_collection.data.insert(
-                properties=properties, uuid=session_uuid
-            )
-    except Exception as e:
-        logger.exception(f"Whilst inserting feedback to the feedback collection")
+    # inserting with an existing uuid replaces the previous feedback
+    summary = await BatchWriter(logger=logger).insert_objects(
+        feedback_collection,
+        [DataObject(properties=properties, uuid=session_uuid)],
+    )
+    if summary["num_failed"] > 0:
+        logger.error(
+            f"Whilst inserting feedback to the feedback collection: {summary['errors'][0]}"
+        )
 
 
 async def view_feedback(user_id: str, conversation_id: str, query_id: str, client):
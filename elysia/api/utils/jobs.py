@@ -0,0 +1,231 @@
+import json
+import time
+import sqlite3
+import threading
+
+
+class PreprocessingJobStore:
+    """
+    Persists preprocessing jobs in a SQLite file, so that jobs can be resumed after a restart.
+
+    A job is a batch of collections to preprocess for a user. For each collection, the store keeps its status
+    (`"queued"`, `"running"`, `"completed"` or `"failed"`), its latest progress and message,
+    and the checkpoint of its completed stages (see the `checkpoint` argument of `preprocess_async`).
+    The status of the job itself is `"queued"`, `"running"`, `"completed"` (all collections completed) or `"failed"`.
+
+    Several workers can share the same file. A worker only runs a job while it holds the job's lease (see `claim_job`),
+    so that an unfinished job is resumed by a single worker.
+    Checkpoints are stored as JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, "
+                "user_id TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "options TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "updated REAL NOT NULL, "
+                "owner TEXT, "
+                "lease_expires REAL NOT NULL DEFAULT 0)"
+            )
+            # files created before jobs had owners
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                self.conn.execute(
+                    "ALTER TABLE jobs ADD COLUMN lease_expires REAL NOT NULL DEFAULT 0"
+                )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_collections ("
+                "job_id TEXT NOT NULL, "
+                "position INTEGER NOT NULL, "
+                "collection_name TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "progress REAL NOT NULL, "
+                "message TEXT NOT NULL, "
+                "error TEXT NOT NULL, "
+                "checkpoint TEXT, "
+                "updated REAL NOT NULL, "
+                "PRIMARY KEY (job_id, collection_name))"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_user_id ON jobs (user_id)"
+            )
+
+    def create_job(
+        self,
+        job_id: str,
+        user_id: str,
+        collection_names: list[str],
+        options: dict,
+        owner: str,
+        lease: float,
+    ) -> None:
+        """
+        Add a job, with its lease held by `owner` for `lease` seconds.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, user_id, status, options, created, updated, owner, lease_expires) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    user_id,
+                    "queued",
+                    json.dumps(options),
+                    now,
+                    now,
+                    owner,
+                    now + lease,
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO job_collections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, i, collection_name, "queued", 0.0, "", "", None, now)
+                    for i, collection_name in enumerate(collection_names)
+                ],
+            )
+
+    def claim_job(self, job_id: str, owner: str, lease: float) -> bool:
+        """
+        Take (or renew) the lease of an unfinished job for `lease` seconds.
+        The lease can only be taken if it is not held by another owner, or has expired.
+
+        Returns:
+            (bool): Whether `owner` now holds the lease.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET owner = ?, lease_expires = ? "
+                "WHERE job_id = ? AND status IN ('queued', 'running') "
+                "AND (owner IS NULL OR owner = ? OR lease_expires < ?)",
+                (owner, now + lease, job_id, owner, now),
+            )
+        return cursor.rowcount == 1
+
+    def release_job(self, job_id: str, owner: str) -> None:
+        """
+        Give up the lease of a job, if held by `owner`, so that another worker can resume it straight away.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET owner = NULL, lease_expires = 0 "
+                "WHERE job_id = ? AND owner = ?",
+                (job_id, owner),
+            )
+
+    def set_job_status(self, job_id: str, status: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE job_id = ?",
+                (status, time.time(), job_id),
+            )
+
+    def update_collection(
+        self,
+        job_id: str,
+        collection_name: str,
+        status: str,
+        progress: float,
+        message: str = "",
+        error: str = "",
+        checkpoint: dict | None = None,
+        keep_checkpoint: bool = False,
+    ) -> None:
+        """
+        Update the status of a collection of a job, and replace its checkpoint with `checkpoint`
+        (or leave the stored checkpoint as it is, if `keep_checkpoint` is True).
+        """
+        columns = ["status", "progress", "message", "error", "updated"]
+        values = [status, progress, message, error, time.time()]
+        if not keep_checkpoint:
+            columns.append("checkpoint")
+            values.append(json.dumps(checkpoint) if checkpoint is not None else None)
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE job_collections SET {', '.join(f'{c} = ?' for c in columns)} "
+                "WHERE job_id = ? AND collection_name = ?",
+                (*values, job_id, collection_name),
+            )
+
+    def get_checkpoint(self, job_id: str, collection_name: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT checkpoint FROM job_collections WHERE job_id = ? AND collection_name = ?",
+                (job_id, collection_name),
+            ).fetchone()
+        # checkpoints were pickled before they were stored as JSON, these are not loaded
+        if row is None or not isinstance(row[0], str):
+            return None
+        return json.loads(row[0])
+
+    def get_job(self, job_id: str) -> dict | None:
+        """
+        Get the status of a job and each of its collections (without checkpoints), or None if there is no such job.
+        """
+        with self.lock:
+            job = self.conn.execute(
+                "SELECT job_id, user_id, status, options, created, updated FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if job is None:
+                return None
+            collections = self.conn.execute(
+                "SELECT collection_name, status, progress, message, error, updated "
+                "FROM job_collections WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+
+        return {
+            "job_id": job[0],
+            "user_id": job[1],
+            "status": job[2],
+            "options": json.loads(job[3]),
+            "created": job[4],
+            "updated": job[5],
+            "collections": [
+                {
+                    "collection_name": row[0],
+                    "status": row[1],
+                    "progress": row[2],
+                    "message": row[3],
+                    "error": row[4],
+                    "updated": row[5],
+                }
+                for row in collections
+            ],
+        }
+
+    def get_job_ids(
+        self, user_id: str | None = None, statuses: list[str] | None = None
+    ) -> list[str]:
+        """
+        Get the IDs of jobs, oldest first, optionally only those of a user and/or with one of the given statuses.
+        """
+        query = "SELECT job_id FROM jobs WHERE 1 = 1"
+        params = []
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if statuses is not None:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        query += " ORDER BY created"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
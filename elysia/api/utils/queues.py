@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class QueueFullError(Exception):
+    """
+    Raised when work is added to a `WorkQueue` that already has `max_waiting` items waiting.
+    """
+
+
+class WorkQueue:
+    """
+    A first-in-first-out queue of work, where at most `max_running` items run at once and at most `max_waiting` items wait.
+
+    Work is run inside `slot()`:
+    ```python
+    async with queue.slot() as wait_seconds:
+        ...
+    ```
+    If the queue is full, `slot()` raises a `QueueFullError` without waiting.
+    If a waiting task is cancelled, it leaves the queue (and passes on its slot if it was just given one).
+    """
+
+    def __init__(self, max_running: int = 1, max_waiting: int | None = None) -> None:
+        """
+        Args:
+            max_running (int): The maximum number of items running at once.
+            max_waiting (int | None): The maximum number of items waiting to run. None for no limit.
+        """
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.num_running = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+        self.num_started = 0
+        self.num_rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot to run in.
+
+        Returns:
+            (float): The number of seconds waited.
+        """
+        if self.num_running < self.max_running and len(self._waiters) == 0:
+            self.num_running += 1
+            self._record_wait(0.0)
+            return 0.0
+
+        if self.max_waiting is not None and len(self._waiters) >= self.max_waiting:
+            self.num_rejected += 1
+            raise QueueFullError(
+                f"There are already {len(self._waiters)} requests waiting in the queue."
+            )
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was given to this task as it was cancelled
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+        wait_seconds = time.perf_counter() - start
+        self._record_wait(wait_seconds)
+        return wait_seconds
+
+    def release(self) -> None:
+        # hand the slot over to the next waiting task, so it cannot be taken by a new one
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.num_running -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        wait_seconds = await self.acquire()
+        try:
+            yield wait_seconds
+        finally:
+            self.release()
+
+    def _record_wait(self, wait_seconds: float) -> None:
+        self.num_started += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.num_running,
+            "waiting": self.num_waiting,
+            "max_running": self.max_running,
+            "max_waiting": self.max_waiting,
+            "started": self.num_started,
+            "rejected": self.num_rejected,
+            "average_wait_seconds": (
+                self.total_wait_seconds / self.num_started
+                if self.num_started > 0
+                else 0.0
+            ),
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+_run_queue: WorkQueue | None = None
+
+
+def get_run_queue() -> WorkQueue:
+    """
+    The queue shared by all trees in this process, which limits the number of `Tree.async_run` executions at once.
+    The limit is set by the `MAX_CONCURRENT_TREE_RUNS` environment variable (default 16).
+    """
+    global _run_queue
+    if _run_queue is None:
+        _run_queue = WorkQueue(
+            max_running=int(os.environ.get("MAX_CONCURRENT_TREE_RUNS", 16))
+        )
+    return _run_queue
@@ -1,8 +1,10 @@
 import asyncio
+import json
 import time
+import weakref
 
 import psutil
-from typing import Callable
+from typing import Any, Callable, Coroutine
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
 
@@ -12,6 +14,79 @@ from elysia.api.core.log import logger
 # Objects
 from elysia.api.utils.default_payloads import error_payload
 
+# messages received while waiting for a disconnect (see `run_until_disconnect`), to be processed by `help_websocket`
+_pending_messages: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def is_disconnected_error(e: Exception) -> bool:
+    """
+    Whether an error from sending or receiving on a websocket is because it is no longer connected.
+    Starlette raises a RuntimeError (rather than WebSocketDisconnect) when a websocket is used after it has closed.
+    """
+    if isinstance(e, WebSocketDisconnect):
+        return True
+    return isinstance(e, RuntimeError) and any(
+        message in str(e)
+        for message in [
+            "once a close message has been sent",
+            "once a disconnect message has been received",
+            "WebSocket is not connected",
+        ]
+    )
+
+
+async def _receive_json(websocket: WebSocket) -> Any:
+    pending = _pending_messages.get(websocket)
+    if pending:
+        message = pending.pop(0)
+        if message.get("text") is not None:
+            return json.loads(message["text"])
+        return json.loads(message["bytes"].decode("utf-8"))
+    return await websocket.receive_json()
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    while True:
+        try:
+            message = await websocket.receive()
+        except Exception as e:
+            if is_disconnected_error(e):
+                return
+            raise
+
+        if message["type"] == "websocket.disconnect":
+            return
+        _pending_messages.setdefault(websocket, []).append(message)
+
+
+async def run_until_disconnect(
+    websocket: WebSocket, coroutine: Coroutine[Any, Any, Any]
+) -> bool:
+    """
+    Run a coroutine (e.g. processing a query), cancelling it if the client disconnects before it finishes,
+    so that any resources it holds or is waiting for (e.g. a slot to run a tree) are released straight away.
+    Other messages received from the client meanwhile are processed by `help_websocket` afterwards, in order.
+
+    Returns:
+        (bool): True if the coroutine finished, False if it was cancelled because the client disconnected.
+    """
+    task = asyncio.ensure_future(coroutine)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done() and watcher.exception() is not None:
+            # the websocket cannot be watched, so only stop on errors when sending
+            await task
+    finally:
+        for pending in [task, watcher]:
+            pending.cancel()
+        await asyncio.gather(task, watcher, return_exceptions=True)
+
+    if not task.cancelled():
+        task.result()
+        return True
+    return False
+
 
 async def help_websocket(websocket: WebSocket, ws_route: Callable):
     memory_process = psutil.Process()
@@ -37,7 +112,7 @@ async def help_websocket(websocket: WebSocket, ws_route: Callable):
                         try:
                             # Use a short timeout for receive_json to allow checking the timer
                             data = await asyncio.wait_for(
-                                websocket.receive_json(), timeout=1.0
+                                _receive_json(websocket), timeout=1.0
                             )
                             last_communication = time.time()
 
@@ -67,10 +142,7 @@ async def help_websocket(websocket: WebSocket, ws_route: Callable):
                 break  # Exit the loop on disconnect
 
             except RuntimeError as e:
-                if (
-                    "Cannot call 'receive' once a disconnect message has been received"
-                    in str(e)
-                ):
+                if is_disconnected_error(e):
                     # logger.info("WebSocket already disconnected")
                     break  # Exit the loop if the connection is already closed
                 else:
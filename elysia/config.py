@@ -16,7 +16,8 @@ import random
 
 from dotenv import load_dotenv
 from dspy import LM
-from copy import deepcopy
+from collections.abc import MutableMapping
+from contextvars import ContextVar
 
 load_dotenv(override=True)
 
@@ -173,10 +174,32 @@ class Settings:
         self.LOGGING_LEVEL = "INFO"
         self.LOGGING_LEVEL_INT = 20
 
+        self.ENVIRONMENT_TOKEN_BUDGET: int | None = None
+        self.SUMMARISE_BATCH_TOKENS = 4000
+        self.SUMMARISE_MAX_CONCURRENCY = 4
+        self.QUERY_MAX_CONCURRENCY = 8
+        self.QUERY_TIMEOUT: float | None = 60
+        self.PREPROCESS_MAX_CONCURRENCY = 8
+        self.PREPROCESS_MAX_LM_CONCURRENCY = 4
+        self.PREPROCESS_DRIFT_THRESHOLD = 0.1
+        self.CHUNK_WITH_PROCESSES = False
+        self.HISTORY_MAX_QUERIES: int | None = None
+        self.HISTORY_SPILL_DIRECTORY: str | None = None
+
         # Experimental features
         self.USE_FEEDBACK = False
         self.BASE_USE_REASONING = True
         self.COMPLEX_USE_REASONING = True
+        self.USE_PARALLEL_TOOLS = False
+        self.USE_LLM_CACHE = False
+        self.LLM_CACHE_MAX_SIZE = 1000
+        self.LLM_CACHE_TTL: float | None = 3600
+        self.LLM_CACHE_PATH: str | None = None
+        self.LLM_CACHE_EMBEDDING_MODEL: str | None = None
+        self.LLM_CACHE_SIMILARITY_THRESHOLD = 0.95
+        self.USE_QUERY_CACHE = False
+        self.QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+        self.QUERY_CACHE_TTL: float | None = 300
 
     def setup_app_logger(self, logger: logging.Logger):
         """
@@ -335,6 +358,27 @@ class Settings:
                 - wcd_url (str): The Weaviate cloud URL to use.
                 - wcd_api_key (str): The Weaviate cloud API key to use.
                 - logging_level (str): The logging level to use. e.g. "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"
+                - environment_token_budget (int | None): The maximum (estimated) number of tokens of the environment in LLM prompts.
+                    If the environment is larger, the objects of the oldest results are hidden (keeping their metadata) until it fits.
+                    Defaults to None, no limit.
+                - summarise_batch_tokens (int): The maximum (estimated) number of tokens of objects summarised in a single LLM call
+                    when creating itemised summaries. Defaults to 4000.
+                - summarise_max_concurrency (int): The maximum number of LLM calls made at once when creating itemised summaries. Defaults to 4.
+                - query_max_concurrency (int): The maximum number of collections queried (or aggregated) at once by the retrieval tools. Defaults to 8.
+                - query_timeout (float | None): The number of seconds a query (or aggregation) on each collection can take before it fails.
+                    Defaults to 60. None for no timeout.
+                - preprocess_max_concurrency (int): The maximum number of Weaviate requests made at once when preprocessing a collection. Defaults to 8.
+                - preprocess_max_lm_concurrency (int): The maximum number of LLM calls made at once when preprocessing a collection
+                    (when defining the mappings of its return types). Defaults to 4.
+                - preprocess_drift_threshold (float): How much a collection can change (the fraction of objects added or removed, or of fields changed)
+                    before an incremental preprocess writes a new summary of it. Defaults to 0.1.
+                - chunk_with_processes (bool): Whether to chunk large amounts of text (100,000 characters or more) in a pool of worker processes,
+                    rather than in a thread. The processes are spawned, which re-imports the `__main__` module of the program,
+                    so only enable this if the program's entry point is guarded by `if __name__ == "__main__":`. Defaults to False.
+                - history_max_queries (int | None): The number of most recent queries whose history (used for feedback) is kept in memory by each tree.
+                    Defaults to None, keeping the history of all queries.
+                - history_spill_directory (str | None): A directory to write the history of older queries to, instead of dropping it,
+                    when `history_max_queries` is set. Defaults to None.
                 - use_feedback (bool): EXPERIMENTAL. Whether to use feedback from previous runs of the tree.
                     If True, the tree will use TrainingUpdate objects that have been saved in previous runs of the decision tree.
                     These are implemented via few-shot examples for the decision node.
@@ -344,6 +388,22 @@ class Settings:
                     If True, the model will generate reasoning before coming to its solution.
                 - complex_use_reasoning (bool): Whether to use reasoning output for the complex model.
                     If True, the model will generate reasoning before coming to its solution.
+                - use_parallel_tools (bool): EXPERIMENTAL. Whether the decision agent can choose multiple independent tools at once.
+                    If True, any additional tools chosen alongside the main decision are run concurrently,
+                    and their results are added to the environment in the order they were chosen.
+                - use_llm_cache (bool): EXPERIMENTAL. Whether to cache LLM predictions of Elysia's modules.
+                    If True, a call with the same signature, LM and inputs as a previous call returns the previous prediction.
+                - llm_cache_max_size (int): The maximum number of cached predictions. Defaults to 1000.
+                - llm_cache_ttl (float | None): The number of seconds a cached prediction is valid for. Defaults to 3600.
+                - llm_cache_path (str | None): A SQLite database to store cached predictions in, otherwise they are kept in memory.
+                - llm_cache_embedding_model (str | None): An embedding model (e.g. "openai/text-embedding-3-small").
+                    If set, predictions are also re-used for user prompts that are similar to a cached prompt, when all other inputs are identical.
+                - llm_cache_similarity_threshold (float): The minimum cosine similarity for a similar user prompt. Defaults to 0.95.
+                - use_query_cache (bool): EXPERIMENTAL. Whether to cache the results of Weaviate queries and aggregations.
+                    If True, an identical query on the same collection returns the previous results.
+                    Results are shared between all users connected to the same Weaviate cluster.
+                - query_cache_max_bytes (int): The maximum (estimated) size of the cached results in bytes. Defaults to 64MB.
+                - query_cache_ttl (float | None): The number of seconds cached results are valid for. Defaults to 300.
                 - Additional API keys to set. E.g. `openai_apikey="..."`, if this argument ends with `apikey` or `api_key`,
                     it will be added to the `API_KEYS` dictionary.
 
@@ -456,6 +516,50 @@ class Settings:
             self.SETTINGS_ID = kwargs["settings_id"]
             kwargs.pop("settings_id")
 
+        if "environment_token_budget" in kwargs:
+            self.ENVIRONMENT_TOKEN_BUDGET = kwargs["environment_token_budget"]
+            kwargs.pop("environment_token_budget")
+
+        if "summarise_batch_tokens" in kwargs:
+            self.SUMMARISE_BATCH_TOKENS = kwargs["summarise_batch_tokens"]
+            kwargs.pop("summarise_batch_tokens")
+
+        if "summarise_max_concurrency" in kwargs:
+            self.SUMMARISE_MAX_CONCURRENCY = kwargs["summarise_max_concurrency"]
+            kwargs.pop("summarise_max_concurrency")
+
+        if "query_max_concurrency" in kwargs:
+            self.QUERY_MAX_CONCURRENCY = kwargs["query_max_concurrency"]
+            kwargs.pop("query_max_concurrency")
+
+        if "query_timeout" in kwargs:
+            self.QUERY_TIMEOUT = kwargs["query_timeout"]
+            kwargs.pop("query_timeout")
+
+        if "preprocess_max_concurrency" in kwargs:
+            self.PREPROCESS_MAX_CONCURRENCY = kwargs["preprocess_max_concurrency"]
+            kwargs.pop("preprocess_max_concurrency")
+
+        if "chunk_with_processes" in kwargs:
+            self.CHUNK_WITH_PROCESSES = kwargs["chunk_with_processes"]
+            kwargs.pop("chunk_with_processes")
+
+        if "preprocess_max_lm_concurrency" in kwargs:
+            self.PREPROCESS_MAX_LM_CONCURRENCY = kwargs["preprocess_max_lm_concurrency"]
+            kwargs.pop("preprocess_max_lm_concurrency")
+
+        if "preprocess_drift_threshold" in kwargs:
+            self.PREPROCESS_DRIFT_THRESHOLD = kwargs["preprocess_drift_threshold"]
+            kwargs.pop("preprocess_drift_threshold")
+
+        if "history_max_queries" in kwargs:
+            self.HISTORY_MAX_QUERIES = kwargs["history_max_queries"]
+            kwargs.pop("history_max_queries")
+
+        if "history_spill_directory" in kwargs:
+            self.HISTORY_SPILL_DIRECTORY = kwargs["history_spill_directory"]
+            kwargs.pop("history_spill_directory")
+
         if "use_feedback" in kwargs:
             self.USE_FEEDBACK = kwargs["use_feedback"]
             kwargs.pop("use_feedback")
@@ -468,6 +572,48 @@ class Settings:
             self.COMPLEX_USE_REASONING = kwargs["complex_use_reasoning"]
             kwargs.pop("complex_use_reasoning")
 
+        if "use_parallel_tools" in kwargs:
+            self.USE_PARALLEL_TOOLS = kwargs["use_parallel_tools"]
+            kwargs.pop("use_parallel_tools")
+
+        if "use_llm_cache" in kwargs:
+            self.USE_LLM_CACHE = kwargs["use_llm_cache"]
+            kwargs.pop("use_llm_cache")
+
+        if "llm_cache_max_size" in kwargs:
+            self.LLM_CACHE_MAX_SIZE = kwargs["llm_cache_max_size"]
+            kwargs.pop("llm_cache_max_size")
+
+        if "llm_cache_ttl" in kwargs:
+            self.LLM_CACHE_TTL = kwargs["llm_cache_ttl"]
+            kwargs.pop("llm_cache_ttl")
+
+        if "llm_cache_path" in kwargs:
+            self.LLM_CACHE_PATH = kwargs["llm_cache_path"]
+            kwargs.pop("llm_cache_path")
+
+        if "llm_cache_embedding_model" in kwargs:
+            self.LLM_CACHE_EMBEDDING_MODEL = kwargs["llm_cache_embedding_model"]
+            kwargs.pop("llm_cache_embedding_model")
+
+        if "llm_cache_similarity_threshold" in kwargs:
+            self.LLM_CACHE_SIMILARITY_THRESHOLD = kwargs[
+                "llm_cache_similarity_threshold"
+            ]
+            kwargs.pop("llm_cache_similarity_threshold")
+
+        if "use_query_cache" in kwargs:
+            self.USE_QUERY_CACHE = kwargs["use_query_cache"]
+            kwargs.pop("use_query_cache")
+
+        if "query_cache_max_bytes" in kwargs:
+            self.QUERY_CACHE_MAX_BYTES = kwargs["query_cache_max_bytes"]
+            kwargs.pop("query_cache_max_bytes")
+
+        if "query_cache_ttl" in kwargs:
+            self.QUERY_CACHE_TTL = kwargs["query_cache_ttl"]
+            kwargs.pop("query_cache_ttl")
+
         if "api_keys" in kwargs and isinstance(kwargs["api_keys"], dict):
             for key, value in kwargs["api_keys"].items():
                 self.set_api_key(value, key)
@@ -555,7 +701,72 @@ class IncorrectModelError(Exception):
     pass
 
 
+_credentials: ContextVar[dict[str, str] | None] = ContextVar(
+    "elysia_credentials", default=None
+)
+
+
+class CredentialEnviron(MutableMapping):
+    """
+    A view of `os.environ` where the credentials set by the current `ElysiaKeyManager` replace the environment variables,
+    and any other API keys in the environment are hidden.
+    Outside of an `ElysiaKeyManager`, this is the same as `os.environ`.
+    Writes always go to the process environment.
+    """
+
+    def __init__(self, environ: MutableMapping[str, str]):
+        self.environ = environ
+
+    def __getitem__(self, key: str) -> str:
+        credentials = _credentials.get()
+        if credentials is not None:
+            if key in credentials:
+                return credentials[key]
+            if is_api_key(key):
+                raise KeyError(key)
+        return self.environ[key]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.environ[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.environ[key]
+
+    def _keys(self) -> list[str]:
+        credentials = _credentials.get()
+        if credentials is None:
+            return list(self.environ)
+        return [
+            key for key in self.environ if key in credentials or not is_api_key(key)
+        ] + [key for key in credentials if key not in self.environ]
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def copy(self) -> dict[str, str]:
+        return dict(self)
+
+    def __getattr__(self, name: str):
+        # e.g. `encodekey`, used by the standard library
+        return getattr(self.environ, name)
+
+
+def _install_credential_environ() -> None:
+    if not isinstance(os.environ, CredentialEnviron):
+        os.environ = CredentialEnviron(os.environ)  # type: ignore
+
+
 class ElysiaKeyManager:
+    """
+    Sets the API keys of the settings as environment variables for the code run inside it.
+    The keys are only set in the current context (see `contextvars`), so concurrent trees with different settings do not see each other's keys.
+
+    The LMs loaded from the settings (see `load_lm`) are also given the API key of their provider directly, so do not rely on this.
+    """
+
     def __init__(self, settings: Settings):
         self.settings = settings
 
@@ -597,26 +808,29 @@ class ElysiaKeyManager:
         return False
 
     def __enter__(self):
+        _install_credential_environ()
 
-        # save existing env
-        self.existing_env = deepcopy(os.environ)
-
-        # blank out the environ except for certain values
-        os.environ = {
+        # the credentials are only seen by this context (and tasks or threads started from it),
+        # so trees of different users can run at once
+        credentials = {
             "MODEL_API_BASE": self.settings.MODEL_API_BASE,
             "WCD_URL": self.settings.WCD_URL,
             "WCD_API_KEY": self.settings.WCD_API_KEY,
         }
-
-        # update all api keys in env
         for api_key, value in self.settings.API_KEYS.items():
-            os.environ[api_key.upper()] = value
+            credentials[api_key.upper()] = value
 
-        pass
+        self.previous = _credentials.get()
+        self.token = _credentials.set(
+            {key: value for key, value in credentials.items() if value is not None}
+        )
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # reset env to original
-        os.environ = self.existing_env
+        try:
+            _credentials.reset(self.token)
+        except ValueError:
+            # exited in a different context to the one it was entered in (e.g. when an async generator is closed)
+            _credentials.set(self.previous)
 
         if exc_type is NotFoundError or exc_type is BadRequestError:
             self._check_model_availability(
@@ -711,6 +925,7 @@ def load_base_lm(settings: Settings) -> LM:
         settings.BASE_PROVIDER,
         settings.BASE_MODEL,
         settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        settings.API_KEYS,
     )
 
 
@@ -721,6 +936,7 @@ def load_complex_lm(settings: Settings) -> LM:
         settings.COMPLEX_PROVIDER,
         settings.COMPLEX_MODEL,
         settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        settings.API_KEYS,
     )
 
 
@@ -728,20 +944,36 @@ def load_lm(
     provider: str | None,
     lm_name: str | None,
     model_api_base: str | None = None,
+    api_keys: dict[str, str] | None = None,
 ) -> LM:
+    """
+    Get a handle to the LM from the process-wide LM pool (see `elysia.util.lm_pool`),
+    which shares its provider clients with all other handles to the same model and keeps its own usage.
+    The API key of the provider in `api_keys` is passed to the LM on each call.
+    """
+    # imported here, as elysia.util imports the settings from this module
+    from elysia.util.lm_pool import get_pooled_lm
 
     if provider is None or lm_name is None:
         raise ValueError("Provider and LM name must be set")
 
     api_base = model_api_base if provider == "ollama" else None
-    full_lm_name = f"{provider}/{lm_name}"
+
+    # only the API keys used by the provider decide which pooled LM is used
+    api_keys = api_keys or {}
+    if provider in provider_to_api_keys:
+        api_keys = {
+            name: value
+            for name, value in api_keys.items()
+            if name.lower() in provider_to_api_keys[provider]
+        }
 
     if lm_name.startswith("o1") or lm_name.startswith("o3"):
-        return LM(
-            model=full_lm_name, api_base=api_base, max_tokens=8000, temperature=1.0
+        return get_pooled_lm(
+            provider, lm_name, api_base, api_keys, max_tokens=8000, temperature=1.0
         )
 
-    return LM(model=full_lm_name, api_base=api_base, max_tokens=8000)
+    return get_pooled_lm(provider, lm_name, api_base, api_keys, max_tokens=8000)
 
 
 # global settings that should never be used by the frontend
@@ -780,11 +1012,33 @@ def configure(**kwargs) -> None:
             - wcd_url (str): The Weaviate cloud URL to use.
             - wcd_api_key (str): The Weaviate cloud API key to use.
             - logging_level (str): The logging level to use. e.g. "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"
+            - environment_token_budget (int | None): The maximum (estimated) number of tokens of the environment in LLM prompts.
+            - summarise_batch_tokens (int): The maximum (estimated) number of tokens of objects summarised in a single LLM call.
+            - summarise_max_concurrency (int): The maximum number of LLM calls made at once when creating itemised summaries.
+            - query_max_concurrency (int): The maximum number of collections queried (or aggregated) at once by the retrieval tools.
+            - query_timeout (float | None): The number of seconds a query (or aggregation) on each collection can take before it fails.
+            - preprocess_max_concurrency (int): The maximum number of Weaviate requests made at once when preprocessing a collection.
+            - preprocess_max_lm_concurrency (int): The maximum number of LLM calls made at once when preprocessing a collection.
+            - preprocess_drift_threshold (float): How much a collection can change before an incremental preprocess writes a new summary of it.
+            - chunk_with_processes (bool): Whether to chunk large amounts of text in a pool of (spawned) worker processes, rather than in a thread.
+            - history_max_queries (int | None): The number of most recent queries whose history is kept in memory by each tree.
+            - history_spill_directory (str | None): A directory to write the history of older queries to, instead of dropping it.
             - use_feedback (bool): EXPERIMENTAL. Whether to use feedback from previous runs of the tree.
                 If True, the tree will use TrainingUpdate objects that have been saved in previous runs of the decision tree.
                 These are implemented via few-shot examples for the decision node.
                 They are collected in the 'feedback' collection (ELYSIA_FEEDBACK__).
                 Relevant examples are retrieved from the collection based on searching the collection via the user's prompt.
+            - use_parallel_tools (bool): EXPERIMENTAL. Whether the decision agent can choose multiple independent tools at once.
+                If True, any additional tools chosen alongside the main decision are run concurrently.
+            - use_llm_cache (bool): EXPERIMENTAL. Whether to cache LLM predictions of Elysia's modules.
+            - llm_cache_max_size (int): The maximum number of cached predictions.
+            - llm_cache_ttl (float | None): The number of seconds a cached prediction is valid for.
+            - llm_cache_path (str | None): A SQLite database to store cached predictions in.
+            - llm_cache_embedding_model (str | None): An embedding model used to re-use predictions for similar user prompts.
+            - llm_cache_similarity_threshold (float): The minimum cosine similarity for a similar user prompt.
+            - use_query_cache (bool): EXPERIMENTAL. Whether to cache the results of Weaviate queries and aggregations.
+            - query_cache_max_bytes (int): The maximum (estimated) size of the cached results in bytes.
+            - query_cache_ttl (float | None): The number of seconds cached results are valid for.
             - Additional API keys to set. E.g. `openai_apikey="..."`, if this argument ends with `apikey` or `api_key`,
                 it will be added to the `API_KEYS` dictionary.
 
@@ -1,22 +1,29 @@
-import random
+import asyncio
 import dspy
 from rich.progress import Progress
 from typing import AsyncGenerator
 
 # Weaviate
-from weaviate.classes.aggregate import GroupByAggregate
-from weaviate.classes.query import Metrics, Filter
+from weaviate.classes.query import Filter
 from weaviate.collections import CollectionAsync
 from weaviate.classes.config import Configure, Property, DataType, Tokenization
 
-from elysia.config import nlp, Settings, load_base_lm, ElysiaKeyManager
+from elysia.config import Settings, load_base_lm, ElysiaKeyManager
 from elysia.config import settings as environment_settings
 
 from elysia.util import return_types as rt
 
+from elysia.preprocessing.incremental import (
+    diff_metadata,
+    stale_fields,
+    stale_mappings,
+)
+from elysia.preprocessing.sampling import estimate_token_counts, sample_objects
+from elysia.preprocessing.statistics import evaluate_field_statistics
 from elysia.preprocessing.prompt_templates import (
     CollectionSummariserPrompt,
     DataMappingPrompt,
+    FieldDescriptionPrompt,
     ReturnTypePrompt,
     PromptSuggestorPrompt,
 )
@@ -94,152 +101,31 @@ async def _summarise_collection(
     return summary_concat, prediction.field_descriptions
 
 
-async def _evaluate_field_statistics(
-    collection: CollectionAsync,
-    properties: dict,
-    property: str,
-    len_collection: int,
-    sample_objects: list[dict],
+async def _describe_fields(
+    field_description_prompt: dspy.Module,
+    collection_summary: str,
+    fields: dict,
+    subset_objects: list[dict],
+    settings: Settings,
+    lm: dspy.LM,
 ) -> dict:
-    out = {}
-    out["type"] = properties[property] if properties[property] != "number" else "float"
-    out["name"] = property
-    out["range"] = None
-    out["mean"] = None
-    out["date_range"] = None
-    out["date_median"] = None
-    out["groups"] = None
-
-    if not out["type"].startswith("object"):
-
-        groups_response = await collection.aggregate.over_all(
-            total_count=True, group_by=GroupByAggregate(prop=property, limit=30)
-        )
-
-        if len(groups_response.groups) > 15:
-            groups = [
-                {
-                    "value": str(
-                        group.grouped_by.value
-                    ),  # must force to string for weaviate
-                    "count": group.total_count,
-                }
-                for group in groups_response.groups
-                if group.total_count > 1
-            ]
-        else:
-            groups = [
-                {
-                    "value": str(group.grouped_by.value),
-                    "count": group.total_count,
-                }
-                for group in groups_response.groups
-            ]
-
-        total_count = sum(group["count"] for group in groups)
-        remainder = len_collection - total_count
-        group_coverage = total_count / len_collection
-        if remainder > 0:
-            groups.append(
-                {
-                    "value": "<undefined_group> (not used for filtering)",
-                    "count": remainder,
-                }
-            )
 
-        # check if groups are useful
-        if len(groups) == 1 or group_coverage < 0.5:
-            out["groups"] = None
-        else:
-            out["groups"] = groups
-
-    # Number (summary statistics)
-    if properties[property] == "int":
-        response = await collection.aggregate.over_all(
-            return_metrics=[
-                Metrics(property).integer(mean=True, maximum=True, minimum=True),
-            ]
-        )
-        out["range"] = [
-            response.properties[property].minimum,
-            response.properties[property].maximum,
-        ]
-        out["mean"] = response.properties[property].mean
-        out["date_range"] = None
-        out["date_median"] = None
-
-    elif properties[property] == "number":
-        response = await collection.aggregate.over_all(
-            return_metrics=[
-                Metrics(property).number(mean=True, maximum=True, minimum=True),
-            ]
-        )
-        out["range"] = [
-            response.properties[property].minimum,
-            response.properties[property].maximum,
-        ]
-        out["mean"] = response.properties[property].mean
-        out["date_range"] = None
-        out["date_median"] = None
-
-    # Text (lengths)
-    elif properties[property] == "text":
-
-        # For text, we want to evaluate the length of the text in tokens (use spacy)
-        lengths = []
-        for obj in sample_objects:
-            if property in obj and isinstance(obj[property], str):
-                lengths.append(len(nlp(obj[property])))
-
-        if len(lengths) == 0:
-            out["range"] = None
-            out["mean"] = None
-        else:
-            out["range"] = [min(lengths), max(lengths)]
-            out["mean"] = sum(lengths) / len(lengths)
-        out["date_median"] = None
-        out["date_range"] = None
-
-    # Boolean (grouping + mean)
-    elif properties[property] == "boolean":
-        response = await collection.aggregate.over_all(
-            return_metrics=[Metrics(property).boolean(percentage_true=True)]
-        )
-        out["mean"] = response.properties[property].percentage_true
-        out["range"] = [0, 1]
-        out["date_range"] = None
-        out["date_median"] = None
-
-    # Date (summary statistics)
-    elif properties[property] == "date":
-        response = await collection.aggregate.over_all(
-            return_metrics=[
-                Metrics(property).date_(median=True, minimum=True, maximum=True)
-            ]
+    with ElysiaKeyManager(settings):
+        prediction = await field_description_prompt.aforward(
+            collection_summary=collection_summary,
+            data_sample=[
+                {name: obj.get(name) for name in fields} for obj in subset_objects
+            ],
+            data_fields=fields,
+            lm=lm,
         )
-        out["date_range"] = [
-            response.properties[property].minimum,
-            response.properties[property].maximum,
-        ]
-        out["mean"] = None
-        out["date_median"] = response.properties[property].median
-        out["range"] = None
-        out["mean"] = None
-
-    # List (lengths)
-    elif properties[property].endswith("[]"):
-        lengths = [len(obj[property]) for obj in sample_objects]
-
-        if len(lengths) == 0:
-            out["range"] = None
-            out["mean"] = None
-        else:
-            out["range"] = [min(lengths), max(lengths)]
-            out["mean"] = sum(lengths) / len(lengths)
-        out["date_range"] = None
-        out["date_median"] = None
 
-    return out
+    # only the requested fields are kept
+    return {
+        name: description
+        for name, description in prediction.field_descriptions.items()
+        if name in fields
+    }
 
 
 async def _suggest_prompts(
@@ -313,6 +199,23 @@ async def _define_mappings(
     return prediction.field_mapping
 
 
+def _is_valid_mapping(
+    return_type: str, mapping: dict, percentage_correct_threshold: float
+) -> bool:
+
+    # check if the `conversation_id` field is in the mapping (required for conversation type)
+    if return_type == "conversation" and (
+        (mapping.get("conversation_id") is None or mapping["conversation_id"] == "")
+        or (mapping.get("message_id") is None or mapping["message_id"] == "")
+    ):
+        return False
+
+    # If less than threshold_for_missing_fields%, keep the return type
+    num_missing = sum([m == "" for m in list(mapping.values())])
+    perc_correct = 1 - (num_missing / len(mapping.keys()))
+    return perc_correct >= percentage_correct_threshold
+
+
 async def _evaluate_index_properties(collection: CollectionAsync) -> dict:
     schema_info = await collection.config.get()
 
@@ -373,6 +276,9 @@ async def preprocess_async(
     force: bool = False,
     percentage_correct_threshold: float = 0.3,
     settings: Settings = environment_settings,
+    sample_group_by: str | None = None,
+    incremental: bool = False,
+    checkpoint: dict | None = None,
 ) -> AsyncGenerator[dict, None]:
     """
     Preprocess a collection, obtain a LLM-generated summary of the collection,
@@ -398,15 +304,32 @@ async def preprocess_async(
         force (bool): Whether to force the preprocessor to run even if the collection already exists. Optional, defaults to False.
         threshold_for_missing_fields (float): The threshold for the number of missing fields in the data mapping. Optional, defaults to 0.1.
         settings (Settings): The settings to use. Optional, defaults to the environment variables/configured settings.
+        sample_group_by (str | None): A property to stratify the sample of objects by, so that each of its values is represented in the sample.
+            Optional, defaults to None (a uniform random sample).
+        incremental (bool): Whether to update the existing preprocessed metadata of the collection, rather than creating it from scratch.
+            Only the statistics of new or changed fields (or all fields, if the number of objects has changed) and the mappings that use them are recomputed.
+            The summary, return types and prompt suggestions are only recomputed if the collection has changed by more than `settings.PREPROCESS_DRIFT_THRESHOLD`.
+            Otherwise, only the descriptions of new or changed fields are generated.
+            Runs even if `force` is False. If there is no existing metadata, the collection is preprocessed from scratch.
+            Optional, defaults to False.
+        checkpoint (dict | None): A dictionary that the results of each LLM stage (summary, return types, prompt suggestions, mappings)
+            are added to as they complete, before the update for that stage is yielded.
+            Pass the same dictionary (e.g. after saving and loading it) to resume an interrupted run without repeating the completed stages.
+            Optional, defaults to None (no checkpoints).
 
     Returns:
         AsyncGenerator[dict, None]: A generator that yields dictionaries with the status updates and progress of the preprocessor.
     """
 
+    if checkpoint is None:
+        checkpoint = {}
+    checkpoint.setdefault("mappings", {})
+
     collection_summariser_prompt = dspy.ChainOfThought(CollectionSummariserPrompt)
     return_type_prompt = dspy.ChainOfThought(ReturnTypePrompt)
     data_mapping_prompt = dspy.ChainOfThought(DataMappingPrompt)
     prompt_suggestor_prompt = dspy.ChainOfThought(PromptSuggestorPrompt)
+    field_description_prompt = dspy.ChainOfThought(FieldDescriptionPrompt)
 
     lm = load_base_lm(settings)
     logger = settings.logger
@@ -427,12 +350,17 @@ async def preprocess_async(
                 raise Exception(f"Collection {collection_name} does not exist!")
 
         # Check if the preprocessed collection exists
-        if (
-            await preprocessed_collection_exists_async(collection_name, client_manager)
-            and not force
-        ):
-            logger.info(f"Preprocessed metadata for {collection_name} already exists!")
-            return
+        metadata = None
+        if await preprocessed_collection_exists_async(collection_name, client_manager):
+            if incremental:
+                metadata = await _get_preprocessed_metadata_async(
+                    collection_name, client_manager
+                )
+            elif not force:
+                logger.info(
+                    f"Preprocessed metadata for {collection_name} already exists!"
+                )
+                return
 
         # Get the collection and its properties
         async with client_manager.connect_to_async_client() as client:
@@ -443,43 +371,86 @@ async def preprocess_async(
         agg = await collection.aggregate.over_all(total_count=True)
         len_collection: int = agg.total_count  # type: ignore
 
-        # Randomly sample sample_size objects for the summary
-        indices = random.sample(
-            range(len_collection),
+        # Randomly sample up to max_sample_size objects for the summary
+        sample = await sample_objects(
+            collection,
+            len_collection,
             max(min(max_sample_size, len_collection), 1),
+            group_by=sample_group_by,
         )
+        token_counts = await estimate_token_counts(sample)
+
+        # Use as many objects as fit in num_sample_tokens, but at least min_sample_size
+        subset_objects: list[dict] = []
+        total_tokens = 0
+        for obj, token_count in zip(sample, token_counts):
+            if (
+                len(subset_objects) >= min_sample_size
+                and total_tokens + token_count > num_sample_tokens
+            ):
+                break
+            subset_objects.append(obj)
+            total_tokens += token_count
 
-        # Get first object to estimate token count
-        obj = await collection.query.fetch_objects(limit=1, offset=indices[0])
-        token_count_0 = len(nlp(str(obj.objects[0].properties)))
-        subset_objects: list[dict] = [obj.objects[0].properties]  # type: ignore
-
-        # Get number of objects to sample to get close to num_sample_tokens
-        num_sample_objects = max(min_sample_size, num_sample_tokens // token_count_0)
-
-        for index in indices[1:num_sample_objects]:
-            obj = await collection.query.fetch_objects(limit=1, offset=index)
-            subset_objects.append(obj.objects[0].properties)  # type: ignore
-
-        # Estimate number of tokens
-        logger.debug(
-            f"Estimated token count of sample: {token_count_0*len(subset_objects)}"
-        )
+        logger.debug(f"Estimated token count of sample: {total_tokens}")
         logger.debug(f"Number of objects in sample: {len(subset_objects)}")
 
-        # Summarise the collection using LLM and the subset of the data
-        summary, field_descriptions = await _summarise_collection(
-            collection_summariser_prompt,
-            properties,
-            subset_objects,
-            len_collection,
-            settings,
-            lm,
-        )
+        # Compare to the existing metadata, to only recompute what has changed
+        if metadata is not None:
+            diff = diff_metadata(metadata, properties, len_collection)
+            resummarise = diff["drift"] > settings.PREPROCESS_DRIFT_THRESHOLD
+            logger.debug(
+                f"Changes since {collection_name} was last preprocessed: {diff}"
+            )
+        else:
+            diff = None
+            resummarise = True
+
+        if "summary" in checkpoint:
+            summary = checkpoint["summary"]
+            field_descriptions = checkpoint["field_descriptions"]
+            message = "Resumed summary of collection from checkpoint"
+        elif resummarise:
+            # Summarise the collection using LLM and the subset of the data
+            summary, field_descriptions = await _summarise_collection(
+                collection_summariser_prompt,
+                properties,
+                subset_objects,
+                len_collection,
+                settings,
+                lm,
+            )
+            message = "Generated summary of collection"
+        else:
+            summary = metadata["summary"]  # type: ignore
+            field_descriptions = {
+                field["name"]: field.get("description") or ""
+                for field in metadata["fields"]  # type: ignore
+            }
+            message = "Kept existing summary of collection"
 
-        yield await process_update(
-            message="Generated summary of collection",
-        )
+            # new fields (and those whose type changed) are described without re-summarising the whole collection
+            fields_to_describe = {
+                name: data_type
+                for name, data_type in properties.items()
+                if name in diff["added"] or name in diff["changed"]  # type: ignore
+            }
+            if len(fields_to_describe) > 0:
+                field_descriptions.update(
+                    await _describe_fields(
+                        field_description_prompt,
+                        summary,
+                        fields_to_describe,
+                        subset_objects,
+                        settings,
+                        lm,
+                    )
+                )
+                message = f"Kept existing summary of collection, described new fields {', '.join(fields_to_describe)}"
+
+        checkpoint["summary"] = summary
+        checkpoint["field_descriptions"] = field_descriptions
+        yield await process_update(message=message)
 
         if len_collection > max_sample_size:
             full_response = subset_objects
@@ -489,6 +460,18 @@ async def preprocess_async(
 
         # Initialise the output
         named_vectors, vectoriser = await _find_vectorisers(collection)
+        if metadata is not None and named_vectors is not None:
+            # keep any named vectors that have been enabled/disabled or described
+            existing_named_vectors = {
+                named_vector["name"]: named_vector
+                for named_vector in metadata.get("named_vectors") or []
+            }
+            for named_vector in named_vectors:
+                if named_vector["name"] in existing_named_vectors:
+                    existing = existing_named_vectors[named_vector["name"]]
+                    named_vector["enabled"] = existing["enabled"]
+                    named_vector["description"] = existing["description"]
+
         out = {
             "name": collection_name,
             "length": len_collection,
@@ -500,96 +483,170 @@ async def preprocess_async(
             "mappings": {},
         }
 
-        # Evaluate the summary statistics of each field
-        for property in properties:
-            out["fields"].append(
-                await _evaluate_field_statistics(
-                    collection, properties, property, len_collection, full_response
-                )
-            )
-            if property in field_descriptions:
-                out["fields"][-1]["description"] = field_descriptions[property]
-            else:
-                out["fields"][-1]["description"] = ""
-
-        yield await process_update(
-            message="Evaluated field statistics",
-        )
+        # Evaluate the summary statistics of all (stale) fields at once
+        if diff is not None and not resummarise:
+            field_statistics = {
+                field["name"]: field
+                for field in metadata["fields"]  # type: ignore
+                if field["name"] in properties
+            }
+            fields_to_evaluate = {
+                name: properties[name] for name in stale_fields(diff, properties)
+            }
+        else:
+            field_statistics = {}
+            fields_to_evaluate = properties
 
-        return_types = await _evaluate_return_types(
-            return_type_prompt,
-            summary,
-            properties,
-            subset_objects,
-            settings,
-            lm,
-        )
+        process_update.update_total(process_update.total + len(fields_to_evaluate) - 1)
+        async for field in evaluate_field_statistics(
+            collection,
+            fields_to_evaluate,
+            len_collection,
+            full_response,
+            max_concurrency=settings.PREPROCESS_MAX_CONCURRENCY,
+        ):
+            field["description"] = field_descriptions.get(field["name"], "")
+            field_statistics[field["name"]] = field
+            yield await process_update(
+                message=f"Evaluated field statistics for {field['name']}",
+            )
+        out["fields"] = [field_statistics[property] for property in properties]
+
+        if "return_types" in checkpoint:
+            return_types = checkpoint["return_types"]
+            message = "Resumed return types from checkpoint"
+        elif resummarise:
+            return_types = await _evaluate_return_types(
+                return_type_prompt,
+                summary,
+                properties,
+                subset_objects,
+                settings,
+                lm,
+            )
+            message = "Evaluated return types"
+        else:
+            return_types = [
+                return_type
+                for return_type in metadata["mappings"]  # type: ignore
+                if return_type in rt.types_dict and return_type != "table"
+            ]
+            message = "Kept existing return types"
 
-        yield await process_update(
-            message="Evaluated return types",
-        )
-        process_update.update_total(len(return_types) + 5)
+        checkpoint["return_types"] = return_types
+        yield await process_update(message=message)
+        process_update.update_total(len(return_types) + len(fields_to_evaluate) + 4)
 
         # suggest prompts
-        out["prompts"] = await _suggest_prompts(
-            prompt_suggestor_prompt,
-            out,
-            subset_objects,
-            settings,
-            lm,
-        )
+        if "prompts" in checkpoint:
+            out["prompts"] = checkpoint["prompts"]
+            message = "Resumed suggestions for prompts from checkpoint"
+        elif resummarise or not metadata.get("prompts"):  # type: ignore
+            out["prompts"] = await _suggest_prompts(
+                prompt_suggestor_prompt,
+                out,
+                subset_objects,
+                settings,
+                lm,
+            )
+            message = "Created suggestions for prompts"
+        else:
+            out["prompts"] = metadata["prompts"]  # type: ignore
+            message = "Kept existing suggestions for prompts"
 
-        yield await process_update(
-            message="Created suggestions for prompts",
-        )
+        checkpoint["prompts"] = out["prompts"]
+        yield await process_update(message=message)
+
+        # Only mappings that use changed fields are defined again, unless re-summarised
+        if resummarise:
+            mappings_to_define = return_types
+        else:
+            mappings_to_define = stale_mappings(diff, metadata["mappings"])  # type: ignore
 
         # For each return type created above, define the mappings from the properties to the frontend types
-        mappings = {}
-        for return_type in return_types:
-            fields = rt.types_dict[return_type]
+        # The mappings are defined concurrently, and checked as each is defined
+        semaphore = asyncio.Semaphore(settings.PREPROCESS_MAX_LM_CONCURRENCY)
+
+        async def define_mapping(return_type: str) -> tuple[str, dict, bool, str]:
+            if return_type in checkpoint["mappings"]:
+                mapping = checkpoint["mappings"][return_type]
+                return (
+                    return_type,
+                    mapping,
+                    _is_valid_mapping(
+                        return_type, mapping, percentage_correct_threshold
+                    ),
+                    f"Resumed mappings for {return_type} from checkpoint",
+                )
 
-            mapping = await _define_mappings(
-                data_mapping_prompt,
-                mapping_type=return_type,
-                input_fields=list(fields.keys()),
-                output_fields=list(properties.keys()),
-                properties=properties,
-                collection_information=out,
-                example_objects=subset_objects,
-                settings=settings,
-                lm=lm,
-            )
+            if return_type not in mappings_to_define:
+                mapping = metadata["mappings"][return_type]  # type: ignore
+                return (
+                    return_type,
+                    mapping,
+                    _is_valid_mapping(
+                        return_type, mapping, percentage_correct_threshold
+                    ),
+                    f"Kept existing mappings for {return_type}",
+                )
+
+            fields = rt.types_dict[return_type]
+            async with semaphore:
+                mapping = await _define_mappings(
+                    data_mapping_prompt,
+                    mapping_type=return_type,
+                    input_fields=list(fields.keys()),
+                    output_fields=list(properties.keys()),
+                    properties=properties,
+                    collection_information=out,
+                    example_objects=subset_objects,
+                    settings=settings,
+                    lm=lm,
+                )
 
             # remove any extra fields the model may have added
             mapping = {k: v for k, v in mapping.items() if k in list(fields.keys())}
-
-            yield await process_update(
-                message=f"Defined mappings for {return_type}",
+            checkpoint["mappings"][return_type] = mapping
+            return (
+                return_type,
+                mapping,
+                _is_valid_mapping(return_type, mapping, percentage_correct_threshold),
+                f"Defined mappings for {return_type}",
             )
 
-            mappings[return_type] = mapping
+        async def define_mapping_at(i: int) -> tuple[int, tuple[str, dict, bool, str]]:
+            return i, await define_mapping(return_types[i])
 
-        new_return_types = []
-        for return_type in return_types:
-
-            # check if the `conversation_id` field is in the mapping (required for conversation type)
-            if return_type == "conversation" and (
-                (
-                    mappings[return_type]["conversation_id"] is None
-                    or mappings[return_type]["conversation_id"] == ""
-                )
-                or (
-                    mappings[return_type]["message_id"] is None
-                    or mappings[return_type]["message_id"] == ""
-                )
-            ):
-                continue
+        mappings = {}
+        valid_return_types = set()
+        tasks = [
+            asyncio.ensure_future(define_mapping_at(i))
+            for i in range(len(return_types))
+        ]
 
-            # If less than threshold_for_missing_fields%, keep the return type
-            num_missing = sum([m == "" for m in list(mappings[return_type].values())])
-            perc_correct = 1 - (num_missing / len(mappings[return_type].keys()))
-            if perc_correct >= percentage_correct_threshold:
-                new_return_types.append(return_type)
+        # mappings are validated as they complete, but the updates are sent in the order of return_types
+        completed_messages = {}
+        num_sent = 0
+        try:
+            for task in asyncio.as_completed(tasks):
+                i, (return_type, mapping, valid, message) = await task
+                mappings[return_type] = mapping
+                if valid:
+                    valid_return_types.add(return_type)
+                completed_messages[i] = message
+
+                while num_sent in completed_messages:
+                    yield await process_update(message=completed_messages.pop(num_sent))
+                    num_sent += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        new_return_types = [
+            return_type
+            for return_type in return_types
+            if return_type in valid_return_types
+        ]
 
         # If no return types are left, fall-back to generic
         if len(new_return_types) == 0:
@@ -615,9 +672,7 @@ async def preprocess_async(
             mappings["generic"] = mapping
 
             # re-check the threshold for missing fields on generic
-            num_missing = sum([m == "" for m in list(mappings[return_type].values())])
-            perc_correct = 1 - (num_missing / len(mappings[return_type].keys()))
-            if perc_correct >= percentage_correct_threshold:
+            if _is_valid_mapping("generic", mapping, percentage_correct_threshold):
                 new_return_types = ["generic"]
 
         # Add the mappings to the output
@@ -786,6 +841,8 @@ async def _preprocess_async(
     num_sample_tokens: int = 30000,
     settings: Settings = environment_settings,
     force: bool = False,
+    sample_group_by: str | None = None,
+    incremental: bool = False,
 ) -> None:
 
     if client_manager is None:
@@ -811,6 +868,8 @@ async def _preprocess_async(
                     num_sample_tokens=num_sample_tokens,
                     force=force,
                     settings=settings,
+                    sample_group_by=sample_group_by,
+                    incremental=incremental,
                 ):
                     if (
                         result is not None
@@ -833,6 +892,8 @@ async def _preprocess_async(
                         num_sample_tokens=num_sample_tokens,
                         force=force,
                         settings=settings,
+                        sample_group_by=sample_group_by,
+                        incremental=incremental,
                     ):
                         if (
                             result is not None
@@ -865,6 +926,8 @@ def preprocess(
     num_sample_tokens: int = 30000,
     settings: Settings = environment_settings,
     force: bool = False,
+    sample_group_by: str | None = None,
+    incremental: bool = False,
 ) -> None:
     """
     Preprocess a collection, obtain a LLM-generated summary of the collection,
@@ -886,6 +949,7 @@ def preprocess(
 
     But note that the pre-processing step only needs to be done once for each collection.
     The output of this function is cached, so that if you run it again, it will not re-process the collection (unless the force flag is set to True).
+    If a collection has changed since it was preprocessed, set the incremental flag to True to only recompute what has changed.
 
     This function saves the output into a collection called ELYSIA_METADATA__, which is automatically called by Elysia.
     This is saved to whatever Weaviate cluster URL/API key you have configured, or in your environment variables.
@@ -901,6 +965,12 @@ def preprocess(
         num_sample_tokens (int): The maximum number of tokens in the sample objects used to evaluate the summary. Optional, defaults to 30000.
         settings (Settings): The settings to use. Optional, defaults to the environment variables/configured settings.
         force (bool): Whether to force the preprocessor to run even if the collection already exists. Optional, defaults to False.
+        sample_group_by (str | None): A property to stratify the sample of objects by, so that each of its values is represented in the sample.
+            Optional, defaults to None (a uniform random sample).
+        incremental (bool): Whether to update the existing preprocessed metadata of the collections, rather than creating it from scratch.
+            Only what has changed since the collections were last preprocessed is recomputed, which is much cheaper than `force=True`.
+            The summary is only written again if a collection has changed by more than `settings.PREPROCESS_DRIFT_THRESHOLD`.
+            Optional, defaults to False.
     """
 
     asyncio_run(
@@ -912,10 +982,30 @@ def preprocess(
             num_sample_tokens,
             settings,
             force,
+            sample_group_by,
+            incremental,
         )
     )
 
 
+async def _get_preprocessed_metadata_async(
+    collection_name: str, client_manager: ClientManager
+) -> dict | None:
+    async with client_manager.connect_to_async_client() as client:
+        if not await client.collections.exists("ELYSIA_METADATA__"):
+            return None
+
+        metadata_collection = client.collections.get("ELYSIA_METADATA__")
+        metadata = await metadata_collection.query.fetch_objects(
+            filters=Filter.by_property("name").equal(collection_name),
+            limit=1,
+        )
+
+    if len(metadata.objects) == 0:
+        return None
+    return metadata.objects[0].properties  # type: ignore
+
+
 async def preprocessed_collection_exists_async(
     collection_name: str, client_manager: ClientManager | None = None
 ) -> bool:
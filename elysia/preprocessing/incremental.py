@@ -0,0 +1,93 @@
+"""
+Comparisons between a collection and its stored preprocessed metadata (in ELYSIA_METADATA__),
+used to preprocess a collection incrementally, recomputing only what has changed:
+
+- the statistics of fields that were added or changed type (or of all fields, if the number of objects changed),
+- the mappings that use a removed or changed field, or that have an empty field which a new field could fill,
+- the summary, return types and prompt suggestions, only if the collection has drifted past a threshold
+  (otherwise only the fields that were added or changed type are described).
+"""
+
+
+def _field_type(data_type: str) -> str:
+    # number fields are stored as float in the metadata
+    return data_type if data_type != "number" else "float"
+
+
+def diff_metadata(metadata: dict, properties: dict, len_collection: int) -> dict:
+    """
+    Compare a collection to its stored preprocessed metadata.
+
+    Args:
+        metadata (dict): The stored preprocessed metadata of the collection.
+        properties (dict): The current data types of the fields, keyed by field name (see `async_get_collection_data_types`).
+        len_collection (int): The current number of objects in the collection.
+
+    Returns:
+        (dict): With keys
+            - "added" (list[str]): Fields not in the metadata.
+            - "removed" (list[str]): Fields in the metadata that are no longer in the collection.
+            - "changed" (list[str]): Fields whose type has changed.
+            - "length_changed" (bool): Whether the number of objects has changed.
+            - "drift" (float): The larger of the fraction of objects added or removed, and the fraction of fields added, removed or changed.
+    """
+    stored_types = {
+        field["name"]: field["type"] for field in metadata.get("fields") or []
+    }
+    current_types = {
+        name: _field_type(data_type) for name, data_type in properties.items()
+    }
+
+    added = [name for name in current_types if name not in stored_types]
+    removed = [name for name in stored_types if name not in current_types]
+    changed = [
+        name
+        for name in current_types
+        if name in stored_types and stored_types[name] != current_types[name]
+    ]
+
+    stored_length = int(metadata.get("length") or 0)
+    length_drift = abs(len_collection - stored_length) / max(stored_length, 1)
+    schema_drift = (len(added) + len(removed) + len(changed)) / max(
+        len(set(stored_types) | set(current_types)), 1
+    )
+
+    return {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "length_changed": len_collection != stored_length,
+        "drift": max(length_drift, schema_drift),
+    }
+
+
+def stale_fields(diff: dict, properties: dict) -> list[str]:
+    """
+    The fields whose statistics need to be evaluated again, in the order of `properties`.
+    Statistics (groups, ranges) are of the whole collection, so all are stale when the number of objects has changed.
+    """
+    if diff["length_changed"]:
+        return list(properties)
+    return [
+        name for name in properties if name in diff["added"] or name in diff["changed"]
+    ]
+
+
+def stale_mappings(diff: dict, mappings: dict[str, dict]) -> list[str]:
+    """
+    The return types whose mappings need to be defined again.
+    A mapping is stale if it maps to a field that was removed or changed type,
+    or if fields were added and it has an empty field (that one of the new fields may fill).
+    The table mapping is always rebuilt, so is never included.
+    """
+    removed_or_changed = set(diff["removed"]) | set(diff["changed"])
+    stale = []
+    for return_type, mapping in mappings.items():
+        if return_type == "table" or mapping is None:
+            continue
+        values = list(mapping.values())
+        if any(value in removed_or_changed for value in values) or (
+            len(diff["added"]) > 0 and any(value in ["", None] for value in values)
+        ):
+            stale.append(return_type)
+    return stale
@@ -58,6 +58,30 @@ class CollectionSummariserPrompt(dspy.Signature):
     )
 
 
+class FieldDescriptionPrompt(dspy.Signature):
+    """
+    You are an expert data analyst who describes the fields of datasets.
+    Some fields of a dataset are new, or have changed type, since the dataset was last summarised.
+    Your task is to describe the data in each of these fields, in the context of the existing summary of the dataset.
+    """
+
+    collection_summary = dspy.InputField(
+        desc="The existing summary of the dataset.", format=str
+    )
+    data_sample = dspy.InputField(
+        desc="A subset of the data, with only the fields to describe. This will be a list of JSON objects.",
+        format=list[dict],
+    )
+    data_fields = dspy.InputField(
+        desc="The fields to describe and their data types.", format=dict
+    )
+    field_descriptions: dict[str, str] = dspy.OutputField(
+        description="""
+    A dictionary of the field names and a description of the type of data in the field, be descriptive. Around 1-2 sentences per field.
+    The keys of this dictionary MUST be the field names in the data_fields input.
+    """
+    )
+
 class ReturnTypePrompt(dspy.Signature):
     """
     You are an expert at determining the type of data in a collection.
@@ -0,0 +1,182 @@
+"""
+Random samples of the objects of a collection, used when preprocessing it.
+
+Objects are fetched in a few batched requests rather than one request per object:
+
+- If the collection is no larger than the sample, all objects are fetched in one request.
+- Otherwise, the sample is made of `num_windows` windows of consecutive objects in UUID order,
+    each starting after a random UUID (using the cursor API, so there is no offset to scan past).
+    Object UUIDs are random (or hashes of the object), so consecutive objects in UUID order are a random sample of the collection.
+- With `group_by`, the sample is stratified: the number of objects sampled from each group (value of the property)
+    is proportional to the size of the group, with at least one object from each of the `max_groups` largest groups.
+    Objects are taken from windows (as above) of twice the sample size, split by group.
+    Only groups with too few objects in the windows (usually the small ones) are fetched with a filter on the group,
+    from a random offset within the group, so the offsets are short.
+    Smaller groups than the `max_groups` largest are sampled together, only from the windows.
+"""
+
+import asyncio
+import random
+import uuid
+
+from weaviate.classes.aggregate import GroupByAggregate
+from weaviate.classes.query import Filter
+from weaviate.collections import CollectionAsync
+
+from elysia.config import nlp
+
+
+async def _sample_windows(
+    collection: CollectionAsync, sample_size: int, num_windows: int
+) -> list[dict]:
+    num_windows = max(min(num_windows, sample_size), 1)
+    window_sizes = [
+        sample_size // num_windows + (1 if i < sample_size % num_windows else 0)
+        for i in range(num_windows)
+    ]
+
+    responses = await asyncio.gather(
+        *[
+            collection.query.fetch_objects(after=uuid.uuid4(), limit=window_size)
+            for window_size in window_sizes
+        ]
+    )
+
+    objects = {}
+    for response in responses:
+        for obj in response.objects:
+            objects[obj.uuid] = obj.properties
+
+    # windows starting near the end of the UUID range may be short, so fill up from the start
+    if len(objects) < sample_size:
+        response = await collection.query.fetch_objects(limit=sample_size)
+        for obj in response.objects:
+            if len(objects) >= sample_size:
+                break
+            objects.setdefault(obj.uuid, obj.properties)
+
+    sample = list(objects.values())[:sample_size]
+    random.shuffle(sample)
+    return sample
+
+
+def _in_group(value, properties: dict, group_by: str) -> bool:
+    # values of array properties are grouped by each item
+    prop = properties.get(group_by)
+    if isinstance(prop, list):
+        return str(value) in [str(item) for item in prop]
+    return str(value) == str(prop)
+
+
+async def _sample_stratified(
+    collection: CollectionAsync,
+    len_collection: int,
+    sample_size: int,
+    group_by: str,
+    num_windows: int,
+    max_groups: int,
+) -> list[dict]:
+    groups_response = await collection.aggregate.over_all(
+        total_count=True, group_by=GroupByAggregate(prop=group_by, limit=max_groups)
+    )
+    groups = sorted(
+        [
+            (group.grouped_by.value, group.total_count)
+            for group in groups_response.groups
+            if group.total_count > 0
+        ],
+        key=lambda group: group[1],
+        reverse=True,
+    )[:max_groups]
+    if len(groups) == 0:
+        return await _sample_windows(collection, sample_size, num_windows)
+
+    pool = await _sample_windows(
+        collection, min(2 * sample_size, len_collection), num_windows
+    )
+
+    sample = []
+    in_groups = [False] * len(pool)
+    deficits = []
+    for value, count in groups:
+        group_size = min(max(round(sample_size * count / len_collection), 1), count)
+        members = [i for i, obj in enumerate(pool) if _in_group(value, obj, group_by)]
+        for i in members:
+            in_groups[i] = True
+        if len(members) >= group_size:
+            sample.extend(pool[i] for i in members[:group_size])
+        else:
+            # fetched separately in full, so none of its objects are sampled twice
+            deficits.append((value, count, group_size))
+
+    # objects of smaller groups (or with no value), in proportion to the rest of the collection
+    rest_size = round(
+        sample_size * (len_collection - sum(c for _, c in groups)) / len_collection
+    )
+    sample.extend(
+        [obj for i, obj in enumerate(pool) if not in_groups[i]][: max(rest_size, 0)]
+    )
+
+    async def sample_group(value, count: int, size: int) -> list[dict]:
+        response = await collection.query.fetch_objects(
+            filters=Filter.by_property(group_by).equal(value),
+            limit=size,
+            offset=random.randint(0, count - size),
+        )
+        return [obj.properties for obj in response.objects]
+
+    samples = await asyncio.gather(
+        *[sample_group(value, count, size) for value, count, size in deficits]
+    )
+    sample.extend(obj for group_sample in samples for obj in group_sample)
+    random.shuffle(sample)
+    return sample
+
+
+async def sample_objects(
+    collection: CollectionAsync,
+    len_collection: int,
+    sample_size: int,
+    group_by: str | None = None,
+    num_windows: int = 4,
+    max_groups: int = 10,
+) -> list[dict]:
+    """
+    Get a random sample of the objects of a collection, in a random order.
+
+    Args:
+        collection (CollectionAsync): The collection.
+        len_collection (int): The number of objects in the collection.
+        sample_size (int): The number of objects to sample.
+            A stratified sample may have a few more (one from each of the largest groups), but never more than the collection.
+        group_by (str | None): A property to stratify the sample by. Optional, defaults to None (not stratified).
+        num_windows (int): The number of windows (requests) of the sample. Optional, defaults to 4.
+        max_groups (int): The maximum number of groups sampled separately, when stratified (the largest groups).
+            Each needs at most one extra request. Optional, defaults to 10.
+
+    Returns:
+        (list[dict]): The properties of the sampled objects.
+    """
+    if sample_size >= len_collection:
+        response = await collection.query.fetch_objects(limit=len_collection)
+        sample = [obj.properties for obj in response.objects]
+        random.shuffle(sample)
+        return sample
+
+    if group_by is not None:
+        return await _sample_stratified(
+            collection, len_collection, sample_size, group_by, num_windows, max_groups
+        )
+
+    return await _sample_windows(collection, sample_size, num_windows)
+
+
+def _count_tokens(texts: list[str]) -> list[int]:
+    return [len(doc) for doc in nlp.tokenizer.pipe(texts)]
+
+
+async def estimate_token_counts(objects: list[dict]) -> list[int]:
+    """
+    Count the tokens of each object (as a string), in a worker thread so the event loop is not blocked.
+    """
+    return await asyncio.to_thread(_count_tokens, [str(obj) for obj in objects])
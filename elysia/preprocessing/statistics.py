@@ -0,0 +1,192 @@
+"""
+Statistics of the fields of a collection, used when preprocessing it.
+
+All fields are evaluated at once, limited to `max_concurrency` Weaviate requests at a time:
+
+- each field (other than objects) has its own group-by request, to find its groups (unique values),
+- the metrics of all fields of the same type (e.g. the minimum, maximum and mean of all `int` fields) are merged into a single request,
+- the lengths (in tokens) of text fields are found from the sample objects in a worker thread, so the event loop is not blocked.
+"""
+
+import asyncio
+from typing import AsyncGenerator, Callable
+
+from weaviate.classes.aggregate import GroupByAggregate
+from weaviate.classes.query import Metrics
+from weaviate.collections import CollectionAsync
+
+from elysia.config import nlp
+
+# the metrics requested for each type of field, which are merged into one request per type
+FIELD_METRICS: dict[str, Callable] = {
+    "int": lambda prop: Metrics(prop).integer(mean=True, maximum=True, minimum=True),
+    "number": lambda prop: Metrics(prop).number(mean=True, maximum=True, minimum=True),
+    "boolean": lambda prop: Metrics(prop).boolean(percentage_true=True),
+    "date": lambda prop: Metrics(prop).date_(median=True, minimum=True, maximum=True),
+}
+
+
+def _groups(groups_response, len_collection: int) -> list[dict] | None:
+    if len(groups_response.groups) > 15:
+        groups = [
+            {
+                "value": str(
+                    group.grouped_by.value
+                ),  # must force to string for weaviate
+                "count": group.total_count,
+            }
+            for group in groups_response.groups
+            if group.total_count > 1
+        ]
+    else:
+        groups = [
+            {
+                "value": str(group.grouped_by.value),
+                "count": group.total_count,
+            }
+            for group in groups_response.groups
+        ]
+
+    total_count = sum(group["count"] for group in groups)
+    remainder = len_collection - total_count
+    group_coverage = total_count / len_collection
+    if remainder > 0:
+        groups.append(
+            {
+                "value": "<undefined_group> (not used for filtering)",
+                "count": remainder,
+            }
+        )
+
+    # check if groups are useful
+    if len(groups) == 1 or group_coverage < 0.5:
+        return None
+    return groups
+
+
+def _text_lengths(properties: dict, sample_objects: list[dict]) -> dict[str, list[int]]:
+    # only the number of tokens is needed, so only the tokenizer is run (not the whole pipeline)
+    lengths = {}
+    for property, data_type in properties.items():
+        if data_type != "text":
+            continue
+        texts = [
+            obj[property]
+            for obj in sample_objects
+            if property in obj and isinstance(obj[property], str)
+        ]
+        lengths[property] = [len(doc) for doc in nlp.tokenizer.pipe(texts)]
+    return lengths
+
+
+def _range_and_mean(lengths: list[int]) -> tuple[list | None, float | None]:
+    if len(lengths) == 0:
+        return None, None
+    return [min(lengths), max(lengths)], sum(lengths) / len(lengths)
+
+
+async def evaluate_field_statistics(
+    collection: CollectionAsync,
+    properties: dict,
+    len_collection: int,
+    sample_objects: list[dict],
+    max_concurrency: int = 8,
+) -> AsyncGenerator[dict, None]:
+    """
+    Evaluate the statistics of all fields of a collection at once.
+
+    Args:
+        collection (CollectionAsync): The collection.
+        properties (dict): The data types of the fields, keyed by field name (see `async_get_collection_data_types`).
+        len_collection (int): The number of objects in the collection.
+        sample_objects (list[dict]): Objects from the collection, used for the lengths of text and list fields.
+        max_concurrency (int): The maximum number of Weaviate requests made at once.
+
+    Yields:
+        (dict): The statistics of each field, in the order they are evaluated (not the order of `properties`).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def limited(request: Callable):
+        async with semaphore:
+            return await request()
+
+    metrics: dict[str, asyncio.Future] = {}
+    for data_type, metric in FIELD_METRICS.items():
+        return_metrics = [
+            metric(prop) for prop in properties if properties[prop] == data_type
+        ]
+        if return_metrics:
+            metrics[data_type] = asyncio.ensure_future(
+                limited(
+                    lambda return_metrics=return_metrics: collection.aggregate.over_all(
+                        return_metrics=return_metrics
+                    )
+                )
+            )
+
+    text_lengths = asyncio.ensure_future(
+        asyncio.to_thread(_text_lengths, properties, sample_objects)
+    )
+
+    async def evaluate(property: str) -> dict:
+        data_type = properties[property]
+        out = {
+            "type": data_type if data_type != "number" else "float",
+            "name": property,
+            "range": None,
+            "mean": None,
+            "date_range": None,
+            "date_median": None,
+            "groups": None,
+        }
+
+        if not out["type"].startswith("object"):
+            groups_response = await limited(
+                lambda: collection.aggregate.over_all(
+                    total_count=True, group_by=GroupByAggregate(prop=property, limit=30)
+                )
+            )
+            out["groups"] = _groups(groups_response, len_collection)
+
+        # Number (summary statistics)
+        if data_type in ["int", "number"]:
+            response = (await metrics[data_type]).properties[property]
+            out["range"] = [response.minimum, response.maximum]
+            out["mean"] = response.mean
+
+        # Text (lengths)
+        elif data_type == "text":
+            out["range"], out["mean"] = _range_and_mean((await text_lengths)[property])
+
+        # Boolean (grouping + mean)
+        elif data_type == "boolean":
+            response = (await metrics[data_type]).properties[property]
+            out["mean"] = response.percentage_true
+            out["range"] = [0, 1]
+
+        # Date (summary statistics)
+        elif data_type == "date":
+            response = (await metrics[data_type]).properties[property]
+            out["date_range"] = [response.minimum, response.maximum]
+            out["date_median"] = response.median
+
+        # List (lengths)
+        elif data_type.endswith("[]"):
+            out["range"], out["mean"] = _range_and_mean(
+                [
+                    len(obj[property])
+                    for obj in sample_objects
+                    if isinstance(obj.get(property), list)
+                ]
+            )
+
+        return out
+
+    tasks = [asyncio.ensure_future(evaluate(property)) for property in properties]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in [*tasks, *metrics.values(), text_lengths]:
+            task.cancel()
@@ -1,11 +1,36 @@
+import json
+import asyncio
 import dspy
 
 from logging import Logger
 
-from elysia.objects import Status, Tool
+from elysia.objects import Retrieval, Status, Tool
 from elysia.tools.postprocessing.prompt_templates import ObjectSummaryPrompt
 from elysia.tree.objects import TreeData
 from elysia.util.client import ClientManager
+from elysia.util.parsing import estimate_tokens
+
+
+def shard_objects(objects: list[dict], max_tokens: int) -> list[list[dict]]:
+    """
+    Split objects into consecutive batches whose (estimated) number of tokens is at most `max_tokens`.
+    An object larger than `max_tokens` is put in a batch on its own.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for obj in objects:
+        num_tokens = estimate_tokens(len(json.dumps(obj, default=str)))
+        if batch and batch_tokens + num_tokens > max_tokens:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(obj)
+        batch_tokens += num_tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
 
 
 class SummariseItems(Tool):
@@ -19,6 +44,45 @@ class SummariseItems(Tool):
             status="",
             end=False,
         )
+        self.logger = logger
+        self.object_summariser = dspy.ChainOfThought(ObjectSummaryPrompt)
+
+    async def _summarise_batch(
+        self,
+        objects: list[dict],
+        lm: dspy.LM,
+        semaphore: asyncio.Semaphore,
+        retry: bool = True,
+    ) -> list[str]:
+        async with semaphore:
+            prediction = await self.object_summariser.aforward(objects=objects, lm=lm)
+
+        # keep the summaries aligned with the objects, even if the LM returned the wrong number
+        summaries = list(prediction.summaries)[: len(objects)]
+        missing = objects[len(summaries) :]
+        if len(missing) == 0:
+            return summaries
+
+        # the objects without a summary are summarised again on their own once, then left empty
+        if retry:
+            return summaries + await self._summarise_batch(
+                missing, lm, semaphore, retry=False
+            )
+        if self.logger:
+            self.logger.warning(
+                f"No summaries were returned for {len(missing)} of {len(objects)} objects, "
+                "leaving their summaries empty."
+            )
+        return summaries + [""] * len(missing)
+
+    async def _summarise_retrieval(
+        self, retrieval: Retrieval, batch_tasks: list[asyncio.Task]
+    ) -> Retrieval:
+        batch_summaries = await asyncio.gather(*batch_tasks)
+        retrieval.add_summaries(
+            [summary for summaries in batch_summaries for summary in summaries]
+        )
+        return retrieval
 
     async def __call__(
         self,
@@ -37,19 +101,45 @@ class SummariseItems(Tool):
                 "items_to_summarise"
             ]
 
-            for obj in objects_list:
-                object_summariser = dspy.ChainOfThought(ObjectSummaryPrompt)
-                yield Status(
-                    f"Summarising {len(obj.objects)} objects from {obj.metadata['collection_name']}..."
-                )
+            yield Status(
+                f"Summarising {sum(len(obj.objects) for obj in objects_list)} objects from "
+                f"{', '.join(dict.fromkeys(obj.metadata['collection_name'] for obj in objects_list))}..."
+            )
 
-                summariser = await object_summariser.aforward(
-                    objects=obj.to_json(), lm=base_lm
-                )
+            batches = [
+                shard_objects(obj.to_json(), tree_data.settings.SUMMARISE_BATCH_TOKENS)
+                for obj in objects_list
+            ]
+
+            # batches of all retrievals share the same limit on concurrent LM calls,
+            # and are started round-robin so small retrievals are not stuck behind large ones
+            semaphore = asyncio.Semaphore(tree_data.settings.SUMMARISE_MAX_CONCURRENCY)
+            batch_tasks = [[] for _ in objects_list]
+            for j in range(max([len(b) for b in batches], default=0)):
+                for i, retrieval_batches in enumerate(batches):
+                    if j < len(retrieval_batches):
+                        batch_tasks[i].append(
+                            asyncio.create_task(
+                                self._summarise_batch(
+                                    retrieval_batches[j], base_lm, semaphore
+                                )
+                            )
+                        )
 
-                obj.add_summaries(summariser.summaries)
+            tasks = [
+                asyncio.create_task(self._summarise_retrieval(obj, retrieval_tasks))
+                for obj, retrieval_tasks in zip(objects_list, batch_tasks)
+            ]
 
-                yield obj
+            # yield each retrieval as soon as all of its objects are summarised
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                for task in tasks + [
+                    t for retrieval_tasks in batch_tasks for t in retrieval_tasks
+                ]:
+                    task.cancel()
 
             # remove items from hidden environment
             tree_data.environment.hidden_environment.pop("items_to_summarise")
@@ -21,6 +21,7 @@ from elysia.tools.retrieval.util import (
 )
 from elysia.tree.objects import TreeData
 from elysia.util.client import ClientManager
+from elysia.util.query_cache import get_query_cache
 from elysia.util.objects import TrainingUpdate, FewShotExamples
 from elysia.util.parsing import format_aggregation_response
 
@@ -250,20 +251,29 @@ class Aggregate(Tool):
             # Execute query within Weaviate
             async with client_manager.connect_to_async_client() as client:
                 try:
-                    responses, code_strings = await execute_weaviate_aggregation(
-                        client,
-                        aggregation_output,
-                        property_types={
-                            collection_name: {
-                                schemas[collection_name]["fields"][i]["name"]: schemas[
-                                    collection_name
-                                ]["fields"][i]["type"]
-                                for i in range(len(schemas[collection_name]["fields"]))
-                            }
-                            for collection_name in collection_names
-                        },
-                        vectorised_by_collection=vectorised_by_collection,
-                        schema=schemas,
+                    responses, code_strings, collection_metadata = (
+                        await execute_weaviate_aggregation(
+                            client,
+                            aggregation_output,
+                            property_types={
+                                collection_name: {
+                                    schemas[collection_name]["fields"][i][
+                                        "name"
+                                    ]: schemas[collection_name]["fields"][i]["type"]
+                                    for i in range(
+                                        len(schemas[collection_name]["fields"])
+                                    )
+                                }
+                                for collection_name in collection_names
+                            },
+                            vectorised_by_collection=vectorised_by_collection,
+                            schema=schemas,
+                            max_concurrency=tree_data.settings.QUERY_MAX_CONCURRENCY,
+                            timeout=tree_data.settings.QUERY_TIMEOUT,
+                            query_cache=get_query_cache(
+                                tree_data.settings, client_manager
+                            ),
+                        )
                     )
                 except QueryError as e:
                     yield Error(feedback=str(e))
@@ -284,6 +294,25 @@ class Aggregate(Tool):
             for k, (collection_name, response) in enumerate(
                 zip(aggregation_output.target_collections, responses)
             ):
+                if self.logger:
+                    self.logger.debug(
+                        f"Aggregation on {collection_name} took "
+                        f"{collection_metadata[k]['query_time_seconds']:.3f} seconds"
+                        + (" (cached)" if collection_metadata[k]["cached"] else "")
+                    )
+
+                # The aggregation failed on this collection only, the others can still be used
+                if isinstance(response, QueryError):
+                    yield Error(feedback=str(response))
+                    continue
+                elif isinstance(response, Exception):
+                    if self.logger:
+                        self.logger.error(
+                            f"Error executing aggregation for {collection_name}: {str(response)}"
+                        )
+                    yield Error(error_message=str(response))
+                    continue
+
                 if self.logger and self.logger.level <= 20:
                     print(
                         Panel.fit(
@@ -309,6 +338,8 @@ class Aggregate(Tool):
                 metadata = {
                     "collection_name": collection_name,
                     "aggregation_output": aggregation_output.model_dump(),
+                    "query_time_seconds": collection_metadata[k]["query_time_seconds"],
+                    "cached": collection_metadata[k]["cached"],
                     "code": {
                         "language": "python",
                         "title": "Aggregation",
@@ -1,6 +1,13 @@
+import os
 import asyncio
 import inspect
+import multiprocessing
 import spacy
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncGenerator, Iterator
+from spacy.language import Language
+from spacy.tokens import Doc
 
 from weaviate.classes.config import Configure, DataType, Property, ReferenceProperty
 from weaviate.collections.classes.data import DataObject, DataReference
@@ -11,7 +18,9 @@ from weaviate.exceptions import WeaviateInvalidInputError
 from weaviate.util import generate_uuid5
 from weaviate.client import WeaviateAsyncClient
 
+from elysia.util.batch_writer import BatchWriter
 from elysia.util.client import ClientManager
+from elysia.util.query_cache import invalidate_query_cache
 from elysia.util.collection import (
     async_get_collection_weaviate_data_types,
 )
@@ -36,6 +45,22 @@ def delete_chunked_collection(
     with client_manager.connect_to_client() as client:
         client.collections.delete(f"ELYSIA_CHUNKED_{collection_name.lower()}__")
 
+    invalidate_query_cache(
+        client_manager.wcd_url, f"ELYSIA_CHUNKED_{collection_name.lower()}__"
+    )
+
+
+def load_chunking_pipeline(chunking_strategy: str) -> Language:
+    """
+    Load a spaCy pipeline with only the components needed for the chunking strategy.
+    Sentence chunking only needs the rule-based sentencizer and token chunking only needs the tokenizer,
+    so the full `en_core_web_sm` pipeline (tagger, parser, NER, etc.) is not loaded.
+    """
+    nlp = spacy.blank("en")
+    if chunking_strategy == "sentences":
+        nlp.add_pipe("sentencizer")
+    return nlp
+
 
 class Chunker:
     def __init__(
@@ -47,23 +72,25 @@ class Chunker:
         self.chunking_strategy = chunking_strategy
         assert chunking_strategy in ["fixed", "sentences"]
 
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = load_chunking_pipeline(chunking_strategy)
 
         self.num_tokens = num_tokens
         self.num_sentences = num_sentences
 
     def count_tokens(self, document: str) -> int:
-        return len(self.nlp(document))
+        return len(self.nlp.make_doc(document))
 
     def chunk_by_sentences(
         self,
         document: str,
         num_sentences: int | None = None,
         overlap_sentences: int = 1,
+        doc: Doc | None = None,
     ) -> tuple[list[str], list[tuple[int, int]]]:
         """
         Given a document (string), return the sentences as chunks and span annotations (start and end indices of chunks).
         Using spaCy to do sentence chunking.
+        If the document has already been processed by the pipeline, its `doc` can be given to skip processing it again.
         """
         if num_sentences is None:
             num_sentences = self.num_sentences
@@ -74,7 +101,8 @@ class Chunker:
             )
             overlap_sentences = num_sentences - 1
 
-        doc = self.nlp(document)
+        if doc is None:
+            doc = self.nlp(document)
         sentences = list(doc.sents)  # Get sentence boundaries from spaCy
 
         span_annotations = []
@@ -101,17 +129,23 @@ class Chunker:
         return chunks, span_annotations
 
     def chunk_by_tokens(
-        self, document: str, num_tokens: int | None = None, overlap_tokens: int = 32
+        self,
+        document: str,
+        num_tokens: int | None = None,
+        overlap_tokens: int = 32,
+        doc: Doc | None = None,
     ) -> tuple[list[str], list[tuple[int, int]]]:
         """
         Given a document (string), return the tokens as chunks and span annotations (start and end indices of chunks).
         Includes overlapping tokens between chunks for better context preservation.
         Uses spaCy for tokenization.
+        If the document has already been processed by the pipeline, its `doc` can be given to skip processing it again.
         """
         if num_tokens is None:
             num_tokens = self.num_tokens
 
-        doc = self.nlp(document)
+        if doc is None:
+            doc = self.nlp(document)
         tokens = list(doc)  # Get tokens from spaCy doc
 
         span_annotations = []
@@ -136,19 +170,101 @@ class Chunker:
 
         return chunks, span_annotations
 
-    def chunk(self, document: str) -> tuple[list[str], list[tuple[int, int]]]:
+    def chunk(
+        self, document: str, doc: Doc | None = None
+    ) -> tuple[list[str], list[tuple[int, int]]]:
         if self.chunking_strategy == "sentences":
-            return self.chunk_by_sentences(document)
+            return self.chunk_by_sentences(document, doc=doc)
         elif self.chunking_strategy == "tokens":
-            return self.chunk_by_tokens(document)
+            return self.chunk_by_tokens(document, doc=doc)
         else:
             raise ValueError(f"Invalid chunking strategy: {self.chunking_strategy}")
 
+    def chunk_many(
+        self, documents: list[str], batch_size: int = 32
+    ) -> Iterator[tuple[list[str], list[tuple[int, int]]]]:
+        """
+        Chunk a list of documents, processing them in batches with `nlp.pipe`.
+        Yields the chunks and span annotations of each document in order.
+        """
+        for document, doc in zip(
+            documents, self.nlp.pipe(documents, batch_size=batch_size)
+        ):
+            yield self.chunk(document, doc=doc)
+
+
+# Chunkers are created once per worker process, and re-used for all batches with the same configuration
+_process_chunkers: dict[tuple[str, int, int], Chunker] = {}
+_chunking_pool: ProcessPoolExecutor | None = None
+
+
+def _chunk_documents(
+    chunker_config: tuple[str, int, int], documents: list[str]
+) -> list[tuple[list[str], list[tuple[int, int]]]]:
+    """
+    Chunk a batch of documents in a worker process.
+    """
+    if chunker_config not in _process_chunkers:
+        _process_chunkers[chunker_config] = Chunker(*chunker_config)
+    return list(_process_chunkers[chunker_config].chunk_many(documents))
+
+
+def get_chunking_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool used for chunking, creating it if it does not exist.
+    Processes are spawned (not forked), so they are safe to create from a running event loop with other threads.
+    Spawning re-imports the `__main__` module in each process, so the pool is only used when chunking with processes is enabled
+    (see `chunk_with_processes` in `Settings`).
+    The number of processes can be set with the `CHUNKING_PROCESSES` environment variable.
+    """
+    global _chunking_pool
+    if _chunking_pool is None:
+        _chunking_pool = ProcessPoolExecutor(
+            max_workers=int(
+                os.getenv("CHUNKING_PROCESSES", min(4, os.cpu_count() or 1))
+            ),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _chunking_pool
+
+
+def _discard_chunking_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Shut down a broken chunking pool, so its processes are not leaked, and remove it (if not already replaced).
+    """
+    global _chunking_pool
+    pool.shutdown(wait=False, cancel_futures=True)
+    if _chunking_pool is pool:
+        _chunking_pool = None
+
 
 class AsyncCollectionChunker:
-    def __init__(self, collection_name: str):
+    def __init__(
+        self,
+        collection_name: str,
+        batch_size: int = 32,
+        min_characters_for_processes: int = 100_000,
+        batch_writer: BatchWriter | None = None,
+        use_processes: bool = False,
+    ):
+        """
+        Args:
+            collection_name (str): The name of the collection to chunk.
+            batch_size (int): The number of objects chunked together in a worker process.
+                Chunks are inserted into the chunked collection as soon as each batch is completed.
+            min_characters_for_processes (int): The minimum total number of characters of the objects to chunk them in the process pool,
+                if `use_processes` is True. Smaller amounts are chunked in a thread, which avoids the cost of starting the worker processes.
+            batch_writer (BatchWriter | None): The writer used to insert the chunks and references.
+                Defaults to a `BatchWriter` with default settings.
+            use_processes (bool): Whether large amounts of text are chunked in the process pool (see `get_chunking_pool`).
+                Defaults to False, chunking in a thread.
+        """
         self.collection_name = collection_name
         self.chunker = Chunker("sentences", num_sentences=5)
+        self.batch_size = batch_size
+        self.min_characters_for_processes = min_characters_for_processes
+        self.use_processes = use_processes
+        self.batch_writer = batch_writer if batch_writer is not None else BatchWriter()
 
     async def create_chunked_reference(
         self, content_field: str, client_manager: ClientManager
@@ -298,30 +414,100 @@ class AsyncCollectionChunker:
         self, object: Object, content_field: str
     ) -> tuple[list[str], list[tuple[int, int]], list[str]]:
         content_field_value: str = object.properties[content_field]
-        chunks, spans = self.chunker.chunk(content_field_value)
+        chunks, spans = await asyncio.to_thread(self.chunker.chunk, content_field_value)
         chunk_uuids = self.generate_uuids(chunks, spans, content_field)
         return chunks, spans, chunk_uuids
 
-    async def chunk_objects_parallel(
+    async def _chunk_documents(
+        self, documents: list[str], use_processes: bool
+    ) -> list[tuple[list[str], list[tuple[int, int]]]]:
+        chunker_config = (
+            self.chunker.chunking_strategy,
+            self.chunker.num_tokens,
+            self.chunker.num_sentences,
+        )
+        if use_processes:
+            pool = get_chunking_pool()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    pool, _chunk_documents, chunker_config, documents
+                )
+            except (BrokenProcessPool, OSError, NotImplementedError):
+                # processes are not available (or a worker died), fall back to a thread
+                _discard_chunking_pool(pool)
+
+        # chunk in a thread so the event loop is not blocked
+        return await asyncio.to_thread(lambda: list(self.chunker.chunk_many(documents)))
+
+    async def chunk_objects_stream(
         self,
         unchunked_objects: list[Object],
         unchunked_uuids: list[str],
         content_field: str,
-    ) -> tuple[dict, dict, dict]:
+    ) -> AsyncGenerator[tuple[dict, dict, dict], None]:
+        """
+        Chunk the objects in batches of `batch_size` in a thread
+        (or in the chunking process pool, if `use_processes` is set and there are at least `min_characters_for_processes` characters in total).
+        Yields the chunks, spans and chunk UUIDs (each a dictionary keyed by the original object's UUID)
+        of each batch as soon as it is completed, not necessarily in order.
+        """
+
+        documents = [obj.properties[content_field] for obj in unchunked_objects]
+        use_processes = (
+            self.use_processes
+            and sum(len(document) for document in documents)
+            >= self.min_characters_for_processes
+        )
+
+        async def chunk_batch(
+            uuids: list[str], documents: list[str]
+        ) -> tuple[list[str], list[tuple[list[str], list[tuple[int, int]]]]]:
+            return uuids, await self._chunk_documents(documents, use_processes)
+
         tasks = [
-            self.chunk_single_object(obj, content_field) for obj in unchunked_objects
+            chunk_batch(
+                unchunked_uuids[i : i + self.batch_size],
+                documents[i : i + self.batch_size],
+            )
+            for i in range(0, len(documents), self.batch_size)
         ]
 
-        results = await asyncio.gather(*tasks)
+        for task in asyncio.as_completed(tasks):
+            uuids, results = await task
+
+            original_uuid_to_chunks = {}
+            original_uuid_to_spans = {}
+            original_uuid_to_chunk_uuids = {}
 
+            for uuid, (chunks, spans) in zip(uuids, results):
+                original_uuid_to_chunks[uuid] = chunks
+                original_uuid_to_spans[uuid] = spans
+                original_uuid_to_chunk_uuids[uuid] = self.generate_uuids(
+                    chunks, spans, content_field
+                )
+
+            yield (
+                original_uuid_to_chunks,
+                original_uuid_to_spans,
+                original_uuid_to_chunk_uuids,
+            )
+
+    async def chunk_objects_parallel(
+        self,
+        unchunked_objects: list[Object],
+        unchunked_uuids: list[str],
+        content_field: str,
+    ) -> tuple[dict, dict, dict]:
         original_uuid_to_chunks = {}
         original_uuid_to_spans = {}
         original_uuid_to_chunk_uuids = {}
 
-        for uuid, (chunks, spans, chunk_uuids) in zip(unchunked_uuids, results):
-            original_uuid_to_chunks[uuid] = chunks
-            original_uuid_to_spans[uuid] = spans
-            original_uuid_to_chunk_uuids[uuid] = chunk_uuids
+        async for chunks, spans, chunk_uuids in self.chunk_objects_stream(
+            unchunked_objects, unchunked_uuids, content_field
+        ):
+            original_uuid_to_chunks.update(chunks)
+            original_uuid_to_spans.update(spans)
+            original_uuid_to_chunk_uuids.update(chunk_uuids)
 
         return (
             original_uuid_to_chunks,
@@ -336,7 +522,7 @@ class AsyncCollectionChunker:
         original_uuid_to_spans: dict,
         original_uuid_to_chunk_uuids: dict,
         content_field: str,
-    ) -> None:
+    ) -> dict:
         data_objects = []
         for original_uuid in original_uuid_to_chunks:
             for i, (chunk, span, uuid) in enumerate(
@@ -354,24 +540,13 @@ class AsyncCollectionChunker:
                     )
                 )
 
-        batch_size = 15
-        data_objects_batches = [
-            data_objects[i : i + batch_size]
-            for i in range(0, len(data_objects), batch_size)
-        ]
-
-        tasks = [
-            chunked_collection.data.insert_many(data_objects)
-            for data_objects in data_objects_batches
-        ]
-
-        await asyncio.gather(*tasks)
+        return await self.batch_writer.insert_objects(chunked_collection, data_objects)
 
     async def insert_references(
         self,
         full_collection: CollectionAsync,
         original_uuid_to_chunk_uuids: dict,
-    ) -> None:
+    ) -> dict:
         references = []
         for original_uuid in original_uuid_to_chunk_uuids:
             for chunk_uuid in original_uuid_to_chunk_uuids[original_uuid]:
@@ -383,18 +558,7 @@ class AsyncCollectionChunker:
                     )
                 )
 
-        batch_size = 15
-        references_batches = [
-            references[i : i + batch_size]
-            for i in range(0, len(references), batch_size)
-        ]
-
-        tasks = [
-            full_collection.data.reference_add_many(references)
-            for references in references_batches
-        ]
-
-        await asyncio.gather(*tasks)
+        return await self.batch_writer.add_references(full_collection, references)
 
     def get_chunked_objects(self, objects: list[Object]) -> list[str]:
         """
@@ -451,22 +615,27 @@ class AsyncCollectionChunker:
                 )
                 full_collection = client.collections.get(self.collection_name)
 
-                (
+                # insert into weaviate as each batch of objects is chunked
+                async for (
                     original_uuid_to_chunks,
                     original_uuid_to_spans,
                     original_uuid_to_chunk_uuids,
-                ) = await self.chunk_objects_parallel(
+                ) in self.chunk_objects_stream(
                     unchunked_objects, unchunked_uuids, content_field
-                )
+                ):
+                    await self.insert_chunks(
+                        chunked_collection,
+                        original_uuid_to_chunks,
+                        original_uuid_to_spans,
+                        original_uuid_to_chunk_uuids,
+                        content_field,
+                    )
+                    await self.insert_references(
+                        full_collection, original_uuid_to_chunk_uuids
+                    )
 
-                # insert into weaviate
-                await self.insert_chunks(
-                    chunked_collection,
-                    original_uuid_to_chunks,
-                    original_uuid_to_spans,
-                    original_uuid_to_chunk_uuids,
-                    content_field,
-                )
-                await self.insert_references(
-                    full_collection, original_uuid_to_chunk_uuids
-                )
+            # cached results of both collections are now out of date
+            invalidate_query_cache(client_manager.wcd_url, self.collection_name)
+            invalidate_query_cache(
+                client_manager.wcd_url, self.get_chunked_collection_name()
+            )
@@ -27,6 +27,7 @@ from elysia.tools.retrieval.util import (
 )
 from elysia.tree.objects import TreeData
 from elysia.util.client import ClientManager
+from elysia.util.query_cache import get_query_cache
 from elysia.util.objects import TrainingUpdate, TreeUpdate, FewShotExamples
 from elysia.util.return_types import all_return_types
 
@@ -459,7 +460,10 @@ class Query(Tool):
                         self.logger.debug(f"Chunking {collection_name}")
 
                     # set up chunking (create reference in this collection)
-                    collection_chunker = AsyncCollectionChunker(collection_name)
+                    collection_chunker = AsyncCollectionChunker(
+                        collection_name,
+                        use_processes=tree_data.settings.CHUNK_WITH_PROCESSES,
+                    )
                     await collection_chunker.create_chunked_reference(
                         content_field, client_manager
                     )
@@ -476,7 +480,7 @@ class Query(Tool):
                     # run this augmented query for the unchunked collection
                     async with client_manager.connect_to_async_client() as client:
                         try:
-                            unchunked_response, _ = await execute_weaviate_query(
+                            unchunked_response, _, _ = await execute_weaviate_query(
                                 client,
                                 query_output_copy,
                                 reference_property="isChunked",
@@ -486,6 +490,8 @@ class Query(Tool):
                                     for field in schemas[collection_name]["fields"]
                                 },
                                 schema=schemas,
+                                max_concurrency=tree_data.settings.QUERY_MAX_CONCURRENCY,
+                                timeout=tree_data.settings.QUERY_TIMEOUT,
                             )
                         except QueryError as e:
                             yield Error(feedback=str(e))
@@ -520,18 +526,25 @@ class Query(Tool):
             # Execute query within Weaviate
             async with client_manager.connect_to_async_client() as client:
                 try:
-                    responses, code_strings = await execute_weaviate_query(
-                        client,
-                        query_output,
-                        named_vector_fields=query.fields_to_search,
-                        property_types={
-                            collection_name: {
-                                field["name"]: field["type"]
-                                for field in schemas[collection_name]["fields"]
-                            }
-                            for collection_name in collection_names
-                        },
-                        schema=schemas,
+                    responses, code_strings, collection_metadata = (
+                        await execute_weaviate_query(
+                            client,
+                            query_output,
+                            named_vector_fields=query.fields_to_search,
+                            property_types={
+                                collection_name: {
+                                    field["name"]: field["type"]
+                                    for field in schemas[collection_name]["fields"]
+                                }
+                                for collection_name in collection_names
+                            },
+                            schema=schemas,
+                            max_concurrency=tree_data.settings.QUERY_MAX_CONCURRENCY,
+                            timeout=tree_data.settings.QUERY_TIMEOUT,
+                            query_cache=get_query_cache(
+                                tree_data.settings, client_manager
+                            ),
+                        )
                     )
                 except QueryError as e:
                     yield Error(feedback=str(e))
@@ -542,12 +555,27 @@ class Query(Tool):
                     continue
 
                 yield Status(
-                    f"Retrieved {sum(len(x.objects) for x in responses)} objects from {len(collection_names)} collections..."
+                    f"Retrieved {sum(len(x.objects) for x in responses if not isinstance(x, Exception))} objects from {len(collection_names)} collections..."
                 )
 
             for k, (collection_name, response) in enumerate(
                 zip(collection_names, responses)
             ):
+                if self.logger:
+                    self.logger.debug(
+                        f"Query on {collection_name} took "
+                        f"{collection_metadata[k]['query_time_seconds']:.3f} seconds"
+                        + (" (cached)" if collection_metadata[k]["cached"] else "")
+                    )
+
+                # The query failed on this collection only, the others can still be used
+                if isinstance(response, QueryError):
+                    yield Error(feedback=str(response))
+                    continue
+                elif isinstance(response, Exception):
+                    yield Error(error_message=str(response))
+                    continue
+
                 if self.logger and self.logger.level <= 20:
                     print(
                         Panel.fit(
@@ -585,6 +613,8 @@ class Query(Tool):
                         schemas[collection_name],
                     ),
                     "query_output": query_output_formatted,
+                    "query_time_seconds": collection_metadata[k]["query_time_seconds"],
+                    "cached": collection_metadata[k]["cached"],
                     "code": {
                         "language": "python",
                         "title": "Query",
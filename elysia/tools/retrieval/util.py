@@ -1,5 +1,7 @@
+import asyncio
+import time
 from datetime import timezone
-from typing import Any, List, Literal, Optional, Union
+from typing import Any, Awaitable, Callable, List, Literal, Optional, Union
 from typing_extensions import TypeAlias
 from typing import get_args, get_origin
 
@@ -19,6 +21,8 @@ from weaviate.exceptions import (
     AuthenticationFailedError,
 )
 
+from elysia.util.query_cache import QueryCache
+
 # == Define Pydantic models for structured outputs of LLMs
 
 
@@ -456,6 +460,74 @@ def _catch_weaviate_errors(e: WeaviateBaseError):
         raise e
 
 
+async def _run_per_collection(
+    collection_names: list[str],
+    run: Callable[[str], Awaitable[Any]],
+    max_concurrency: int,
+    timeout: float | None,
+    query_cache: QueryCache | None = None,
+    cache_kind: str = "query",
+    cache_args: dict[str, dict] | None = None,
+) -> tuple[list[Any], list[dict]]:
+    """
+    Run `run(collection_name)` for all collections concurrently, with at most `max_concurrency` running at once.
+    Each collection has its own `timeout`, and errors are returned in place of the response instead of being raised,
+    so a single slow or failing collection does not stop the others.
+    If every collection fails, the first error is raised.
+
+    If a `query_cache` is given, responses are looked up by `cache_kind`, the collection name and the arguments
+    for that collection in `cache_args` (all arguments that change its response), and successful responses are added to the cache. Cached responses are marked with `cached` in the metadata.
+
+    Returns:
+        (tuple[list[Any], list[dict]]): The responses (or errors) and the metadata for each collection, in order of `collection_names`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(collection_name: str) -> tuple[Any, dict]:
+        if query_cache is not None:
+            key = query_cache.get_key(
+                cache_kind, collection_name, (cache_args or {}).get(collection_name, {})
+            )
+            response = query_cache.get(key)
+            if response is not None:
+                return response, {"query_time_seconds": 0.0, "cached": True}
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(run(collection_name), timeout)
+            except asyncio.TimeoutError:
+                response = QueryError(
+                    f"The query on the collection '{collection_name}' timed out after {timeout} seconds."
+                )
+            except WeaviateBaseError as e:
+                try:
+                    _catch_weaviate_errors(e)
+                except Exception as caught:
+                    response = caught
+            except Exception as e:
+                response = e
+
+        if query_cache is not None and not isinstance(response, Exception):
+            query_cache.set(key, collection_name, response)
+
+        return response, {
+            "query_time_seconds": time.perf_counter() - start,
+            "cached": False,
+        }
+
+    results = await asyncio.gather(
+        *[run_one(collection_name) for collection_name in collection_names]
+    )
+    responses = [response for response, _ in results]
+    collection_metadata = [metadata for _, metadata in results]
+
+    if len(responses) > 0 and all(isinstance(r, Exception) for r in responses):
+        raise responses[0]
+
+    return responses, collection_metadata
+
+
 async def execute_weaviate_query(
     weaviate_client: weaviate.WeaviateAsyncClient,
     predicted_query: QueryOutput,
@@ -463,8 +535,21 @@ async def execute_weaviate_query(
     reference_property: str | None = None,
     named_vector_fields: dict[str, list[str]] | None = None,
     schema: dict | None = None,
-) -> tuple[list[QueryReturn], list[str]]:
-    """Execute from a QueryOutput and return response."""
+    max_concurrency: int = 8,
+    timeout: float | None = 60,
+    query_cache: QueryCache | None = None,
+) -> tuple[list[QueryReturn | Exception], list[str], list[dict]]:
+    """
+    Execute from a QueryOutput and return response.
+    The query is run on each of the target collections concurrently (at most `max_concurrency` at once),
+    with a separate `timeout` (in seconds) for each collection.
+    If a `query_cache` is given, identical queries on a collection re-use the cached response.
+
+    Returns:
+        (tuple): The responses, the code strings and the metadata (e.g. `query_time_seconds`, `cached`) for each collection.
+            If the query failed on a collection, its response is the exception instead.
+            If the query failed on all collections, the exception is raised.
+    """
 
     # Convert WeaviateQuery to tool args format
     tool_args: dict[str, Any] = {
@@ -503,22 +588,25 @@ async def execute_weaviate_query(
     _catch_typing_errors(tool_args, property_types, schema)
 
     try:
-        final_responses, str_responses = await _handle_search(
-            weaviate_client, tool_args
+        final_responses, str_responses, collection_metadata = await _handle_search(
+            weaviate_client, tool_args, max_concurrency, timeout, query_cache
         )
     except WeaviateBaseError as e:
         _catch_weaviate_errors(e)
 
-    return final_responses, str_responses
+    return final_responses, str_responses, collection_metadata
 
 
 async def _handle_search(
-    weaviate_client: weaviate.WeaviateAsyncClient, tool_args: dict
-) -> tuple[list[QueryReturn], list[str]]:
+    weaviate_client: weaviate.WeaviateAsyncClient,
+    tool_args: dict,
+    max_concurrency: int = 8,
+    timeout: float | None = 60,
+    query_cache: QueryCache | None = None,
+) -> tuple[list[QueryReturn | Exception], list[str], list[dict]]:
     """Do vector/keyword/hybrid search from a QueryOutput."""
 
     collection_names = tool_args["collection_names"]
-    collections = [weaviate_client.collections.get(name) for name in collection_names]
 
     # Build reference property
     if "reference_property" in tool_args:
@@ -538,57 +626,85 @@ async def _handle_search(
     combined_filter = _build_filters(tool_args)
     sort = _build_sort(tool_args)
 
-    # Loop over collections and execute search
-    responses = []
-    str_responses = []
-    for i, collection in enumerate(collections):
+    # Execute search on each collection concurrently
+    async def search(collection_name: str) -> QueryReturn:
+        collection = weaviate_client.collections.get(collection_name)
         if tool_args["search_type"] == "filter_only":
-            response = await collection.query.fetch_objects(
+            return await collection.query.fetch_objects(
                 limit=tool_args["limit"],
                 filters=combined_filter,
                 return_references=reference,
                 sort=sort,
             )
-        else:
-            if tool_args["search_type"] == "hybrid":
-                response = await collection.query.hybrid(
-                    query=tool_args["search_query"],
-                    limit=tool_args["limit"],
-                    filters=combined_filter,
-                    return_references=reference,
-                    target_vector=(
-                        named_vector_fields[collection.name]
-                        if named_vector_fields
-                        else None
-                    ),
-                )
 
-            elif tool_args["search_type"] == "vector":
-                response = await collection.query.near_text(
-                    query=tool_args["search_query"],
-                    limit=tool_args["limit"],
-                    filters=combined_filter,
-                    return_references=reference,
-                    target_vector=(
-                        named_vector_fields[collection.name]
-                        if named_vector_fields
-                        else None
-                    ),
-                )
+        if tool_args["search_type"] == "hybrid":
+            return await collection.query.hybrid(
+                query=tool_args["search_query"],
+                limit=tool_args["limit"],
+                filters=combined_filter,
+                return_references=reference,
+                target_vector=(
+                    named_vector_fields[collection.name]
+                    if named_vector_fields
+                    else None
+                ),
+            )
 
-            elif tool_args["search_type"] == "keyword":
-                response = await collection.query.bm25(
-                    query=tool_args["search_query"],
-                    limit=tool_args["limit"],
-                    filters=combined_filter,
-                    return_references=reference,
-                )
+        elif tool_args["search_type"] == "vector":
+            return await collection.query.near_text(
+                query=tool_args["search_query"],
+                limit=tool_args["limit"],
+                filters=combined_filter,
+                return_references=reference,
+                target_vector=(
+                    named_vector_fields[collection.name]
+                    if named_vector_fields
+                    else None
+                ),
+            )
 
-        str_response = _construct_string_search_query(tool_args, combined_filter)
-        responses.append(response)
-        str_responses.append(str_response)
+        elif tool_args["search_type"] == "keyword":
+            return await collection.query.bm25(
+                query=tool_args["search_query"],
+                limit=tool_args["limit"],
+                filters=combined_filter,
+                return_references=reference,
+            )
 
-    return responses, str_responses
+        raise QueryError(f"Invalid search type: {tool_args['search_type']}")
+
+    # Everything except the other collections changes the response of a collection
+    cache_args = {
+        collection_name: {
+            **{
+                k: v
+                for k, v in tool_args.items()
+                if k not in ["collection_names", "named_vector_fields"]
+            },
+            "target_vector": (
+                named_vector_fields.get(collection_name)
+                if named_vector_fields
+                else None
+            ),
+        }
+        for collection_name in collection_names
+    }
+
+    responses, collection_metadata = await _run_per_collection(
+        collection_names,
+        search,
+        max_concurrency,
+        timeout,
+        query_cache=query_cache,
+        cache_kind="query",
+        cache_args=cache_args,
+    )
+    str_responses = [
+        _construct_string_search_query(tool_args, combined_filter)
+        for _ in collection_names
+    ]
+
+    return responses, str_responses, collection_metadata
 
 
 def _build_sort(tool_args: dict) -> Sorting | None:
@@ -738,8 +854,21 @@ async def execute_weaviate_aggregation(
     property_types: dict[str, dict[str, str]],
     vectorised_by_collection: dict[str, bool],
     schema: dict | None = None,
-) -> tuple[list[AggregateReturn], list[str]]:
-    """Execute a predicted WeaviateAggregation and return formatted results."""
+    max_concurrency: int = 8,
+    timeout: float | None = 60,
+    query_cache: QueryCache | None = None,
+) -> tuple[list[AggregateReturn | Exception], list[str], list[dict]]:
+    """
+    Execute a predicted WeaviateAggregation and return formatted results.
+    The aggregation is run on each of the target collections concurrently (at most `max_concurrency` at once),
+    with a separate `timeout` (in seconds) for each collection.
+    If a `query_cache` is given, identical aggregations on a collection re-use the cached response.
+
+    Returns:
+        (tuple): The responses, the code strings and the metadata (e.g. `query_time_seconds`, `cached`) for each collection.
+            If the aggregation failed on a collection, its response is the exception instead.
+            If the aggregation failed on all collections, the exception is raised.
+    """
 
     # Convert WeaviateAggregation to tool args format
     tool_args: dict[str, Any] = {
@@ -798,55 +927,83 @@ async def execute_weaviate_aggregation(
 
     # Execute query based on type
     try:
-        responses, str_responses = await _handle_aggregation_query(
-            weaviate_client, tool_args, vectorised_by_collection
+        responses, str_responses, collection_metadata = await _handle_aggregation_query(
+            weaviate_client,
+            tool_args,
+            vectorised_by_collection,
+            max_concurrency,
+            timeout,
+            query_cache,
         )
     except WeaviateBaseError as e:
         _catch_weaviate_errors(e)
 
-    return responses, str_responses
+    return responses, str_responses, collection_metadata
 
 
 async def _handle_aggregation_query(
     weaviate_client: weaviate.WeaviateAsyncClient,
     tool_args: dict,
     vectorised_by_collection: dict[str, bool],
-) -> tuple[list[AggregateReturn], list[str]]:
+    max_concurrency: int = 8,
+    timeout: float | None = 60,
+    query_cache: QueryCache | None = None,
+) -> tuple[list[AggregateReturn | Exception], list[str], list[dict]]:
     collection_names = tool_args["collection_names"]
-    collections = [weaviate_client.collections.get(name) for name in collection_names]
 
     agg_args = _build_aggregation_args(tool_args)
     combined_filter = _build_filters(tool_args)
-    responses = []
-    str_responses = []
 
-    for collection in collections:
-        if (
+    def with_search(collection_name: str) -> bool:
+        return bool(
             "search_query" in tool_args
             and tool_args["search_query"]
             and "search_type" in tool_args
             and tool_args["search_type"]
-            and vectorised_by_collection[collection.name]
-        ):
-            responses.append(
-                await _execute_aggregation_with_search(
-                    collection, tool_args, agg_args, combined_filter
-                )
-            )
-            str_responses.append(
-                _get_string_aggregation_with_search(tool_args, combined_filter)
-            )
-        else:
-            responses.append(
-                await _execute_aggregation_over_all(
-                    collection, agg_args, combined_filter
-                )
-            )
-            str_responses.append(
-                _get_string_aggregation_over_all(tool_args, combined_filter)
+            and vectorised_by_collection[collection_name]
+        )
+
+    # Execute aggregation on each collection concurrently
+    async def aggregate(
+        collection_name: str,
+    ) -> AggregateReturn | AggregateGroupByReturn:
+        collection = weaviate_client.collections.get(collection_name)
+        if with_search(collection_name):
+            return await _execute_aggregation_with_search(
+                collection, tool_args, agg_args, combined_filter
             )
+        return await _execute_aggregation_over_all(
+            collection, agg_args, combined_filter
+        )
+
+    # Everything except the other collections changes the response of a collection
+    cache_args = {
+        collection_name: {
+            **{k: v for k, v in tool_args.items() if k != "collection_names"},
+            "with_search": with_search(collection_name),
+        }
+        for collection_name in collection_names
+    }
+
+    responses, collection_metadata = await _run_per_collection(
+        collection_names,
+        aggregate,
+        max_concurrency,
+        timeout,
+        query_cache=query_cache,
+        cache_kind="aggregate",
+        cache_args=cache_args,
+    )
+    str_responses = [
+        (
+            _get_string_aggregation_with_search(tool_args, combined_filter)
+            if with_search(collection_name)
+            else _get_string_aggregation_over_all(tool_args, combined_filter)
+        )
+        for collection_name in collection_names
+    ]
 
-    return responses, str_responses
+    return responses, str_responses, collection_metadata
 
 
 def _build_return_metrics(tool_args: dict) -> list[Metrics] | None:
@@ -0,0 +1,150 @@
+"""
+Codecs for the data of trees saved in Weaviate (snapshots and deltas, see `elysia.tree.persistence`).
+
+- `"json"`: plain JSON text, as trees have always been saved.
+- `"binary"`: a compact binary encoding, stored as text in the form
+    `elysia-bin:<version>:<serialiser>:<compressor>:<base64 payload>`.
+
+    Dictionary keys are replaced by indices into a string table, so property names repeated across
+    thousands of retrieved objects are only stored once, and the result is compressed.
+    The payload is serialised with msgpack and compressed with zstd when the `msgpack` and `zstandard` packages
+    are installed (`pip install elysia-ai[binary]`), and otherwise with compact JSON and zlib.
+    The serialiser and compressor are part of the header, so data can always be decoded with the same packages.
+
+Decoding detects the codec from the data, so trees saved as JSON (including trees saved before this module) still load.
+"""
+
+import base64
+import json
+import zlib
+from typing import Any, Literal
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TreeCodec = Literal["json", "binary"]
+
+BINARY_PREFIX = "elysia-bin:"
+BINARY_VERSION = 1
+
+
+def _pack(value: Any, keys: dict[str, int]) -> Any:
+    if isinstance(value, dict):
+        packed = {}
+        for key, item in value.items():
+            index = keys.get(key)
+            if index is None:
+                index = keys[key] = len(keys)
+            packed[index] = _pack(item, keys)
+        return packed
+    if isinstance(value, list):
+        return [_pack(item, keys) for item in value]
+    return value
+
+
+def _unpack(value: Any, keys: list[str]) -> Any:
+    if isinstance(value, dict):
+        # JSON serialises the integer indices as strings
+        return {keys[int(index)]: _unpack(item, keys) for index, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack(item, keys) for item in value]
+    return value
+
+
+def _serialise(value: Any, serialiser: str) -> bytes:
+    if serialiser == "msgpack":
+        return msgpack.packb(value)  # type: ignore
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _deserialise(data: bytes, serialiser: str) -> Any:
+    if serialiser == "msgpack":
+        return msgpack.unpackb(data, strict_map_key=False)  # type: ignore
+    return json.loads(data)
+
+
+def _compress(data: bytes, compressor: str) -> bytes:
+    if compressor == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)  # type: ignore
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes, compressor: str) -> bytes:
+    if compressor == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)  # type: ignore
+    return zlib.decompress(data)
+
+
+def _check_installed(serialiser: str, compressor: str) -> None:
+    for name, module, package in [
+        (serialiser, msgpack, "msgpack"),
+        (compressor, zstandard, "zstandard"),
+    ]:
+        if name in ("msgpack", "zstd") and module is None:
+            raise ImportError(
+                f"Decoding this tree requires the `{package}` package. "
+                "Install it with `pip install elysia-ai[binary]`."
+            )
+
+
+def encode_tree_data(value: Any, codec: TreeCodec = "json") -> str:
+    """
+    Encode JSON serialisable data (an exported tree or a delta) as text, to be stored in Weaviate.
+
+    Args:
+        value (Any): The data to encode.
+        codec (TreeCodec): The codec to use, `"json"` or `"binary"`. See `elysia.tree.codec`.
+
+    Returns:
+        (str): The encoded data, which can be decoded with `decode_tree_data`.
+    """
+    if codec == "json":
+        return json.dumps(value)
+
+    if codec != "binary":
+        raise ValueError(f"Unknown tree codec '{codec}', must be 'json' or 'binary'.")
+
+    serialiser = "msgpack" if msgpack is not None else "json"
+    compressor = "zstd" if zstandard is not None else "zlib"
+
+    keys = {}
+    packed = _pack(value, keys)
+    payload = _compress(_serialise([list(keys), packed], serialiser), compressor)
+    return (
+        f"{BINARY_PREFIX}{BINARY_VERSION}:{serialiser}:{compressor}:"
+        + base64.b64encode(payload).decode("ascii")
+    )
+
+
+def decode_tree_data(data: str) -> Any:
+    """
+    Decode data encoded with `encode_tree_data`, with any codec.
+
+    Args:
+        data (str): The encoded data.
+
+    Returns:
+        (Any): The decoded data.
+    """
+    if not data.startswith(BINARY_PREFIX):
+        return json.loads(data)
+
+    version, serialiser, compressor, payload = data[len(BINARY_PREFIX) :].split(":", 3)
+    if int(version) > BINARY_VERSION:
+        raise ValueError(
+            f"This tree was saved with a newer version ({version}) of the binary tree codec. "
+            "Upgrade Elysia to load it."
+        )
+    _check_installed(serialiser, compressor)
+
+    keys, packed = _deserialise(
+        _decompress(base64.b64decode(payload), compressor), serialiser
+    )
+    return _unpack(packed, keys)
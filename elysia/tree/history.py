@@ -0,0 +1,349 @@
+"""
+The history of a tree: a record of what the tree did for each completed query, used for feedback.
+
+Each `QueryRecord` is immutable and is built without copying the tree:
+
+- the environment is referenced as a snapshot (see `Environment.snapshot()`), which shares its results with the tree's environment,
+- the decisions and iteration timings are appended to a columnar `DecisionLog` shared by all records of the tree,
+- the conversation history, tasks completed, action information and training updates are serialised once to compressed bytes,
+    and only deserialised when they are accessed.
+
+`QueryHistory` keeps the records of a tree, with an optional retention policy:
+only the last `max_queries` records are kept in memory, and older records are either dropped or (if `spill_directory` is set) written to disk.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from array import array
+from sys import intern
+from typing import Any, Iterator
+
+from elysia.tree.objects import EnvironmentSnapshot
+
+
+def _dump(value: Any) -> bytes:
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def _load(data: bytes) -> Any:
+    return pickle.loads(zlib.decompress(data))
+
+
+class DecisionLog:
+    """
+    Columnar log of the decisions and iteration stats (see `Tree._start_iteration_stats`) of all queries of a tree.
+    Records refer to rows by absolute position, which stays valid when the oldest rows are removed with `trim`.
+    """
+
+    def __init__(self) -> None:
+        self.decision_offset = 0
+        self.decisions: list[str] = []
+
+        self.iteration_offset = 0
+        self.iteration = array("i")
+        self.decision_time = array("d")
+        self.tool_time = array("d")
+        self.total_time = array("d")
+        self.input_tokens = array("q")
+        self.output_tokens = array("q")
+        self.tools: list[tuple[str, ...]] = []
+
+    def append(
+        self, decisions: list[str], iteration_stats: list[dict]
+    ) -> tuple[int, int, int, int]:
+        """
+        Returns:
+            (tuple[int, int, int, int]): The start and end positions of the appended decisions and iterations.
+        """
+        decision_start = self.decision_offset + len(self.decisions)
+        self.decisions.extend(intern(decision) for decision in decisions)
+
+        iteration_start = self.iteration_offset + len(self.iteration)
+        for stats in iteration_stats:
+            self.iteration.append(stats.get("iteration", 0))
+            self.decision_time.append(stats.get("decision_time", 0.0))
+            self.tool_time.append(stats.get("tool_time", 0.0))
+            self.total_time.append(stats.get("total_time", 0.0))
+            self.input_tokens.append(stats.get("input_tokens", 0))
+            self.output_tokens.append(stats.get("output_tokens", 0))
+            self.tools.append(tuple(intern(tool) for tool in stats.get("tools", [])))
+
+        return (
+            decision_start,
+            self.decision_offset + len(self.decisions),
+            iteration_start,
+            self.iteration_offset + len(self.iteration),
+        )
+
+    def get_decisions(self, start: int, end: int) -> list[str]:
+        return self.decisions[start - self.decision_offset : end - self.decision_offset]
+
+    def get_iteration_stats(self, start: int, end: int) -> list[dict]:
+        return [
+            {
+                "iteration": self.iteration[i],
+                "decision_time": self.decision_time[i],
+                "tool_time": self.tool_time[i],
+                "total_time": self.total_time[i],
+                "input_tokens": self.input_tokens[i],
+                "output_tokens": self.output_tokens[i],
+                "tools": list(self.tools[i]),
+            }
+            for i in range(start - self.iteration_offset, end - self.iteration_offset)
+        ]
+
+    def trim(self, decision_start: int, iteration_start: int) -> None:
+        """
+        Remove the rows before the given positions.
+        """
+        num_decisions = decision_start - self.decision_offset
+        del self.decisions[:num_decisions]
+        self.decision_offset = decision_start
+
+        num_iterations = iteration_start - self.iteration_offset
+        for column in [
+            self.iteration,
+            self.decision_time,
+            self.tool_time,
+            self.total_time,
+            self.input_tokens,
+            self.output_tokens,
+            self.tools,
+        ]:
+            del column[:num_iterations]
+        self.iteration_offset = iteration_start
+
+
+class QueryRecord:
+    """
+    An immutable record of what the tree did for a single completed query.
+
+    The conversation history, tasks completed, action information, decision history, iteration stats and training updates
+    are returned as new lists each time they are accessed, so they can be modified without changing the record.
+    """
+
+    __slots__ = (
+        "query_id",
+        "user_prompt",
+        "num_trees_completed",
+        "base_lm_used",
+        "complex_lm_used",
+        "time_taken_seconds",
+        "initialisation",
+        "environment",
+        "_data",
+        "_training_updates",
+        "_decision_log",
+        "_positions",
+        "_decisions",
+        "_iteration_stats",
+    )
+
+    def __init__(
+        self,
+        query_id: str,
+        user_prompt: str,
+        num_trees_completed: int,
+        base_lm_used: str | None,
+        complex_lm_used: str | None,
+        time_taken_seconds: float,
+        initialisation: str,
+        environment: EnvironmentSnapshot,
+        conversation_history: list[dict],
+        tasks_completed: list[dict],
+        action_information: list[dict],
+        training_updates: list[dict],
+        decision_log: DecisionLog,
+        positions: tuple[int, int, int, int],
+    ) -> None:
+        set_attribute = object.__setattr__
+        set_attribute(self, "query_id", query_id)
+        set_attribute(self, "user_prompt", user_prompt)
+        set_attribute(self, "num_trees_completed", num_trees_completed)
+        set_attribute(self, "base_lm_used", base_lm_used)
+        set_attribute(self, "complex_lm_used", complex_lm_used)
+        set_attribute(self, "time_taken_seconds", time_taken_seconds)
+        set_attribute(self, "initialisation", initialisation)
+        set_attribute(self, "environment", environment)
+        set_attribute(
+            self,
+            "_data",
+            _dump((conversation_history, tasks_completed, action_information)),
+        )
+        set_attribute(self, "_training_updates", _dump(training_updates))
+        set_attribute(self, "_decision_log", decision_log)
+        set_attribute(self, "_positions", positions)
+        set_attribute(self, "_decisions", None)
+        set_attribute(self, "_iteration_stats", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("QueryRecord is immutable")
+
+    @property
+    def conversation_history(self) -> list[dict]:
+        return _load(self._data)[0]
+
+    @property
+    def tasks_completed(self) -> list[dict]:
+        return _load(self._data)[1]
+
+    @property
+    def action_information(self) -> list[dict]:
+        return _load(self._data)[2]
+
+    @property
+    def training_updates(self) -> list[dict]:
+        return _load(self._training_updates)
+
+    @property
+    def decision_history(self) -> list[str]:
+        if self._decisions is not None:
+            return list(self._decisions)
+        start, end, _, _ = self._positions
+        return self._decision_log.get_decisions(start, end)
+
+    @property
+    def iteration_stats(self) -> list[dict]:
+        if self._iteration_stats is not None:
+            return [dict(stats) for stats in self._iteration_stats]
+        _, _, start, end = self._positions
+        return self._decision_log.get_iteration_stats(start, end)
+
+    def __getstate__(self) -> dict:
+        # detach from the decision log, e.g. when written to disk
+        state = {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ["_decision_log", "_decisions", "_iteration_stats"]
+        }
+        state["_decisions"] = self.decision_history
+        state["_iteration_stats"] = self.iteration_stats
+        state["_decision_log"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
+class QueryHistory:
+    """
+    The records of the completed queries of a tree, keyed by query ID, in the order they were completed.
+
+    Args:
+        max_queries (int | None): The number of most recent records kept in memory. None keeps all records.
+        spill_directory (str | None): A directory to write records to when they are no longer kept in memory,
+            so they can still be retrieved (e.g. to give feedback on an old query). If None, these records are dropped.
+    """
+
+    def __init__(
+        self, max_queries: int | None = None, spill_directory: str | None = None
+    ) -> None:
+        self.max_queries = max_queries
+        self.spill_directory = spill_directory
+        self.records: dict[str, QueryRecord] = {}
+        self.spilled: dict[str, str] = {}
+        self.decision_log = DecisionLog()
+        self._spill_path: str | None = None
+        # spill files are numbered by a counter, as `spilled` shrinks when records are replaced
+        self._num_spills = 0
+
+    def add(
+        self,
+        query_id: str,
+        decisions: list[str],
+        iteration_stats: list[dict],
+        **kwargs,
+    ) -> QueryRecord:
+        """
+        Add a record of a completed query, replacing any existing record with the same query ID.
+        See `QueryRecord` for the other arguments.
+        """
+        positions = self.decision_log.append(decisions, iteration_stats)
+        record = QueryRecord(
+            query_id=query_id,
+            decision_log=self.decision_log,
+            positions=positions,
+            **kwargs,
+        )
+        self._remove(query_id)
+        self.records[query_id] = record
+        self._apply_retention()
+        return record
+
+    def _apply_retention(self) -> None:
+        if self.max_queries is None:
+            return
+
+        while len(self.records) > self.max_queries:
+            query_id = next(iter(self.records))
+            record = self.records.pop(query_id)
+            if self.spill_directory is not None:
+                self._spill(record)
+
+        # the decision log only needs the rows from the oldest record kept in memory
+        if self.records:
+            decision_start, _, iteration_start, _ = next(
+                iter(self.records.values())
+            )._positions
+            self.decision_log.trim(decision_start, iteration_start)
+
+    def _spill(self, record: QueryRecord) -> None:
+        if self._spill_path is None:
+            os.makedirs(self.spill_directory, exist_ok=True)  # type: ignore
+            self._spill_path = tempfile.mkdtemp(
+                prefix="history_", dir=self.spill_directory
+            )
+        path = os.path.join(self._spill_path, f"{self._num_spills}.pkl")
+        self._num_spills += 1
+        with open(path, "wb") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled[record.query_id] = path
+
+    def _remove(self, query_id: str) -> None:
+        self.records.pop(query_id, None)
+        path = self.spilled.pop(query_id, None)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def clear(self) -> None:
+        self.records = {}
+        self.spilled = {}
+        self.decision_log = DecisionLog()
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+
+    def __getitem__(self, query_id: str) -> QueryRecord:
+        if query_id in self.records:
+            return self.records[query_id]
+        if query_id in self.spilled:
+            with open(self.spilled[query_id], "rb") as f:
+                return pickle.load(f)
+        raise KeyError(query_id)
+
+    def __contains__(self, query_id: object) -> bool:
+        return query_id in self.records or query_id in self.spilled
+
+    def __len__(self) -> int:
+        return len(self.spilled) + len(self.records)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.spilled
+        yield from self.records
+
+    def keys(self) -> list[str]:
+        return list(self)
+
+    def values(self) -> list[QueryRecord]:
+        return [self[query_id] for query_id in self]
+
+    def items(self) -> list[tuple[str, QueryRecord]]:
+        return [(query_id, self[query_id]) for query_id in self]
+
+    def __del__(self) -> None:
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
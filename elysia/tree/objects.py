@@ -1,3 +1,5 @@
+import json
+import hashlib
 from typing import Any
 from logging import Logger
 from datetime import datetime
@@ -7,11 +9,73 @@ from elysia.config import Settings
 from elysia.config import settings as environment_settings
 from elysia.objects import Result
 from elysia.util.client import ClientManager
-from elysia.util.parsing import format_dict_to_serialisable, remove_whitespace
+from elysia.util.parsing import (
+    estimate_tokens,
+    format_datetime,
+    format_dict_to_serialisable,
+    remove_whitespace,
+)
 from copy import deepcopy
 from weaviate.classes.query import Filter
 
 
+def _serialise_value(value: Any) -> str:
+    # matches format_dict_to_serialisable, so formatting a stored object does not change its hash
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    return str(value)
+
+
+def _render_json(value: Any) -> str:
+    # same separators as DSPy uses to format dictionary inputs
+    return json.dumps(value, ensure_ascii=False, default=_serialise_value)
+
+
+def _compress_result(result: dict, level: str) -> dict:
+    if level == "refs":
+        return {
+            "metadata": result["metadata"],
+            "objects": [
+                {"_REF_ID": obj["_REF_ID"]}
+                for obj in result["objects"]
+                if "_REF_ID" in obj
+            ],
+            "objects_hidden": f"The {len(result['objects'])} objects of this result are hidden to save space, only their _REF_IDs are shown.",
+        }
+    return {
+        "metadata": result["metadata"],
+        "objects_hidden": f"The {len(result['objects'])} objects of this result are hidden to save space.",
+    }
+
+
+def _object_hash(obj: dict) -> str:
+    # the _REF_ID is excluded so that a stored object has the same hash as the object it was created from
+    obj = {key: value for key, value in obj.items() if key != "_REF_ID"}
+    try:
+        serialised = json.dumps(obj, sort_keys=True, default=_serialise_value)
+    except TypeError:
+        # e.g. keys of mixed types cannot be sorted
+        serialised = repr(obj)
+    return hashlib.sha1(serialised.encode()).hexdigest()
+
+
+class EnvironmentSnapshot(dict):
+    """
+    The environment dictionary at a point in time, returned by `Environment.snapshot()` and `Environment.to_json()`.
+
+    The dictionaries keyed by `tool_name` and `name` and the lists of results are new,
+    but the results themselves (each `{"metadata": ..., "objects": ...}`) are shared with the environment it was taken from.
+    The environment never modifies a result after it has been added, results are only appended, removed or replaced as a whole.
+    So a snapshot costs one copy per result rather than per object, and is treated as read-only: copying it returns the same snapshot.
+    """
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo: dict):
+        return self
+
+
 class Environment:
     """
     Store of all objects across different types of queries and responses.
@@ -59,6 +123,13 @@ class Environment:
 
     Within the environment, there is a variable called `hidden_environment`, which is a dictionary of key-value pairs.
     This is used to store information that is not shown to the LLM, but is instead a 'store' of data that can be used across tools.
+
+    To detect duplicate objects without comparing against every stored object, the environment keeps an `object_index`,
+    mapping a hash of each stored object to the stored objects, for each `tool_name`/`name`.
+    This is kept in sync by the `add`, `add_objects`, `remove` and `replace` methods.
+
+    Results are not modified after they are added, so that snapshots and copies of the environment can share them (copy-on-write).
+    To change a result, use `replace`, rather than modifying the `metadata` or `objects` in place.
     """
 
     def __init__(
@@ -72,6 +143,9 @@ class Environment:
         self.environment = environment
         self.hidden_environment = hidden_environment
         self.self_info = self_info
+        self.object_index: dict[tuple[str, str], dict] = {}
+        self.rendered_results: dict[int, dict] = {}
+        self.num_rendered = 0
         if self_info:
             self.environment["SelfInfo"] = {}
             self.environment["SelfInfo"]["info"] = [
@@ -103,6 +177,144 @@ class Environment:
                 }
             ]
 
+        self.rebuild_object_index()
+
+    def _index_objects(self, tool_name: str, name: str) -> dict[str, list[dict]]:
+        results = self.environment[tool_name][name]
+        hashes = {}
+        for result in results:
+            for obj in result["objects"]:
+                hashes.setdefault(_object_hash(obj), []).append(obj)
+
+        self.object_index[(tool_name, name)] = {
+            "results": results,
+            "num_results": len(results),
+            "num_formatted": 0,
+            "hashes": hashes,
+        }
+        return hashes
+
+    def _get_object_index(self, tool_name: str, name: str) -> dict[str, list[dict]]:
+        # re-index if the list of results has been changed outside of the environment methods
+        index = self.object_index.get((tool_name, name))
+        results = self.environment[tool_name][name]
+        if (
+            index is None
+            or index["results"] is not results
+            or index["num_results"] != len(results)
+        ):
+            return self._index_objects(tool_name, name)
+        return index["hashes"]
+
+    def rebuild_object_index(self):
+        """
+        Rebuild the index used to detect duplicate objects from the current environment.
+        This is called automatically on initialisation (including `from_json`), and only needs to be called manually
+        if the objects within the `environment` dictionary have been modified directly.
+        """
+        self.object_index = {}
+        for tool_name in self.environment:
+            if tool_name == "SelfInfo":
+                continue
+            for name in self.environment[tool_name]:
+                self._index_objects(tool_name, name)
+
+    def _get_rendered_result(self, result: dict, level: str = "full") -> str:
+        rendered = self.rendered_results[id(result)]
+        if level not in rendered["text"]:
+            rendered["text"][level] = _render_json(_compress_result(result, level))
+        return rendered["text"][level]
+
+    def to_prompt(self, token_budget: int | None = None) -> str:
+        """
+        Renders the environment as text to be used in an LLM prompt, the same JSON as the environment dictionary.
+        The text of each result is cached, so only results added since the last call are rendered.
+
+        If a `token_budget` is given and the (estimated) number of tokens is over the budget, the oldest results are compressed first,
+        until the text fits in the budget:
+        1. The objects are replaced with their `_REF_ID`s, keeping the metadata.
+        2. The objects are removed entirely, keeping the metadata and the number of objects.
+        Results from `SelfInfo` are never compressed.
+
+        Args:
+            token_budget (int | None): The maximum (estimated) number of tokens for the environment.
+                If `None`, the full environment is always rendered.
+
+        Returns:
+            (str): The environment as a JSON string.
+        """
+
+        # render new results, and forget any that have been removed
+        rendered_results = {}
+        for tool_results in self.environment.values():
+            for results in tool_results.values():
+                for result in results:
+                    rendered = self.rendered_results.get(id(result))
+                    if rendered is None or rendered["result"] is not result:
+                        self.num_rendered += 1
+                        rendered = {
+                            "result": result,
+                            "order": self.num_rendered,
+                            "text": {"full": _render_json(result)},
+                        }
+                    rendered_results[id(result)] = rendered
+        self.rendered_results = rendered_results
+
+        levels = {key: "full" for key in rendered_results}
+
+        def assemble() -> str:
+            return (
+                "{"
+                + ", ".join(
+                    f"{_render_json(tool_name)}: {{"
+                    + ", ".join(
+                        f"{_render_json(name)}: ["
+                        + ", ".join(
+                            self._get_rendered_result(result, levels[id(result)])
+                            for result in results
+                        )
+                        + "]"
+                        for name, results in tool_results.items()
+                    )
+                    + "}"
+                    for tool_name, tool_results in self.environment.items()
+                )
+                + "}"
+            )
+
+        text = assemble()
+        if token_budget is None or estimate_tokens(len(text)) <= token_budget:
+            return text
+
+        candidates = sorted(
+            (
+                rendered_results[id(result)]
+                for tool_name, tool_results in self.environment.items()
+                if tool_name != "SelfInfo"
+                for results in tool_results.values()
+                for result in results
+                if isinstance(result, dict) and "objects" in result
+            ),
+            key=lambda rendered: rendered["order"],
+        )
+
+        # only the length changes when a result is compressed, so track the length rather than re-assembling
+        length = len(text)
+        for level in ["refs", "count"]:
+            for rendered in candidates:
+                if estimate_tokens(length) <= token_budget:
+                    break
+                key = id(rendered["result"])
+                old_length = len(
+                    self._get_rendered_result(rendered["result"], levels[key])
+                )
+                new_length = len(self._get_rendered_result(rendered["result"], level))
+                if new_length < old_length:
+                    levels[key] = level
+                    length += new_length - old_length
+
+        return assemble()
+
     def is_empty(self):
         """
         Check if the environment is empty.
@@ -185,41 +397,43 @@ class Environment:
             self.environment[tool_name][name] = []
 
         if len(objects) > 0:
+            object_index = self._get_object_index(tool_name, name)
+
             self.environment[tool_name][name].append(
                 {
                     "metadata": metadata,
                     "objects": [],
                 }
             )
+            self.object_index[(tool_name, name)]["num_results"] += 1
 
             for i, obj in enumerate(objects):
                 # check if the object is already in the environment
+                obj_hash = _object_hash(obj)
                 obj_found = False
-                where_obj = None
-                for env_item in self.environment[tool_name][name]:
-                    if obj in env_item["objects"]:
+                for env_obj in object_index.get(obj_hash, []):
+                    if env_obj == obj:
                         obj_found = True
-                        where_obj = env_item["objects"].index(obj)
-                        _REF_ID = env_item["objects"][where_obj]["_REF_ID"]
+                        _REF_ID = env_obj["_REF_ID"]
                         break
 
                 if obj_found and not include_duplicates:
-                    self.environment[tool_name][name][-1]["objects"].append(
-                        {
-                            "object_info": f"[repeat]",
-                            "_REF_ID": _REF_ID,
-                        }
-                    )
+                    new_obj = {
+                        "object_info": f"[repeat]",
+                        "_REF_ID": _REF_ID,
+                    }
+                    obj_hash = _object_hash(new_obj)
                 elif "_REF_ID" not in obj:
                     _REF_ID = f"{tool_name}_{name}_{len(self.environment[tool_name][name])}_{i}"
-                    self.environment[tool_name][name][-1]["objects"].append(
-                        {
-                            "_REF_ID": _REF_ID,
-                            **obj,
-                        }
-                    )
+                    new_obj = {
+                        "_REF_ID": _REF_ID,
+                        **obj,
+                    }
                 else:
-                    self.environment[tool_name][name][-1]["objects"].append(obj)
+                    new_obj = obj
+
+                self.environment[tool_name][name][-1]["objects"].append(new_obj)
+                object_index.setdefault(obj_hash, []).append(new_obj)
 
     def remove(self, tool_name: str, name: str, index: int | None = None):
         """
@@ -240,6 +454,7 @@ class Environment:
                     self.environment[tool_name][name] = []
                 else:
                     self.environment[tool_name][name].pop(index)
+                self._index_objects(tool_name, name)
 
     def replace(
         self,
@@ -276,6 +491,7 @@ class Environment:
                         "metadata": metadata,
                         "objects": objects,
                     }
+                self._index_objects(tool_name, name)
 
     def find(self, tool_name: str, name: str, index: int | None = None):
         """
@@ -305,30 +521,62 @@ class Environment:
         else:
             return self.environment[tool_name][name][index]
 
+    def _copy_structure(self) -> dict:
+        return {
+            tool_name: {name: list(results) for name, results in tool_results.items()}
+            for tool_name, tool_results in self.environment.items()
+        }
+
+    def snapshot(self) -> EnvironmentSnapshot:
+        """
+        Returns a read-only copy of the environment dictionary, which shares the results with this environment.
+        Later changes to the environment (via `add`, `remove`, `replace` etc.) are not reflected in the snapshot.
+        """
+        return EnvironmentSnapshot(self._copy_structure())
+
+    def __deepcopy__(self, memo: dict):
+        copied = Environment.__new__(Environment)
+        memo[id(self)] = copied
+        copied.environment = self._copy_structure()
+        copied.hidden_environment = deepcopy(self.hidden_environment, memo)
+        copied.self_info = self.self_info
+        copied.object_index = {}  # rebuilt when needed
+        copied.rendered_results = {}
+        copied.num_rendered = 0
+        return copied
+
+    def _format_results(self, remove_unserialisable: bool = False):
+        # Results are formatted in place, once, when they are first serialised
+        for tool_name in self.environment:
+            if tool_name == "SelfInfo":
+                continue
+            for name in self.environment[tool_name]:
+                self._get_object_index(tool_name, name)
+                index = self.object_index[(tool_name, name)]
+                results = self.environment[tool_name][name]
+                start = 0 if remove_unserialisable else index["num_formatted"]
+                for obj_metadata in results[start:]:
+                    format_dict_to_serialisable(
+                        obj_metadata["metadata"], remove_unserialisable
+                    )
+                    for obj in obj_metadata["objects"]:
+                        format_dict_to_serialisable(obj, remove_unserialisable)
+                index["num_formatted"] = len(results)
+
     def to_json(self, remove_unserialisable: bool = False):
         """
         Converts the environment to a JSON serialisable format.
         Used to access specific objects from the environment.
+
+        The environment is returned as a snapshot (see `snapshot`), so it is not copied object by object.
         """
+        self._format_results(remove_unserialisable)
 
-        env_copy = deepcopy(self.environment)
         hidden_env_copy = deepcopy(self.hidden_environment)
-
-        # Check if environment and hidden_environment are JSON serialisable
-        for tool_name in env_copy:
-            if tool_name != "SelfInfo":
-                for name in self.environment[tool_name]:
-                    for obj_metadata in self.environment[tool_name][name]:
-                        format_dict_to_serialisable(
-                            obj_metadata["metadata"], remove_unserialisable
-                        )
-                        for obj in obj_metadata["objects"]:
-                            format_dict_to_serialisable(obj, remove_unserialisable)
-
         format_dict_to_serialisable(hidden_env_copy, remove_unserialisable)
 
         return {
-            "environment": env_copy,
+            "environment": self.snapshot(),
             "hidden_environment": hidden_env_copy,
             "self_info": self.self_info,
         }
@@ -336,7 +584,12 @@ class Environment:
     @classmethod
     def from_json(cls, json_data: dict):
         return cls(
-            environment=json_data["environment"],
+            environment={
+                tool_name: {
+                    name: list(results) for name, results in tool_results.items()
+                }
+                for tool_name, tool_results in json_data["environment"].items()
+            },
             hidden_environment=json_data["hidden_environment"],
             self_info=json_data["self_info"],
         )
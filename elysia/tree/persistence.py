@@ -0,0 +1,451 @@
+"""
+Delta-based persistence of trees in Weaviate.
+
+A saved tree is stored as:
+
+- a head object in the trees collection (e.g. `ELYSIA_TREES__`), one per conversation, with the `user_id`, `conversation_id` and `title`.
+    Its `tree` property is a small manifest: `{"format": "delta", "sequence": int, "snapshot_sequence": int}`.
+- records in the records collection (e.g. `ELYSIA_TREES_RECORDS__`), keyed by conversation and sequence number.
+    Each record is either a `snapshot` (the full output of `Tree.export_to_json()`)
+    or a `delta` (the changes to the exported tree since the previous record, see `apply_json_delta`).
+    The `data` of each record is encoded with one of the codecs in `elysia.tree.codec`.
+
+Loading a tree replays the latest snapshot and all deltas after it, up to the sequence number in the head.
+Every `snapshot_every` saves a new snapshot is written and the records before it are deleted.
+
+To find the changes since the last save without serialising the whole tree, a tree keeps track of what it has saved (see `track_tree` and `diff_tree`):
+the lengths of the lists that only grow (the conversation history, tasks completed and frontend rebuild), the results of the environment
+(which are never modified once added), and a fingerprint of everything else, which does not grow with the conversation (see `json_fingerprint`).
+A record is only written if no record with its sequence number exists, and the head is only moved forward,
+so processes saving the same conversation at once do not overwrite each other's records.
+
+Trees saved before this format have the full exported tree in the `tree` property of the head, and are still loaded as before.
+"""
+
+import json
+import hashlib
+from typing import Any
+
+import weaviate.classes.config as wc
+from weaviate.classes.query import Filter, Sort
+from weaviate.collections import CollectionAsync
+from weaviate.util import generate_uuid5
+
+from elysia.tree.codec import decode_tree_data
+
+
+def _hash_json(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True)
+    # short values are kept as they are, as the hash would not be any smaller
+    if len(text) < 32:
+        return text
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def json_fingerprint(value: Any) -> Any:
+    """
+    A compact summary of a JSON serialisable value, enough to find the changes to it with `diff_fingerprint`.
+    Dictionaries keep their keys (with the fingerprints of their values), lists become a tuple of the hashes of their items,
+    and other values are hashed.
+    """
+    if isinstance(value, dict):
+        return {key: json_fingerprint(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return tuple(_hash_json(v) for v in value)
+    return _hash_json(value)
+
+
+def diff_fingerprint(
+    fingerprint: Any, new: Any, path: list | None = None
+) -> tuple[list[dict], Any]:
+    """
+    Find the changes to a value since its fingerprint was taken, as operations in the format of `apply_json_delta`.
+    Lists that only grew are stored as the appended values only, and any changed items of a list are set in full.
+
+    Returns:
+        (tuple[list[dict], Any]): The operations, and the fingerprint of `new`.
+    """
+    if path is None:
+        path = []
+
+    if isinstance(fingerprint, dict) and isinstance(new, dict):
+        ops = [
+            {"op": "delete", "path": path + [key]}
+            for key in fingerprint
+            if key not in new
+        ]
+        new_fingerprint = {}
+        for key, value in new.items():
+            if key not in fingerprint:
+                ops.append({"op": "set", "path": path + [key], "value": value})
+                new_fingerprint[key] = json_fingerprint(value)
+            else:
+                key_ops, new_fingerprint[key] = diff_fingerprint(
+                    fingerprint[key], value, path + [key]
+                )
+                ops.extend(key_ops)
+        return ops, new_fingerprint
+
+    if (
+        isinstance(fingerprint, tuple)
+        and isinstance(new, list)
+        and len(new) >= len(fingerprint)
+    ):
+        hashes = tuple(_hash_json(v) for v in new)
+        ops = [
+            {"op": "set", "path": path + [i], "value": new[i]}
+            for i in range(len(fingerprint))
+            if hashes[i] != fingerprint[i]
+        ]
+        if len(new) > len(fingerprint):
+            ops.append(
+                {"op": "append", "path": path, "values": new[len(fingerprint) :]}
+            )
+        return ops, hashes
+
+    new_fingerprint = json_fingerprint(new)
+    if isinstance(fingerprint, str) and fingerprint == new_fingerprint:
+        return [], new_fingerprint
+    return [{"op": "set", "path": path, "value": new}], new_fingerprint
+
+
+# the lists of an exported tree that only grow, and whether their last item can still change after it is added
+# (a message is extended when the same role speaks again, and the tasks of the current prompt are added to its entry)
+_APPENDED_LISTS = {
+    ("tree_data", "conversation_history"): True,
+    ("tree_data", "tasks_completed"): True,
+    ("frontend_rebuild",): False,
+}
+_ENVIRONMENT_PATH = ("tree_data", "environment", "environment")
+
+
+def _get_path(value: Any, path: tuple) -> Any:
+    for key in path:
+        value = value[key]
+    return value
+
+
+def _without_paths(value: dict, paths: list[tuple]) -> dict:
+    # a shallow copy of the dictionary, without the values at the paths
+    value = dict(value)
+    children: dict[str, list[tuple]] = {}
+    for path in paths:
+        children.setdefault(path[0], []).append(path[1:])
+    for key, child_paths in children.items():
+        if key not in value:
+            continue
+        if any(len(path) == 0 for path in child_paths):
+            del value[key]
+        else:
+            value[key] = _without_paths(value[key], child_paths)
+    return value
+
+
+def _untracked(tree_json: dict) -> Any:
+    # normalised to JSON, so the fingerprint matches the saved (and reloaded) state
+    rest = _without_paths(tree_json, [*_APPENDED_LISTS, _ENVIRONMENT_PATH])
+    return json.loads(json.dumps(rest))
+
+
+def _track_list(values: list) -> tuple[list, int, str | None]:
+    # the list, its length, and a hash of its last item (which may still change)
+    return values, len(values), _hash_json(values[-1]) if len(values) > 0 else None
+
+
+def track_tree(tree_json: dict) -> dict:
+    """
+    The state needed to find the changes to an exported tree (the output of `Tree.export_to_json()`) with `diff_tree`,
+    taken when it is saved or loaded.
+
+    This holds references to the lists that only grow and to the environment results (not copies), with the number of items saved,
+    and a fingerprint of the rest of the tree, which does not grow with the conversation.
+    """
+    return {
+        "rest": json_fingerprint(_untracked(tree_json)),
+        "lists": {
+            path: _track_list(_get_path(tree_json, path)) for path in _APPENDED_LISTS
+        },
+        "environment": {
+            tool_name: {name: tuple(results) for name, results in tool_results.items()}
+            for tool_name, tool_results in _get_path(
+                tree_json, _ENVIRONMENT_PATH
+            ).items()
+        },
+    }
+
+
+def _diff_environment(saved: dict, environment: dict) -> list[dict]:
+    path = list(_ENVIRONMENT_PATH)
+    ops = [
+        {"op": "delete", "path": path + [tool_name]}
+        for tool_name in saved
+        if tool_name not in environment
+    ]
+    for tool_name, tool_results in environment.items():
+        if tool_name not in saved:
+            ops.append({"op": "set", "path": path + [tool_name], "value": tool_results})
+            continue
+
+        saved_results = saved[tool_name]
+        ops.extend(
+            {"op": "delete", "path": path + [tool_name, name]}
+            for name in saved_results
+            if name not in tool_results
+        )
+        for name, results in tool_results.items():
+            results_path = path + [tool_name, name]
+            previous = saved_results.get(name)
+            # results are not modified once added, so saved results are found by identity
+            if (
+                previous is not None
+                and len(results) >= len(previous)
+                and all(a is b for a, b in zip(previous, results))
+            ):
+                if len(results) > len(previous):
+                    ops.append(
+                        {
+                            "op": "append",
+                            "path": results_path,
+                            "values": results[len(previous) :],
+                        }
+                    )
+            else:
+                ops.append({"op": "set", "path": results_path, "value": results})
+    return ops
+
+
+def diff_tree(state: dict, tree_json: dict) -> tuple[list[dict], dict]:
+    """
+    Find the changes to an exported tree since `state` was taken (see `track_tree`), as operations in the format of `apply_json_delta`.
+
+    Only the items appended to the lists that only grow (and their last saved item, if it can still change) and the new environment results are included,
+    so the cost does not grow with the length of the conversation.
+    Items of those lists, and environment results, are assumed not to be modified in place once saved (other than the last item as above).
+    A list or environment result list that has been replaced or shortened is set in full.
+
+    Returns:
+        (tuple[list[dict], dict]): The operations, and the state of `tree_json`.
+    """
+    ops, rest = diff_fingerprint(state["rest"], _untracked(tree_json))
+
+    lists = {}
+    for path, mutable_last in _APPENDED_LISTS.items():
+        values = _get_path(tree_json, path)
+        saved, num_saved, last_hash = state["lists"][path]
+        if values is saved and len(values) >= num_saved:
+            if (
+                mutable_last
+                and num_saved > 0
+                and _hash_json(values[num_saved - 1]) != last_hash
+            ):
+                ops.append(
+                    {
+                        "op": "set",
+                        "path": list(path) + [num_saved - 1],
+                        "value": values[num_saved - 1],
+                    }
+                )
+            if len(values) > num_saved:
+                ops.append(
+                    {"op": "append", "path": list(path), "values": values[num_saved:]}
+                )
+        else:
+            ops.append({"op": "set", "path": list(path), "value": values})
+        lists[path] = _track_list(values)
+
+    environment = _get_path(tree_json, _ENVIRONMENT_PATH)
+    ops.extend(_diff_environment(state["environment"], environment))
+
+    return ops, {
+        "rest": rest,
+        "lists": lists,
+        "environment": {
+            tool_name: {name: tuple(results) for name, results in tool_results.items()}
+            for tool_name, tool_results in environment.items()
+        },
+    }
+
+
+def apply_json_delta(value: Any, ops: list[dict]) -> Any:
+    """
+    Apply the operations of a delta to a value, in place where possible. The operations are:
+
+    - `{"op": "set", "path": [...], "value": ...}`: set the value at the path.
+    - `{"op": "delete", "path": [...]}`: delete the dictionary key at the path.
+    - `{"op": "append", "path": [...], "values": [...]}`: append values to the list at the path.
+
+    Paths are lists of dictionary keys (str) and list indices (int).
+
+    Returns:
+        (Any): The updated value.
+    """
+    for op in ops:
+        if len(op["path"]) == 0:
+            if op["op"] == "set":
+                value = op["value"]
+            elif op["op"] == "append":
+                value.extend(op["values"])
+            continue
+
+        target = value
+        for key in op["path"][:-1]:
+            target = target[key]
+        key = op["path"][-1]
+
+        if op["op"] == "set":
+            target[key] = op["value"]
+        elif op["op"] == "delete":
+            del target[key]
+        elif op["op"] == "append":
+            target[key].extend(op["values"])
+
+    return value
+
+
+def get_records_collection_name(collection_name: str) -> str:
+    """
+    The name of the collection that stores the snapshot and delta records of the trees in `collection_name`.
+    E.g. `ELYSIA_TREES__` -> `ELYSIA_TREES_RECORDS__`.
+    """
+    return f"{collection_name.rstrip('_')}_RECORDS__"
+
+
+def get_record_uuid(conversation_id: str, sequence: int) -> str:
+    return generate_uuid5({"conversation_id": conversation_id, "sequence": sequence})
+
+
+async def create_trees_collection(client, collection_name: str) -> None:
+    await client.collections.create(
+        collection_name,
+        vectorizer_config=wc.Configure.Vectorizer.none(),
+        inverted_index_config=wc.Configure.inverted_index(index_timestamps=True),
+        properties=[
+            wc.Property(name="user_id", data_type=wc.DataType.TEXT),
+            wc.Property(name="conversation_id", data_type=wc.DataType.TEXT),
+            wc.Property(name="tree", data_type=wc.DataType.TEXT),
+            wc.Property(name="title", data_type=wc.DataType.TEXT),
+        ],
+    )
+
+
+async def create_records_collection(client, collection_name: str) -> None:
+    await client.collections.create(
+        collection_name,
+        vectorizer_config=wc.Configure.Vectorizer.none(),
+        properties=[
+            wc.Property(name="conversation_id", data_type=wc.DataType.TEXT),
+            wc.Property(name="sequence", data_type=wc.DataType.INT),
+            wc.Property(name="record_type", data_type=wc.DataType.TEXT),
+            wc.Property(
+                name="data",
+                data_type=wc.DataType.TEXT,
+                index_filterable=False,
+                index_searchable=False,
+            ),
+        ],
+    )
+
+
+async def get_head_sequence(
+    collection: CollectionAsync, conversation_id: str
+) -> int | None:
+    """
+    The sequence number of the latest record of a saved tree, from its head.
+    None if the tree has not been saved, or was saved before the delta format.
+    """
+    response = await collection.query.fetch_object_by_id(
+        generate_uuid5(conversation_id), return_properties=["tree"]
+    )
+    if response is None:
+        return None
+    manifest = json.loads(response.properties["tree"])  # type: ignore
+    if manifest.get("format") != "delta":
+        return None
+    return manifest["sequence"]
+
+
+async def insert_record(
+    records_collection: CollectionAsync,
+    conversation_id: str,
+    sequence: int,
+    record_type: str,
+    data: str,
+) -> bool:
+    """
+    Write a record, unless a record with the same sequence number already exists (e.g. written by another process).
+
+    Returns:
+        (bool): Whether the record was written.
+    """
+    uuid = get_record_uuid(conversation_id, sequence)
+    try:
+        # unlike a batch insert, this does not replace an existing object
+        await records_collection.data.insert(
+            uuid=uuid,
+            properties={
+                "conversation_id": conversation_id,
+                "sequence": sequence,
+                "record_type": record_type,
+                "data": data,
+            },
+        )
+    except Exception:
+        if await records_collection.data.exists(uuid):
+            return False
+        raise
+    return True
+
+
+def _conversation_filter(conversation_id: str):
+    return Filter.by_property("conversation_id").equal(conversation_id)
+
+
+async def load_records(
+    records_collection: CollectionAsync,
+    conversation_id: str,
+    snapshot_sequence: int,
+    sequence: int,
+) -> dict:
+    """
+    Rebuild an exported tree from its latest snapshot and the deltas after it.
+
+    Returns:
+        (dict): The exported tree, as from `Tree.export_to_json()`.
+    """
+    response = await records_collection.query.fetch_objects(
+        filters=(
+            _conversation_filter(conversation_id)
+            & Filter.by_property("sequence").greater_or_equal(snapshot_sequence)
+            & Filter.by_property("sequence").less_or_equal(sequence)
+        ),
+        sort=Sort.by_property("sequence", ascending=True),
+        limit=sequence - snapshot_sequence + 1,
+    )
+
+    records = response.objects
+    if (
+        len(records) != sequence - snapshot_sequence + 1
+        or records[0].properties["record_type"] != "snapshot"
+    ):
+        raise ValueError(
+            f"The saved records for conversation id '{conversation_id}' are incomplete."
+        )
+
+    tree_json = decode_tree_data(records[0].properties["data"])  # type: ignore
+    for record in records[1:]:
+        tree_json = apply_json_delta(tree_json, decode_tree_data(record.properties["data"]))  # type: ignore
+    return tree_json
+
+
+async def delete_records(
+    records_collection: CollectionAsync,
+    conversation_id: str,
+    before_sequence: int | None = None,
+) -> None:
+    """
+    Delete the records of a conversation, or only those before a sequence number.
+    """
+    filters = _conversation_filter(conversation_id)
+    if before_sequence is not None:
+        filters = filters & Filter.by_property("sequence").less_than(before_sequence)
+    await records_collection.data.delete_many(where=filters)
@@ -1,8 +1,9 @@
+import asyncio
 import inspect
 import json
 import time
 import textwrap
-from copy import deepcopy
+from copy import copy, deepcopy
 from typing import AsyncGenerator, Literal
 
 import dspy
@@ -14,8 +15,8 @@ from rich.panel import Panel
 import uuid
 
 # Weaviate
-import weaviate.classes.config as wc
 from weaviate.util import generate_uuid5
+from weaviate.collections.classes.data import DataObject
 
 # Elysia
 from elysia.config import Settings, ElysiaKeyManager
@@ -47,7 +48,21 @@ from elysia.tools.text.text import (
 )
 from elysia.tree.util import ForcedTextResponse
 from elysia.util.async_util import asyncio_run
+from elysia.util.batch_writer import BatchWriter
+from elysia.tree.codec import TreeCodec, encode_tree_data
+from elysia.tree.persistence import (
+    create_records_collection,
+    create_trees_collection,
+    delete_records,
+    diff_tree,
+    get_head_sequence,
+    get_records_collection_name,
+    insert_record,
+    load_records,
+    track_tree,
+)
 from elysia.tree.objects import CollectionData, TreeData, Atlas, Environment
+from elysia.tree.history import QueryHistory
 from elysia.util.client import ClientManager
 from elysia.config import (
     check_base_lm_settings,
@@ -56,6 +71,7 @@ from elysia.config import (
     load_complex_lm,
 )
 from elysia.util.objects import Tracker, TrainingUpdate, TreeUpdate
+from elysia.util.llm_cache import get_llm_cache
 from elysia.util.parsing import remove_whitespace
 from elysia.util.collection import retrieve_all_collection_names
 
@@ -170,7 +186,8 @@ class Tree:
 
         # some variables for storing feedback
         self.action_information = []
-        self.history = {}
+        self.iteration_stats = []
+        self.history = QueryHistory()
         self.training_updates = []
 
         # -- Get the root node and construct the tree
@@ -184,6 +201,10 @@ class Tree:
             conversation_id=self.conversation_id,
         )
 
+        # where the tree was last saved to (or loaded from) in Weaviate, and a fingerprint of the saved state,
+        # so only the changes are saved next time
+        self.persisted = None
+
         # Print the tree if required
         self.settings.logger.debug(
             "Initialised tree with the following decision nodes:"
@@ -519,7 +540,7 @@ class Tree:
         # conversation history is not reset
         # environment is not reset
         if self.low_memory:
-            self.history = {}
+            self.history.clear()
 
         self.recursion_counter = 0
         self.tree_data.num_trees_completed = 0
@@ -527,6 +548,7 @@ class Tree:
         self.training_updates = []
         self.tree_data.soft_reset()
         self.action_information = []
+        self.iteration_stats = []
         self.tree_index += 1
         self.retrieved_objects = []
         self.returner.set_tree_index(self.tree_index)
@@ -534,30 +556,67 @@ class Tree:
     def save_history(self, query_id: str, time_taken_seconds: float) -> None:
         """
         What the tree did, results for saving feedback.
+        Stored as an immutable record (see `elysia.tree.history`), the tree itself is not copied.
         """
-        training_update = deepcopy(
-            [update.to_json() for update in self.training_updates]
+        self.history.max_queries = self.settings.HISTORY_MAX_QUERIES
+        self.history.spill_directory = self.settings.HISTORY_SPILL_DIRECTORY
+        self.history.add(
+            query_id=query_id,
+            decisions=[item for sublist in self.decision_history for item in sublist],
+            iteration_stats=self.iteration_stats,
+            user_prompt=self.tree_data.user_prompt,
+            num_trees_completed=self.tree_data.num_trees_completed,
+            base_lm_used=self.settings.BASE_MODEL,
+            complex_lm_used=self.settings.COMPLEX_MODEL,
+            time_taken_seconds=time_taken_seconds,
+            initialisation=f"{self.branch_initialisation}",
+            environment=self.tree_data.environment.snapshot(),
+            conversation_history=self.tree_data.conversation_history,
+            tasks_completed=self.tree_data.tasks_completed,
+            action_information=self.action_information,
+            training_updates=[update.to_json() for update in self.training_updates],
         )
-
-        self.history[query_id] = {
-            "num_trees_completed": self.tree_data.num_trees_completed,
-            "tree_data": deepcopy(self.tree_data),
-            "action_information": deepcopy(self.action_information),
-            "decision_history": [
-                item for sublist in deepcopy(self.decision_history) for item in sublist
-            ],
-            "base_lm_used": self.settings.BASE_MODEL,
-            "complex_lm_used": self.settings.COMPLEX_MODEL,
-            "time_taken_seconds": time_taken_seconds,
-            "training_updates": training_update,
-            "initialisation": f"{self.branch_initialisation}",
-        }
         # can reset training updates now
         self.training_updates = []
 
     def set_start_time(self) -> None:
         self.start_time = time.time()
 
+    def _get_total_tokens(self) -> tuple[int, int]:
+        input_tokens = 0
+        output_tokens = 0
+        for model_type in ["base_lm", "complex_lm"]:
+            input_tokens += self.tracker.get_total_input_tokens(model_type) or 0
+            output_tokens += self.tracker.get_total_output_tokens(model_type) or 0
+        return input_tokens, output_tokens
+
+    def _start_iteration_stats(self) -> dict:
+        """
+        Start a record of the stats for a single iteration of the tree (a single pass from the root).
+        Timings are in seconds, token counts are only tracked when not in low memory mode.
+        """
+        input_tokens, output_tokens = self._get_total_tokens()
+        iteration_stats = {
+            "iteration": self.tree_data.num_trees_completed,
+            "decision_time": 0.0,
+            "tool_time": 0.0,
+            "total_time": 0.0,
+            "input_tokens": -input_tokens,
+            "output_tokens": -output_tokens,
+            "tools": [],
+            "start_time": time.perf_counter(),
+        }
+        self.iteration_stats.append(iteration_stats)
+        return iteration_stats
+
+    def _end_iteration_stats(self, iteration_stats: dict) -> None:
+        input_tokens, output_tokens = self._get_total_tokens()
+        iteration_stats["input_tokens"] += input_tokens
+        iteration_stats["output_tokens"] += output_tokens
+        iteration_stats["total_time"] = time.perf_counter() - iteration_stats.pop(
+            "start_time"
+        )
+
     def add_tool(
         self,
         tool,
@@ -1113,7 +1172,9 @@ class Tree:
         """
         with ElysiaKeyManager(self.settings):
             self.conversation_title = await create_conversation_title(
-                self.tree_data.conversation_history, self.base_lm
+                self.tree_data.conversation_history,
+                self.base_lm,
+                get_llm_cache(self.settings),
             )
         return self.conversation_title
 
@@ -1374,6 +1435,88 @@ class Tree:
                 unavailable_tools.append((tool, is_tool_available_doc))
         return available_tools, unavailable_tools
 
+    async def _collect_action_results(
+        self,
+        action_fn: Tool,
+        decision: Decision,
+        tree_data: TreeData,
+        client_manager: ClientManager,
+        **kwargs,
+    ) -> list:
+        results = []
+        try:
+            async for result in action_fn(
+                tree_data=tree_data,
+                inputs=decision.function_inputs,
+                base_lm=self.base_lm,
+                complex_lm=self.complex_lm,
+                client_manager=client_manager,
+                **kwargs,
+            ):
+                results.append(result)
+        except Exception as e:
+            # an error in one tool should not stop the others, so it is returned to the decision agent instead
+            self.settings.logger.exception(
+                f"Error in parallel tool {decision.function_name}"
+            )
+            results.append(Error(error_message=str(e)))
+        return results
+
+    def _start_parallel_actions(
+        self,
+        current_decision_node: DecisionNode,
+        client_manager: ClientManager,
+        **kwargs,
+    ) -> list[tuple[Decision, asyncio.Task]]:
+        """
+        Start any additional decisions chosen alongside the current decision as concurrent tasks.
+        The results of each are collected by the task, and are evaluated (added to the environment etc.)
+        in the order the decisions were made, after the current decision has finished.
+        So the results of these tools (including any updates for the frontend) are held until the current decision's tool has finished,
+        even if they finish first.
+        An exception raised by one of these tools becomes an `Error` result of its decision, and does not stop the other tools.
+        """
+        parallel_actions = []
+        for decision in self.current_decision.parallel_decisions:
+            action_fn: Tool = current_decision_node.options[decision.function_name][
+                "action"
+            ]  # type: ignore
+
+            decision.function_inputs = self._get_function_inputs(
+                decision.function_name, decision.function_inputs
+            )
+
+            self.decision_history[-1].append(decision.function_name)
+            self.tree_data.update_tasks_completed(
+                prompt=self.user_prompt,
+                task=decision.function_name,
+                num_trees_completed=self.tree_data.num_trees_completed,
+                reasoning=decision.reasoning,
+                action=True,
+            )
+
+            # each tool gets its own view of the tree data, so that errors are retrieved for the correct tool
+            tool_tree_data = copy(self.tree_data)
+            tool_tree_data.set_current_task(decision.function_name)
+
+            self.tracker.start_tracking(decision.function_name)
+            parallel_actions.append(
+                (
+                    decision,
+                    asyncio.create_task(
+                        self._collect_action_results(
+                            action_fn,
+                            decision,
+                            tool_tree_data,
+                            client_manager,
+                            **kwargs,
+                        )
+                    ),
+                )
+            )
+
+        return parallel_actions
+
     def _get_successive_actions(
         self, successive_actions: dict, current_options: dict
     ) -> dict:
@@ -1428,6 +1571,13 @@ class Tree:
                     f"Complex Model Usage: [magenta]0[/magenta] calls"
                 )
 
+        if self.tracker.llm_cache is not None:
+            self.settings.logger.debug(
+                f"LLM Cache: [green]{self.tracker.get_cache_hits()}[/green] hits "
+                f"([green]{self.tracker.get_cache_hits() - self.tracker.get_cache_hits(semantic=False)}[/green] similar prompts), "
+                f"[red]{self.tracker.get_cache_misses()}[/red] misses"
+            )
+
     async def async_run(
         self,
         user_prompt: str,
@@ -1436,7 +1586,6 @@ class Tree:
         training_route: str = "",
         query_id: str | None = None,
         close_clients_after_completion: bool = True,
-        _first_run: bool = True,
         **kwargs,
     ) -> AsyncGenerator[dict | None, None]:
         """
@@ -1453,372 +1602,434 @@ class Tree:
                 **self.settings.API_KEYS,
             )
 
-        # If training route is provided, split it into a list
-        if training_route != "":
-            route_list = training_route.split("/")
-        else:
-            route_list = []
+        self.settings.logger.debug(f"Style: {self.tree_data.atlas.style}")
+        self.settings.logger.debug(
+            f"Agent description: {self.tree_data.atlas.agent_description}"
+        )
+        self.settings.logger.debug(f"End goal: {self.tree_data.atlas.end_goal}")
+
+        if query_id is None:
+            query_id = str(uuid.uuid4())
+
+        self.returner.add_prompt(user_prompt, query_id)
+
+        # Reset the tree (clear temporary data specific to the last user prompt)
+        self.soft_reset()
+
+        check_base_lm_settings(self.settings)
+        check_complex_lm_settings(self.settings)
+
+        # Initialise some objects
+        self.tracker.llm_cache = get_llm_cache(self.settings)
+        self.tracker.track_cache_stats()
+        self.set_start_time()
+        self.query_id_to_prompt[query_id] = user_prompt
+        self.prompt_to_query_id[user_prompt] = query_id
+        self.tree_data.set_property("user_prompt", user_prompt)
+        self._update_conversation_history("user", user_prompt)
+        self.user_prompt = user_prompt
+
+        # check and start clients if not already started
+        if client_manager.is_client:
+            await client_manager.start_clients()
+
+            # Initialise the collections
+            if self.use_elysia_collections:
+                if collection_names == []:
+                    async with client_manager.connect_to_async_client() as client:
+                        collection_names = await retrieve_all_collection_names(client)
+                await self.set_collection_names(
+                    collection_names,
+                    client_manager,
+                )
 
-        # Some initial steps if this is the first run (no recursion yet)
-        if _first_run:
+        # If there are any empty branches, remove them (no tools attached to them)
+        self._remove_empty_branches()
 
-            self.settings.logger.debug(f"Style: {self.tree_data.atlas.style}")
-            self.settings.logger.debug(
-                f"Agent description: {self.tree_data.atlas.agent_description}"
+        if self.settings.LOGGING_LEVEL_INT <= 20:
+            print(
+                Panel.fit(
+                    user_prompt,
+                    title="User prompt",
+                    border_style="yellow",
+                    padding=(1, 1),
+                )
             )
-            self.settings.logger.debug(f"End goal: {self.tree_data.atlas.end_goal}")
 
-            if query_id is None:
-                query_id = str(uuid.uuid4())
+        # Loop through iterations of the tree until the goal is completed
+        while True:
 
-            self.returner.add_prompt(user_prompt, query_id)
+            # If training route is provided, split it into a list
+            if training_route != "":
+                route_list = training_route.split("/")
+            else:
+                route_list = []
 
-            # Reset the tree (clear temporary data specific to the last user prompt)
-            self.soft_reset()
+            iteration_stats = self._start_iteration_stats()
 
-            check_base_lm_settings(self.settings)
-            check_complex_lm_settings(self.settings)
+            # Start the tree at the root node
+            if self.root is not None:
+                current_decision_node: DecisionNode = self.decision_nodes[self.root]
+            else:
+                raise ValueError("No root node found!")
 
-            # Initialise some objects
-            self.set_start_time()
-            self.query_id_to_prompt[query_id] = user_prompt
-            self.prompt_to_query_id[user_prompt] = query_id
-            self.tree_data.set_property("user_prompt", user_prompt)
-            self._update_conversation_history("user", user_prompt)
-            self.user_prompt = user_prompt
+            # Loop through the tree until the end is reached
+            while True:
 
-            # check and start clients if not already started
-            if client_manager.is_client:
-                await client_manager.start_clients()
+                available_tools, unavailable_tools = await self._get_available_tools(
+                    current_decision_node, client_manager
+                )
 
-                # Initialise the collections
-                if self.use_elysia_collections:
-                    if collection_names == []:
-                        async with client_manager.connect_to_async_client() as client:
-                            collection_names = await retrieve_all_collection_names(
-                                client
-                            )
-                    await self.set_collection_names(
-                        collection_names,
-                        client_manager,
+                if len(available_tools) == 0:
+                    self.settings.logger.error("No tools available to use!")
+                    raise ValueError(
+                        "No tools available to use! "
+                        "Check the tool definitions and the `is_tool_available` methods."
                     )
 
-            # If there are any empty branches, remove them (no tools attached to them)
-            self._remove_empty_branches()
-
-            if self.settings.LOGGING_LEVEL_INT <= 20:
-                print(
-                    Panel.fit(
-                        user_prompt,
-                        title="User prompt",
-                        border_style="yellow",
-                        padding=(1, 1),
-                    )
+                init_options = deepcopy(self.tree["options"])
+                successive_actions = self._get_successive_actions(
+                    successive_actions={},
+                    current_options=init_options,
                 )
 
-        # Start the tree at the root node
-        if self.root is not None:
-            current_decision_node: DecisionNode = self.decision_nodes[self.root]
-        else:
-            raise ValueError("No root node found!")
-
-        # Loop through the tree until the end is reached
-        while True:
-
-            available_tools, unavailable_tools = await self._get_available_tools(
-                current_decision_node, client_manager
-            )
-
-            if len(available_tools) == 0:
-                self.settings.logger.error("No tools available to use!")
-                raise ValueError(
-                    "No tools available to use! "
-                    "Check the tool definitions and the `is_tool_available` methods."
+                # Evaluate any tools which have hardcoded rules that have been met
+                nodes_with_rules_met, rule_tool_inputs = await self._check_rules(
+                    current_decision_node.id, client_manager
                 )
 
-            init_options = deepcopy(self.tree["options"])
-            successive_actions = self._get_successive_actions(
-                successive_actions={},
-                current_options=init_options,
-            )
-
-            # Evaluate any tools which have hardcoded rules that have been met
-            nodes_with_rules_met, rule_tool_inputs = await self._check_rules(
-                current_decision_node.id, client_manager
-            )
+                if len(nodes_with_rules_met) > 0:
+                    for rule in nodes_with_rules_met:
+                        rule_decision = Decision(rule, {}, "", False, False)
+                        with ElysiaKeyManager(self.settings):
+                            async for result in self.tools[rule](
+                                tree_data=self.tree_data,
+                                inputs=rule_tool_inputs[rule],
+                                base_lm=self.base_lm,
+                                complex_lm=self.complex_lm,
+                                client_manager=client_manager,
+                            ):
+                                action_result, _ = await self._evaluate_result(
+                                    result, rule_decision
+                                )
+                                if action_result is not None:
+                                    yield action_result
+
+                # If training route is provided, decide from the training route
+                if len(route_list) > 0:
+                    self.settings.logger.debug(f"Route that will be used: {route_list}")
+
+                    (
+                        self.current_decision,
+                        training_route,
+                    ) = current_decision_node.decide_from_route(route_list)
+
+                    force_text_response = (
+                        self.current_decision.function_name == "text_response"
+                    )
 
-            if len(nodes_with_rules_met) > 0:
-                for rule in nodes_with_rules_met:
-                    rule_decision = Decision(rule, {}, "", False, False)
+                # Under normal circumstances decide from the decision node
+                else:
+                    decision_start_time = time.perf_counter()
+                    self.tracker.start_tracking("decision_node")
+                    self.tree_data.set_current_task("elysia_decision_node")
                     with ElysiaKeyManager(self.settings):
-                        async for result in self.tools[rule](
+                        self.current_decision, results = await current_decision_node(
                             tree_data=self.tree_data,
-                            inputs=rule_tool_inputs[rule],
                             base_lm=self.base_lm,
                             complex_lm=self.complex_lm,
+                            available_tools=available_tools,
+                            unavailable_tools=unavailable_tools,
+                            successive_actions=successive_actions,
                             client_manager=client_manager,
-                        ):
-                            action_result, _ = await self._evaluate_result(
-                                result, rule_decision
-                            )
-                            if action_result is not None:
-                                yield action_result
-
-            # If training route is provided, decide from the training route
-            if len(route_list) > 0:
-                self.settings.logger.debug(f"Route that will be used: {route_list}")
-
-                (
-                    self.current_decision,
-                    training_route,
-                ) = current_decision_node.decide_from_route(route_list)
-
-                force_text_response = (
-                    self.current_decision.function_name == "text_response"
-                )
-
-            # Under normal circumstances decide from the decision node
-            else:
-                self.tracker.start_tracking("decision_node")
-                self.tree_data.set_current_task("elysia_decision_node")
-                with ElysiaKeyManager(self.settings):
-                    self.current_decision, results = await current_decision_node(
-                        tree_data=self.tree_data,
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                        available_tools=available_tools,
-                        unavailable_tools=unavailable_tools,
-                        successive_actions=successive_actions,
-                        client_manager=client_manager,
-                    )
-
-                for result in results:
-                    action_result, _ = await self._evaluate_result(
-                        result, self.current_decision
-                    )
-                    if action_result is not None:
-                        yield action_result
-
-                self.tracker.end_tracking(
-                    "decision_node",
-                    "Decision Node",
-                    self.base_lm if not self.low_memory else None,
-                    self.complex_lm if not self.low_memory else None,
-                )
-
-                # Force text response (later) if model chooses end actions
-                # but no response will be generated from the node, set flag now
-                force_text_response = (
-                    not current_decision_node.options[
-                        self.current_decision.function_name
-                    ]["end"]
-                    and self.current_decision.end_actions
-                )
-
-            # Set default values for the function inputs for current call
-            self.current_decision.function_inputs = self._get_function_inputs(
-                self.current_decision.function_name,
-                self.current_decision.function_inputs,
-            )
-
-            # end criteria, task picked is "text_response" or model chooses to end conversation
-            completed = (
-                self.current_decision.function_name == "text_response"
-                or self.current_decision.end_actions
-                or self.current_decision.impossible
-                or self.tree_data.num_trees_completed > self.tree_data.recursion_limit
-            )
-
-            # assign action function
-            action_fn: Tool | None = current_decision_node.options[
-                self.current_decision.function_name
-            ][
-                "action"
-            ]  # type: ignore
-
-            # update the decision history
-            self.decision_history[-1].append(self.current_decision.function_name)
-
-            # print the current node information
-            if self.settings.LOGGING_LEVEL_INT <= 20:
-                print(
-                    Panel.fit(
-                        f"[bold]Node:[/bold] [magenta]{current_decision_node.id}[/magenta]\n"
-                        f"[bold]Decision:[/bold] [green]{self.current_decision.function_name}[/green]\n"
-                        f"[bold]Reasoning:[/bold] {self.current_decision.reasoning}\n",
-                        title="Current Decision",
-                        border_style="magenta",
-                        padding=(1, 1),
-                    )
-                )
-
-            self.tree_data.update_tasks_completed(
-                prompt=self.user_prompt,
-                task=self.current_decision.function_name,
-                num_trees_completed=self.tree_data.num_trees_completed,
-                reasoning=self.current_decision.reasoning,
-                action=action_fn is not None,
-            )
+                        )
 
-            # evaluate the action if this is not a branch
-            if action_fn is not None:
-                self.tracker.start_tracking(self.current_decision.function_name)
-                self.tree_data.set_current_task(self.current_decision.function_name)
-                successful_action = True
-                with ElysiaKeyManager(self.settings):
-                    async for result in action_fn(
-                        tree_data=self.tree_data,
-                        inputs=self.current_decision.function_inputs,
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                        client_manager=client_manager,
-                        **kwargs,
-                    ):
-                        action_result, error = await self._evaluate_result(
+                    for result in results:
+                        action_result, _ = await self._evaluate_result(
                             result, self.current_decision
                         )
-
                         if action_result is not None:
                             yield action_result
 
-                        successful_action = not error and successful_action
-
-                if not successful_action:
-                    completed = (
-                        False
-                        or self.tree_data.num_trees_completed
-                        > self.tree_data.recursion_limit
+                    self.tracker.end_tracking(
+                        "decision_node",
+                        "Decision Node",
+                        self.base_lm if not self.low_memory else None,
+                        self.complex_lm if not self.low_memory else None,
+                    )
+                    iteration_stats["decision_time"] += (
+                        time.perf_counter() - decision_start_time
                     )
 
-                if successful_action:
-                    self.tree_data.clear_error(self.current_decision.function_name)
+                    # Force text response (later) if model chooses end actions
+                    # but no response will be generated from the node, set flag now
+                    force_text_response = (
+                        not current_decision_node.options[
+                            self.current_decision.function_name
+                        ]["end"]
+                        and self.current_decision.end_actions
+                    )
 
-                self.tracker.end_tracking(
-                    self.current_decision.function_name,
+                # Set default values for the function inputs for current call
+                self.current_decision.function_inputs = self._get_function_inputs(
                     self.current_decision.function_name,
-                    self.base_lm if not self.low_memory else None,
-                    self.complex_lm if not self.low_memory else None,
+                    self.current_decision.function_inputs,
                 )
 
-            yield (
-                await self._evaluate_result(
-                    TreeUpdate(
-                        from_node=current_decision_node.id,
-                        to_node=self.current_decision.function_name,
-                        reasoning=(
-                            self.current_decision.reasoning
-                            if self.settings.BASE_USE_REASONING
-                            else ""
-                        ),
-                        reset_tree=current_decision_node.options[
-                            self.current_decision.function_name
-                        ]["next"]
-                        is None
-                        and (not completed),
-                    ),
-                    self.current_decision,
+                # end criteria, task picked is "text_response" or model chooses to end conversation
+                completed = (
+                    self.current_decision.function_name == "text_response"
+                    or self.current_decision.end_actions
+                    or self.current_decision.impossible
+                    or self.tree_data.num_trees_completed
+                    > self.tree_data.recursion_limit
                 )
-            )[0]
 
-            # check if the current node is the end of the tree
-            if (
-                current_decision_node.options[self.current_decision.function_name][
-                    "next"
-                ]
-                is None
-                or completed
-            ):
-                break
-            else:
-                current_decision_node = current_decision_node.options[
+                # assign action function
+                action_fn: Tool | None = current_decision_node.options[
                     self.current_decision.function_name
                 ][
-                    "next"
+                    "action"
                 ]  # type: ignore
 
-        self.tree_data.num_trees_completed += 1
+                # update the decision history
+                self.decision_history[-1].append(self.current_decision.function_name)
 
-        # end of all trees
-        if completed:
+                # print the current node information
+                if self.settings.LOGGING_LEVEL_INT <= 20:
+                    parallel_decision_names = ", ".join(
+                        decision.function_name
+                        for decision in self.current_decision.parallel_decisions
+                    )
+                    print(
+                        Panel.fit(
+                            f"[bold]Node:[/bold] [magenta]{current_decision_node.id}[/magenta]\n"
+                            f"[bold]Decision:[/bold] [green]{self.current_decision.function_name}[/green]\n"
+                            + (
+                                f"[bold]Parallel decisions:[/bold] [green]{parallel_decision_names}[/green]\n"
+                                if parallel_decision_names != ""
+                                else ""
+                            )
+                            + f"[bold]Reasoning:[/bold] {self.current_decision.reasoning}\n",
+                            title="Current Decision",
+                            border_style="magenta",
+                            padding=(1, 1),
+                        )
+                    )
 
-            # firstly, if we reached the end of a tree at a node that shouldn't be the end, call text response tool here to respond
-            if (
-                not current_decision_node.options[self.current_decision.function_name][
-                    "end"
-                ]
-                or force_text_response
-            ):
-                with ElysiaKeyManager(self.settings):
-                    async for result in self.tools["forced_text_response"](
-                        tree_data=self.tree_data,
-                        inputs={},
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                    ):
-                        action_result, _ = await self._evaluate_result(
-                            result, self.current_decision
+                self.tree_data.update_tasks_completed(
+                    prompt=self.user_prompt,
+                    task=self.current_decision.function_name,
+                    num_trees_completed=self.tree_data.num_trees_completed,
+                    reasoning=self.current_decision.reasoning,
+                    action=action_fn is not None,
+                )
+
+                # evaluate the action if this is not a branch
+                if action_fn is not None:
+                    tool_start_time = time.perf_counter()
+                    self.tracker.start_tracking(self.current_decision.function_name)
+                    self.tree_data.set_current_task(self.current_decision.function_name)
+                    successful_action = True
+                    successful_parallel_actions = True
+                    with ElysiaKeyManager(self.settings):
+                        parallel_actions = self._start_parallel_actions(
+                            current_decision_node, client_manager, **kwargs
+                        )
+                        try:
+                            async for result in action_fn(
+                                tree_data=self.tree_data,
+                                inputs=self.current_decision.function_inputs,
+                                base_lm=self.base_lm,
+                                complex_lm=self.complex_lm,
+                                client_manager=client_manager,
+                                **kwargs,
+                            ):
+                                action_result, error = await self._evaluate_result(
+                                    result, self.current_decision
+                                )
+
+                                if action_result is not None:
+                                    yield action_result
+
+                                successful_action = not error and successful_action
+
+                            # merge the parallel results in the order they were decided
+                            for parallel_decision, parallel_task in parallel_actions:
+                                successful_parallel_action = True
+                                for result in await parallel_task:
+                                    action_result, error = await self._evaluate_result(
+                                        result, parallel_decision
+                                    )
+
+                                    if action_result is not None:
+                                        yield action_result
+
+                                    successful_parallel_action = (
+                                        not error and successful_parallel_action
+                                    )
+
+                                if successful_parallel_action:
+                                    self.tree_data.clear_error(
+                                        parallel_decision.function_name
+                                    )
+
+                                successful_parallel_actions = (
+                                    successful_parallel_action
+                                    and successful_parallel_actions
+                                )
+
+                                self.tracker.end_tracking(
+                                    parallel_decision.function_name,
+                                    parallel_decision.function_name,
+                                    self.base_lm if not self.low_memory else None,
+                                    self.complex_lm if not self.low_memory else None,
+                                )
+                        finally:
+                            for _, parallel_task in parallel_actions:
+                                if not parallel_task.done():
+                                    parallel_task.cancel()
+
+                    if not successful_action or not successful_parallel_actions:
+                        completed = (
+                            False
+                            or self.tree_data.num_trees_completed
+                            > self.tree_data.recursion_limit
                         )
-                        if action_result is not None:
-                            yield action_result
 
-            self.save_history(
-                query_id=self.prompt_to_query_id[user_prompt],
-                time_taken_seconds=time.time() - self.start_time,
-            )
+                    if successful_action:
+                        self.tree_data.clear_error(self.current_decision.function_name)
 
-            yield await self.returner(
-                Completed(), query_id=self.prompt_to_query_id[user_prompt]
-            )
+                    self.tracker.end_tracking(
+                        self.current_decision.function_name,
+                        self.current_decision.function_name,
+                        self.base_lm if not self.low_memory else None,
+                        self.complex_lm if not self.low_memory else None,
+                    )
+                    iteration_stats["tool_time"] += (
+                        time.perf_counter() - tool_start_time
+                    )
+                    iteration_stats["tools"].append(self.current_decision.function_name)
+                    iteration_stats["tools"].extend(
+                        decision.function_name
+                        for decision in self.current_decision.parallel_decisions
+                    )
 
+                yield (
+                    await self._evaluate_result(
+                        TreeUpdate(
+                            from_node=current_decision_node.id,
+                            to_node=self.current_decision.function_name,
+                            reasoning=(
+                                self.current_decision.reasoning
+                                if self.settings.BASE_USE_REASONING
+                                else ""
+                            ),
+                            reset_tree=current_decision_node.options[
+                                self.current_decision.function_name
+                            ]["next"]
+                            is None
+                            and (not completed),
+                        ),
+                        self.current_decision,
+                    )
+                )[0]
+
+                # check if the current node is the end of the tree
+                if (
+                    current_decision_node.options[self.current_decision.function_name][
+                        "next"
+                    ]
+                    is None
+                    or completed
+                ):
+                    break
+                else:
+                    current_decision_node = current_decision_node.options[
+                        self.current_decision.function_name
+                    ][
+                        "next"
+                    ]  # type: ignore
+
+            self._end_iteration_stats(iteration_stats)
+            self.tree_data.num_trees_completed += 1
             self.settings.logger.debug(
-                f"[bold green]Model identified overall goal as completed![/bold green]"
-            )
-            self.settings.logger.debug(
-                f"Total time taken for decision tree: {time.time() - self.start_time:.2f} seconds"
-            )
-            self.settings.logger.debug(
-                f"Decision Node Avg. Time: {self.tracker.get_average_time('decision_node'):.2f} seconds"
+                f"Iteration {self.tree_data.num_trees_completed} took {iteration_stats['total_time']:.2f} seconds "
+                f"(decisions: {iteration_stats['decision_time']:.2f}s, tools: {iteration_stats['tool_time']:.2f}s, "
+                f"tokens: {iteration_stats['input_tokens']} in / {iteration_stats['output_tokens']} out)"
             )
-            self.log_token_usage()
 
-            avg_times = []
-            for i, iteration in enumerate(self.decision_history):
-                if iteration != []:
-                    avg_times = [
-                        (
-                            f"  - {task} ([magenta]Avg. {self.tracker.get_average_time(task):.2f} seconds[/magenta])\n"
-                            if task in self.tracker.trackers
-                            else ""
+            # end of all trees
+            if completed:
+
+                # firstly, if we reached the end of a tree at a node that shouldn't be the end, call text response tool here to respond
+                if (
+                    not current_decision_node.options[
+                        self.current_decision.function_name
+                    ]["end"]
+                    or force_text_response
+                ):
+                    with ElysiaKeyManager(self.settings):
+                        async for result in self.tools["forced_text_response"](
+                            tree_data=self.tree_data,
+                            inputs={},
+                            base_lm=self.base_lm,
+                            complex_lm=self.complex_lm,
+                        ):
+                            action_result, _ = await self._evaluate_result(
+                                result, self.current_decision
+                            )
+                            if action_result is not None:
+                                yield action_result
+
+                self.save_history(
+                    query_id=self.prompt_to_query_id[user_prompt],
+                    time_taken_seconds=time.time() - self.start_time,
+                )
+
+                yield await self.returner(
+                    Completed(), query_id=self.prompt_to_query_id[user_prompt]
+                )
+
+                self.settings.logger.debug(
+                    f"[bold green]Model identified overall goal as completed![/bold green]"
+                )
+                self.settings.logger.debug(
+                    f"Total time taken for decision tree: {time.time() - self.start_time:.2f} seconds"
+                )
+                self.settings.logger.debug(
+                    f"Decision Node Avg. Time: {self.tracker.get_average_time('decision_node'):.2f} seconds"
+                )
+                self.log_token_usage()
+
+                avg_times = []
+                for i, iteration in enumerate(self.decision_history):
+                    if iteration != []:
+                        avg_times = [
+                            (
+                                f"  - {task} ([magenta]Avg. {self.tracker.get_average_time(task):.2f} seconds[/magenta])\n"
+                                if task in self.tracker.trackers
+                                else ""
+                            )
+                            for task in iteration
+                        ]
+                        self.settings.logger.debug(
+                            f"Tasks completed (iteration {i+1}):\n" + "".join(avg_times)
                         )
-                        for task in iteration
-                    ]
-                    self.settings.logger.debug(
-                        f"Tasks completed (iteration {i+1}):\n" + "".join(avg_times)
-                    )
 
-            if close_clients_after_completion and client_manager.is_client:
-                await client_manager.close_clients()
+                if close_clients_after_completion and client_manager.is_client:
+                    await client_manager.close_clients()
 
-        # otherwise, end of the tree for this iteration, and recursively call process() to restart the tree
-        else:
+                break
+
+            # otherwise, end of the tree for this iteration, restart the tree from the root
             self.settings.logger.debug(
                 f"Model did [bold red]not[/bold red] yet complete overall goal! "
             )
             self.settings.logger.debug(
-                f"Restarting tree (Recursion: {self.tree_data.num_trees_completed+1}/{self.tree_data.recursion_limit})..."
+                f"Restarting tree (Iteration: {self.tree_data.num_trees_completed+1}/{self.tree_data.recursion_limit})..."
             )
-
-            # recursive call to restart the tree since the goal was not completed
             self.decision_history.append([])
-            async for result in self.async_run(
-                user_prompt,
-                collection_names,
-                client_manager,
-                training_route=training_route,
-                query_id=query_id,
-                _first_run=False,
-            ):
-                yield result
 
     def run(
         self,
@@ -1973,15 +2184,28 @@ class Tree:
             raise e
 
     async def export_to_weaviate(
-        self, collection_name: str, client_manager: ClientManager | None = None
+        self,
+        collection_name: str,
+        client_manager: ClientManager | None = None,
+        snapshot_every: int = 10,
+        codec: TreeCodec = "json",
     ) -> None:
         """
         Export the tree to a Weaviate collection.
 
+        Only the changes since the last export (or import) of this tree are written, as a delta record,
+        so the size of each save does not grow with the length of the conversation.
+        The tree keeps track of what it has saved to find the changes without serialising the whole tree (see `diff_tree`).
+        Every `snapshot_every` exports, a full snapshot of the tree is written instead and the older records are deleted.
+        See `elysia.tree.persistence` for the format.
+
         Args:
             collection_name (str): The name of the collection to export to.
             client_manager (ClientManager): The client manager to use.
                 If not provided, a new ClientManager will be created from environment variables.
+            snapshot_every (int): The number of exports between full snapshots of the tree.
+            codec (TreeCodec): The codec the records are saved with, `"json"` or `"binary"` (compressed).
+                Records saved with any codec can be imported. See `elysia.tree.codec`.
         """
         if client_manager is None:
             client_manager = ClientManager()
@@ -1989,67 +2213,110 @@ class Tree:
         else:
             close_after_use = False
 
+        records_collection_name = get_records_collection_name(collection_name)
+
+        tree_json = self.export_to_json()
+
+        location = (client_manager.wcd_url, collection_name)
+        persisted = (
+            self.persisted
+            if self.persisted is not None and self.persisted["location"] == location
+            else None
+        )
+
         async with client_manager.connect_to_async_client() as client:
 
             if not await client.collections.exists(collection_name):
-                await client.collections.create(
-                    collection_name,
-                    vectorizer_config=wc.Configure.Vectorizer.none(),
-                    inverted_index_config=wc.Configure.inverted_index(
-                        index_timestamps=True
-                    ),
-                    properties=[
-                        wc.Property(
-                            name="user_id",
-                            data_type=wc.DataType.TEXT,
-                        ),
-                        wc.Property(
-                            name="conversation_id",
-                            data_type=wc.DataType.TEXT,
-                        ),
-                        wc.Property(
-                            name="tree",
-                            data_type=wc.DataType.TEXT,
-                        ),
-                        wc.Property(
-                            name="title",
-                            data_type=wc.DataType.TEXT,
-                        ),
-                    ],
-                )
+                await create_trees_collection(client, collection_name)
 
-            collection = client.collections.get(collection_name)
+            if not await client.collections.exists(records_collection_name):
+                await create_records_collection(client, records_collection_name)
 
-            json_data_str = json.dumps(self.export_to_json())
+            collection = client.collections.get(collection_name)
+            records_collection = client.collections.get(records_collection_name)
 
-            uuid = generate_uuid5(self.conversation_id)
+            # if the tree was saved elsewhere since (e.g. by another process), the changes are not since the saved state
+            head_sequence = await get_head_sequence(collection, self.conversation_id)
+            if persisted is not None and persisted["sequence"] != head_sequence:
+                persisted = None
 
-            if await collection.data.exists(uuid):
-                await collection.data.update(
-                    uuid=uuid,
-                    properties={
-                        "user_id": self.user_id,
-                        "conversation_id": self.conversation_id,
-                        "tree": json_data_str,
-                        "title": self.conversation_title,
-                    },
-                )
-                self.settings.logger.info(
-                    f"Successfully updated existing tree in collection '{collection_name}' with id '{self.conversation_id}'"
-                )
+            sequence = head_sequence + 1 if head_sequence is not None else 0
+            if (
+                persisted is not None
+                and sequence - persisted["snapshot_sequence"] < snapshot_every
+            ):
+                snapshot_sequence = persisted["snapshot_sequence"]
+                record_type = "delta"
+                ops, tracked = diff_tree(persisted["tracked"], tree_json)
+                data = encode_tree_data(ops, codec)
             else:
-                await collection.data.insert(
-                    uuid=uuid,
-                    properties={
-                        "user_id": self.user_id,
-                        "conversation_id": self.conversation_id,
-                        "tree": json_data_str,
-                        "title": self.conversation_title,
-                    },
+                snapshot_sequence = sequence
+                record_type = "snapshot"
+                tracked = track_tree(tree_json)
+                data = encode_tree_data(tree_json, codec)
+
+            # write the record before the head, so the head never points to a missing record
+            while not await insert_record(
+                records_collection, self.conversation_id, sequence, record_type, data
+            ):
+                # another process has written a record with this sequence number, so write a snapshot after it
+                sequence += 1
+                snapshot_sequence = sequence
+                record_type = "snapshot"
+                data = encode_tree_data(tree_json, codec)
+
+            # only move the head forward, in case another process has saved a later record since
+            head_sequence = await get_head_sequence(collection, self.conversation_id)
+            if head_sequence is not None and head_sequence >= sequence:
+                self.settings.logger.warning(
+                    f"Tree with id '{self.conversation_id}' was saved to collection '{collection_name}' "
+                    f"by another process at the same time, keeping the later save."
                 )
-                self.settings.logger.info(
-                    f"Successfully inserted new tree in collection '{collection_name}' with id '{self.conversation_id}'"
+            else:
+                # inserting with an existing uuid replaces the existing head
+                summary = await BatchWriter(logger=self.settings.logger).insert_objects(
+                    collection,
+                    [
+                        DataObject(
+                            uuid=generate_uuid5(self.conversation_id),
+                            properties={
+                                "user_id": self.user_id,
+                                "conversation_id": self.conversation_id,
+                                "tree": json.dumps(
+                                    {
+                                        "format": "delta",
+                                        "sequence": sequence,
+                                        "snapshot_sequence": snapshot_sequence,
+                                    }
+                                ),
+                                "title": self.conversation_title,
+                            },
+                        )
+                    ],
                 )
+                if summary["num_failed"] > 0:
+                    raise Exception(
+                        f"Failed to export tree to collection '{collection_name}': {summary['errors'][0]}"
+                    )
+
+                if record_type == "snapshot":
+                    await delete_records(
+                        records_collection,
+                        self.conversation_id,
+                        before_sequence=sequence,
+                    )
+
+        self.persisted = {
+            "location": location,
+            "tracked": tracked,
+            "sequence": sequence,
+            "snapshot_sequence": snapshot_sequence,
+        }
+
+        self.settings.logger.info(
+            f"Successfully exported tree to collection '{collection_name}' with id '{self.conversation_id}' "
+            f"({record_type} {sequence}, {len(data)} characters)"
+        )
 
         if close_after_use:
             await client_manager.close_clients()
@@ -2136,6 +2403,22 @@ class Tree:
 
             response = await collection.query.fetch_object_by_id(uuid)
 
+            if response is not None:
+                json_data_str = response.properties["tree"]
+                json_data = json.loads(json_data_str)  # type: ignore
+                manifest = json_data if json_data.get("format") == "delta" else None
+
+                # replay the latest snapshot and the deltas after it
+                if manifest is not None:
+                    json_data = await load_records(
+                        client.collections.get(
+                            get_records_collection_name(collection_name)
+                        ),
+                        conversation_id,
+                        manifest["snapshot_sequence"],
+                        manifest["sequence"],
+                    )
+
         if close_after_use:
             await client_manager.close_clients()
 
@@ -2144,10 +2427,18 @@ class Tree:
                 f"No tree found for conversation id '{conversation_id}' in collection '{collection_name}'."
             )
 
-        json_data_str = response.properties["tree"]
-        json_data = json.loads(json_data_str)  # type: ignore
+        tree = cls.import_from_json(json_data)
+
+        # continue the saved records on the next export
+        if manifest is not None:
+            tree.persisted = {
+                "location": (client_manager.wcd_url, collection_name),
+                "tracked": track_tree(tree.export_to_json()),
+                "sequence": manifest["sequence"],
+                "snapshot_sequence": manifest["snapshot_sequence"],
+            }
 
-        return cls.import_from_json(json_data)
+        return tree
 
     def __call__(self, *args, **kwargs) -> tuple[str, list[dict]]:
         return self.run(*args, **kwargs)
@@ -1,3 +1,7 @@
+import base64
+import datetime
+import json
+import time
 import uuid
 
 # dspy requires a 'base' LM but this should not be used
@@ -21,10 +25,12 @@ from elysia.objects import (
 )
 
 from elysia.tree.objects import TreeData
+from elysia.tree.persistence import delete_records, get_records_collection_name
 from elysia.util.objects import TrainingUpdate, TreeUpdate, FewShotExamples
 from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
 from elysia.util.parsing import format_datetime
 from elysia.util.client import ClientManager
+from elysia.util.llm_cache import LLMCache, get_llm_cache
 from elysia.tree.prompt_templates import (
     FollowUpSuggestionsPrompt,
     TitleCreatorPrompt,
@@ -228,6 +234,7 @@ class Decision:
         impossible: bool,
         end_actions: bool,
         last_in_tree: bool = False,
+        parallel_decisions: list["Decision"] | None = None,
     ):
         self.function_name = function_name
         self.function_inputs = function_inputs
@@ -236,6 +243,12 @@ class Decision:
         self.end_actions = end_actions
         self.last_in_tree = last_in_tree
 
+        # additional, independent decisions to be run alongside this one
+        if parallel_decisions is None:
+            self.parallel_decisions = []
+        else:
+            self.parallel_decisions = parallel_decisions
+
 
 class DecisionNode:
     """
@@ -374,6 +387,85 @@ class DecisionNode:
         compiled_executor = optimizer.compile(decision_executor, trainset=examples)
         return compiled_executor
 
+    def _add_parallel_actions_field(self, module: ElysiaChainOfThought):
+        """
+        Add an output field to the decision module so that the model can choose
+        additional actions to run at the same time as `function_name`.
+        """
+        parallel_actions_desc = (
+            "Other actions from `available_actions` that can be run at the same time as `function_name`. "
+            "Only include actions that are completely independent of `function_name` and of each other, "
+            "i.e. they do not need the output of any other action to decide their inputs. "
+            "For example, searching two different collections, or a search and an aggregation that do not depend on each other. "
+            "Do not include any action that responds to the user, or any action that is identical to `function_name`. "
+            "This is a list of dictionaries, each with the keys `function_name` and `function_inputs`, "
+            "following the same rules as `function_name` and `function_inputs`. "
+            "Return an empty list ([]) if there are no other independent actions to run now."
+        )
+        parallel_actions_prefix = "${parallel_actions}"
+        parallel_actions_field: list[dict] = dspy.OutputField(
+            prefix=parallel_actions_prefix, desc=parallel_actions_desc
+        )
+        module.predict.signature = module.predict.signature.append(  # type: ignore
+            name="parallel_actions", field=parallel_actions_field, type_=list[dict]
+        )
+
+    def _parse_parallel_actions(
+        self,
+        parallel_actions: list[dict] | None,
+        primary_decision: Decision,
+        available_tools: list[str],
+    ) -> list[Decision]:
+        """
+        Convert the parallel actions output by the model into Decision objects.
+        Any actions that cannot be run alongside the primary decision are ignored,
+        i.e. branches, end tools, or repeats of an existing decision.
+        Parallel actions do not continue onto any of their successive actions, only the primary decision does.
+        """
+        if not parallel_actions or not isinstance(parallel_actions, list):
+            return []
+
+        primary_option = self.options[primary_decision.function_name]
+        if primary_option["action"] is None:
+            return []
+
+        parallel_decisions = []
+        seen = [(primary_decision.function_name, str(primary_decision.function_inputs))]
+        for parallel_action in parallel_actions:
+            if not isinstance(parallel_action, dict):
+                continue
+
+            function_name = str(parallel_action.get("function_name", "")).strip("'\"`")
+            function_inputs = parallel_action.get("function_inputs", {})
+            if not isinstance(function_inputs, dict):
+                function_inputs = {}
+
+            if (
+                function_name not in available_tools
+                or function_name not in self.options
+                or self.options[function_name]["action"] is None
+                or self.options[function_name]["end"]
+                or (function_name, str(function_inputs)) in seen
+            ):
+                if self.logger:
+                    self.logger.debug(
+                        f"Ignoring parallel action `{function_name}` (cannot be run alongside `{primary_decision.function_name}`)"
+                    )
+                continue
+
+            seen.append((function_name, str(function_inputs)))
+            parallel_decisions.append(
+                Decision(
+                    function_name=function_name,
+                    function_inputs=function_inputs,
+                    reasoning=primary_decision.reasoning,
+                    impossible=False,
+                    end_actions=False,
+                )
+            )
+
+        return parallel_decisions
+
     def _tool_assertion(self, kwargs, pred):
         return (
             pred.function_name in self.options,
@@ -424,6 +516,9 @@ class DecisionNode:
                 reasoning=tree_data.settings.BASE_USE_REASONING,
             )
 
+            if tree_data.settings.USE_PARALLEL_TOOLS:
+                self._add_parallel_actions_field(decision_module)
+
             decision_executor = AssertedModule(
                 decision_module,
                 assertion=self._tool_assertion,
@@ -487,6 +582,13 @@ class DecisionNode:
                 output.end_actions and bool(self.options[output.function_name]["end"]),
             )
 
+            if tree_data.settings.USE_PARALLEL_TOOLS:
+                decision.parallel_decisions = self._parse_parallel_actions(
+                    getattr(output, "parallel_actions", None),
+                    decision,
+                    available_tools,
+                )
+
             results = [
                 TrainingUpdate(
                     module_name="decision",
@@ -630,12 +732,21 @@ class TreeReturner:
             return payload
 
 
-async def create_conversation_title(conversation: list[dict], lm: dspy.LM):
+async def create_conversation_title(
+    conversation: list[dict], lm: dspy.LM, llm_cache: LLMCache | None = None
+):
     title_creator = dspy.Predict(TitleCreatorPrompt)
-    title = await title_creator.aforward(
-        conversation=conversation,
-        lm=lm,
-    )
+    if llm_cache is not None:
+        title = await llm_cache.acall(
+            title_creator,
+            conversation=conversation,
+            lm=lm,
+        )
+    else:
+        title = await title_creator.aforward(
+            conversation=conversation,
+            lm=lm,
+        )
     return title.title
 
 
@@ -661,22 +772,178 @@ async def get_follow_up_suggestions(
             "Or, questions which span across other collections, but are still relevant to the user's prompt."
         )
 
+    inputs = {
+        "user_prompt": tree_data.user_prompt,
+        "reference": tree_data.atlas.datetime_reference,
+        "conversation_history": tree_data.conversation_history,
+        "environment": tree_data.environment.to_prompt(
+            tree_data.settings.ENVIRONMENT_TOKEN_BUDGET
+        ),
+        "data_information": tree_data.output_collection_metadata(with_mappings=False),
+        "old_suggestions": current_suggestions,
+        "context": context,
+        "num_suggestions": num_suggestions,
+    }
+
     # get prediction
-    prediction = await follow_up_suggestor.aforward(
-        user_prompt=tree_data.user_prompt,
-        reference=tree_data.atlas.datetime_reference,
-        conversation_history=tree_data.conversation_history,
-        environment=tree_data.environment.environment,
-        data_information=tree_data.output_collection_metadata(with_mappings=False),
-        old_suggestions=current_suggestions,
-        context=context,
-        num_suggestions=num_suggestions,
-        lm=lm,
-    )
+    llm_cache = get_llm_cache(tree_data.settings)
+    if llm_cache is not None:
+        prediction = await llm_cache.acall(follow_up_suggestor, lm=lm, **inputs)
+    else:
+        prediction = await follow_up_suggestor.aforward(lm=lm, **inputs)
 
     return prediction.suggestions
 
 
+def encode_saved_trees_page_token(
+    last_update_time: datetime.datetime, conversation_ids: list[str]
+) -> str:
+    """
+    Encode the position after a page of saved trees, which are sorted by last update time (newest first).
+    The conversation IDs are the trees already returned with exactly `last_update_time`, so trees updated at the same time are not skipped.
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps({"t": last_update_time.isoformat(), "ids": conversation_ids}).encode(
+            "utf-8"
+        )
+    ).decode("ascii")
+
+
+def decode_saved_trees_page_token(
+    page_token: str,
+) -> tuple[datetime.datetime, list[str]]:
+    try:
+        token = json.loads(base64.urlsafe_b64decode(page_token.encode("ascii")))
+        return datetime.datetime.fromisoformat(token["t"]), list(token["ids"])
+    except Exception:
+        raise ValueError(f"Invalid page token '{page_token}'.")
+
+
+def _next_page_token(
+    page: list[dict], page_token: str | None, has_more: bool
+) -> str | None:
+    if not has_more or len(page) == 0:
+        return None
+
+    last_update_time = page[-1]["last_update_time"]
+    conversation_ids = [
+        tree["conversation_id"]
+        for tree in page
+        if tree["last_update_time"] == last_update_time
+    ]
+    if page_token is not None:
+        previous_update_time, previous_ids = decode_saved_trees_page_token(page_token)
+        if previous_update_time == last_update_time:
+            conversation_ids = previous_ids + conversation_ids
+    return encode_saved_trees_page_token(last_update_time, conversation_ids)
+
+
+def _format_saved_tree(tree: dict) -> dict:
+    return {
+        "conversation_id": tree["conversation_id"],
+        "title": tree["title"],
+        "last_update_time": format_datetime(tree["last_update_time"]),
+    }
+
+
+async def _list_saved_trees(
+    collection_name: str,
+    client_manager: ClientManager,
+    user_id: str | None,
+    limit: int,
+    page_token: str | None,
+) -> tuple[list[dict], str | None]:
+    filters = []
+    if user_id is not None:
+        filters.append(Filter.by_property("user_id").equal(user_id))
+
+    seen_ids = []
+    if page_token is not None:
+        last_update_time, seen_ids = decode_saved_trees_page_token(page_token)
+        filters.append(Filter.by_update_time().less_or_equal(last_update_time))
+
+    async with client_manager.connect_to_async_client() as client:
+
+        if not await client.collections.exists(collection_name):
+            return [], None
+
+        collection = client.collections.get(collection_name)
+        response = await collection.query.fetch_objects(
+            # trees already returned with the same update time are fetched again, and removed below
+            limit=limit + len(seen_ids) + 1,
+            sort=Sort.by_update_time(ascending=False),
+            return_properties=["conversation_id", "title"],
+            return_metadata=MetadataQuery(last_update_time=True),
+            filters=Filter.all_of(filters) if filters else None,
+        )
+
+    trees = [
+        {
+            "conversation_id": obj.properties["conversation_id"],
+            "title": obj.properties["title"],
+            "last_update_time": obj.metadata.last_update_time,
+        }
+        for obj in response.objects
+        if obj.properties["conversation_id"] not in seen_ids
+    ]
+    page = trees[:limit]
+    return page, _next_page_token(page, page_token, len(trees) > limit)
+
+
+async def list_saved_trees_weaviate(
+    collection_name: str,
+    client_manager: ClientManager | None = None,
+    user_id: str | None = None,
+    limit: int = 50,
+    page_token: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    Get a page of saved trees from a Weaviate collection, newest first.
+    Only the conversation ID, title and last update time of each tree are fetched, not the saved trees themselves.
+
+    Args:
+        collection_name (str): The name of the collection to get the trees from.
+        client_manager (ClientManager): The client manager to use.
+            If not provided, a new ClientManager will be created from environment variables.
+        user_id (str): The user ID to get the trees from.
+            If not provided, the trees will be retrieved from the collection without any filters.
+        limit (int): The maximum number of trees in the page.
+        page_token (str | None): The `next_page_token` returned with the previous page, or None for the first page.
+
+    Returns:
+        (tuple[list[dict], str | None]): The page of trees, as dictionaries with the `conversation_id`, `title` and `last_update_time`,
+            and the token for the next page (None if this is the last page).
+    """
+    if client_manager is None:
+        client_manager = ClientManager()
+        close_after_use = True
+    else:
+        close_after_use = False
+
+    page, next_page_token = await _list_saved_trees(
+        collection_name, client_manager, user_id, limit, page_token
+    )
+
+    if close_after_use:
+        await client_manager.close_clients()
+
+    return [_format_saved_tree(tree) for tree in page], next_page_token
+
+
+async def _list_all_saved_trees(
+    collection_name: str, client_manager: ClientManager, user_id: str | None
+) -> list[dict]:
+    trees = []
+    page_token = None
+    while True:
+        page, page_token = await _list_saved_trees(
+            collection_name, client_manager, user_id, 1000, page_token
+        )
+        trees.extend(page)
+        if page_token is None:
+            return trees
+
+
 async def get_saved_trees_weaviate(
     collection_name: str,
     client_manager: ClientManager | None = None,
@@ -684,6 +951,7 @@ async def get_saved_trees_weaviate(
 ):
     """
     Get all saved trees from a Weaviate collection.
+    For large numbers of trees, use `list_saved_trees_weaviate` to get them a page at a time.
 
     Args:
         collection_name (str): The name of the collection to get the trees from.
@@ -701,44 +969,152 @@ async def get_saved_trees_weaviate(
     else:
         close_after_use = False
 
-    if user_id is not None:
-        user_id_filter = Filter.by_property("user_id").equal(user_id)
-    else:
-        user_id_filter = None
+    trees = await _list_all_saved_trees(collection_name, client_manager, user_id)
 
-    async with client_manager.connect_to_async_client() as client:
+    if close_after_use:
+        await client_manager.close_clients()
 
+    return {
+        tree["conversation_id"]: {
+            "title": tree["title"],
+            "last_update_time": format_datetime(tree["last_update_time"]),
+        }
+        for tree in trees
+    }
+
+
+async def get_saved_tree_update_time(
+    conversation_id: str, collection_name: str, client_manager: ClientManager
+) -> datetime.datetime | None:
+    """
+    Get the last update time of a saved tree, as recorded by Weaviate, or None if the tree is not saved.
+    """
+    async with client_manager.connect_to_async_client() as client:
         if not await client.collections.exists(collection_name):
-            return {}
+            return None
+        response = await client.collections.get(
+            collection_name
+        ).query.fetch_object_by_id(
+            generate_uuid5(conversation_id), return_properties=["conversation_id"]
+        )
+    if response is None:
+        return None
+    return response.metadata.last_update_time
 
-        collection = client.collections.get(collection_name)
 
-        len_collection = (
-            await collection.aggregate.over_all(
-                total_count=True,
-                filters=user_id_filter,
-            )
-        ).total_count
+class SavedTreeIndex:
+    """
+    An in-memory index of the conversation IDs, titles and last update times of the trees a user has saved in one location,
+    so the saved trees can be listed (a page at a time) without querying Weaviate on every request.
 
-        response = await collection.query.fetch_objects(
-            limit=len_collection,
-            sort=Sort.by_update_time(ascending=False),
-            return_metadata=MetadataQuery(last_update_time=True),
-            filters=user_id_filter,
-        )
+    The index is loaded from Weaviate (see `load`), and should then be kept up to date
+    by calling `update` when a tree is saved and `remove` when a tree is deleted.
+    Trees saved or deleted elsewhere (e.g. by another process) are only seen when the index is loaded again,
+    which should be done once it is older than `ttl` seconds (see `is_stale`).
+    """
 
-    if close_after_use:
-        await client_manager.close_clients()
+    def __init__(self, ttl: float | None = None) -> None:
+        """
+        Args:
+            ttl (float | None): The number of seconds after loading the index is considered stale. None to never go stale.
+        """
+        self.trees: dict[str, dict] = {}
+        self.ttl = ttl
+        self.loaded_at: float | None = None
 
-    trees = {
-        obj.properties["conversation_id"]: {
-            "title": obj.properties["title"],
-            "last_update_time": format_datetime(obj.metadata.last_update_time),
+        # changes made while the index is loading, applied on top of the loaded trees
+        self.changes: dict[str, dict | None] | None = None
+
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self.loaded_at > self.ttl
+
+    async def load(
+        self,
+        collection_name: str,
+        client_manager: ClientManager,
+        user_id: str | None = None,
+    ) -> None:
+        self.changes = {}
+        try:
+            trees = await _list_all_saved_trees(
+                collection_name, client_manager, user_id
+            )
+            self.trees = {tree["conversation_id"]: tree for tree in trees}
+            for conversation_id, tree in self.changes.items():
+                if tree is None:
+                    self.trees.pop(conversation_id, None)
+                else:
+                    self.trees[conversation_id] = tree
+        finally:
+            self.changes = None
+
+        self.loaded_at = time.monotonic()
+
+    def update(
+        self,
+        conversation_id: str,
+        title: str,
+        last_update_time: datetime.datetime | None = None,
+    ) -> None:
+        """
+        Add or update a saved tree.
+        The `last_update_time` should be the one recorded by Weaviate (see `get_saved_tree_update_time`),
+        so it is comparable with those of trees loaded from Weaviate. Defaults to the current time.
+        """
+        tree = {
+            "conversation_id": conversation_id,
+            "title": title,
+            "last_update_time": last_update_time
+            or datetime.datetime.now(datetime.timezone.utc),
         }
-        for obj in response.objects
-    }
+        self.trees[conversation_id] = tree
+        if self.changes is not None:
+            self.changes[conversation_id] = tree
+
+    def remove(self, conversation_id: str) -> None:
+        self.trees.pop(conversation_id, None)
+        if self.changes is not None:
+            self.changes[conversation_id] = None
+
+    def page(
+        self, limit: int = 50, page_token: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        """
+        Get a page of the saved trees, newest first, in the same format as `list_saved_trees_weaviate`.
+        """
+        trees = sorted(
+            self.trees.values(), key=lambda tree: tree["last_update_time"], reverse=True
+        )
+        if page_token is not None:
+            last_update_time, seen_ids = decode_saved_trees_page_token(page_token)
+            trees = [
+                tree
+                for tree in trees
+                if tree["last_update_time"] < last_update_time
+                or (
+                    tree["last_update_time"] == last_update_time
+                    and tree["conversation_id"] not in seen_ids
+                )
+            ]
+
+        page = trees[:limit]
+        next_page_token = _next_page_token(page, page_token, len(trees) > limit)
+        return [_format_saved_tree(tree) for tree in page], next_page_token
 
-    return trees
+    def to_dict(self) -> dict:
+        """
+        All saved trees, newest first, in the same format as `get_saved_trees_weaviate`.
+        """
+        trees, _ = self.page(limit=len(self.trees))
+        return {
+            tree["conversation_id"]: {
+                "title": tree["title"],
+                "last_update_time": tree["last_update_time"],
+            }
+            for tree in trees
+        }
 
 
 async def delete_tree_from_weaviate(
@@ -747,7 +1123,7 @@ async def delete_tree_from_weaviate(
     client_manager: ClientManager | None = None,
 ):
     """
-    Delete a tree from a Weaviate collection.
+    Delete a tree (and its saved records, see `elysia.tree.persistence`) from a Weaviate collection.
 
     Args:
         conversation_id (str): The conversation ID of the tree to delete.
@@ -764,3 +1140,9 @@ async def delete_tree_from_weaviate(
         uuid = generate_uuid5(conversation_id)
         if await collection.data.exists(uuid):
             await collection.data.delete_by_id(uuid)
+
+        records_collection_name = get_records_collection_name(collection_name)
+        if await client.collections.exists(records_collection_name):
+            await delete_records(
+                client.collections.get(records_collection_name), conversation_id
+            )
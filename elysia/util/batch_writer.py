@@ -0,0 +1,269 @@
+import json
+import time
+import asyncio
+from logging import Logger
+from typing import Any, Awaitable, Callable, Sequence
+
+from weaviate.collections import CollectionAsync
+from weaviate.collections.classes.data import DataObject, DataReference
+
+
+def _vector_length(vector: Any) -> int:
+    # named vectors are a dict of vectors, and multi-vectors a list of vectors
+    if isinstance(vector, dict):
+        return sum(_vector_length(value) for value in vector.values())
+    if len(vector) > 0 and hasattr(vector[0], "__len__"):
+        return sum(len(value) for value in vector)
+    return len(vector)
+
+
+def _payload_size(item: DataObject | DataReference) -> int:
+    """
+    Estimate the number of bytes an object or reference takes up in a batch request.
+    """
+    if isinstance(item, DataReference):
+        to_uuids = item.to_uuid if isinstance(item.to_uuid, list) else [item.to_uuid]
+        return len(item.from_property) + 36 * (1 + len(to_uuids))
+
+    size = 36
+    if item.properties is not None:
+        size += len(json.dumps(item.properties, default=str))
+    if item.references is not None:
+        size += len(json.dumps(item.references, default=str))
+    if item.vector is not None:
+        # vectors are sent as 4 byte floats
+        size += 4 * _vector_length(item.vector)
+    return size
+
+
+class BatchWriter:
+    """
+    Writes objects and references to Weaviate collections in batches.
+
+    Batches are filled up to a budget of (estimated) payload bytes, rather than a fixed number of items,
+    so a few large objects are sent in small batches and many small objects in few requests.
+    The budget adapts to the cluster: it starts at `max_batch_bytes`, is halved (down to `min_batch_bytes`) each time a batch request fails
+    (e.g. times out), and grows back by a quarter after each batch request that succeeds. It is kept between writes, in `batch_bytes`.
+    At most `max_in_flight` batch requests are sent at once, each batch filled with the budget at the time it is sent.
+    Items that fail in a batch are retried one by one, so one bad object does not fail the others.
+
+    Each write returns a summary of the write, including the throughput:
+    ```python
+    {
+        "num_written": 100,  # the number of items written
+        "num_failed": 0,  # the number of items that could not be written, even when retried
+        "errors": [],  # the error messages of the failed items
+        "num_batches": 2,
+        "time_taken_seconds": 0.5,
+        "items_per_second": 200.0,
+    }
+    ```
+
+    Example:
+    ```python
+    writer = BatchWriter(logger=logger)
+    summary = await writer.insert_objects(collection, data_objects)
+    ```
+
+    Objects written with an existing UUID replace the existing object.
+    """
+
+    def __init__(
+        self,
+        max_batch_bytes: int = 5 * 1024 * 1024,
+        min_batch_bytes: int = 64 * 1024,
+        max_batch_size: int = 1000,
+        max_in_flight: int = 4,
+        logger: Logger | None = None,
+    ) -> None:
+        """
+        Args:
+            max_batch_bytes (int): The maximum (estimated) payload of a single batch request in bytes, and the initial budget.
+            min_batch_bytes (int): The smallest the budget is reduced to after failed batch requests.
+            max_batch_size (int): The maximum number of items in a single batch request.
+            max_in_flight (int): The maximum number of batch requests sent at once.
+            logger (Logger | None): A logger for the throughput and failed items.
+        """
+        self.max_batch_bytes = max_batch_bytes
+        self.min_batch_bytes = min(min_batch_bytes, max_batch_bytes)
+        self.batch_bytes = max_batch_bytes
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.logger = logger
+
+    def _batch_end(self, sizes: list[int], start: int, budget: int) -> int:
+        # the end of the batch starting at `start`, which always has at least one item
+        end = start + 1
+        batch_bytes = sizes[start]
+        while (
+            end < len(sizes)
+            and end - start < self.max_batch_size
+            and batch_bytes + sizes[end] <= budget
+        ):
+            batch_bytes += sizes[end]
+            end += 1
+        return end
+
+    def make_batches(
+        self, items: Sequence[DataObject | DataReference]
+    ) -> list[list[DataObject | DataReference]]:
+        """
+        Split items into batches with the current budget, `batch_bytes`.
+        """
+        sizes = [_payload_size(item) for item in items]
+        batches = []
+        start = 0
+        while start < len(items):
+            end = self._batch_end(sizes, start, self.batch_bytes)
+            batches.append(list(items[start:end]))
+            start = end
+        return batches
+
+    def _adapt(self, failed: bool) -> None:
+        if failed:
+            self.batch_bytes = max(self.min_batch_bytes, self.batch_bytes // 2)
+        else:
+            self.batch_bytes = min(
+                self.max_batch_bytes, self.batch_bytes + self.batch_bytes // 4
+            )
+
+    async def insert_objects(
+        self, collection: CollectionAsync, objects: Sequence[DataObject]
+    ) -> dict:
+        """
+        Insert (or replace) objects in a collection.
+
+        Args:
+            collection (CollectionAsync): The collection to insert the objects into.
+            objects (Sequence[DataObject]): The objects to insert.
+
+        Returns:
+            (dict): A summary of the write, see `BatchWriter`.
+        """
+
+        async def insert_one(obj: DataObject) -> None:
+            # match insert_many, which replaces objects with an existing UUID
+            if obj.uuid is not None and await collection.data.exists(obj.uuid):
+                await collection.data.replace(
+                    uuid=obj.uuid,
+                    properties=obj.properties,
+                    references=obj.references,
+                    vector=obj.vector,
+                )
+                return
+
+            await collection.data.insert(
+                properties=obj.properties,
+                references=obj.references,
+                uuid=obj.uuid,
+                vector=obj.vector,
+            )
+
+        return await self._write(
+            collection.name,
+            "objects",
+            objects,
+            collection.data.insert_many,
+            insert_one,
+        )
+
+    async def add_references(
+        self, collection: CollectionAsync, references: Sequence[DataReference]
+    ) -> dict:
+        """
+        Add references from objects in a collection.
+
+        Args:
+            collection (CollectionAsync): The collection the references are from.
+            references (Sequence[DataReference]): The references to add.
+
+        Returns:
+            (dict): A summary of the write, see `BatchWriter`.
+        """
+
+        async def add_one(reference: DataReference) -> None:
+            await collection.data.reference_add(
+                from_uuid=reference.from_uuid,
+                from_property=reference.from_property,
+                to=reference.to_uuid,
+            )
+
+        return await self._write(
+            collection.name,
+            "references",
+            references,
+            collection.data.reference_add_many,
+            add_one,
+        )
+
+    async def _write(
+        self,
+        collection_name: str,
+        item_type: str,
+        items: Sequence[Any],
+        write_many: Callable[[list], Awaitable[Any]],
+        write_one: Callable[[Any], Awaitable[None]],
+    ) -> dict:
+        start = time.perf_counter()
+        sizes = [_payload_size(item) for item in items]
+        next_start = 0
+        num_batches = 0
+
+        # each of the workers takes the next batch with the budget at that time, so the budget applies to the batches after a failure
+        async def write_batches() -> list[str]:
+            nonlocal next_start, num_batches
+            errors = []
+            while next_start < len(items):
+                end = self._batch_end(sizes, next_start, self.batch_bytes)
+                batch = list(items[next_start:end])
+                next_start = end
+                num_batches += 1
+
+                try:
+                    response = await write_many(batch)
+                    failed = [batch[i] for i in response.errors]
+                    self._adapt(failed=False)
+                except Exception as e:
+                    self._adapt(failed=True)
+                    if self.logger:
+                        self.logger.warning(
+                            f"Batch of {len(batch)} {item_type} for '{collection_name}' failed, "
+                            f"retrying individually and reducing the batch budget to {self.batch_bytes} bytes: {str(e)}"
+                        )
+                    failed = batch
+
+                # retry failed items one by one
+                for item in failed:
+                    try:
+                        await write_one(item)
+                    except Exception as e:
+                        errors.append(str(e))
+            return errors
+
+        results = await asyncio.gather(
+            *[write_batches() for _ in range(self.max_in_flight)]
+        )
+        errors = [error for worker_errors in results for error in worker_errors]
+
+        time_taken = time.perf_counter() - start
+        num_written = len(items) - len(errors)
+        summary = {
+            "num_written": num_written,
+            "num_failed": len(errors),
+            "errors": errors,
+            "num_batches": num_batches,
+            "time_taken_seconds": time_taken,
+            "items_per_second": num_written / time_taken if time_taken > 0 else 0.0,
+        }
+
+        if self.logger:
+            self.logger.debug(
+                f"Wrote {num_written} {item_type} to '{collection_name}' in {num_batches} batches, "
+                f"{time_taken:.2f} seconds ({summary['items_per_second']:.1f} {item_type}/sec)"
+            )
+            if errors:
+                self.logger.error(
+                    f"Failed to write {len(errors)} {item_type} to '{collection_name}': {errors[0]}"
+                )
+
+        return summary
@@ -1,10 +1,13 @@
 import asyncio
 import datetime
+import hashlib
 import os
 import threading
+import time
+import weakref
 
 from contextlib import asynccontextmanager, contextmanager
-from typing import AsyncGenerator, Generator, Any
+from typing import AsyncGenerator, Callable, Generator, Any
 from logging import Logger
 
 import weaviate
@@ -52,12 +55,260 @@ api_key_map = {
 }
 
 
+class _PooledAsyncClient:
+    """
+    An async client in the `AsyncClientPool`, shared by all `ClientManager`s with the same cluster credentials.
+    """
+
+    def __init__(self, key: tuple, client: WeaviateAsyncClient) -> None:
+        self.key = key
+        self.client = client
+        self.connect_lock = asyncio.Lock()
+        self.references = 0
+        self.in_use = 0
+        self.connected = False
+        self.last_used = time.monotonic()
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class AsyncClientPool:
+    """
+    A process-wide pool of async Weaviate clients, so that `ClientManager`s with the same cluster url, API key and headers
+    (e.g. many users of the same cluster) share one client, instead of each opening its own connections.
+
+    - Each `ClientManager` holds a reference to a pooled client (see `acquire` and `release`) and leases it for each use (see `lease`).
+        A client is closed and removed from the pool when its last reference is released.
+    - At most `max_connections` clients are connected at once.
+        When another client needs to connect, the least recently used client that is not leased is disconnected,
+        or if all are leased, it waits (on a condition of its event loop, notified when a lease ends or a client disconnects)
+        for one to be returned.
+    - `reap_idle` disconnects clients that have not been leased for a given time.
+        These reconnect the next time they are leased.
+
+    The maximum number of connections is set by the `WEAVIATE_MAX_CONNECTIONS` environment variable (default 64).
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        client_factory: Callable[..., WeaviateAsyncClient] | None = None,
+    ) -> None:
+        """
+        Args:
+            max_connections (int | None): The maximum number of connected clients. Defaults to `WEAVIATE_MAX_CONNECTIONS`.
+            client_factory (Callable | None): Creates an async client from `cluster_url`, `auth_credentials` and `headers`.
+                Defaults to `weaviate.use_async_with_weaviate_cloud`.
+        """
+        if max_connections is None:
+            max_connections = int(os.getenv("WEAVIATE_MAX_CONNECTIONS", 64))
+        self.max_connections = max_connections
+        self.client_factory = client_factory or weaviate.use_async_with_weaviate_cloud
+        self.clients: dict[tuple, _PooledAsyncClient] = {}
+        self.lock = threading.Lock()
+        # notified when a lease ends or a client is disconnected, one per event loop
+        self.returned: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Condition
+        ] = weakref.WeakKeyDictionary()
+
+    def _key(self, wcd_url: str, wcd_api_key: str, headers: dict[str, str]) -> tuple:
+        # clients are bound to the event loop they connect on
+        return (
+            wcd_url,
+            _hash(wcd_api_key),
+            tuple(sorted((name, _hash(value)) for name, value in headers.items())),
+            asyncio.get_running_loop(),
+        )
+
+    async def acquire(
+        self, wcd_url: str, wcd_api_key: str, headers: dict[str, str]
+    ) -> _PooledAsyncClient:
+        """
+        Get a reference to the pooled client for the credentials, creating it if needed.
+        Every call must be matched by a call to `release`.
+        """
+        key = self._key(wcd_url, wcd_api_key, headers)
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = _PooledAsyncClient(
+                    key,
+                    self.client_factory(
+                        cluster_url=wcd_url,
+                        auth_credentials=Auth.api_key(wcd_api_key),
+                        headers=headers,
+                        skip_init_checks=True,
+                    ),
+                )
+            pooled = self.clients[key]
+            pooled.references += 1
+        return pooled
+
+    async def release(self, pooled: _PooledAsyncClient) -> None:
+        with self.lock:
+            pooled.references -= 1
+            close = pooled.references <= 0
+            if close and self.clients.get(pooled.key) is pooled:
+                del self.clients[pooled.key]
+        if close and pooled.connected:
+            if pooled.key[-1] is asyncio.get_running_loop():
+                # any leases still running (e.g. of other tasks of the same manager) are finished first
+                condition = self._returned_condition()
+                while pooled.connected and not await self._disconnect_idle(pooled):
+                    async with condition:
+                        await condition.wait_for(lambda: pooled.in_use == 0)
+            else:
+                # the connections were closed with their event loop
+                pooled.connected = False
+
+    @asynccontextmanager
+    async def lease(
+        self, pooled: _PooledAsyncClient
+    ) -> AsyncGenerator[WeaviateAsyncClient, Any]:
+        """
+        Use a pooled client (that the caller holds a reference to), connecting it if needed.
+        """
+        pooled.in_use += 1
+        pooled.last_used = time.monotonic()
+        try:
+            async with pooled.connect_lock:
+                if not pooled.connected or not pooled.client.is_connected():
+                    await self._make_room(pooled)
+                    await pooled.client.connect()
+                    pooled.connected = True
+            yield pooled.client
+        finally:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            if pooled.in_use == 0:
+                await self._notify_returned([pooled.key[-1]])
+
+    def _returned_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if loop not in self.returned:
+                self.returned[loop] = asyncio.Condition()
+            return self.returned[loop]
+
+    async def _notify_returned(self, loops: list | None = None) -> None:
+        """
+        Wake the tasks waiting for a client to be returned, on the given event loops (or all of them).
+        """
+        current = asyncio.get_running_loop()
+        with self.lock:
+            conditions = [
+                (loop, condition)
+                for loop, condition in self.returned.items()
+                if loops is None or loop in loops
+            ]
+
+        async def notify(condition: asyncio.Condition) -> None:
+            async with condition:
+                condition.notify_all()
+
+        for loop, condition in conditions:
+            if loop is current:
+                await notify(condition)
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(notify(condition), loop)
+
+    def _find_room(self, pooled: _PooledAsyncClient) -> _PooledAsyncClient | bool:
+        # True if another client can connect, otherwise the least recently used idle client to disconnect (or False if none)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            connected = [
+                other
+                for other in self.clients.values()
+                if other.connected and other is not pooled
+            ]
+            if len(connected) < self.max_connections:
+                return True
+            idle = [
+                other
+                for other in connected
+                if other.in_use == 0 and other.key[-1] is loop
+            ]
+        if not idle:
+            return False
+        return min(idle, key=lambda other: other.last_used)
+
+    async def _make_room(self, pooled: _PooledAsyncClient) -> None:
+        condition = self._returned_condition()
+        while True:
+            async with condition:
+                room = self._find_room(pooled)
+                while room is False:
+                    await condition.wait()
+                    room = self._find_room(pooled)
+            if room is True or await self._disconnect_idle(room):
+                return
+
+    async def _disconnect_idle(self, pooled: _PooledAsyncClient) -> bool:
+        # holding the connect lock, so that a lease cannot reconnect the client while it is being closed,
+        # and re-checking it is still idle, since it may have been leased since it was chosen
+        async with pooled.connect_lock:
+            if pooled.in_use > 0 or not pooled.connected:
+                return False
+            await self._disconnect(pooled)
+            return True
+
+    async def _disconnect(self, pooled: _PooledAsyncClient) -> None:
+        pooled.connected = False
+        await pooled.client.close()
+        await self._notify_returned()
+
+    async def reap_idle(self, idle_timeout: datetime.timedelta) -> int:
+        """
+        Disconnect the clients that are not in use and have not been used for `idle_timeout`.
+
+        Returns:
+            (int): The number of clients disconnected.
+        """
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            idle = [
+                pooled
+                for pooled in self.clients.values()
+                if pooled.connected
+                and pooled.key[-1] is loop
+                and pooled.in_use == 0
+                and now - pooled.last_used > idle_timeout.total_seconds()
+            ]
+        return sum([await self._disconnect_idle(pooled) for pooled in idle])
+
+    def metrics(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "connected": sum(pooled.connected for pooled in self.clients.values()),
+            "in_use": sum(pooled.in_use for pooled in self.clients.values()),
+            "references": sum(pooled.references for pooled in self.clients.values()),
+            "max_connections": self.max_connections,
+        }
+
+
+_async_client_pool: AsyncClientPool | None = None
+
+
+def get_async_client_pool() -> AsyncClientPool:
+    """
+    The async client pool shared by all `ClientManager`s in this process.
+    """
+    global _async_client_pool
+    if _async_client_pool is None:
+        _async_client_pool = AsyncClientPool()
+    return _async_client_pool
+
+
 class ClientManager:
     """
     Handles the creation and management of the Weaviate client.
     Handles cases where the client can be used in more than one thread or async operation at a time,
     via threading and asyncio locks.
     Also can use methods for restarting client if its been inactive.
+
+    The async client is shared with all other ClientManagers with the same cluster credentials, via the `AsyncClientPool`.
     """
 
     def __init__(
@@ -130,19 +381,21 @@ class ClientManager:
                 self.headers[api_key_map[kwarg.upper()]] = kwargs[kwarg]
 
         # Create locks for client events
-        self.async_lock = asyncio.Lock()
         self.sync_lock = threading.Lock()
 
         # In use counter tracks when the client is in use and by how many operations. 0 = can restart
-        self.async_in_use_counter = 0
         self.sync_in_use_counter = 0
-        self.async_restart_event = asyncio.Event()
         self.sync_restart_event = threading.Event()
 
         self.last_used_sync_client = datetime.datetime.now()
         self.last_used_async_client = datetime.datetime.now()
 
-        self.async_client = None
+        # The sync client is only created when it is first used (see `connect_to_client`)
+        self.client: WeaviateClient | None = None
+        self.sync_restart_event.set()
+
+        # A reference to the async client in the pool, acquired when the clients are started
+        self.pooled_async_client: _PooledAsyncClient | None = None
         self.async_init_completed = False
         self.is_client = self.wcd_url != "" and self.wcd_api_key != ""
 
@@ -168,13 +421,6 @@ class ClientManager:
                     "All Weaviate functionality will be enabled."
                 )
 
-        if not self.is_client:
-            return
-
-        # Start sync client
-        self.client = self.get_client()
-        self.sync_restart_event.set()
-
     async def reset_keys(
         self,
         wcd_url: str | None = None,
@@ -206,7 +452,7 @@ class ClientManager:
 
     async def start_clients(self) -> None:
         """
-        Start the async and sync clients if they are not already running.
+        Start the async client if it is not already running, and reconnect the sync client if it has been created.
         """
 
         if not self.is_client:
@@ -214,16 +460,21 @@ class ClientManager:
                 "Weaviate is not available. Please set the WCD_URL and WCD_API_KEY in the settings."
             )
 
-        if self.async_client is None:
-            self.async_client = await self.get_async_client()
-            self.async_restart_event.set()
+        if (
+            self.pooled_async_client is not None
+            and self.pooled_async_client.key[-1] is not asyncio.get_running_loop()
+        ):
+            # the pooled client belongs to another (e.g. finished) event loop
+            await self.restart_async_client(force=True)
 
-        if not self.async_client.is_connected():
-            await self.async_client.connect()
+        if self.pooled_async_client is None:
+            self.pooled_async_client = await get_async_client_pool().acquire(
+                self.wcd_url, self.wcd_api_key, self.headers
+            )
 
         self.async_init_completed = True
 
-        if not self.client.is_connected():
+        if self.client is not None and not self.client.is_connected():
             self.client.connect()
 
     def update_last_user_request(self) -> None:
@@ -246,6 +497,12 @@ class ClientManager:
             skip_init_checks=True,
         )
 
+    @property
+    def async_client(self) -> WeaviateAsyncClient | None:
+        if self.pooled_async_client is None:
+            return None
+        return self.pooled_async_client.client
+
     async def get_async_client(self) -> WeaviateAsyncClient:
         if self.wcd_url is None or self.wcd_api_key is None:
             raise ValueError("WCD_URL and WCD_API_KEY must be set")
@@ -278,6 +535,8 @@ class ClientManager:
         self.sync_restart_event.wait()
         with self.sync_lock:
             self.sync_in_use_counter += 1
+            if self.client is None:
+                self.client = self.get_client()
 
         if not self.client.is_connected():
             self.client.connect()
@@ -305,121 +564,52 @@ class ClientManager:
                 "Weaviate is not available. Please set the WCD_URL and WCD_API_KEY in the settings."
             )
 
-        if not self.async_init_completed:
+        if (
+            not self.async_init_completed
+            or self.pooled_async_client is None
+            or self.pooled_async_client.key[-1] is not asyncio.get_running_loop()
+        ):
             await self.start_clients()
 
-        await self.async_restart_event.wait()
-        async with self.async_lock:
-            self.async_in_use_counter += 1
-
-        if self.async_client is None:
-            raise ValueError("Async client not initialised")
-
-        if not self.async_client.is_connected():
-            await self.async_client.connect()
-
-        connection = _AsyncClientConnection(self, self.async_client)
-        async with connection:
-            yield connection.client
+        try:
+            async with get_async_client_pool().lease(
+                self.pooled_async_client  # type: ignore
+            ) as client:
+                yield client
+        finally:
+            self.update_last_used_async_client()
 
     async def restart_async_client(self, force=False) -> None:
         """
-        Restart the async client if it has not been used in the last client_timeout minutes (set in init).
+        Disconnect any pooled async clients that have not been used in the last client_timeout minutes (set in init).
+        They reconnect the next time they are used.
+        If `force`, release this ClientManager's async client instead, so a new one is acquired (e.g. with new keys) the next time it is used.
         """
-        if self.client_timeout == datetime.timedelta(minutes=0) and not force:
+        if force:
+            if self.pooled_async_client is not None:
+                pooled_async_client = self.pooled_async_client
+                self.pooled_async_client = None
+                self.async_init_completed = False
+                await get_async_client_pool().release(pooled_async_client)
             return
 
-        # First check if the client has been used in the last X minutes
         if (
-            datetime.datetime.now() - self.last_used_async_client > self.client_timeout
-            or force
+            self.pooled_async_client is None
+            or self.client_timeout == datetime.timedelta(minutes=0)
         ):
-            # Acquire lock before modifying shared state to prevent race conditions
-            try:
-                async with self.async_lock:
-                    # Clear the event WHILE holding the lock to prevent new connections from starting
-                    # This ensures no new connections can proceed until we're done
-                    self.async_restart_event.clear()
-
-                    # Record current counter value before waiting
-                    last_recorded_counter = self.async_in_use_counter
-
-                    # Set reasonable timeout values
-                    time_spent = 0
-                    max_wait_time = 10  # seconds
-                    check_interval = 0.1  # seconds
-
-                    # Only wait if there are active connections
-                    if last_recorded_counter > 0:
-                        # Wait for existing connections to complete
-                        while self.async_in_use_counter > 0:
-                            # Release lock during sleep to prevent deadlock
-                            self.async_lock.release()
-
-                            # Only timeout after 10 seconds if nothing is happening
-                            # if the counter is changing, then things are happening and we should wait
-                            if self.async_in_use_counter != last_recorded_counter:
-                                last_recorded_counter = self.async_in_use_counter
-                                time_spent = 0
-
-                            try:
-                                await asyncio.sleep(check_interval)
-                                time_spent += check_interval
-                                if time_spent > max_wait_time:
-                                    if self.logger:
-                                        self.logger.error(
-                                            f"Async client restart timed out after {max_wait_time} seconds. "
-                                        )
-                                    break
-                            finally:
-                                # Re-acquire lock after sleep
-                                await self.async_lock.acquire()
-
-                    # Handle timeout case - must reset state regardless of timeout
-                    if self.async_in_use_counter > 0:
-                        if self.logger:
-                            self.logger.error(
-                                "Force resetting async client state due to timeout"
-                            )
-                        self.async_in_use_counter = 0
-
-                    # Whether we timed out or not, we need to restart the client
-                    try:
-                        # Only close if client exists and is connected
-                        if (
-                            hasattr(self, "async_client")
-                            and self.async_client is not None
-                        ):
-                            await self.async_client.close()
-                        await asyncio.sleep(0.1)
-                        # Create a new client instance
-                        self.async_client = await self.get_async_client()
-                    except Exception as e:
-                        if self.logger:
-                            self.logger.error(
-                                f"Error during async client restart: {str(e)}"
-                            )
-                        # Create a new client anyway to ensure we have a valid client
-                        self.async_client = await self.get_async_client()
-                    finally:
-                        # CRITICAL: Always set the event to prevent deadlocks
-                        # This ensures waiting connections can proceed
-                        self.async_restart_event.set()
+            return
 
-            except Exception as e:
-                if self.logger:
-                    self.logger.error(
-                        f"Unexpected error in async client restart: {str(e)}"
-                    )
-                # Ensure the event is set in all error cases
-                self.async_restart_event.set()
-                # Attempt to create a new client
-                self.async_client = await self.get_async_client()
+        await get_async_client_pool().reap_idle(self.client_timeout)
 
     async def restart_client(self, force=False) -> None:
         """
-        Restart the sync client if it has not been used in the last client_timeout minutes (set in init).
+        Close the sync client if it has not been used in the last client_timeout minutes (set in init).
+        It is created again the next time it is used.
+        Does nothing if the sync client has not been created.
         """
+        if self.client is None:
+            return
+
         if self.client_timeout == datetime.timedelta(minutes=0) and not force:
             return
 
@@ -478,22 +668,18 @@ class ClientManager:
                             )
                         self.sync_in_use_counter = 0
 
-                    # Whether we timed out or not, we need to restart the client
+                    # Whether we timed out or not, we need to close the client
                     try:
-                        # Only close if client exists and is connected
-                        if hasattr(self, "client") and self.client is not None:
+                        if self.client is not None:
                             self.client.close()
-                        await asyncio.sleep(0.1)
-                        # Create a new client instance
-                        self.client = self.get_client()
                     except Exception as e:
                         if self.logger:
                             self.logger.error(
                                 f"Error during sync client restart: {str(e)}"
                             )
-                        # Create a new client anyway
-                        self.client = self.get_client()
                     finally:
+                        # A new client is created the next time it is used
+                        self.client = None
                         # CRITICAL: Always set the event to prevent deadlocks
                         self.sync_restart_event.set()
 
@@ -504,18 +690,17 @@ class ClientManager:
                     )
                 # Ensure the event is set in all error cases
                 self.sync_restart_event.set()
-                # Attempt to create a new client
-                self.client = self.get_client()
+                self.client = None
 
     async def close_clients(self) -> None:
         """
-        Close both the async and sync clients.
+        Close the sync client, and release the async client (which is closed if no other ClientManager uses it).
         Should not be called inside a Tool or other function inside the decision tree.
         """
-        if hasattr(self, "async_client") and self.async_client is not None:
-            await self.async_client.close()
-        if hasattr(self, "client") and self.client is not None:
+        await self.restart_async_client(force=True)
+        if self.client is not None:
             self.client.close()
+            self.client = None
 
 
 # Custom context managers so that clients do not close after use (instead on a timer)
@@ -531,17 +716,3 @@ class _ClientConnection:
         with self.manager.sync_lock:
             self.manager.sync_in_use_counter -= 1
         self.manager.update_last_used_sync_client()
-
-
-class _AsyncClientConnection:
-    def __init__(self, manager: ClientManager, client: WeaviateAsyncClient):
-        self.manager = manager
-        self.client = client
-
-    async def __aenter__(self) -> WeaviateAsyncClient:
-        return self.client
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
-        async with self.manager.async_lock:
-            self.manager.async_in_use_counter -= 1
-        self.manager.update_last_used_async_client()
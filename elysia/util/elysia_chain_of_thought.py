@@ -7,7 +7,7 @@ from dspy.signatures.signature import Signature, ensure_signature
 from elysia.tree.objects import TreeData, Atlas
 from elysia.util.retrieve_feedback import retrieve_feedback
 from elysia.util.client import ClientManager
-
+from elysia.util.llm_cache import get_llm_cache
 
 elysia_meta_prompt = """
 You are part of an ensemble of agents that are working together to solve a task.
@@ -323,7 +323,9 @@ class ElysiaChainOfThought(Module):
 
         # Add the optional inputs to the kwargs
         if self.environment:
-            kwargs["environment"] = self.tree_data.environment.environment
+            kwargs["environment"] = self.tree_data.environment.to_prompt(
+                self.tree_data.settings.ENVIRONMENT_TOKEN_BUDGET
+            )
 
         if self.collection_schemas:
             if self.collection_names != []:
@@ -348,6 +350,9 @@ class ElysiaChainOfThought(Module):
 
     async def aforward(self, **kwargs):
         kwargs = self._add_tree_data_inputs(kwargs)
+        llm_cache = get_llm_cache(self.tree_data.settings)
+        if llm_cache is not None:
+            return await llm_cache.acall(self.predict, **kwargs)
         return await self.predict.acall(**kwargs)
 
     async def aforward_with_feedback_examples(
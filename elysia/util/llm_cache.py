@@ -0,0 +1,454 @@
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Protocol
+
+import dspy
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic.errors import PydanticSchemaGenerationError
+from pydantic_core import to_jsonable_python
+
+from elysia.util.parsing import canonical_hash
+
+
+def _cosine_similarity(a: list[float], b: list[float]) -> float:
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    if norm == 0:
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / norm
+
+
+def _without_last_user_turn(conversation_history: list) -> list:
+    """
+    The conversation history without its last user turn, which contains the current user prompt.
+    """
+    for i in range(len(conversation_history) - 1, -1, -1):
+        turn = conversation_history[i]
+        if isinstance(turn, dict) and turn.get("role") == "user":
+            return conversation_history[:i] + conversation_history[i + 1 :]
+    return conversation_history
+
+
+# the counts of the lookups made in the current context (and any tasks started from it), see `track_cache_stats`
+_cache_stats: ContextVar[dict[str, int] | None] = ContextVar(
+    "llm_cache_stats", default=None
+)
+
+
+def track_cache_stats(stats: dict[str, int]) -> None:
+    """
+    Count the hits, semantic hits and misses of all LLM cache lookups made from now on in the current context
+    (and any tasks started from it) in `stats`, e.g. the counts of the `Tracker` of the tree being run.
+    Caches are shared between trees, so this attributes each lookup to the tree that made it.
+    """
+    _cache_stats.set(stats)
+
+
+def _signature_fingerprint(signature: type[dspy.Signature]) -> dict:
+    return {
+        "instructions": signature.instructions,
+        "fields": {
+            name: [str(field.annotation), field.json_schema_extra]
+            for name, field in signature.model_fields.items()
+        },
+    }
+
+
+def _restore_outputs(signature: type[dspy.Signature], outputs: dict) -> dict | None:
+    """
+    Convert cached outputs (which may have been stored as JSON) back to the types of the output fields of the signature,
+    e.g. pydantic models. Returns None if the outputs no longer match the signature.
+    """
+    restored = dict(outputs)
+    try:
+        for name, field in signature.output_fields.items():
+            if name in restored and field.annotation not in (str, Any):
+                restored[name] = TypeAdapter(field.annotation).validate_python(
+                    restored[name]
+                )
+    except (ValidationError, PydanticSchemaGenerationError):
+        return None
+    return restored
+
+
+class CacheBackend(Protocol):
+    """
+    Storage for the LLM cache. Entries are dictionaries with the following keys:
+    - `outputs` (dict): the outputs of the prediction
+    - `semantic_key` (str | None): the hash of all inputs except the user prompt (and the last user turn of the conversation history)
+    - `embedding` (list[float] | None): the embedding of the user prompt
+    - `created` (float): the time the entry was added
+    """
+
+    def get(self, key: str) -> dict | None: ...
+
+    def set(self, key: str, entry: dict) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def candidates(self, semantic_key: str) -> list[tuple[str, list[float]]]: ...
+
+    def evict(self, max_size: int, ttl: float | None) -> None: ...
+
+    def clear(self) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class MemoryCacheBackend:
+    """
+    In-process backend, an ordered dictionary where the least recently used entries are first.
+    """
+
+    def __init__(self):
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+
+    def get(self, key: str) -> dict | None:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key: str, entry: dict) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+    def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def candidates(self, semantic_key: str) -> list[tuple[str, list[float]]]:
+        return [
+            (key, entry["embedding"])
+            for key, entry in self.entries.items()
+            if entry["semantic_key"] == semantic_key and entry["embedding"] is not None
+        ]
+
+    def evict(self, max_size: int, ttl: float | None) -> None:
+        if ttl is not None:
+            cutoff = time.time() - ttl
+            for key in [k for k, e in self.entries.items() if e["created"] < cutoff]:
+                self.entries.pop(key)
+        while len(self.entries) > max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk backend, so that cached predictions survive restarts and can be shared between processes.
+    Outputs and embeddings are stored as JSON.
+
+    Recency for LRU eviction is tracked via the `last_used` column.
+    So that a hit does not write to disk, the times entries are used are kept in memory,
+    and written with the next entry that is added (or once `flush_every` have been kept).
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.last_used: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, "
+                "semantic_key TEXT, "
+                "embedding TEXT, "
+                "outputs TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_semantic_key "
+                "ON llm_cache (semantic_key)"
+            )
+
+    def _flush(self) -> None:
+        # must be called holding the lock, in a transaction
+        self.conn.executemany(
+            "UPDATE llm_cache SET last_used = ? WHERE key = ?",
+            [(last_used, key) for key, last_used in self.last_used.items()],
+        )
+        self.last_used.clear()
+
+    def get(self, key: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT semantic_key, embedding, outputs, created FROM llm_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            # outputs pickled by earlier versions are not loaded
+            if row is None or not isinstance(row[2], str):
+                return None
+            try:
+                outputs = json.loads(row[2])
+            except json.JSONDecodeError:
+                return None
+
+            self.last_used[key] = time.time()
+            if len(self.last_used) >= self.flush_every:
+                with self.conn:
+                    self._flush()
+
+        return {
+            "semantic_key": row[0],
+            "embedding": json.loads(row[1]) if row[1] is not None else None,
+            "outputs": outputs,
+            "created": row[3],
+        }
+
+    def set(self, key: str, entry: dict) -> None:
+        with self.lock, self.conn:
+            self._flush()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry["semantic_key"],
+                    (
+                        json.dumps(entry["embedding"])
+                        if entry["embedding"] is not None
+                        else None
+                    ),
+                    json.dumps(to_jsonable_python(entry["outputs"])),
+                    entry["created"],
+                    time.time(),
+                ),
+            )
+
+    def delete(self, key: str) -> None:
+        with self.lock, self.conn:
+            self.last_used.pop(key, None)
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def candidates(self, semantic_key: str) -> list[tuple[str, list[float]]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, embedding FROM llm_cache "
+                "WHERE semantic_key = ? AND embedding IS NOT NULL",
+                (semantic_key,),
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def evict(self, max_size: int, ttl: float | None) -> None:
+        with self.lock, self.conn:
+            self._flush()
+            if ttl is not None:
+                self.conn.execute(
+                    "DELETE FROM llm_cache WHERE created < ?", (time.time() - ttl,)
+                )
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key NOT IN "
+                "(SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT ?)",
+                (max_size,),
+            )
+
+    def clear(self) -> None:
+        with self.lock, self.conn:
+            self.last_used.clear()
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMCache:
+    """
+    A cache for the predictions of DSPy modules, placed in front of the LM calls made by Elysia.
+
+    There are two tiers:
+    1. Exact match: keyed on a hash of the signature (instructions and fields), any few-shot demos,
+        the LM (model and kwargs) and all of the inputs to the module.
+    2. Semantic match (optional, when an `embedding_model` is given): if there is no exact match,
+        a previous prediction is re-used if every input *except* the user prompt is identical
+        (the last user turn of any `conversation_history` input, which contains the prompt, is also excluded),
+        and the embedding of the user prompt is within `similarity_threshold` (cosine similarity) of the cached prompt.
+
+    Both tiers share the same entries, which are evicted after `ttl` seconds or when there are more than `max_size` entries (least recently used first).
+    Counts of hits and misses are kept on the cache, and counted per lookup for the tree making it (see `track_cache_stats`).
+
+    Example:
+    ```python
+    llm_cache = LLMCache(path="llm_cache.db", ttl=3600)
+    prediction = await llm_cache.acall(dspy.Predict(MySignature), lm=lm, question="...")
+    ```
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl: float | None = 3600,
+        path: str | None = None,
+        embedding_model: str | None = None,
+        similarity_threshold: float = 0.95,
+    ):
+        """
+        Args:
+            max_size (int): The maximum number of predictions to store.
+            ttl (float | None): The number of seconds a prediction is valid for. None for no expiry.
+            path (str | None): The path to a SQLite database to store predictions in.
+                If None, predictions are stored in memory only.
+            embedding_model (str | None): The embedding model (e.g. "openai/text-embedding-3-small") used for the semantic tier.
+                If None, only exact matches are returned.
+            similarity_threshold (float): The minimum cosine similarity between user prompts for a semantic match.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.backend: CacheBackend = (
+            SQLiteCacheBackend(path) if path is not None else MemoryCacheBackend()
+        )
+        self.embedder = (
+            dspy.Embedder(embedding_model) if embedding_model is not None else None
+        )
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _is_expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def get_keys(self, predict: dspy.Predict, **kwargs) -> tuple[str, str]:
+        """
+        Returns the exact and semantic keys for a call of `predict` with `kwargs`.
+        """
+        lm = kwargs.pop("lm", None) or dspy.settings.lm
+        kwargs.pop("config", None)
+
+        base = {
+            "signature": _signature_fingerprint(predict.signature),
+            "demos": [dict(demo) for demo in predict.demos],
+            "lm": (
+                [lm.model, {k: v for k, v in lm.kwargs.items() if k != "api_key"}]
+                if lm is not None
+                else None
+            ),
+        }
+        semantic_inputs = {k: v for k, v in kwargs.items() if k != "user_prompt"}
+        if isinstance(semantic_inputs.get("conversation_history"), list):
+            semantic_inputs["conversation_history"] = _without_last_user_turn(
+                semantic_inputs["conversation_history"]
+            )
+        return (
+            canonical_hash({**base, "inputs": kwargs}),
+            canonical_hash({**base, "inputs": semantic_inputs}),
+        )
+
+    def get(self, key: str) -> dict | None:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(entry):
+            self.backend.delete(key)
+            return None
+        return entry["outputs"]
+
+    def get_similar(self, semantic_key: str, embedding: list[float]) -> dict | None:
+        best_key, best_similarity = None, self.similarity_threshold
+        for key, candidate in self.backend.candidates(semantic_key):
+            similarity = _cosine_similarity(embedding, candidate)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+
+        if best_key is None:
+            return None
+        return self.get(best_key)
+
+    def set(
+        self,
+        key: str,
+        outputs: dict,
+        semantic_key: str | None = None,
+        embedding: list[float] | None = None,
+    ) -> None:
+        self.backend.set(
+            key,
+            {
+                "outputs": outputs,
+                "semantic_key": semantic_key,
+                "embedding": embedding,
+                "created": time.time(),
+            },
+        )
+        self.backend.evict(self.max_size, self.ttl)
+
+    def _count(self, outcome: str) -> None:
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        stats = _cache_stats.get()
+        if stats is not None:
+            stats[outcome] += 1
+
+    async def _embed(self, text: str) -> list[float] | None:
+        if self.embedder is None or not isinstance(text, str) or text == "":
+            return None
+        embedding = await self.embedder.acall(text)
+        return [float(x) for x in embedding]
+
+    async def acall(self, predict: dspy.Predict, **kwargs) -> dspy.Prediction:
+        """
+        Call `predict` with `kwargs`, returning a cached prediction instead if one exists.
+        Only successful predictions are cached.
+        """
+        key, semantic_key = self.get_keys(predict, **kwargs)
+
+        outputs = self.get(key)
+        if outputs is not None:
+            outputs = _restore_outputs(predict.signature, outputs)
+        if outputs is not None:
+            self._count("hits")
+            return dspy.Prediction(**outputs)
+
+        embedding = await self._embed(kwargs.get("user_prompt"))
+        if embedding is not None:
+            outputs = self.get_similar(semantic_key, embedding)
+            if outputs is not None:
+                outputs = _restore_outputs(predict.signature, outputs)
+            if outputs is not None:
+                self._count("semantic_hits")
+                return dspy.Prediction(**outputs)
+
+        self._count("misses")
+        prediction = await predict.acall(**kwargs)
+        self.set(key, prediction.toDict(), semantic_key, embedding)
+        return prediction
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+
+_llm_caches: dict[tuple, LLMCache] = {}
+
+
+def get_llm_cache(settings) -> LLMCache | None:
+    """
+    Get the LLM cache for the settings, or None if `USE_LLM_CACHE` is not enabled.
+    Caches are shared between all trees whose settings have the same cache configuration.
+    """
+    if not settings.USE_LLM_CACHE:
+        return None
+
+    config = (
+        settings.LLM_CACHE_MAX_SIZE,
+        settings.LLM_CACHE_TTL,
+        settings.LLM_CACHE_PATH,
+        settings.LLM_CACHE_EMBEDDING_MODEL,
+        settings.LLM_CACHE_SIMILARITY_THRESHOLD,
+    )
+    if config not in _llm_caches:
+        _llm_caches[config] = LLMCache(*config)
+    return _llm_caches[config]
@@ -0,0 +1,238 @@
+"""
+A process-wide pool of language models, shared by all trees.
+
+Each distinct (provider, model, api base, API key fingerprint) has a single `PooledLM`, which owns the provider clients,
+so HTTP connections are reused between trees.
+Trees get a lightweight handle to the pooled LM (see `PooledLM.handle()`), which shares the clients of the pooled LM but has its own
+`LMUsage` (the number of calls, tokens and cost) and only keeps the last `max_history` history entries, instead of an unbounded history.
+
+All calls to the LMs of a provider go through a `ProviderLimiter`, which limits the number of calls in flight to a provider at once
+(set by the `MAX_CONCURRENT_LM_CALLS` environment variable, default 32), to avoid bursts of rate limit errors.
+The limit applies to the sync calls of all threads, and separately to the async calls of each event loop.
+"""
+
+import os
+import asyncio
+import hashlib
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+import dspy
+
+
+class LMUsage:
+    """
+    The number of calls, tokens and cost of the calls made by an LM handle.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, entry: dict) -> None:
+        usage = entry.get("usage") or {}
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += usage.get("prompt_tokens") or 0
+            self.output_tokens += usage.get("completion_tokens") or 0
+            self.cost += entry.get("cost") or 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost,
+        }
+
+    def __getstate__(self) -> dict:
+        return self.to_dict()
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class ProviderLimiter:
+    """
+    Limits the number of calls in flight to a provider.
+    Sync calls (`slot`) share a threading semaphore across all threads of the process,
+    and async calls (`aslot`) share an asyncio semaphore per event loop, so that waiting never blocks the event loop.
+    """
+
+    def __init__(self, max_concurrent: int) -> None:
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._async_semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.BoundedSemaphore
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.num_running = 0
+        self.num_waited = 0
+
+    def _async_semaphore(self) -> asyncio.BoundedSemaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_semaphores:
+                self._async_semaphores[loop] = asyncio.BoundedSemaphore(
+                    self.max_concurrent
+                )
+            return self._async_semaphores[loop]
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self._semaphore.acquire(blocking=False):
+            self.num_waited += 1
+            self._semaphore.acquire()
+        self.num_running += 1
+        try:
+            yield
+        finally:
+            self.num_running -= 1
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        semaphore = self._async_semaphore()
+        if semaphore.locked():
+            self.num_waited += 1
+        async with semaphore:
+            self.num_running += 1
+            try:
+                yield
+            finally:
+                self.num_running -= 1
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.num_running,
+            "max_running": self.max_concurrent,
+            "waited": self.num_waited,
+        }
+
+
+_provider_limiters: dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    with _limiters_lock:
+        if provider not in _provider_limiters:
+            _provider_limiters[provider] = ProviderLimiter(
+                int(os.environ.get("MAX_CONCURRENT_LM_CALLS", 32))
+            )
+        return _provider_limiters[provider]
+
+
+class PooledLM(dspy.LM):
+    """
+    A `dspy.LM` whose calls are limited by the `ProviderLimiter` of its provider,
+    and which records its usage in `usage` and keeps only the last `max_history` history entries.
+    """
+
+    def __init__(self, *args, pool_provider: str, max_history: int = 50, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_provider = pool_provider
+        self.max_history = max_history
+        self.usage = LMUsage()
+
+    @property
+    def limiter(self) -> ProviderLimiter:
+        return get_provider_limiter(self.pool_provider)
+
+    def handle(self) -> "PooledLM":
+        """
+        A copy of this LM that shares its provider clients, with its own usage and history.
+        """
+        return self.copy()
+
+    def copy(self, **kwargs) -> "PooledLM":
+        new_instance = super().copy(**kwargs)
+        new_instance.history = []
+        new_instance.usage = LMUsage()
+        return new_instance
+
+    def update_history(self, entry: dict) -> None:
+        self.usage.record(entry)
+        if self.max_history > 0:
+            self.history.append(entry)
+            if len(self.history) > self.max_history:
+                del self.history[: -self.max_history]
+
+    def __call__(self, *args, **kwargs):
+        with self.limiter.slot():
+            return super().__call__(*args, **kwargs)
+
+    async def acall(self, *args, **kwargs):
+        async with self.limiter.aslot():
+            return await super().acall(*args, **kwargs)
+
+
+def api_key_fingerprint(api_keys: dict[str, str]) -> str:
+    """
+    A hash of the API keys, so LMs using different keys are pooled separately without keeping the keys in the pool's keys.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(api_keys):
+        digest.update(f"{name.lower()}={api_keys[name]}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def _lm_credentials(api_keys: dict[str, str]) -> dict[str, str]:
+    keys = [name for name in api_keys if name.lower().endswith("_api_key")]
+    if len(keys) != 1:
+        # e.g. AWS credentials, which are read from the environment (see `ElysiaKeyManager`)
+        return {}
+    return {"api_key": api_keys[keys[0]]}
+
+
+_lm_pool: dict[tuple, PooledLM] = {}
+_pool_lock = threading.Lock()
+
+
+def get_pooled_lm(
+    provider: str,
+    lm_name: str,
+    api_base: str | None = None,
+    api_keys: dict[str, str] | None = None,
+    **kwargs,
+) -> PooledLM:
+    """
+    Get a handle to the pooled LM for the provider, model, api base and API keys, creating the pooled LM if needed.
+    Any other keyword arguments are passed to `dspy.LM` when the pooled LM is created.
+
+    If `api_keys` has a single API key (e.g. `openai_api_key`), it is passed to every call of the LM as `api_key`,
+    so the LM does not depend on the environment variables of the process.
+    """
+    key = (
+        provider,
+        lm_name,
+        api_base,
+        api_key_fingerprint(api_keys or {}),
+        tuple(sorted(kwargs.items())),
+    )
+    with _pool_lock:
+        if key not in _lm_pool:
+            _lm_pool[key] = PooledLM(
+                model=f"{provider}/{lm_name}",
+                api_base=api_base,
+                pool_provider=provider,
+                **_lm_credentials(api_keys or {}),
+                **kwargs,
+            )
+        return _lm_pool[key].handle()
+
+
+def get_lm_pool_metrics() -> dict:
+    return {
+        "pooled_lms": len(_lm_pool),
+        "providers": {
+            provider: limiter.metrics()
+            for provider, limiter in _provider_limiters.items()
+        },
+    }
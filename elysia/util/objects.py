@@ -7,6 +7,8 @@ from typing import Any
 from elysia.util.parsing import format_dict_to_serialisable
 from logging import Logger
 from elysia.objects import Update
+from elysia.util.llm_cache import LLMCache, track_cache_stats
+from elysia.util.lm_pool import LMUsage
 
 
 class Tracker:
@@ -15,6 +17,7 @@ class Tracker:
     - the average time taken for an LLM call
     - number of calls made
     - number of input/output tokens used
+    - number of hits/misses of the LLM cache (counted via `track_cache_stats`, when `llm_cache` is set)
     """
 
     def __init__(self, tracker_names: list[str], logger: Logger):
@@ -52,23 +55,45 @@ class Tracker:
                     "avg_output_tokens": None,
                 },
             },
+            "llm_cache": {
+                "hits": 0,
+                "semantic_hits": 0,
+                "misses": 0,
+            },
         }
         self.logger = logger
 
+        self.llm_cache: LLMCache | None = None
+        self.lm_usage_seen: dict[str, tuple[LMUsage, dict]] = {}
+
     def start_tracking(self, tracker_name: str):
         self.trackers[tracker_name]["timer"]["start_time"] = time.perf_counter()
 
     def update_lm_costs(self, lm: dspy.LM | None = None, model_type: str = "base_lm"):
 
-        if lm is not None:
+        if lm is None:
+            return
+
+        usage = getattr(lm, "usage", None)
+        if isinstance(usage, LMUsage):
+            # pooled LMs keep a running total, so only count the changes since it was last checked
+            seen = self.lm_usage_seen.get(model_type)
+            if seen is None or seen[0] is not usage:
+                seen = (usage, LMUsage().to_dict())
+            totals = usage.to_dict()
+            self.lm_usage_seen[model_type] = (usage, totals)
+
+            num_calls = totals["calls"] - seen[1]["calls"]
+            input_tokens = totals["input_tokens"] - seen[1]["input_tokens"]
+            output_tokens = totals["output_tokens"] - seen[1]["output_tokens"]
+            cost = totals["cost"] - seen[1]["cost"]
 
+        else:
             # check how many calls have been made
             prev_calls = self.trackers["models"][model_type]["calls"]
-            total_calls = len(lm.history)
-            self.trackers["models"][model_type]["calls"] = total_calls
-            num_calls = total_calls - prev_calls
+            num_calls = len(lm.history) - prev_calls
 
-            if num_calls == 0:
+            if num_calls <= 0:
                 return
 
             history = lm.history[-num_calls:]
@@ -88,20 +113,31 @@ class Tracker:
                 if "cost" in h and h["cost"] is not None:
                     cost += h["cost"]
 
-            if self.trackers["models"][model_type]["input_tokens"] is None:
-                self.trackers["models"][model_type]["input_tokens"] = input_tokens
-            else:
-                self.trackers["models"][model_type]["input_tokens"] += input_tokens
+        if num_calls == 0:
+            return
+
+        self.trackers["models"][model_type]["calls"] += num_calls
+
+        if self.trackers["models"][model_type]["input_tokens"] is None:
+            self.trackers["models"][model_type]["input_tokens"] = input_tokens
+        else:
+            self.trackers["models"][model_type]["input_tokens"] += input_tokens
 
-            if self.trackers["models"][model_type]["output_tokens"] is None:
-                self.trackers["models"][model_type]["output_tokens"] = output_tokens
-            else:
-                self.trackers["models"][model_type]["output_tokens"] += output_tokens
+        if self.trackers["models"][model_type]["output_tokens"] is None:
+            self.trackers["models"][model_type]["output_tokens"] = output_tokens
+        else:
+            self.trackers["models"][model_type]["output_tokens"] += output_tokens
 
-            if self.trackers["models"][model_type]["cost"] is None:
-                self.trackers["models"][model_type]["cost"] = cost
-            else:
-                self.trackers["models"][model_type]["cost"] += cost
+        if self.trackers["models"][model_type]["cost"] is None:
+            self.trackers["models"][model_type]["cost"] = cost
+        else:
+            self.trackers["models"][model_type]["cost"] += cost
+
+    def track_cache_stats(self):
+        """
+        Count the LLM cache lookups made from now on in the current context (e.g. the running tree) in this tracker.
+        """
+        track_cache_stats(self.trackers["llm_cache"])
 
     def end_tracking(
         self,
@@ -165,6 +201,14 @@ class Tracker:
     def get_total_output_tokens(self, model_type: str):
         return self.trackers["models"][model_type]["output_tokens"]
 
+    def get_cache_hits(self, semantic: bool = True):
+        return self.trackers["llm_cache"]["hits"] + (
+            self.trackers["llm_cache"]["semantic_hits"] if semantic else 0
+        )
+
+    def get_cache_misses(self):
+        return self.trackers["llm_cache"]["misses"]
+
     def get_total_cost(self, model_type: str):
         return self.trackers["models"][model_type]["cost"]
 
@@ -303,12 +347,19 @@ class TrainingUpdate:
         self.outputs = outputs_copy
 
     def _convert_basemodel(self, value: Any):
+        # containers without any Pydantic models are returned as is, so shared data (e.g. environment snapshots) is not copied
         if isinstance(value, BaseModel):
             return value.model_dump()
         elif isinstance(value, dict):
-            return {k: self._convert_basemodel(v) for k, v in value.items()}
+            converted = {k: self._convert_basemodel(v) for k, v in value.items()}
+            if all(converted[k] is v for k, v in value.items()):
+                return value
+            return converted
         elif isinstance(value, list):
-            return [self._convert_basemodel(v) for v in value]
+            converted = [self._convert_basemodel(v) for v in value]
+            if all(c is v for c, v in zip(converted, value)):
+                return value
+            return converted
         else:
             return value
 
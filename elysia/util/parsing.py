@@ -1,8 +1,11 @@
 import datetime
+import hashlib
 import json
 import uuid
 from typing import Any
 
+from pydantic import BaseModel
+
 from weaviate.collections.classes.aggregate import (
     AggregateDate,
     AggregateGroupByReturn,
@@ -90,6 +93,39 @@ def format_dict_to_serialisable(d: dict[str, Any], remove_unserialisable: bool =
             del d[key]
 
 
+def estimate_tokens(num_characters: int) -> int:
+    """
+    A rough estimate of the number of tokens in a text (or JSON) of `num_characters` characters, without a tokeniser.
+    """
+    # roughly 4 characters per token for English text and JSON
+    return num_characters // 4
+
+
+def _canonicalise(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return _canonicalise(value.model_dump())
+    if isinstance(value, dict):
+        return {str(k): _canonicalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalise(v) for v in value]
+    if isinstance(value, set):
+        return sorted(str(v) for v in value)
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def canonical_hash(value: Any) -> str:
+    """
+    A SHA-256 hash of a value, that is identical for identical inputs regardless of dictionary ordering or pydantic model types
+    (pydantic models are hashed as their dumped fields, and other values that are not JSON serialisable as their string).
+    Used as the key of cached LLM calls and queries.
+    """
+    return hashlib.sha256(
+        json.dumps(_canonicalise(value), sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
 def remove_whitespace(text: str) -> str:
     return " ".join(text.split())
 
@@ -0,0 +1,176 @@
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from elysia.util.parsing import canonical_hash
+
+
+def _estimate_size(value: Any) -> int:
+    """
+    A rough size in bytes of a query result, from the lengths of its strings and the number of its values,
+    without serialising it. Objects (e.g. Weaviate objects and their metadata) are sized by their attributes.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return 8
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(
+            _estimate_size(key) + _estimate_size(item) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple, set)):
+        # vectors are sized by their length alone
+        if len(value) > 0 and isinstance(next(iter(value)), float):
+            return 8 * len(value)
+        return 8 + sum(_estimate_size(item) for item in value)
+    if hasattr(value, "__dict__"):
+        return 8 + _estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    A cache of the results of Weaviate queries and aggregations, for a single Weaviate cluster.
+    Results are keyed on the kind of query, the collection and a canonical form of the query arguments,
+    so identical queries on the same collection (from any user connected to the cluster) are not sent to Weaviate again.
+
+    Results are stored per collection, so they can be invalidated when a collection changes.
+    Entries expire after `ttl` seconds, and the least recently used entries are evicted once the estimated size
+    of all results is larger than `max_bytes`.
+
+    Cached results are shared, so they should not be modified.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float | None = 300,
+    ) -> None:
+        """
+        Args:
+            max_bytes (int): The maximum (estimated) size of all cached results in bytes.
+            ttl (float | None): The number of seconds a result is valid for. None means results do not expire.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # key -> (created, num_bytes, collection_name, result)
+        self.entries: OrderedDict[str, tuple[float, int, str, Any]] = OrderedDict()
+        self.collection_keys: dict[str, set[str]] = {}
+        self.num_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get_key(self, kind: str, collection_name: str, args: dict) -> str:
+        """
+        Args:
+            kind (str): The kind of query, e.g. "query" or "aggregate".
+            collection_name (str): The collection the query is run on.
+            args (dict): All arguments that change the result of the query on this collection.
+        """
+        return canonical_hash(
+            {"kind": kind, "collection_name": collection_name, "args": args}
+        )
+
+    def get(self, key: str) -> Any | None:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            created, _, _, result = self.entries[key]
+            if self.ttl is not None and time.time() - created > self.ttl:
+                self._delete(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def set(self, key: str, collection_name: str, result: Any) -> None:
+        num_bytes = _estimate_size(result)
+        if num_bytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._delete(key)
+
+            self.entries[key] = (time.time(), num_bytes, collection_name, result)
+            self.collection_keys.setdefault(collection_name, set()).add(key)
+            self.num_bytes += num_bytes
+
+            while self.num_bytes > self.max_bytes:
+                self._delete(next(iter(self.entries)))
+
+    def invalidate(self, collection_name: str | None = None) -> None:
+        """
+        Remove all cached results for a collection, or all cached results if no collection is given.
+        """
+        with self.lock:
+            if collection_name is None:
+                keys = list(self.entries.keys())
+            else:
+                keys = list(self.collection_keys.get(collection_name, set()))
+
+            for key in keys:
+                self._delete(key)
+
+    def _delete(self, key: str) -> None:
+        _, num_bytes, collection_name, _ = self.entries.pop(key)
+        self.num_bytes -= num_bytes
+        self.collection_keys[collection_name].discard(key)
+        if not self.collection_keys[collection_name]:
+            del self.collection_keys[collection_name]
+
+
+_query_caches: dict[tuple, QueryCache] = {}
+
+
+def _cluster_key(wcd_url: str | None, wcd_api_key: str | None) -> tuple[str, str]:
+    # results can differ between API keys with different permissions, so only share between identical keys
+    return (
+        wcd_url or "",
+        hashlib.sha256((wcd_api_key or "").encode()).hexdigest(),
+    )
+
+
+def get_query_cache(settings, client_manager) -> QueryCache | None:
+    """
+    Get the query cache for the Weaviate cluster of the client manager, or None if `USE_QUERY_CACHE` is not enabled.
+    Caches are shared between all client managers connected to the same cluster (with the same API key),
+    so between all users of a `UserManager` that use the same cluster.
+    """
+    if not settings.USE_QUERY_CACHE:
+        return None
+
+    config = (
+        *_cluster_key(client_manager.wcd_url, client_manager.wcd_api_key),
+        settings.QUERY_CACHE_MAX_BYTES,
+        settings.QUERY_CACHE_TTL,
+    )
+    if config not in _query_caches:
+        _query_caches[config] = QueryCache(
+            max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+            ttl=settings.QUERY_CACHE_TTL,
+        )
+    return _query_caches[config]
+
+
+def invalidate_query_cache(wcd_url: str | None, collection_name: str) -> None:
+    """
+    Remove the cached results of a collection from all query caches for a Weaviate cluster.
+    This should be called whenever the objects in the collection are changed by Elysia.
+    """
+    for config, query_cache in _query_caches.items():
+        if config[0] == (wcd_url or ""):
+            query_cache.invalidate(collection_name)
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from elysia.api.dependencies.common import get_user_manager
+from elysia.api.routes.db import get_saved_trees_page, router
+
+
+@pytest.mark.asyncio
+async def test_saved_trees_page_invalid_token():
+    # the token is checked before the user is loaded
+    response = await get_saved_trees_page(
+        "test_user", limit=10, page_token="not a token", user_manager=None  # type: ignore
+    )
+    assert response.status_code == 400
+    content = json.loads(response.body)
+    assert content["trees"] == []
+    assert "Invalid page token" in content["error"]
+
+
+def test_saved_trees_page_limit_is_validated():
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_user_manager] = lambda: None
+
+    with TestClient(app) as client:
+        for limit in [0, -1, 100000]:
+            response = client.get(f"/test_user/saved_trees/page?limit={limit}")
+            assert response.status_code == 422
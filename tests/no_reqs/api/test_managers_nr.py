@@ -1,11 +1,17 @@
+import asyncio
+import datetime
 import pytest
 import os
 import dotenv
+from types import SimpleNamespace
 
 from elysia.api.services.user import UserManager
 from elysia.api.services.tree import TreeManager
 from elysia.config import Settings
 from elysia.api.utils.config import Config
+from elysia.api.utils.queues import QueueFullError, WorkQueue
+from elysia.tree.tree import Tree
+import elysia.tree.util as tree_util
 
 dotenv.load_dotenv(override=True)
 
@@ -65,3 +71,127 @@ async def test_tree_manager():
     # get tree
     tree = tree_manager.get_tree(conversation_id)
     assert tree is not None
+
+
+@pytest.mark.asyncio
+async def test_work_queue():
+    queue = WorkQueue(max_running=1, max_waiting=2)
+    order = []
+
+    async def work(i, delay=0.02):
+        async with queue.slot():
+            order.append(i)
+            await asyncio.sleep(delay)
+
+    tasks = [asyncio.create_task(work(i)) for i in range(3)]
+    await asyncio.sleep(0)
+
+    # one running, two waiting
+    with pytest.raises(QueueFullError):
+        await work(3)
+
+    # a cancelled task leaves the queue without blocking the others
+    tasks[1].cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert order == [0, 2]
+
+    metrics = queue.metrics()
+    assert metrics["running"] == 0 and metrics["waiting"] == 0
+    assert metrics["rejected"] == 1
+    assert metrics["max_wait_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_tree_manager_queue(monkeypatch):
+    conversation_id = f"test_{uuid4()}"
+    tree_manager = TreeManager(f"test_{uuid4()}", max_queue_depth=1)
+    tree_manager.add_tree(conversation_id, low_memory=True)
+
+    started = []
+
+    async def async_run(self, query, query_id=None, **kwargs):
+        started.append(query_id)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"query_id": query_id, "step": i}
+
+    monkeypatch.setattr(Tree, "async_run", async_run)
+
+    async def run(query_id):
+        return [
+            result
+            async for result in tree_manager.process_tree(
+                "query", conversation_id, query_id
+            )
+        ]
+
+    first = asyncio.create_task(run("first"))
+    second = asyncio.create_task(run("second"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueFullError):
+        await run("third")
+
+    results = await asyncio.gather(first, second)
+    assert started == ["first", "second"]
+    assert [len(r) for r in results] == [3, 3]
+
+    # closing a query part way (e.g. on disconnect) frees the tree for the next query
+    results = tree_manager.process_tree("query", conversation_id, "closed")
+    await results.__anext__()
+    assert tree_manager.get_queue_metrics()[conversation_id]["running"] == 1
+    await results.aclose()
+    assert tree_manager.get_queue_metrics()[conversation_id]["running"] == 0
+    assert tree_manager.get_event(conversation_id).is_set()
+    assert len(await run("after")) == 3
+
+
+@pytest.mark.asyncio
+async def test_saved_tree_index(monkeypatch):
+    num_loads = 0
+
+    async def list_all_saved_trees(collection_name, client_manager, user_id):
+        nonlocal num_loads
+        num_loads += 1
+        index = tree_manager.saved_tree_indexes[
+            tree_manager._saved_tree_index_key(client_manager)
+        ]
+
+        # a tree saved and a tree deleted while the index is loading
+        index.update("new", "New")
+        index.remove("old")
+        return [
+            {
+                "conversation_id": conversation_id,
+                "title": conversation_id,
+                "last_update_time": datetime.datetime.now(datetime.timezone.utc),
+            }
+            for conversation_id in ["old", client_manager.wcd_api_key]
+        ]
+
+    monkeypatch.setattr(tree_util, "_list_all_saved_trees", list_all_saved_trees)
+    tree_manager = TreeManager(f"test_{uuid4()}", saved_tree_index_ttl=60)
+
+    # indexes are kept per API key, as keys can have different permissions
+    index = await tree_manager.get_saved_tree_index(
+        SimpleNamespace(wcd_url="http://localhost:8080", wcd_api_key="key_1")  # type: ignore
+    )
+    assert set(index.to_dict()) == {"new", "key_1"}
+    other_index = await tree_manager.get_saved_tree_index(
+        SimpleNamespace(wcd_url="http://localhost:8080", wcd_api_key="key_2")  # type: ignore
+    )
+    assert other_index is not index
+    assert set(other_index.to_dict()) == {"new", "key_2"}
+    assert num_loads == 2
+
+    # the index is loaded again once it is older than the ttl
+    await tree_manager.get_saved_tree_index(
+        SimpleNamespace(wcd_url="http://localhost:8080", wcd_api_key="key_1")  # type: ignore
+    )
+    assert num_loads == 2
+    index.loaded_at -= 61
+    assert index.is_stale()
+    await tree_manager.get_saved_tree_index(
+        SimpleNamespace(wcd_url="http://localhost:8080", wcd_api_key="key_1")  # type: ignore
+    )
+    assert num_loads == 3
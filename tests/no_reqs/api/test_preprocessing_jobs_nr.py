@@ -0,0 +1,263 @@
+import asyncio
+import json
+import pickle
+import sqlite3
+import time
+
+import pytest
+
+import elysia.api.services.preprocessing as preprocessing_service
+from elysia.api.services.preprocessing import PreprocessingJobManager
+from elysia.api.utils.jobs import PreprocessingJobStore
+from elysia.config import Settings
+
+
+class FakePreprocessor:
+    """
+    Stands in for `preprocess_async`, with two stages per collection that are checkpointed.
+    Stages (other than `free_stages`) wait for `release` to be set, so a job can be interrupted part way through.
+    """
+
+    def __init__(
+        self, fail: list[str] | None = None, free_stages: list[str] | None = None
+    ):
+        self.fail = fail or []
+        self.free_stages = free_stages or []
+        self.release = asyncio.Event()
+        self.stages_run = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, collection_name, checkpoint, **kwargs):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            for i, stage in enumerate(["summary", "mappings"]):
+                if stage not in checkpoint:
+                    if stage not in self.free_stages:
+                        await self.release.wait()
+                    self.stages_run.append((collection_name, stage))
+                    checkpoint[stage] = f"{stage} of {collection_name}"
+                yield {
+                    "type": "update",
+                    "collection_name": collection_name,
+                    "progress": (i + 1) / 3,
+                    "message": f"Finished {stage}",
+                    "error": "",
+                }
+
+            yield {
+                "type": "completed" if collection_name not in self.fail else "update",
+                "collection_name": collection_name,
+                "progress": 1.0,
+                "message": "Saved metadata to Weaviate",
+                "error": (
+                    "Error preprocessing collection"
+                    if collection_name in self.fail
+                    else ""
+                ),
+            }
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_job_runs_collections_in_parallel(tmp_path, monkeypatch):
+    preprocessor = FakePreprocessor(fail=["C"])
+    monkeypatch.setattr(preprocessing_service, "preprocess_async", preprocessor)
+    job_manager = PreprocessingJobManager(path=str(tmp_path / "jobs.db"), max_running=2)
+
+    job_id = await job_manager.submit(
+        "user", ["A", "B", "C", "A"], Settings(), None  # type: ignore
+    )
+    job = job_manager.get_job(job_id)
+    assert [c["collection_name"] for c in job["collections"]] == ["A", "B", "C"]
+
+    updates = []
+
+    async def follow():
+        async for update in job_manager.subscribe(job_id):
+            updates.append(update)
+
+    follower = asyncio.create_task(follow())
+    await asyncio.sleep(0.05)
+    preprocessor.release.set()
+    await asyncio.wait_for(follower, timeout=5)
+
+    assert preprocessor.max_running == 2
+    assert updates[0]["type"] == "job_status"
+    assert updates[-1] == {
+        "type": "job_completed",
+        "job_id": job_id,
+        "status": "failed",
+    }
+    assert all(u["job_id"] == job_id for u in updates[1:])
+
+    job = job_manager.get_job(job_id)
+    assert job["status"] == "failed"
+    statuses = {c["collection_name"]: c["status"] for c in job["collections"]}
+    assert statuses == {"A": "completed", "B": "completed", "C": "failed"}
+    assert job["collections"][2]["error"] == "Error preprocessing collection"
+    assert [j["job_id"] for j in job_manager.get_jobs("user")] == [job_id]
+    assert job_manager.get_jobs("someone else") == []
+
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_job_resumes_from_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+
+    # interrupted after the first stage of each collection
+    preprocessor = FakePreprocessor(free_stages=["summary"])
+    monkeypatch.setattr(preprocessing_service, "preprocess_async", preprocessor)
+    job_manager = PreprocessingJobManager(path=path, max_running=2)
+    job_id = await job_manager.submit("user", ["A", "B"], Settings(), None)  # type: ignore
+
+    await asyncio.sleep(0.05)
+    await job_manager.close()
+    assert sorted(preprocessor.stages_run) == [("A", "summary"), ("B", "summary")]
+
+    # after the restart, only the remaining stages run
+    preprocessor = FakePreprocessor()
+    preprocessor.release.set()
+    monkeypatch.setattr(preprocessing_service, "preprocess_async", preprocessor)
+    job_manager = PreprocessingJobManager(path=path, max_running=2)
+    assert job_manager.get_job(job_id)["status"] == "running"
+
+    assert await job_manager.resume_jobs("someone else", Settings(), None) == []  # type: ignore
+    assert await job_manager.resume_jobs("user", Settings(), None) == [job_id]  # type: ignore
+    assert await job_manager.resume_jobs("user", Settings(), None) == []  # type: ignore
+    await asyncio.wait_for(job_manager.tasks[job_id], timeout=5)
+
+    assert sorted(preprocessor.stages_run) == [("A", "mappings"), ("B", "mappings")]
+    job = job_manager.get_job(job_id)
+    assert job["status"] == "completed"
+    assert all(c["progress"] == 1.0 for c in job["collections"])
+    assert job_manager.store.get_checkpoint(job_id, "A") is None
+
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_job_resumed_by_one_worker(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.db")
+    preprocessor = FakePreprocessor()
+    monkeypatch.setattr(preprocessing_service, "preprocess_async", preprocessor)
+
+    # two workers sharing the same file
+    worker_1 = PreprocessingJobManager(path=path, max_running=2, lease=0.3)
+    worker_2 = PreprocessingJobManager(path=path, max_running=2, lease=0.3)
+    job_id = await worker_1.submit("user", ["A"], Settings(), None)  # type: ignore
+
+    # the lease is renewed while the job runs, so the other worker leaves it alone
+    await asyncio.sleep(0.5)
+    assert await worker_2.resume_jobs("user", Settings(), None) == []  # type: ignore
+    assert worker_1.is_running(job_id)
+
+    # once the first worker stops, only one of the others resumes it
+    await worker_1.close()
+    worker_3 = PreprocessingJobManager(path=path, max_running=2, lease=0.3)
+    assert await worker_2.resume_jobs("user", Settings(), None) == [job_id]  # type: ignore
+    assert await worker_3.resume_jobs("user", Settings(), None) == []  # type: ignore
+
+    preprocessor.release.set()
+    await asyncio.wait_for(worker_2.tasks[job_id], timeout=5)
+    assert worker_2.get_job(job_id)["status"] == "completed"
+
+    await worker_2.close()
+    await worker_3.close()
+
+
+def test_job_lease_expires(tmp_path):
+    store = PreprocessingJobStore(str(tmp_path / "jobs.db"))
+    store.create_job("job", "user", ["A"], {}, owner="worker 1", lease=0.05)
+
+    assert not store.claim_job("job", "worker 2", 10)
+    assert store.claim_job("job", "worker 1", 0.05)
+    time.sleep(0.1)
+    # a worker that stopped without releasing the job
+    assert store.claim_job("job", "worker 2", 10)
+    assert not store.claim_job("job", "worker 1", 10)
+
+    store.set_job_status("job", "completed")
+    assert not store.claim_job("job", "worker 2", 10)
+    store.close()
+
+
+def test_checkpoints_are_json(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = PreprocessingJobStore(path)
+    store.create_job("job", "user", ["A", "B"], {}, owner="worker", lease=10)
+    checkpoint = {"summary": "A summary.", "mappings": {"document": {"title": "t"}}}
+    store.update_collection("job", "A", "running", 0.5, checkpoint=checkpoint)
+
+    assert store.get_checkpoint("job", "A") == checkpoint
+    row = sqlite3.connect(path).execute(
+        "SELECT checkpoint FROM job_collections WHERE collection_name = 'A'"
+    )
+    assert json.loads(row.fetchone()[0]) == checkpoint
+
+    # checkpoints pickled by earlier versions are not loaded
+    with store.conn:
+        store.conn.execute(
+            "UPDATE job_collections SET checkpoint = ? WHERE collection_name = 'B'",
+            (pickle.dumps(checkpoint),),
+        )
+    assert store.get_checkpoint("job", "B") is None
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_only_written_when_changed(tmp_path, monkeypatch):
+    async def preprocessor(collection_name, checkpoint, **kwargs):
+        for progress in [0.1, 0.2]:
+            yield {
+                "type": "update",
+                "collection_name": collection_name,
+                "progress": progress,
+                "message": "Summarising collection",
+                "error": "",
+            }
+        checkpoint["summary"] = "A summary."
+        for progress in [0.5, 0.6]:
+            yield {
+                "type": "update",
+                "collection_name": collection_name,
+                "progress": progress,
+                "message": "Finished summary",
+                "error": "",
+            }
+        yield {
+            "type": "completed",
+            "collection_name": collection_name,
+            "progress": 1.0,
+            "message": "Saved metadata to Weaviate",
+            "error": "",
+        }
+
+    monkeypatch.setattr(preprocessing_service, "preprocess_async", preprocessor)
+    job_manager = PreprocessingJobManager(path=str(tmp_path / "jobs.db"))
+
+    checkpoints_written = []
+    update_collection = job_manager.store.update_collection
+
+    def record(*args, checkpoint=None, keep_checkpoint=False, **kwargs):
+        if not keep_checkpoint:
+            checkpoints_written.append(None if checkpoint is None else dict(checkpoint))
+        update_collection(
+            *args, checkpoint=checkpoint, keep_checkpoint=keep_checkpoint, **kwargs
+        )
+
+    monkeypatch.setattr(job_manager.store, "update_collection", record)
+
+    job_id = await job_manager.submit("user", ["A"], Settings(), None)  # type: ignore
+    await asyncio.wait_for(job_manager.tasks[job_id], timeout=5)
+
+    assert checkpoints_written == [{}, {"summary": "A summary."}, None]
+    job = job_manager.get_job(job_id)
+    assert job["status"] == "completed"
+    assert job["collections"][0]["progress"] == 1.0
+    assert job_manager.store.get_checkpoint(job_id, "A") is None
+
+    await job_manager.close()
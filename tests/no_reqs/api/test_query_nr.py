@@ -13,6 +13,7 @@ from elysia.api.routes.query import process
 from elysia.api.api_types import QueryData, InitialiseTreeData, SaveConfigUserData
 from elysia.api.routes.init import initialise_user, initialise_tree
 from elysia.api.routes.user_config import save_config_user
+from elysia.api.utils.websocket import _receive_json, run_until_disconnect
 
 from uuid import uuid4
 
@@ -148,3 +149,53 @@ async def test_query():
     assert ner_found
     assert title_found
     assert complete_found
+
+
+class disconnecting_websocket:
+    """
+    A client that sends a message, then disconnects after `delay` seconds.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.messages = [
+            {"type": "websocket.receive", "text": json.dumps({"query": "next"})}
+        ]
+
+    async def receive(self):
+        if self.messages:
+            return self.messages.pop(0)
+        await asyncio.sleep(self.delay)
+        return {"type": "websocket.disconnect", "code": 1001}
+
+    async def receive_json(self):
+        raise AssertionError("the pending message should be received first")
+
+
+@pytest.mark.asyncio
+async def test_query_cancelled_on_disconnect():
+    released = asyncio.Event()
+
+    async def waiting_query():
+        # e.g. waiting for a slot to run the tree
+        try:
+            await asyncio.Event().wait()
+        finally:
+            released.set()
+
+    websocket = disconnecting_websocket(delay=0.05)
+    assert not await asyncio.wait_for(
+        run_until_disconnect(websocket, waiting_query()), timeout=5  # type: ignore
+    )
+    assert released.is_set()
+
+    # messages received while the query ran are kept for the next receive
+    assert await _receive_json(websocket) == {"query": "next"}  # type: ignore
+
+    async def query():
+        return "done"
+
+    assert await run_until_disconnect(disconnecting_websocket(delay=5), query())  # type: ignore
+
+    # a websocket that cannot be watched only stops the query when sending fails
+    assert await run_until_disconnect(fake_websocket(), query())  # type: ignore
@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+
+from weaviate.collections.classes.batch import BatchObjectReturn
+from weaviate.collections.classes.data import DataObject, DataReference
+
+from elysia.util.batch_writer import BatchWriter, _payload_size
+
+
+class FakeData:
+    def __init__(self, fail_uuids=(), fail_batches=False):
+        self.fail_uuids = set(fail_uuids)
+        self.fail_batches = fail_batches
+        self.objects = {}
+        self.references = []
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def insert_many(self, objects):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        self.batch_sizes.append(len(objects))
+        if self.fail_batches:
+            raise ConnectionError("batch failed")
+
+        response = BatchObjectReturn()
+        for i, obj in enumerate(objects):
+            if obj.uuid in self.fail_uuids:
+                response.errors[i] = "invalid object"
+            else:
+                self.objects[obj.uuid] = obj.properties
+        return response
+
+    async def insert(self, properties, references=None, uuid=None, vector=None):
+        if uuid in self.fail_uuids:
+            raise ValueError(f"invalid object {uuid}")
+        if uuid in self.objects:
+            raise ValueError(f"object {uuid} already exists")
+        self.objects[uuid] = properties
+
+    async def exists(self, uuid):
+        return uuid in self.objects
+
+    async def replace(self, uuid, properties, references=None, vector=None):
+        if uuid not in self.objects:
+            raise ValueError(f"object {uuid} does not exist")
+        self.objects[uuid] = properties
+
+    async def reference_add_many(self, refs):
+        raise ConnectionError("batch failed")
+
+    async def reference_add(self, from_uuid, from_property, to):
+        self.references.append((from_uuid, from_property, to))
+
+
+class TimeoutData(FakeData):
+    """
+    Times out on batches of more than `max_items` objects.
+    """
+
+    def __init__(self, max_items):
+        super().__init__()
+        self.max_items = max_items
+
+    async def insert_many(self, objects):
+        if len(objects) > self.max_items:
+            self.batch_sizes.append(len(objects))
+            raise TimeoutError("batch timed out")
+        return await super().insert_many(objects)
+
+
+class FakeCollection:
+    def __init__(self, **kwargs):
+        self.name = "Test"
+        self.data = FakeData(**kwargs)
+
+
+def make_objects(n, text_length=100):
+    return [
+        DataObject(properties={"text": "x" * text_length}, uuid=str(i))
+        for i in range(n)
+    ]
+
+
+def test_batches_sized_by_bytes():
+    writer = BatchWriter(max_batch_bytes=10_000, max_batch_size=50)
+
+    # small objects fill batches up to the maximum size
+    assert [len(b) for b in writer.make_batches(make_objects(120, 1))] == [50, 50, 20]
+
+    writer = BatchWriter(max_batch_bytes=1000, max_batch_size=50)
+
+    # large objects are sent in smaller batches
+    batches = writer.make_batches(make_objects(20, 400))
+    assert all(len(batch) == 2 for batch in batches)
+
+    # an object larger than the limit is sent on its own
+    assert len(writer.make_batches(make_objects(3, 5000))) == 3
+
+
+@pytest.mark.asyncio
+async def test_insert_objects():
+    collection = FakeCollection(fail_uuids=["3"])
+    writer = BatchWriter(max_batch_bytes=1000, max_in_flight=2)
+
+    summary = await writer.insert_objects(collection, make_objects(40))
+    assert collection.data.max_in_flight <= 2
+    assert summary["num_batches"] == len(collection.data.batch_sizes) > 1
+    assert summary["num_written"] == 39
+    assert summary["num_failed"] == 1
+    assert "3" in summary["errors"][0]
+    assert summary["items_per_second"] > 0
+    assert len(collection.data.objects) == 39
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_individually():
+    collection = FakeCollection(fail_batches=True)
+    summary = await BatchWriter().insert_objects(collection, make_objects(5))
+    assert summary["num_written"] == 5
+    assert len(collection.data.objects) == 5
+
+    # objects that already exist are replaced, as in a batch
+    objects = [DataObject(properties={"text": "new"}, uuid=str(i)) for i in range(3, 7)]
+    summary = await BatchWriter().insert_objects(collection, objects)
+    assert summary["num_written"] == 4
+    assert summary["num_failed"] == 0
+    assert len(collection.data.objects) == 7
+    assert collection.data.objects["4"] == {"text": "new"}
+
+    references = [
+        DataReference(from_uuid=str(i), from_property="isChunked", to_uuid="chunk")
+        for i in range(5)
+    ]
+    summary = await BatchWriter().add_references(collection, references)
+    assert summary["num_written"] == 5
+    assert len(collection.data.references) == 5
+
+
+def test_vector_size():
+    obj = DataObject(properties={}, vector=[0.1] * 1536)
+    assert _payload_size(obj) == 36 + 2 + 4 * 1536
+
+    # named vectors and multi-vectors count every float
+    obj = DataObject(properties={}, vector={"a": [0.1] * 10, "b": [[0.1] * 4] * 3})
+    assert _payload_size(obj) == 36 + 2 + 4 * 22
+
+
+@pytest.mark.asyncio
+async def test_budget_shrinks_after_failed_batches():
+    collection = FakeCollection()
+    collection.data = TimeoutData(max_items=5)
+    writer = BatchWriter(
+        max_batch_bytes=4000, min_batch_bytes=100, max_batch_size=50, max_in_flight=1
+    )
+
+    # the first batch times out, and each failure halves the budget for the next batches
+    summary = await writer.insert_objects(collection, make_objects(100))
+    assert summary["num_written"] == 100
+    assert summary["num_failed"] == 0
+    sizes = collection.data.batch_sizes
+    assert sizes[0] > 5
+    assert sizes[:4] == sorted(sizes[:4], reverse=True)
+    assert max(sizes[3:]) < sizes[0] / 2
+
+    # grows back after batches succeed, up to the maximum
+    budget = writer.batch_bytes
+    assert budget < 4000
+    await writer.insert_objects(FakeCollection(), make_objects(200, 1))
+    assert budget < writer.batch_bytes <= 4000
@@ -1,6 +1,9 @@
 import pytest
 import inspect
 
+from concurrent.futures.process import BrokenProcessPool
+
+import elysia.tools.retrieval.chunk as chunk
 from elysia.tools.retrieval.chunk import AsyncCollectionChunker, Chunker
 from elysia.util.client import ClientManager
 
@@ -36,3 +39,88 @@ def test_chunker():
     assert doc[spans[0][0] : spans[0][1]] == chunks[0]
     assert doc[spans[1][0] : spans[1][1]] == chunks[1]
     assert doc[spans[2][0] : spans[2][1]] == chunks[2]
+
+
+def test_chunk_many():
+    chunker = Chunker(chunking_strategy="sentences", num_sentences=1)
+    docs = [
+        "Hello, world! This is a test.",
+        "Hello, world! This is a test. This is another test.",
+    ]
+    assert list(chunker.chunk_many(docs, batch_size=1)) == [
+        chunker.chunk(doc) for doc in docs
+    ]
+
+    # only the components needed for chunking are loaded
+    assert chunker.nlp.pipe_names == ["sentencizer"]
+
+
+class FakeObject:
+    def __init__(self, content):
+        self.properties = {"content": content}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_processes", [True, False])
+async def test_chunk_objects_in_batches(use_processes):
+    collection_chunker = AsyncCollectionChunker(
+        "Test",
+        batch_size=2,
+        min_characters_for_processes=0,
+        use_processes=use_processes,
+    )
+    documents = [f"Document {i}. " * 12 for i in range(5)]
+    objects = [FakeObject(document) for document in documents]
+    uuids = [str(i) for i in range(5)]
+
+    num_batches = 0
+    async for chunks, spans, chunk_uuids in collection_chunker.chunk_objects_stream(
+        objects, uuids, "content"
+    ):
+        num_batches += 1
+        assert chunks.keys() == spans.keys() == chunk_uuids.keys()
+    assert num_batches == 3
+
+    chunks, spans, chunk_uuids = await collection_chunker.chunk_objects_parallel(
+        objects, uuids, "content"
+    )
+    for uuid, document in zip(uuids, documents):
+        expected_chunks, expected_spans = collection_chunker.chunker.chunk(document)
+        assert chunks[uuid] == expected_chunks
+        assert spans[uuid] == expected_spans
+        assert chunk_uuids[uuid] == collection_chunker.generate_uuids(
+            expected_chunks, expected_spans, "content"
+        )
+
+
+class BrokenPool:
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.mark.asyncio
+async def test_broken_chunking_pool_is_shut_down(monkeypatch):
+    pool = BrokenPool()
+    monkeypatch.setattr(chunk, "_chunking_pool", pool)
+
+    # processes are only used when enabled
+    collection_chunker = AsyncCollectionChunker("Test", min_characters_for_processes=0)
+    await collection_chunker.chunk_objects_parallel(
+        [FakeObject("Hello. World.")], ["0"], "content"
+    )
+    assert chunk._chunking_pool is pool
+
+    # a broken pool is shut down and replaced, and the batch is chunked in a thread
+    collection_chunker.use_processes = True
+    chunks, _, _ = await collection_chunker.chunk_objects_parallel(
+        [FakeObject("Hello. World.")], ["0"], "content"
+    )
+    assert chunks["0"] == collection_chunker.chunker.chunk("Hello. World.")[0]
+    assert pool.shut_down
+    assert chunk._chunking_pool is None
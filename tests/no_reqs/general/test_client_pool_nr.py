@@ -0,0 +1,178 @@
+import asyncio
+import datetime
+
+import pytest
+
+from elysia.util.client import AsyncClientPool, ClientManager
+
+
+class FakeAsyncClient:
+    def __init__(self, cluster_url, auth_credentials, headers, skip_init_checks):
+        self.cluster_url = cluster_url
+        self.headers = headers
+        self.connected = False
+        self.num_connects = 0
+
+    def is_connected(self):
+        return self.connected
+
+    async def connect(self):
+        self.connected = True
+        self.num_connects += 1
+
+    async def close(self):
+        self.connected = False
+
+
+@pytest.mark.asyncio
+async def test_clients_are_shared():
+    pool = AsyncClientPool(max_connections=4, client_factory=FakeAsyncClient)
+
+    pooled_1 = await pool.acquire("url", "key", {"X-OpenAI-Api-Key": "a"})
+    pooled_2 = await pool.acquire("url", "key", {"X-OpenAI-Api-Key": "a"})
+    pooled_3 = await pool.acquire("url", "key", {"X-OpenAI-Api-Key": "b"})
+    assert pooled_1 is pooled_2
+    assert pooled_1 is not pooled_3
+    assert pool.metrics()["clients"] == 2
+
+    async with pool.lease(pooled_1) as client_1:
+        async with pool.lease(pooled_2) as client_2:
+            assert client_1 is client_2
+            assert pool.metrics()["in_use"] == 2
+    assert client_1.num_connects == 1
+
+    # closed when the last reference is released
+    await pool.release(pooled_1)
+    assert client_1.connected
+    await pool.release(pooled_2)
+    assert not client_1.connected
+    assert pool.metrics()["clients"] == 1
+
+    await pool.release(pooled_3)
+    assert pool.metrics()["clients"] == 0
+
+
+@pytest.mark.asyncio
+async def test_max_connections_and_reaping():
+    pool = AsyncClientPool(max_connections=2, client_factory=FakeAsyncClient)
+    pooled = [await pool.acquire(f"url-{i}", "key", {}) for i in range(3)]
+
+    async with pool.lease(pooled[0]):
+        async with pool.lease(pooled[1]):
+            # both connections are in use, so the third waits for one to be returned
+            task = asyncio.create_task(_lease(pool, pooled[2]))
+            await asyncio.sleep(0.1)
+            assert not task.done()
+        await task
+    assert pool.metrics()["connected"] == 2
+    assert not pooled[1].client.connected
+
+    # idle clients are disconnected, and reconnect when next used
+    assert await pool.reap_idle(datetime.timedelta(minutes=1)) == 0
+    assert await pool.reap_idle(datetime.timedelta(seconds=0)) == 2
+    assert pool.metrics()["connected"] == 0
+    async with pool.lease(pooled[0]) as client:
+        assert client.connected
+        assert client.num_connects == 2
+
+    for p in pooled:
+        await pool.release(p)
+
+
+class SlowCloseAsyncClient(FakeAsyncClient):
+    async def close(self):
+        await asyncio.sleep(0.1)
+        self.connected = False
+
+
+@pytest.mark.asyncio
+async def test_evicted_client_is_not_reconnected_while_closing():
+    pool = AsyncClientPool(max_connections=1, client_factory=SlowCloseAsyncClient)
+    pooled = [await pool.acquire(f"url-{i}", "key", {}) for i in range(2)]
+
+    await _lease(pool, pooled[0])
+
+    # the first client is evicted to connect the second, and leased again while it is being closed
+    evict = asyncio.create_task(_lease(pool, pooled[1]))
+    await asyncio.sleep(0.01)
+    async with pool.lease(pooled[0]) as client:
+        await asyncio.sleep(0.2)
+        assert client.connected
+        assert client.num_connects == 2
+    await evict
+
+    for p in pooled:
+        await pool.release(p)
+
+
+@pytest.mark.asyncio
+async def test_release_waits_for_leases():
+    pool = AsyncClientPool(max_connections=1, client_factory=FakeAsyncClient)
+    pooled = await pool.acquire("url", "key", {})
+    leased = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def use():
+        async with pool.lease(pooled) as client:
+            leased.set()
+            await finish.wait()
+            assert client.connected
+
+    task = asyncio.create_task(use())
+    await leased.wait()
+
+    # the last reference is released while the client is still leased
+    release = asyncio.create_task(pool.release(pooled))
+    await asyncio.sleep(0.05)
+    assert not release.done()
+    assert pooled.client.connected
+
+    finish.set()
+    await asyncio.wait_for(asyncio.gather(task, release), timeout=1)
+    assert not pooled.client.connected
+    assert pool.metrics()["clients"] == 0
+
+
+async def _lease(pool: AsyncClientPool, pooled):
+    async with pool.lease(pooled) as client:
+        assert client.connected
+
+
+class FakeSyncClient:
+    def __init__(self):
+        self.connected = False
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    def connect(self):
+        self.connected = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_sync_client_is_lazy(monkeypatch):
+    client_manager = ClientManager(
+        wcd_url="https://example.weaviate.network", wcd_api_key="key"
+    )
+    assert client_manager.client is None
+
+    # nothing to restart or close
+    await client_manager.restart_client(force=True)
+    await client_manager.restart_async_client()
+    assert client_manager.client is None
+
+    monkeypatch.setattr(client_manager, "get_client", FakeSyncClient)
+    with client_manager.connect_to_client() as client:
+        assert client.connected
+    assert client_manager.client is client
+
+    # closed on restart, and created again when next used
+    await client_manager.restart_client(force=True)
+    assert client.closed
+    assert client_manager.client is None
+    with client_manager.connect_to_client() as new_client:
+        assert new_client is not client
@@ -0,0 +1,106 @@
+import os
+import random
+import asyncio
+
+import pytest
+from dspy import LM
+
+from elysia import Tool
+from elysia.config import ElysiaKeyManager, Settings, configure
+from elysia.tree.objects import TreeData
+from elysia.tree.tree import Tree
+from elysia.tools.text.text import TextResponse
+from elysia.util.client import ClientManager
+
+configure(logging_level="CRITICAL")
+
+
+class ReadKeyTool(Tool):
+    """
+    Reads the OpenAI API key from the environment several times, from the event loop and from a thread.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(name="read_key_tool", description="Reads the API key")
+        self.keys_seen = []
+
+    async def is_tool_available(self, tree_data, base_lm, complex_lm, client_manager):
+        return False
+
+    async def run_if_true(
+        self,
+        tree_data: TreeData,
+        base_lm: LM,
+        complex_lm: LM,
+        client_manager: ClientManager,
+    ):
+        return True, {}
+
+    async def __call__(
+        self,
+        tree_data: TreeData,
+        inputs: dict,
+        base_lm: LM,
+        complex_lm: LM,
+        client_manager: ClientManager,
+        **kwargs,
+    ):
+        for _ in range(3):
+            await asyncio.sleep(random.random() * 0.01)
+            self.keys_seen.append(os.environ.get("OPENAI_API_KEY"))
+            self.keys_seen.append(await asyncio.to_thread(os.getenv, "OPENAI_API_KEY"))
+        yield True
+
+
+def test_credentials_are_isolated():
+    settings_1 = Settings()
+    settings_1.configure(openai_api_key="key-1")
+    settings_2 = Settings()
+    settings_2.configure(openai_api_key="key-2")
+
+    with ElysiaKeyManager(settings_1):
+        assert os.environ["OPENAI_API_KEY"] == "key-1"
+        with ElysiaKeyManager(settings_2):
+            assert os.environ["OPENAI_API_KEY"] == "key-2"
+        assert os.environ["OPENAI_API_KEY"] == "key-1"
+
+    settings_3 = Settings()
+    with ElysiaKeyManager(settings_3):
+        # keys not in the settings are hidden, other variables are not
+        assert "OPENAI_API_KEY" not in os.environ
+        assert os.environ.get("PATH") is not None
+    assert os.environ.get("OPENAI_API_KEY") != "key-1"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_trees_use_their_own_keys():
+    num_trees = 20
+    trees = []
+    for i in range(num_trees):
+        settings = Settings()
+        settings.configure(
+            base_model="gpt-4o-mini",
+            base_provider="openai",
+            complex_model="gpt-4o",
+            complex_provider="openai",
+            openai_api_key=f"key-{i}",
+        )
+        tree = Tree(low_memory=False, branch_initialisation="empty", settings=settings)
+        tree.add_tool(TextResponse, root=True)
+        tree.add_tool(ReadKeyTool, root=True)
+        trees.append(tree)
+
+    async def run(tree: Tree):
+        async for _ in tree.async_run("Hello", collection_names=[]):
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*[run(tree) for tree in trees])
+
+    for i, tree in enumerate(trees):
+        keys_seen = tree.tools["read_key_tool"].keys_seen
+        assert len(keys_seen) > 0
+        assert set(keys_seen) == {f"key-{i}"}
+
+        # the LMs are given the key directly
+        assert tree.base_lm.kwargs["api_key"] == f"key-{i}"
+        assert tree.complex_lm.kwargs["api_key"] == f"key-{i}"
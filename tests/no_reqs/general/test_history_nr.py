@@ -0,0 +1,123 @@
+import pytest
+
+from elysia.config import Settings
+from elysia.tree.history import QueryHistory
+from elysia.tree.objects import Environment
+from elysia.tree.tree import Tree
+
+
+def add_record(history: QueryHistory, query_id: str, environment: Environment):
+    return history.add(
+        query_id=query_id,
+        decisions=["query", "text_response"],
+        iteration_stats=[
+            {
+                "iteration": 0,
+                "decision_time": 0.5,
+                "tool_time": 1.5,
+                "total_time": 2.0,
+                "input_tokens": 10,
+                "output_tokens": 5,
+                "tools": ["query"],
+            }
+        ],
+        user_prompt=f"Prompt for {query_id}",
+        num_trees_completed=1,
+        base_lm_used="base",
+        complex_lm_used="complex",
+        time_taken_seconds=2.5,
+        initialisation="one_branch",
+        environment=environment.snapshot(),
+        conversation_history=[{"role": "user", "content": f"Prompt for {query_id}"}],
+        tasks_completed=[{"prompt": query_id, "task": [{"action": True}]}],
+        action_information=[{"action_name": "query"}],
+        training_updates=[{"module_name": "decision", "inputs": {}, "outputs": {}}],
+    )
+
+
+def test_records_are_immutable():
+    environment = Environment()
+    environment.add_objects("query", "Products", [{"name": "a"}])
+
+    history = QueryHistory()
+    record = add_record(history, "q1", environment)
+    environment.add_objects("query", "Products", [{"name": "b"}])
+
+    # the record references the environment at the time, not a copy of the objects
+    assert len(record.environment["query"]["Products"]) == 1
+    assert (
+        record.environment["query"]["Products"][0]
+        is environment.environment["query"]["Products"][0]
+    )
+
+    with pytest.raises(AttributeError):
+        record.user_prompt = "changed"
+
+    tasks_completed = record.tasks_completed
+    tasks_completed[0]["task"][0]["action"] = False
+    assert record.tasks_completed[0]["task"][0]["action"] is True
+
+    assert record.decision_history == ["query", "text_response"]
+    assert record.iteration_stats[0]["tools"] == ["query"]
+    assert record.training_updates[0]["module_name"] == "decision"
+
+
+def test_retention(tmp_path):
+    environment = Environment()
+
+    history = QueryHistory(max_queries=2)
+    for i in range(5):
+        add_record(history, f"q{i}", environment)
+    assert list(history) == ["q3", "q4"]
+    assert "q0" not in history
+    assert len(history.decision_log.decisions) == 4
+    assert history["q3"].decision_history == ["query", "text_response"]
+
+    history = QueryHistory(max_queries=2, spill_directory=str(tmp_path))
+    for i in range(5):
+        add_record(history, f"q{i}", environment)
+    assert list(history) == [f"q{i}" for i in range(5)]
+    assert len(history.records) == 2
+    assert len(history.decision_log.decisions) == 4
+
+    # older records are read back from disk
+    spilled = history["q0"]
+    assert spilled.user_prompt == "Prompt for q0"
+    assert spilled.decision_history == ["query", "text_response"]
+    assert spilled.iteration_stats[0]["total_time"] == 2.0
+
+    history.clear()
+    assert len(history) == 0
+    assert list(tmp_path.iterdir()) == []
+
+    # replacing a spilled record does not overwrite the files of other spilled records
+    history = QueryHistory(max_queries=1, spill_directory=str(tmp_path))
+    for query_id in ["a", "b", "c", "a"]:
+        add_record(history, query_id, environment)
+    assert list(history) == ["b", "c", "a"]
+    assert history["b"].user_prompt == "Prompt for b"
+    assert history["c"].user_prompt == "Prompt for c"
+    assert history["a"].user_prompt == "Prompt for a"
+
+
+def test_tree_history():
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        history_max_queries=2,
+    )
+    tree = Tree(settings=settings)
+
+    for prompt in ["Hi!", "How are you?", "Bye!"]:
+        tree.run(prompt)
+
+    assert list(tree.history) == [
+        tree.prompt_to_query_id[prompt] for prompt in ["How are you?", "Bye!"]
+    ]
+    record = tree.history[tree.prompt_to_query_id["Bye!"]]
+    assert record.user_prompt == "Bye!"
+    assert record.conversation_history == tree.tree_data.conversation_history
+    assert len(record.decision_history) > 0
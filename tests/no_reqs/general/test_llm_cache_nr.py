@@ -0,0 +1,298 @@
+import json
+import time
+import pickle
+import sqlite3
+import pytest
+import dspy
+from pydantic import BaseModel
+
+from elysia.config import Settings
+import asyncio
+
+from elysia.util.llm_cache import LLMCache, get_llm_cache
+from elysia.util.parsing import canonical_hash
+from elysia.tree.tree import Tree
+from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
+from elysia.util.objects import Tracker
+
+
+class QuestionAnswer(dspy.Signature):
+    user_prompt: str = dspy.InputField()
+    context: str = dspy.InputField()
+    answer: str = dspy.OutputField()
+
+
+class CountingPredict(dspy.Predict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_calls = 0
+
+    async def acall(self, **kwargs):
+        self.num_calls += 1
+        return await super().acall(**kwargs)
+
+
+lm = dspy.LM("gpt-4o-mini")
+
+
+@pytest.mark.asyncio
+async def test_exact_match():
+    llm_cache = LLMCache()
+    predict = CountingPredict(QuestionAnswer)
+
+    first = await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    second = await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    assert predict.num_calls == 1
+    assert first.answer == second.answer
+
+    await llm_cache.acall(predict, user_prompt="hi", context="b", lm=lm)
+    assert predict.num_calls == 2
+
+    # a different LM is a different key
+    await llm_cache.acall(predict, user_prompt="hi", context="a", lm=dspy.LM("gpt-4o"))
+    assert predict.num_calls == 3
+
+    assert llm_cache.hits == 1
+    assert llm_cache.misses == 3
+
+
+@pytest.mark.asyncio
+async def test_ttl_and_lru():
+    llm_cache = LLMCache(ttl=0.1)
+    predict = CountingPredict(QuestionAnswer)
+
+    await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    time.sleep(0.2)
+    await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    assert predict.num_calls == 2
+
+    llm_cache = LLMCache(max_size=2)
+    predict = CountingPredict(QuestionAnswer)
+    for context in ["a", "b", "a", "c"]:
+        await llm_cache.acall(predict, user_prompt="hi", context=context, lm=lm)
+    assert len(llm_cache) == 2
+
+    # "a" was used more recently than "b", so "b" was evicted
+    await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    assert predict.num_calls == 3
+    await llm_cache.acall(predict, user_prompt="hi", context="b", lm=lm)
+    assert predict.num_calls == 4
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+
+    predict = CountingPredict(QuestionAnswer)
+    first = await LLMCache(path=path).acall(
+        predict, user_prompt="hi", context="a", lm=lm
+    )
+
+    llm_cache = LLMCache(path=path)
+    second = await llm_cache.acall(predict, user_prompt="hi", context="a", lm=lm)
+    assert predict.num_calls == 1
+    assert second.toDict() == first.toDict()
+    assert len(llm_cache) == 1
+
+
+class Chart(BaseModel):
+    title: str
+    values: list[float]
+
+
+class ChartSignature(dspy.Signature):
+    user_prompt: str = dspy.InputField()
+    charts: list[Chart] = dspy.OutputField()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_stores_json(tmp_path, monkeypatch):
+    path = str(tmp_path / "llm_cache.db")
+    predict = CountingPredict(ChartSignature)
+
+    async def acall(**kwargs):
+        predict.num_calls += 1
+        return dspy.Prediction(charts=[Chart(title="A chart", values=[1.0, 2.0])])
+
+    monkeypatch.setattr(predict, "acall", acall)
+    await LLMCache(path=path).acall(predict, user_prompt="hi", lm=lm)
+
+    conn = sqlite3.connect(path)
+    outputs = conn.execute("SELECT outputs FROM llm_cache").fetchone()[0]
+    assert json.loads(outputs) == {
+        "charts": [{"title": "A chart", "values": [1.0, 2.0]}]
+    }
+
+    # restored to the types of the output fields
+    llm_cache = LLMCache(path=path)
+    prediction = await llm_cache.acall(predict, user_prompt="hi", lm=lm)
+    assert predict.num_calls == 1
+    assert prediction.charts == [Chart(title="A chart", values=[1.0, 2.0])]
+
+    # a hit does not write to disk until the next entry is added
+    assert llm_cache.backend.last_used != {}
+    await llm_cache.acall(predict, user_prompt="other", lm=lm)
+    assert llm_cache.backend.last_used == {}
+
+    # outputs that are not JSON (e.g. pickled by earlier versions) are not loaded
+    with conn:
+        conn.execute("UPDATE llm_cache SET outputs = ?", (pickle.dumps({}),))
+    await LLMCache(path=path).acall(predict, user_prompt="hi", lm=lm)
+    assert predict.num_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_semantic_match():
+    llm_cache = LLMCache(similarity_threshold=0.9)
+    predict = CountingPredict(QuestionAnswer)
+
+    embeddings = {
+        "how many products?": [1.0, 0.0],
+        "how many products are there?": [0.99, 0.05],
+        "what is the weather?": [0.0, 1.0],
+    }
+
+    async def embed(text):
+        return embeddings[text]
+
+    llm_cache._embed = embed
+
+    await llm_cache.acall(predict, user_prompt="how many products?", context="a", lm=lm)
+    await llm_cache.acall(
+        predict, user_prompt="how many products are there?", context="a", lm=lm
+    )
+    assert predict.num_calls == 1
+    assert llm_cache.semantic_hits == 1
+
+    # similar prompt, but the other inputs differ
+    await llm_cache.acall(
+        predict, user_prompt="how many products are there?", context="b", lm=lm
+    )
+    assert predict.num_calls == 2
+
+    await llm_cache.acall(
+        predict, user_prompt="what is the weather?", context="a", lm=lm
+    )
+    assert predict.num_calls == 3
+
+
+class Answer(dspy.Signature):
+    context: str = dspy.InputField()
+    answer: str = dspy.OutputField()
+
+
+@pytest.mark.asyncio
+async def test_semantic_match_with_conversation_history():
+    settings = Settings()
+    settings.configure(
+        use_llm_cache=True,
+        llm_cache_max_size=11,
+        llm_cache_embedding_model="openai/text-embedding-3-small",
+        llm_cache_similarity_threshold=0.9,
+    )
+    llm_cache = get_llm_cache(settings)
+
+    embeddings = {
+        "how many products?": [1.0, 0.0],
+        "how many products are there?": [0.99, 0.05],
+    }
+
+    async def embed(text):
+        return embeddings[text]
+
+    llm_cache._embed = embed
+
+    tree = Tree(settings=settings)
+    previous_turns = [
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": "hi!"},
+    ]
+
+    # the conversation history includes the prompt, as when running the tree
+    for user_prompt in embeddings:
+        tree.tree_data.user_prompt = user_prompt
+        tree.tree_data.conversation_history = previous_turns + [
+            {"role": "user", "content": user_prompt}
+        ]
+        module = ElysiaChainOfThought(Answer, tree_data=tree.tree_data)
+        await module.aforward(lm=lm, context="a")
+
+    assert llm_cache.misses == 1
+    assert llm_cache.semantic_hits == 1
+
+    # earlier turns of the conversation are still part of the key
+    tree.tree_data.conversation_history = [
+        {"role": "user", "content": "goodbye"},
+        {"role": "assistant", "content": "bye!"},
+        {"role": "user", "content": user_prompt},
+    ]
+    module = ElysiaChainOfThought(Answer, tree_data=tree.tree_data)
+    await module.aforward(lm=lm, context="a")
+    assert llm_cache.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_tracker_cache_stats():
+    settings = Settings()
+    assert get_llm_cache(settings) is None
+
+    settings.configure(use_llm_cache=True, llm_cache_ttl=None)
+    llm_cache = get_llm_cache(settings)
+    assert llm_cache is not None
+    assert get_llm_cache(settings) is llm_cache
+
+    predict = CountingPredict(QuestionAnswer)
+
+    async def run(tracker: Tracker, num_calls: int):
+        tracker.llm_cache = llm_cache
+        tracker.track_cache_stats()
+        for _ in range(num_calls):
+            await llm_cache.acall(predict, user_prompt="hi", context="tracker", lm=lm)
+            await asyncio.sleep(0)
+
+    await llm_cache.acall(predict, user_prompt="hi", context="tracker", lm=lm)
+
+    # lookups are counted by the tracker of the task that made them, even when interleaved
+    first = Tracker(tracker_names=["test"], logger=settings.logger)
+    second = Tracker(tracker_names=["test"], logger=settings.logger)
+    await asyncio.gather(
+        asyncio.create_task(run(first, 3)), asyncio.create_task(run(second, 2))
+    )
+
+    assert first.get_cache_hits() == 3
+    assert second.get_cache_hits() == 2
+    assert first.get_cache_misses() == second.get_cache_misses() == 0
+
+
+@pytest.mark.asyncio
+async def test_tree_uses_llm_cache():
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        use_llm_cache=True,
+        llm_cache_max_size=10,
+    )
+    tree = Tree(settings=settings)
+
+    async for _ in tree.async_run("Hi!"):
+        pass
+
+    llm_cache = get_llm_cache(settings)
+    assert len(llm_cache) > 0
+    assert tree.tracker.get_cache_misses() > 0
+
+
+def test_canonical_hash():
+    class Item(BaseModel):
+        a: int
+        b: list[str]
+
+    # the same for dictionary orderings, tuples and pydantic models with the same fields
+    assert canonical_hash({"x": 1, "y": [1, 2]}) == canonical_hash(
+        {"y": (1, 2), "x": 1}
+    )
+    assert canonical_hash(Item(a=1, b=["c"])) == canonical_hash({"b": ["c"], "a": 1})
+    assert canonical_hash({"x": 1}) != canonical_hash({"x": 2})
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from elysia.config import Settings, load_base_lm, load_lm
+from elysia.util.lm_pool import PooledLM, ProviderLimiter, get_lm_pool_metrics
+from elysia.util.objects import Tracker
+
+
+def test_trees_share_pooled_lms():
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="pool-key-1",
+    )
+
+    lm_1 = load_base_lm(settings)
+    lm_2 = load_base_lm(settings)
+    assert isinstance(lm_1, PooledLM)
+    assert lm_1 is not lm_2
+    assert lm_1.usage is not lm_2.usage
+    num_pooled = get_lm_pool_metrics()["pooled_lms"]
+
+    # unrelated API keys use the same pooled LM, a different key for the provider does not
+    load_lm("openai", "gpt-4o-mini", None, {"openai_api_key": "pool-key-1", "x": "y"})
+    assert get_lm_pool_metrics()["pooled_lms"] == num_pooled
+    load_lm("openai", "gpt-4o-mini", None, {"openai_api_key": "pool-key-2"})
+    assert get_lm_pool_metrics()["pooled_lms"] == num_pooled + 1
+
+
+def test_usage_accounting():
+    lm = load_lm("openai", "gpt-4o-mini")
+    lm.max_history = 2
+    tracker = Tracker(tracker_names=[], logger=Settings().logger)
+
+    for i in range(5):
+        lm.update_history(
+            {
+                "messages": [],
+                "response": str(i),
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+                "cost": 0.5,
+            }
+        )
+    assert [entry["response"] for entry in lm.history] == ["3", "4"]
+    assert lm.usage.to_dict() == {
+        "calls": 5,
+        "input_tokens": 50,
+        "output_tokens": 10,
+        "cost": 2.5,
+    }
+
+    tracker.update_lm_costs(lm, "base_lm")
+    lm.update_history({"usage": {"prompt_tokens": 1, "completion_tokens": 1}})
+    tracker.update_lm_costs(lm, "base_lm")
+    assert tracker.get_num_calls("base_lm") == 6
+    assert tracker.get_total_input_tokens("base_lm") == 51
+    assert tracker.get_total_output_tokens("base_lm") == 11
+
+
+@pytest.mark.asyncio
+async def test_provider_limiter():
+    limiter = ProviderLimiter(max_concurrent=2)
+    running = {"sync": 0, "async": 0}
+    max_running = {"sync": [], "async": []}
+    lock = threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                running["sync"] += 1
+                max_running["sync"].append(running["sync"])
+            time.sleep(0.01)
+            with lock:
+                running["sync"] -= 1
+
+    async def acall():
+        async with limiter.aslot():
+            running["async"] += 1
+            max_running["async"].append(running["async"])
+            await asyncio.sleep(0.01)
+            running["async"] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    await asyncio.gather(*[acall() for _ in range(5)])
+    for thread in threads:
+        thread.join()
+
+    # sync calls share the limit across threads, async calls share it on each event loop
+    assert len(max_running["sync"]) == 5
+    assert len(max_running["async"]) == 5
+    assert max(max_running["sync"]) <= 2
+    assert max(max_running["async"]) == 2
+    assert limiter.metrics()["running"] == 0
+    assert limiter.metrics()["waited"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_provider_limiter_cancelled_waiter():
+    limiter = ProviderLimiter(max_concurrent=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.aslot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+
+    # a cancelled waiter does not take the slot
+    waiter.cancel()
+    release.set()
+    await holder
+    async with limiter.aslot():
+        assert limiter.metrics()["running"] == 1
+    assert limiter.metrics()["running"] == 0
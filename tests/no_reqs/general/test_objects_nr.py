@@ -1,10 +1,14 @@
 import asyncio
+import copy
+import datetime
+import json
 import os
 import pytest
 from typing import Any
 from weaviate.classes.query import Filter, QueryReference
 
 from elysia.tree.objects import Environment
+from elysia.util.objects import TrainingUpdate
 from elysia.objects import (
     Completed,
     Response,
@@ -216,6 +220,147 @@ def test_environment():
     assert len(environment.environment["test_tool2"]["test_result2"]) == 1
 
 
+def test_environment_duplicates():
+    environment = Environment()
+
+    obj = {"_REF_ID": "query_A_0_0", "a": 1, "b": [1, 2]}
+    environment.add_objects("query", "A", [obj, {"_REF_ID": "query_A_0_1", "a": 2}])
+
+    # same object, with keys in a different order
+    environment.add_objects(
+        "query", "A", [{"b": [1, 2], "a": 1, "_REF_ID": "query_A_0_0"}]
+    )
+    assert environment.find("query", "A", 1)["objects"] == [
+        {"object_info": "[repeat]", "_REF_ID": "query_A_0_0"}
+    ]
+
+    # same contents but a different _REF_ID is not a duplicate
+    environment.add_objects(
+        "query", "A", [{"_REF_ID": "query_A_2_0", "a": 1, "b": [1, 2]}]
+    )
+    assert environment.find("query", "A", 2)["objects"][0]["_REF_ID"] == "query_A_2_0"
+
+    environment.add_objects("query", "A", [obj], include_duplicates=True)
+    assert environment.find("query", "A", 3)["objects"][0] == obj
+
+    # duplicates are only detected within the same tool_name/name
+    environment.add_objects("query", "B", [obj])
+    assert environment.find("query", "B", 0)["objects"][0] == obj
+
+    # the index follows removals and replacements
+    environment.remove("query", "A")
+    environment.add_objects("query", "A", [obj])
+    assert environment.find("query", "A", 0)["objects"][0] == obj
+
+    environment.replace("query", "A", [{"_REF_ID": "new", "c": 3}], index=0)
+    environment.add_objects("query", "A", [obj, {"_REF_ID": "new", "c": 3}])
+    assert environment.find("query", "A", 1)["objects"] == [
+        obj,
+        {"object_info": "[repeat]", "_REF_ID": "new"},
+    ]
+
+    # and is rebuilt when loading from json
+    loaded = Environment.from_json(environment.to_json())
+    loaded.add_objects("query", "A", [{"_REF_ID": "new", "c": 3}])
+    assert loaded.find("query", "A", 2)["objects"] == [
+        {"object_info": "[repeat]", "_REF_ID": "new"}
+    ]
+
+
+def test_environment_snapshots():
+    environment = Environment()
+    environment.add_objects(
+        "query",
+        "A",
+        [{"a": 1, "date": datetime.datetime(2024, 1, 1)}],
+        metadata={"time": datetime.datetime(2024, 1, 2)},
+    )
+
+    json_env = environment.to_json()
+    snapshot = json_env["environment"]
+
+    # results are formatted and shared, rather than copied
+    assert snapshot["query"]["A"][0] is environment.environment["query"]["A"][0]
+    assert isinstance(snapshot["query"]["A"][0]["objects"][0]["date"], str)
+    assert isinstance(snapshot["query"]["A"][0]["metadata"]["time"], str)
+    json.dumps(json_env)
+
+    # later changes to the environment do not affect the snapshot
+    environment.add_objects("query", "A", [{"a": 2}])
+    environment.add_objects("query", "B", [{"b": 1}])
+    environment.replace("query", "A", [{"c": 3}], index=0)
+    assert len(snapshot["query"]["A"]) == 1
+    assert "B" not in snapshot["query"]
+    assert snapshot["query"]["A"][0]["objects"][0]["a"] == 1
+
+    assert copy.deepcopy(snapshot) is snapshot
+
+    copied = copy.deepcopy(environment)
+    assert (
+        copied.environment["query"]["B"][0] is environment.environment["query"]["B"][0]
+    )
+    environment.remove("query", "B")
+    assert len(copied.environment["query"]["B"]) == 1
+
+    # a copy can still be added to, with duplicates detected
+    copied.add_objects(
+        "query", "B", [copied.environment["query"]["B"][0]["objects"][0]]
+    )
+    assert (
+        copied.environment["query"]["B"][1]["objects"][0]["object_info"] == "[repeat]"
+    )
+    assert len(environment.environment["query"]["B"]) == 0
+
+    loaded = Environment.from_json(json_env)
+    loaded.add_objects("query", "C", [{"d": 4}])
+    assert "C" not in snapshot["query"]
+    assert (
+        TrainingUpdate("test", {"environment": json_env}, {}).inputs["environment"][
+            "environment"
+        ]
+        is snapshot
+    )
+
+
+def test_environment_to_prompt():
+    environment = Environment()
+    for i in range(5):
+        environment.add_objects(
+            "query",
+            "A",
+            [{"text": "word " * 100, "number": j} for j in range(10)],
+            metadata={"query": f"query {i}"},
+        )
+
+    # without a budget, the same as the dictionary
+    text = environment.to_prompt()
+    assert text == json.dumps(environment.environment, ensure_ascii=False)
+    assert environment.to_prompt() == text
+
+    # new results are rendered, and results that were removed are forgotten
+    environment.add_objects("query", "B", [{"b": 1}])
+    environment.remove("query", "A", 0)
+    assert environment.to_prompt() == json.dumps(
+        environment.environment, ensure_ascii=False
+    )
+    assert len(environment.rendered_results) == 6
+
+    budget = len(text) // 8
+    compressed = json.loads(environment.to_prompt(token_budget=budget))
+    assert len(json.dumps(compressed, ensure_ascii=False)) // 4 <= budget
+
+    # the oldest results are compressed first, and the metadata is kept
+    results = compressed["query"]["A"]
+    assert "objects_hidden" in results[0]
+    assert results[0]["metadata"] == {"query": "query 1"}
+    assert results[-1] == environment.environment["query"]["A"][-1]
+    assert compressed["query"]["B"] == environment.environment["query"]["B"]
+    assert compressed["SelfInfo"] == environment.environment["SelfInfo"]
+
+    # the environment itself is unchanged
+    assert "objects_hidden" not in environment.environment["query"]["A"][0]
+
+
 @pytest.mark.asyncio
 async def test_updates():
     types = [
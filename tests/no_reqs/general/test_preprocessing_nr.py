@@ -0,0 +1,485 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import elysia.preprocessing.collection as preprocessing
+from elysia.config import Settings
+from elysia.preprocessing.incremental import (
+    diff_metadata,
+    stale_fields,
+    stale_mappings,
+)
+from elysia.preprocessing.sampling import estimate_token_counts, sample_objects
+from elysia.preprocessing.statistics import evaluate_field_statistics
+
+
+class FakeAggregate:
+    """
+    Answers aggregate requests from a list of objects, recording the requests made.
+    """
+
+    def __init__(self, objects: list[dict]):
+        self.objects = objects
+        self.requests = []
+        self.running = 0
+        self.max_running = 0
+
+    async def over_all(self, total_count=False, group_by=None, return_metrics=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+        if group_by is None and return_metrics is None:
+            return SimpleNamespace(total_count=len(self.objects))
+
+        if group_by is not None:
+            self.requests.append(("group_by", group_by.prop))
+            counts = {}
+            for obj in self.objects:
+                value = str(obj[group_by.prop])
+                counts[value] = counts.get(value, 0) + 1
+            return SimpleNamespace(
+                groups=[
+                    SimpleNamespace(
+                        grouped_by=SimpleNamespace(value=value), total_count=count
+                    )
+                    for value, count in sorted(
+                        counts.items(), key=lambda group: group[1], reverse=True
+                    )[: group_by.limit]
+                ]
+            )
+
+        props = [metric.property_name for metric in return_metrics]
+        self.requests.append(("metrics", tuple(props)))
+        properties = {}
+        for prop in props:
+            values = [obj[prop] for obj in self.objects]
+            properties[prop] = SimpleNamespace(
+                minimum=min(values),
+                maximum=max(values),
+                mean=sum(values) / len(values),
+                percentage_true=sum(values) / len(values),
+                median=sorted(values)[len(values) // 2],
+            )
+        return SimpleNamespace(properties=properties)
+
+
+@pytest.mark.asyncio
+async def test_field_statistics():
+    objects = [
+        {
+            "price": i % 3,
+            "rating": float(i),
+            "in_stock": i % 2 == 0,
+            "name": f"product number {i}",
+            "tags": ["a"] * (i % 4),
+            "details": {"colour": "red"},
+        }
+        for i in range(10)
+    ]
+    properties = {
+        "price": "int",
+        "rating": "number",
+        "in_stock": "boolean",
+        "name": "text",
+        "tags": "text[]",
+        "details": "object",
+    }
+    aggregate = FakeAggregate(objects)
+    collection = SimpleNamespace(aggregate=aggregate)
+
+    fields = [
+        field
+        async for field in evaluate_field_statistics(
+            collection, properties, len(objects), objects, max_concurrency=2  # type: ignore
+        )
+    ]
+    fields = {field["name"]: field for field in fields}
+    assert set(fields) == set(properties)
+
+    assert fields["price"]["range"] == [0, 2]
+    assert fields["price"]["groups"] is not None
+    assert fields["rating"]["type"] == "float"
+    assert fields["rating"]["mean"] == 4.5
+    assert fields["in_stock"]["mean"] == 0.5
+    assert fields["name"]["range"] == [3, 3]
+    assert fields["tags"]["range"] == [0, 3]
+    assert fields["details"]["groups"] is None
+
+    # one metrics request per type, one group-by request per (non-object) field
+    metric_requests = [r for r in aggregate.requests if r[0] == "metrics"]
+    group_requests = [r for r in aggregate.requests if r[0] == "group_by"]
+    assert sorted(metric_requests) == [
+        ("metrics", ("in_stock",)),
+        ("metrics", ("price",)),
+        ("metrics", ("rating",)),
+    ]
+    assert len(group_requests) == 5
+    assert aggregate.max_running == 2
+
+
+class FakeQuery:
+    """
+    Answers fetch_objects requests from a list of objects, sorted by UUID like the cursor API.
+    """
+
+    def __init__(self, objects: list[dict]):
+        self.objects = sorted(
+            [SimpleNamespace(uuid=uuid.uuid4(), properties=obj) for obj in objects],
+            key=lambda obj: obj.uuid,
+        )
+        self.requests = []
+
+    async def fetch_objects(self, limit=None, offset=None, after=None, filters=None):
+        self.requests.append({"after": after, "filters": filters, "offset": offset})
+        objects = self.objects
+        if after is not None:
+            objects = [obj for obj in objects if obj.uuid > after]
+        if filters is not None:
+            objects = [
+                obj
+                for obj in objects
+                if str(obj.properties[filters.target]) == str(filters.value)
+            ]
+        if offset is not None:
+            objects = objects[offset:]
+        return SimpleNamespace(objects=objects[:limit])
+
+
+@pytest.mark.asyncio
+async def test_sample_objects():
+    objects = [
+        {"id": i, "category": "common" if i < 95 else "rare"} for i in range(100)
+    ]
+    query = FakeQuery(objects)
+    collection = SimpleNamespace(query=query, aggregate=FakeAggregate(objects))
+
+    # a few requests, not one per object
+    sample = await sample_objects(collection, len(objects), 20, num_windows=4)  # type: ignore
+    assert len(sample) == 20
+    assert len({obj["id"] for obj in sample}) == 20
+    assert len(query.requests) <= 5
+
+    # the whole collection when it is no larger than the sample
+    sample = await sample_objects(collection, len(objects), 200)  # type: ignore
+    assert sorted(obj["id"] for obj in sample) == list(range(100))
+
+    # stratified samples include every group, with only small groups fetched separately
+    query.requests = []
+    sample = await sample_objects(collection, len(objects), 10, group_by="category")  # type: ignore
+    assert {obj["category"] for obj in sample} == {"common", "rare"}
+    assert len([obj for obj in sample if obj["category"] == "common"]) == 10
+    assert len(query.requests) <= 4 + 1 + 2
+    assert all(
+        request["offset"] is None or request["offset"] < 5 for request in query.requests
+    )
+
+    # the number of groups sampled separately is capped
+    many_groups = [{"id": i, "category": i % 30} for i in range(300)]
+    query = FakeQuery(many_groups)
+    collection = SimpleNamespace(query=query, aggregate=FakeAggregate(many_groups))
+    sample = await sample_objects(collection, len(many_groups), 20, group_by="category", max_groups=3)  # type: ignore
+    assert 20 <= len(sample) <= 23
+    assert len({obj["id"] for obj in sample}) == len(sample)
+    assert len(query.requests) <= 4 + 1 + 3
+
+    token_counts = await estimate_token_counts(sample)
+    assert len(token_counts) == len(sample)
+    assert all(count > 0 for count in token_counts)
+
+
+def test_diff_metadata():
+    metadata = {
+        "length": 100,
+        "fields": [
+            {"name": "title", "type": "text"},
+            {"name": "price", "type": "float"},
+            {"name": "author", "type": "text"},
+            {"name": "year", "type": "text"},
+        ],
+        "mappings": {
+            "document": {"title": "title", "author": "author", "date": ""},
+            "product": {"name": "title", "price": "price", "image": ""},
+            "ecommerce": {"name": "title", "price": "price"},
+            "table": {"title": "title", "price": "price"},
+        },
+    }
+
+    # unchanged
+    properties = {"title": "text", "price": "number", "author": "text", "year": "text"}
+    diff = diff_metadata(metadata, properties, 100)
+    assert diff["drift"] == 0
+    assert stale_fields(diff, properties) == []
+    assert stale_mappings(diff, metadata["mappings"]) == []
+
+    # a field added, one removed and one changed type, with a few more objects
+    properties = {"title": "text", "price": "number", "year": "int", "date": "date"}
+    diff = diff_metadata(metadata, properties, 103)
+    assert diff["added"] == ["date"]
+    assert diff["removed"] == ["author"]
+    assert diff["changed"] == ["year"]
+    assert diff["length_changed"]
+    assert diff["drift"] == 3 / 5
+    assert stale_fields(diff, properties) == list(properties)
+    assert stale_mappings(diff, metadata["mappings"]) == ["document", "product"]
+
+    # only the new field is stale if the number of objects is the same
+    properties = {
+        "title": "text",
+        "price": "number",
+        "author": "text",
+        "year": "text",
+        "date": "date",
+    }
+    diff = diff_metadata(metadata, properties, 100)
+    assert diff["drift"] == 1 / 5
+    assert stale_fields(diff, properties) == ["date"]
+    assert stale_mappings(diff, metadata["mappings"]) == ["document", "product"]
+
+
+class FakeCollection:
+    def __init__(self, objects: list[dict]):
+        self.query = FakeQuery(objects)
+        self.aggregate = FakeAggregate(objects)
+        self.config = SimpleNamespace(get=self.get_config)
+
+    async def get_config(self):
+        return SimpleNamespace(
+            properties=[
+                SimpleNamespace(name=name, data_type="text")
+                for name in self.query.objects[0].properties
+            ],
+            inverted_index_config=SimpleNamespace(
+                index_null_state=True,
+                index_property_length=False,
+                index_timestamps=False,
+            ),
+            vector_config=None,
+            vectorizer_config=None,
+        )
+
+
+class FakeClientManager:
+    """
+    A client with a single collection, which saves preprocessed metadata to a list.
+    """
+
+    def __init__(self, collection: FakeCollection):
+        self.collection = collection
+        self.saved = []
+
+    @asynccontextmanager
+    async def connect_to_async_client(self):
+        async def exists(name):
+            return name != "ELYSIA_METADATA__" or len(self.saved) > 0
+
+        async def create(name, **kwargs):
+            return self.metadata_collection()
+
+        def get(name):
+            if name == "ELYSIA_METADATA__":
+                return self.metadata_collection()
+            return self.collection
+
+        yield SimpleNamespace(
+            collections=SimpleNamespace(exists=exists, get=get, create=create)
+        )
+
+    def metadata_collection(self):
+        async def insert(out):
+            self.saved.append(out)
+
+        return SimpleNamespace(data=SimpleNamespace(insert=insert))
+
+    async def close_clients(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_mappings_are_defined_concurrently(monkeypatch):
+    objects = [{"title": f"title {i}"} for i in range(10)]
+    running = {"now": 0, "max": 0}
+
+    async def return_types(*args, **kwargs):
+        return ["document", "product", "ticket", "message"]
+
+    async def define_mappings(*args, mapping_type, input_fields, **kwargs):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        # the first return type is the slowest
+        await asyncio.sleep(0.1 if mapping_type == "document" else 0.01)
+        running["now"] -= 1
+        if mapping_type == "product":
+            return {field: "" for field in input_fields}
+        return {field: "title" for field in input_fields}
+
+    async def summarise(*args, **kwargs):
+        return "A summary.", {"title": "The title."}
+
+    async def suggest_prompts(*args, **kwargs):
+        return ["A prompt"]
+
+    async def exists(*args):
+        return False
+
+    monkeypatch.setattr(preprocessing, "load_base_lm", lambda settings: None)
+    monkeypatch.setattr(preprocessing, "_summarise_collection", summarise)
+    monkeypatch.setattr(preprocessing, "_evaluate_return_types", return_types)
+    monkeypatch.setattr(preprocessing, "_suggest_prompts", suggest_prompts)
+    monkeypatch.setattr(preprocessing, "_define_mappings", define_mappings)
+    monkeypatch.setattr(preprocessing, "preprocessed_collection_exists_async", exists)
+
+    client_manager = FakeClientManager(FakeCollection(objects))
+    settings = Settings()
+    settings.configure(preprocess_max_lm_concurrency=2)
+    updates = [
+        update
+        async for update in preprocessing.preprocess_async(
+            "Products", client_manager=client_manager, settings=settings  # type: ignore
+        )
+    ]
+
+    assert updates[-1]["error"] == ""
+    assert running["max"] == 2
+
+    # updates are sent in the order of the return types, even though the first is defined last
+    messages = [update["message"] for update in updates]
+    mapping_messages = [m for m in messages if m.startswith("Defined mappings")]
+    assert mapping_messages == [
+        "Defined mappings for document",
+        "Defined mappings for product",
+        "Defined mappings for ticket",
+        "Defined mappings for message",
+    ]
+    progress = [update["progress"] for update in updates]
+    assert progress == sorted(progress)
+
+    # return types without enough fields mapped are removed, in the original order
+    assert list(client_manager.saved[0]["mappings"]) == [
+        "document",
+        "ticket",
+        "message",
+        "table",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_preprocess_resumes_from_checkpoint(monkeypatch):
+    objects = [{"title": f"title {i}"} for i in range(10)]
+    calls = []
+
+    async def summarise(*args, **kwargs):
+        calls.append("summary")
+        return "A summary.", {"title": "The title."}
+
+    async def return_types(*args, **kwargs):
+        calls.append("return_types")
+        return ["document", "message"]
+
+    async def suggest_prompts(*args, **kwargs):
+        calls.append("prompts")
+        return ["A prompt"]
+
+    async def define_mappings(*args, mapping_type, input_fields, **kwargs):
+        calls.append(mapping_type)
+        return {field: "title" for field in input_fields}
+
+    async def exists(*args):
+        return False
+
+    monkeypatch.setattr(preprocessing, "load_base_lm", lambda settings: None)
+    monkeypatch.setattr(preprocessing, "_summarise_collection", summarise)
+    monkeypatch.setattr(preprocessing, "_evaluate_return_types", return_types)
+    monkeypatch.setattr(preprocessing, "_suggest_prompts", suggest_prompts)
+    monkeypatch.setattr(preprocessing, "_define_mappings", define_mappings)
+    monkeypatch.setattr(preprocessing, "preprocessed_collection_exists_async", exists)
+
+    checkpoint = {
+        "summary": "A checkpointed summary.",
+        "field_descriptions": {"title": "The title."},
+        "return_types": ["document", "message"],
+        "mappings": {"document": {"title": "title"}},
+    }
+    client_manager = FakeClientManager(FakeCollection(objects))
+    updates = [
+        update
+        async for update in preprocessing.preprocess_async(
+            "Products", client_manager=client_manager, checkpoint=checkpoint  # type: ignore
+        )
+    ]
+
+    assert updates[-1]["error"] == ""
+    assert calls == ["prompts", "message"]
+    assert "Resumed summary of collection from checkpoint" in [
+        update["message"] for update in updates
+    ]
+    assert client_manager.saved[0]["summary"] == "A checkpointed summary."
+
+    # the completed stages are added to the checkpoint
+    assert checkpoint["prompts"] == ["A prompt"]
+    assert set(checkpoint["mappings"]) == {"document", "message"}
+
+
+@pytest.mark.asyncio
+async def test_incremental_describes_new_fields(monkeypatch):
+    objects = [{"title": f"title {i}", "brand": f"brand {i}"} for i in range(10)]
+    metadata = {
+        "name": "Products",
+        "length": 10,
+        "summary": "An existing summary.",
+        "fields": [{"name": "title", "type": "text", "description": "The title."}],
+        "mappings": {"document": {"title": "title"}},
+        "prompts": ["A prompt"],
+    }
+    described = []
+
+    async def summarise(*args, **kwargs):
+        raise AssertionError("The collection should not be re-summarised")
+
+    async def describe_fields(prompt, summary, fields, subset_objects, *args):
+        described.append((summary, fields))
+        return {name: f"The {name}." for name in fields}
+
+    async def define_mappings(*args, mapping_type, input_fields, **kwargs):
+        return {field: "title" for field in input_fields}
+
+    async def exists(*args):
+        return True
+
+    async def get_metadata(*args):
+        return metadata
+
+    async def delete(*args):
+        pass
+
+    monkeypatch.setattr(preprocessing, "load_base_lm", lambda settings: None)
+    monkeypatch.setattr(preprocessing, "_summarise_collection", summarise)
+    monkeypatch.setattr(preprocessing, "_describe_fields", describe_fields)
+    monkeypatch.setattr(preprocessing, "_define_mappings", define_mappings)
+    monkeypatch.setattr(preprocessing, "preprocessed_collection_exists_async", exists)
+    monkeypatch.setattr(preprocessing, "_get_preprocessed_metadata_async", get_metadata)
+    monkeypatch.setattr(preprocessing, "delete_preprocessed_collection_async", delete)
+
+    client_manager = FakeClientManager(FakeCollection(objects))
+    settings = Settings()
+    settings.configure(preprocess_drift_threshold=0.6)
+    updates = [
+        update
+        async for update in preprocessing.preprocess_async(
+            "Products", client_manager=client_manager, settings=settings, incremental=True  # type: ignore
+        )
+    ]
+
+    assert updates[-1]["error"] == ""
+    # only the new field is described, and the existing descriptions are kept
+    assert described == [("An existing summary.", {"brand": "text"})]
+    saved = client_manager.saved[0]
+    assert saved["summary"] == "An existing summary."
+    assert {field["name"]: field["description"] for field in saved["fields"]} == {
+        "title": "The title.",
+        "brand": "The brand.",
+    }
@@ -0,0 +1,141 @@
+import time
+import pytest
+
+from elysia.config import Settings
+from elysia.tools.retrieval.util import _run_per_collection
+from elysia.util.query_cache import (
+    QueryCache,
+    get_query_cache,
+    invalidate_query_cache,
+)
+
+
+class FakeClientManager:
+    def __init__(self, wcd_url, wcd_api_key):
+        self.wcd_url = wcd_url
+        self.wcd_api_key = wcd_api_key
+
+
+def test_keys_are_canonical():
+    query_cache = QueryCache()
+    assert query_cache.get_key(
+        "query", "A", {"limit": 5, "search_query": "hi"}
+    ) == query_cache.get_key("query", "A", {"search_query": "hi", "limit": 5})
+    assert query_cache.get_key("query", "A", {"limit": 5}) != query_cache.get_key(
+        "query", "B", {"limit": 5}
+    )
+    assert query_cache.get_key("query", "A", {"limit": 5}) != query_cache.get_key(
+        "aggregate", "A", {"limit": 5}
+    )
+
+
+def test_ttl_max_bytes_and_invalidation():
+    query_cache = QueryCache(ttl=0.1)
+    query_cache.set("key", "A", [1, 2, 3])
+    assert query_cache.get("key") == [1, 2, 3]
+    time.sleep(0.2)
+    assert query_cache.get("key") is None
+    assert query_cache.num_bytes == 0
+
+    result = "x" * 1000
+    query_cache = QueryCache(max_bytes=2500)
+    for key in ["a", "b", "c"]:
+        query_cache.set(key, "A", result)
+    assert len(query_cache) == 2
+    assert query_cache.get("a") is None
+    assert query_cache.num_bytes <= 2500
+
+    # too large to ever fit
+    query_cache.set("d", "A", "x" * 5000)
+    assert query_cache.get("d") is None
+
+    query_cache.set("e", "B", result)
+    query_cache.invalidate("A")
+    assert len(query_cache) == 1
+    assert query_cache.get("e") == result
+
+    query_cache.invalidate()
+    assert len(query_cache) == 0
+    assert query_cache.num_bytes == 0
+
+
+def test_results_are_sized_without_serialising():
+    class Result:
+        def __init__(self, i):
+            self.properties = {"title": "x" * 100, "number": i}
+            self.vector = [0.1] * 100
+            # cannot be pickled
+            self.callback = lambda: i
+
+    query_cache = QueryCache(max_bytes=10_000)
+    query_cache.set("key", "A", [Result(i) for i in range(10)])
+    assert query_cache.get("key") is not None
+
+    # strings by their length, numbers and vectors at 8 bytes per value
+    assert 10 * (100 + 8 + 800) < query_cache.num_bytes < 10_000
+
+    query_cache.set("other", "A", [Result(i) for i in range(20)])
+    assert query_cache.get("other") is None
+
+
+def test_shared_between_users_of_a_cluster():
+    settings = Settings()
+    assert get_query_cache(settings, FakeClientManager("url_1", "key")) is None
+
+    settings.configure(use_query_cache=True)
+    query_cache = get_query_cache(settings, FakeClientManager("url_1", "key"))
+    assert query_cache is not None
+    assert get_query_cache(settings, FakeClientManager("url_1", "key")) is query_cache
+    assert get_query_cache(settings, FakeClientManager("url_2", "key")) is not (
+        query_cache
+    )
+    assert get_query_cache(settings, FakeClientManager("url_1", "other")) is not (
+        query_cache
+    )
+
+    query_cache.set("key", "A", "result")
+    invalidate_query_cache("url_2", "A")
+    assert query_cache.get("key") == "result"
+    invalidate_query_cache("url_1", "A")
+    assert query_cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_run_per_collection_with_cache():
+    query_cache = QueryCache()
+    num_calls = {"A": 0, "B": 0}
+
+    async def run(collection_name):
+        num_calls[collection_name] += 1
+        if collection_name == "B":
+            raise ValueError("broken collection")
+        return f"{collection_name} result"
+
+    cache_args = {"A": {"limit": 5}, "B": {"limit": 5}}
+    for _ in range(2):
+        responses, metadata = await _run_per_collection(
+            ["A", "B"],
+            run,
+            max_concurrency=8,
+            timeout=None,
+            query_cache=query_cache,
+            cache_args=cache_args,
+        )
+
+    # only successful responses are cached
+    assert num_calls == {"A": 1, "B": 2}
+    assert responses[0] == "A result"
+    assert metadata[0]["cached"] and not metadata[1]["cached"]
+
+    # different arguments are a different query
+    cache_args["A"] = {"limit": 10}
+    _, metadata = await _run_per_collection(
+        ["A"],
+        run,
+        max_concurrency=8,
+        timeout=None,
+        query_cache=query_cache,
+        cache_args=cache_args,
+    )
+    assert num_calls["A"] == 2
+    assert not metadata[0]["cached"]
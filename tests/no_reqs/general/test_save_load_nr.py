@@ -1,7 +1,26 @@
+import datetime
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from weaviate.collections.classes.batch import BatchObjectReturn
+
+from elysia.config import Settings
+from elysia.tree.codec import decode_tree_data, encode_tree_data
+from elysia.tree.persistence import (
+    apply_json_delta,
+    diff_fingerprint,
+    diff_tree,
+    get_record_uuid,
+    insert_record,
+    json_fingerprint,
+    track_tree,
+)
 from elysia.tree.tree import Tree
-from elysia.tree.util import get_saved_trees_weaviate
+from elysia.tree.util import SavedTreeIndex, get_saved_trees_weaviate
 
 from elysia.util.client import ClientManager
+from weaviate.util import generate_uuid5
 
 import pytest
 
@@ -40,3 +59,279 @@ def test_save_load_local():
         tree.tree_data.environment.hidden_environment["Example Entry"]
         == loaded_tree.tree_data.environment.hidden_environment["Example Entry"]
     )
+
+
+def test_json_delta():
+    old = {"a": 1, "b": [1, 2], "c": {"d": "x"}, "e": [{"f": 1}], "g": True}
+    new = {"a": 2, "b": [1, 2, 3], "c": {}, "e": [{"f": 2}], "g": 1, "h": None}
+
+    # the changes are found from a fingerprint of the old value
+    ops, fingerprint = diff_fingerprint(json_fingerprint(old), new)
+    assert {"op": "append", "path": ["b"], "values": [3]} in ops
+    assert {"op": "delete", "path": ["c", "d"]} in ops
+    assert {"op": "set", "path": ["e", 0], "value": {"f": 2}} in ops
+    assert apply_json_delta(json.loads(json.dumps(old)), ops) == new
+    assert fingerprint == json_fingerprint(new)
+    assert diff_fingerprint(fingerprint, new) == ([], fingerprint)
+    assert apply_json_delta(
+        [1, 2, 3], diff_fingerprint(json_fingerprint([1, 2, 3]), [1])[0]
+    ) == [1]
+
+
+def test_tree_changes_are_tracked():
+    old_result = {"metadata": {}, "objects": [{"name": "old"}]}
+    tree_json = {
+        "title": "A",
+        "tree_data": {
+            "conversation_history": [{"role": "user", "content": "Hi"}],
+            "tasks_completed": [],
+            "environment": {"environment": {"query": {"Products": [old_result]}}},
+        },
+        "frontend_rebuild": [{"type": "text"}],
+    }
+    saved = json.loads(json.dumps(tree_json))
+    state = track_tree(tree_json)
+
+    new_result = {"metadata": {}, "objects": [{"name": "new"}]}
+    tree_json["title"] = "B"
+    tree_json["tree_data"]["conversation_history"][0]["content"] += " there"
+    tree_json["tree_data"]["conversation_history"].append(
+        {"role": "assistant", "content": "Hello"}
+    )
+    tree_json["tree_data"]["environment"]["environment"]["query"]["Products"].append(
+        new_result
+    )
+    tree_json["frontend_rebuild"] = []
+
+    ops, state = diff_tree(state, tree_json)
+    assert apply_json_delta(saved, json.loads(json.dumps(ops))) == tree_json
+    # results that were already saved are not in the delta
+    assert "old" not in json.dumps(ops)
+    assert {
+        "op": "append",
+        "path": ["tree_data", "environment", "environment", "query", "Products"],
+        "values": [new_result],
+    } in ops
+    assert {"op": "set", "path": ["frontend_rebuild"], "value": []} in ops
+    assert diff_tree(state, tree_json)[0] == []
+
+    # a replaced result is set in full
+    tree_json["tree_data"]["environment"]["environment"]["query"]["Products"] = [
+        new_result
+    ]
+    ops, state = diff_tree(state, tree_json)
+    assert apply_json_delta(saved, json.loads(json.dumps(ops))) == tree_json
+
+
+def test_tree_codecs():
+    tree = Tree()
+    tree.tree_data.environment.add_objects(
+        "query",
+        "Products",
+        [
+            {"uuid": f"product-{i}", "name": f"Product {i}", "price": i * 0.5}
+            for i in range(500)
+        ],
+        metadata={"collection_name": "Products"},
+    )
+    tree_json = json.loads(json.dumps(tree.export_to_json()))
+
+    json_data = encode_tree_data(tree_json, "json")
+    binary_data = encode_tree_data(tree_json, "binary")
+    assert binary_data.startswith("elysia-bin:1:")
+    assert len(binary_data) < len(json_data) / 4
+
+    assert decode_tree_data(json_data) == tree_json
+    assert decode_tree_data(binary_data) == tree_json
+    assert Tree.import_from_json(decode_tree_data(binary_data)).conversation_id == (
+        tree.conversation_id
+    )
+
+    # deltas are encoded the same way
+    ops, _ = diff_fingerprint(
+        json_fingerprint({"a": [1]}), {"a": [1, {"b": None}], "c": 1.5}
+    )
+    assert decode_tree_data(encode_tree_data(ops, "binary")) == ops
+
+    with pytest.raises(ValueError):
+        decode_tree_data(binary_data.replace("elysia-bin:1:", "elysia-bin:2:", 1))
+
+
+def test_tree_deltas():
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+    )
+    tree = Tree(settings=settings)
+
+    # replay a snapshot and the deltas after it, as if loaded from Weaviate
+    tree.run("Hi!")
+    tree_json = tree.export_to_json()
+    replayed = json.loads(json.dumps(tree_json))
+    state = track_tree(tree_json)
+    exports = [replayed]
+    for prompt in ["How are you?", "Bye!", None]:
+        if prompt is not None:
+            tree.run(prompt)
+        else:
+            tree.tree_data.environment.add_objects(
+                "query", "Products", [{"name": "Product"}], metadata={}
+            )
+        tree_json = tree.export_to_json()
+        delta, state = diff_tree(state, tree_json)
+        replayed = apply_json_delta(replayed, json.loads(json.dumps(delta)))
+        exports.append(json.loads(json.dumps(tree_json)))
+        assert replayed == exports[-1]
+
+        # only the changes are saved
+        assert len(json.dumps(delta)) < len(json.dumps(tree_json))
+
+    # nothing has changed
+    assert diff_tree(state, tree.export_to_json())[0] == []
+
+    loaded_tree = Tree.import_from_json(replayed)
+    assert (
+        loaded_tree.tree_data.conversation_history
+        == tree.tree_data.conversation_history
+    )
+    assert loaded_tree.returner.store == exports[-1]["frontend_rebuild"]
+
+
+def test_saved_tree_index_pages():
+    index = SavedTreeIndex()
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for i in range(7):
+        # trees saved in pairs at the same time
+        index.update(
+            f"tree_{i}", f"Tree {i}", start + datetime.timedelta(seconds=i // 2)
+        )
+
+    conversation_ids = []
+    page_token = None
+    while True:
+        page, page_token = index.page(limit=3, page_token=page_token)
+        assert len(page) <= 3
+        conversation_ids.extend(tree["conversation_id"] for tree in page)
+        if page_token is None:
+            break
+
+    # newest first, with no trees skipped or repeated across pages
+    assert len(conversation_ids) == 7
+    assert set(conversation_ids) == {f"tree_{i}" for i in range(7)}
+    assert conversation_ids[0] == "tree_6"
+    assert page[-1]["last_update_time"] == "2025-01-01T00:00:00Z"
+
+    # updates and deletes are reflected in the next page requested
+    first_page, page_token = index.page(limit=2)
+    index.update("tree_0", "Renamed", start + datetime.timedelta(days=1))
+    index.remove("tree_3")
+    page, _ = index.page(limit=10, page_token=page_token)
+    assert "tree_0" not in [tree["conversation_id"] for tree in page]
+    assert "tree_3" not in [tree["conversation_id"] for tree in page]
+    assert index.to_dict()["tree_0"]["title"] == "Renamed"
+    assert list(index.to_dict())[0] == "tree_0"
+
+    with pytest.raises(ValueError):
+        index.page(page_token="not a token")
+
+
+class FakeData:
+    def __init__(self):
+        self.objects = {}
+
+    async def insert(self, properties, uuid=None, references=None, vector=None):
+        if str(uuid) in self.objects:
+            raise Exception(f"id '{uuid}' already exists")
+        self.objects[str(uuid)] = properties
+
+    async def exists(self, uuid):
+        return str(uuid) in self.objects
+
+    async def insert_many(self, objects):
+        for obj in objects:
+            self.objects[str(obj.uuid)] = obj.properties
+        return BatchObjectReturn()
+
+    async def delete_many(self, where):
+        pass
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.data = FakeData()
+        self.query = SimpleNamespace(fetch_object_by_id=self.fetch_object_by_id)
+
+    async def fetch_object_by_id(self, uuid, return_properties=None):
+        properties = self.data.objects.get(str(uuid))
+        return SimpleNamespace(properties=properties) if properties else None
+
+
+class FakeClientManager:
+    def __init__(self):
+        self.wcd_url = "http://localhost:8080"
+        self.collections = {}
+        self.client = SimpleNamespace(
+            collections=SimpleNamespace(
+                exists=self.exists, create=self.create, get=self.collections.get
+            )
+        )
+
+    async def exists(self, name):
+        return name in self.collections
+
+    async def create(self, name, **kwargs):
+        self.collections[name] = FakeCollection(name)
+
+    @asynccontextmanager
+    async def connect_to_async_client(self):
+        yield self.client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_exports():
+    client_manager = FakeClientManager()
+
+    def head(tree):
+        head = client_manager.collections["ELYSIA_TREES__"].data.objects[
+            generate_uuid5(tree.conversation_id)
+        ]
+        return json.loads(head["tree"])
+
+    def record_type(tree, sequence):
+        records = client_manager.collections["ELYSIA_TREES_RECORDS__"]
+        uuid = get_record_uuid(tree.conversation_id, sequence)
+        return records.data.objects[uuid]["record_type"]
+
+    first = Tree()
+    await first.export_to_weaviate("ELYSIA_TREES__", client_manager)
+    first.tree_data.update_list(
+        "conversation_history", {"role": "user", "content": "Hi!"}
+    )
+    await first.export_to_weaviate("ELYSIA_TREES__", client_manager)
+    assert head(first)["sequence"] == 1
+    assert record_type(first, 1) == "delta"
+    assert "tree" not in first.persisted
+
+    # another process saves the same conversation
+    second = Tree.import_from_json(first.export_to_json())
+    await second.export_to_weaviate("ELYSIA_TREES__", client_manager)
+    assert head(first)["sequence"] == 2
+    assert record_type(first, 2) == "snapshot"
+
+    # the next save after it is not a delta of a state that is no longer the latest
+    await first.export_to_weaviate("ELYSIA_TREES__", client_manager)
+    assert head(first) == {"format": "delta", "sequence": 3, "snapshot_sequence": 3}
+
+    # a record written (but not yet in the head) by another process is not overwritten
+    records = client_manager.collections["ELYSIA_TREES_RECORDS__"]
+    assert await insert_record(records, first.conversation_id, 4, "snapshot", "{}")
+    assert not await insert_record(records, first.conversation_id, 4, "delta", "[]")
+    await first.export_to_weaviate("ELYSIA_TREES__", client_manager)
+    assert (
+        records.data.objects[get_record_uuid(first.conversation_id, 4)]["data"] == "{}"
+    )
+    assert head(first) == {"format": "delta", "sequence": 5, "snapshot_sequence": 5}
@@ -166,3 +166,20 @@ def test_model_keys():
     response, objects = tree("hi elly. use text response only")
     tree.create_conversation_title()
     tree.get_follow_up_suggestions()
+
+
+def test_configure_query_limits():
+    """
+    Are the concurrency and timeout of retrieval queries configurable (and saved with the settings)
+    """
+    settings = Settings()
+    assert settings.QUERY_MAX_CONCURRENCY == 8
+    assert settings.QUERY_TIMEOUT == 60
+
+    settings.configure(query_max_concurrency=2, query_timeout=None)
+    assert settings.QUERY_MAX_CONCURRENCY == 2
+    assert settings.QUERY_TIMEOUT is None
+
+    loaded = Settings.from_json(settings.to_json())
+    assert loaded.QUERY_MAX_CONCURRENCY == 2
+    assert loaded.QUERY_TIMEOUT is None
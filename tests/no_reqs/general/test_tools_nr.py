@@ -2,6 +2,7 @@ import os
 from re import S
 import pytest
 import asyncio
+from types import SimpleNamespace
 import dspy
 from dspy import LM
 from elysia.objects import Result
@@ -565,3 +566,135 @@ async def test_add_tool_with_stem_tool():
         "check_result"
         not in tree.tree["options"]["search"]["options"]["query"]["options"]
     )
+
+
+@pytest.mark.asyncio
+async def test_run_per_collection():
+    from elysia.tools.retrieval.util import QueryError, _run_per_collection
+
+    delays = {"A": 0.5, "B": 0.5, "C": 0.5, "Slow": 5.0}
+
+    async def run(collection_name):
+        if collection_name == "Broken":
+            raise ValueError("broken collection")
+        await asyncio.sleep(delays[collection_name])
+        return collection_name.lower()
+
+    start = asyncio.get_event_loop().time()
+    responses, metadata = await _run_per_collection(
+        ["A", "B", "Slow", "Broken", "C"], run, max_concurrency=8, timeout=1.0
+    )
+    time_taken = asyncio.get_event_loop().time() - start
+
+    # collections are queried concurrently, and one slow or broken collection does not fail the others
+    assert time_taken < 2.0
+    assert responses[:2] == ["a", "b"] and responses[4] == "c"
+    assert isinstance(responses[2], QueryError)
+    assert isinstance(responses[3], ValueError)
+    assert all(m["query_time_seconds"] < 2.0 for m in metadata)
+
+    # concurrency is bounded
+    start = asyncio.get_event_loop().time()
+    await _run_per_collection(["A", "B", "C"], run, max_concurrency=1, timeout=None)
+    assert asyncio.get_event_loop().time() - start >= 1.5
+
+    # all collections failing raises the first error
+    with pytest.raises(QueryError):
+        await _run_per_collection(["Slow"], run, max_concurrency=8, timeout=0.1)
+
+
+@pytest.mark.asyncio
+async def test_summarise_items_in_batches():
+    from elysia.objects import Retrieval, Status
+    from elysia.tools.postprocessing.summarise_items import (
+        SummariseItems,
+        shard_objects,
+    )
+
+    objects = [{"text": "x" * 400} for _ in range(10)]
+    assert [len(b) for b in shard_objects(objects, 250)] == [2, 2, 2, 2, 2]
+    assert len(shard_objects(objects, 10)) == 10
+
+    settings = Settings()
+    settings.configure(summarise_batch_tokens=250, summarise_max_concurrency=2)
+    tree_data = Tree(settings=settings).tree_data
+
+    slow = Retrieval(
+        [{"id": i, "text": "x" * 400} for i in range(10)], {"collection_name": "Slow"}
+    )
+    fast = Retrieval([{"id": 0, "text": "fast"}], {"collection_name": "Fast"})
+    tree_data.environment.hidden_environment["items_to_summarise"] = [slow, fast]
+
+    summarise_items = SummariseItems()
+    in_flight = 0
+    max_in_flight = 0
+
+    async def aforward(objects, lm):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        # one summary too few, to check the summaries stay aligned with the objects
+        return dspy.Prediction(summaries=[f"summary {o['id']}" for o in objects][1:])
+
+    summarise_items.object_summariser.aforward = aforward
+
+    outputs = []
+    async for output in summarise_items(
+        tree_data=tree_data, inputs={}, base_lm=None, complex_lm=None
+    ):
+        outputs.append(output)
+
+    assert isinstance(outputs[0], Status)
+    assert max_in_flight == 2
+
+    # the fast retrieval is returned first, without waiting for the slow one
+    assert outputs[1:] == [fast, slow]
+    assert [o["ELYSIA_SUMMARY"] for o in slow.objects[:4]] == [
+        "summary 1",
+        "",
+        "summary 3",
+        "",
+    ]
+    assert "items_to_summarise" not in tree_data.environment.hidden_environment
+
+
+@pytest.mark.asyncio
+async def test_missing_summaries_are_retried():
+    from elysia.tools.postprocessing.summarise_items import SummariseItems
+
+    warnings = []
+    logger = SimpleNamespace(warning=warnings.append)
+    summarise_items = SummariseItems(logger=logger)  # type: ignore
+    calls = []
+
+    async def aforward(objects, lm):
+        calls.append([o["id"] for o in objects])
+        # the last object is dropped the first time, and always for object 9
+        return dspy.Prediction(
+            summaries=[
+                f"summary {o['id']}"
+                for o in (objects[:-1] if len(calls) == 1 else objects)
+                if o["id"] != 9
+            ]
+        )
+
+    summarise_items.object_summariser.aforward = aforward
+    semaphore = asyncio.Semaphore(1)
+
+    objects = [{"id": i} for i in range(3)]
+    summaries = await summarise_items._summarise_batch(objects, None, semaphore)  # type: ignore
+    assert summaries == ["summary 0", "summary 1", "summary 2"]
+    assert calls == [[0, 1, 2], [2]]
+
+    # retried once, then left empty with a warning
+    calls.clear()
+    calls.append("first call done")
+    summaries = await summarise_items._summarise_batch(
+        [{"id": 8}, {"id": 9}], None, semaphore  # type: ignore
+    )
+    assert summaries == ["summary 8", ""]
+    assert calls[1:] == [[8, 9], [9]]
+    assert len(warnings) == 1
+    assert "No summaries were returned for 1 of 1 objects" in warnings[0]
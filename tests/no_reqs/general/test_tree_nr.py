@@ -1,6 +1,10 @@
+import asyncio
+import time
 import pytest
 from elysia.config import Settings
+from elysia.objects import tool
 from elysia.tree.tree import Tree
+from elysia.tree.util import Decision, DecisionNode
 from elysia.util.client import ClientManager
 
 
@@ -63,3 +67,170 @@ async def test_init_tree_with_no_client():
             ),
         )
     )
+
+
+@pytest.mark.asyncio
+async def test_parallel_tools(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        use_parallel_tools=True,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+
+    @tool(tree=tree)
+    async def slow_tool_a():
+        await asyncio.sleep(1.0)
+        return {"tool": "a"}
+
+    @tool(tree=tree)
+    async def slow_tool_b():
+        await asyncio.sleep(1.0)
+        return {"tool": "b"}
+
+    async def parallel_decision(self, **kwargs):
+        decision = Decision(
+            function_name="slow_tool_a",
+            function_inputs={},
+            reasoning="",
+            impossible=False,
+            end_actions=True,
+            parallel_decisions=[Decision("slow_tool_b", {}, "", False, False)],
+        )
+        return decision, []
+
+    monkeypatch.setattr(DecisionNode, "__call__", parallel_decision)
+
+    start = time.time()
+    async for _ in tree.async_run("Run both tools"):
+        pass
+    time_taken = time.time() - start
+
+    # both tools ran, but concurrently
+    assert time_taken < 1.9
+    assert tree.decision_history[0][:2] == ["slow_tool_a", "slow_tool_b"]
+
+    environment = tree.tree_data.environment.environment
+    assert environment["slow_tool_a"]["default"][0]["objects"][0]["tool"] == "a"
+    assert environment["slow_tool_b"]["default"][0]["objects"][0]["tool"] == "b"
+
+    # results are merged in the order they were decided
+    assert list(environment.keys())[-2:] == ["slow_tool_a", "slow_tool_b"]
+
+
+@pytest.mark.asyncio
+async def test_parallel_tool_errors(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        use_parallel_tools=True,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+
+    @tool(tree=tree)
+    async def working_tool():
+        return {"tool": "working"}
+
+    @tool(tree=tree)
+    async def failing_tool():
+        raise ValueError("Something went wrong")
+
+    async def parallel_decision(self, **kwargs):
+        decision = Decision(
+            function_name="working_tool",
+            function_inputs={},
+            reasoning="",
+            impossible=False,
+            end_actions=True,
+            parallel_decisions=[Decision("failing_tool", {}, "", False, False)],
+        )
+        return decision, []
+
+    monkeypatch.setattr(DecisionNode, "__call__", parallel_decision)
+
+    # the error is returned for the failing tool, rather than stopping the query
+    async for _ in tree.async_run("Run both tools"):
+        pass
+
+    environment = tree.tree_data.environment.environment
+    assert environment["working_tool"]["default"][0]["objects"][0]["tool"] == "working"
+    assert "Something went wrong" in tree.tree_data.errors["failing_tool"][0]
+
+    # the tool is retried after the error, and each run is tracked
+    num_runs = sum(
+        decisions.count("failing_tool") for decisions in tree.decision_history
+    )
+    assert num_runs > 1
+    assert tree.tracker.trackers["failing_tool"]["timer"]["calls"] == num_runs
+
+
+def test_parse_parallel_actions():
+    tree = Tree(branch_initialisation="one_branch")
+    decision_node = tree.decision_nodes[tree.root]
+    available_tools = list(decision_node.options.keys())
+    primary = Decision("aggregate", {}, "", False, False)
+
+    parallel_decisions = decision_node._parse_parallel_actions(
+        [
+            {"function_name": "query", "function_inputs": {}},
+            {"function_name": "'aggregate'", "function_inputs": {}},  # same as primary
+            {"function_name": "text_response", "function_inputs": {}},  # end tool
+            {"function_name": "not_a_tool", "function_inputs": {}},
+            "not a dict",
+        ],
+        primary,
+        available_tools,
+    )
+
+    assert [d.function_name for d in parallel_decisions] == ["query"]
+
+
+@pytest.mark.asyncio
+async def test_iteration_stats(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+
+    @tool(tree=tree)
+    async def quick_tool():
+        return {"done": True}
+
+    num_decisions = 0
+
+    async def decide(self, **kwargs):
+        nonlocal num_decisions
+        num_decisions += 1
+        decision = Decision(
+            function_name="quick_tool",
+            function_inputs={},
+            reasoning="",
+            impossible=False,
+            end_actions=num_decisions >= 3,
+        )
+        return decision, []
+
+    monkeypatch.setattr(DecisionNode, "__call__", decide)
+
+    async for _ in tree.async_run("Run the tool three times"):
+        pass
+
+    # one record per pass from the root, without recursing into a new run
+    assert tree.tree_data.num_trees_completed == 3
+    assert [stats["iteration"] for stats in tree.iteration_stats] == [0, 1, 2]
+    for stats in tree.iteration_stats:
+        assert stats["tools"] == ["quick_tool"]
+        assert stats["total_time"] >= stats["decision_time"] + stats["tool_time"]
+        assert "start_time" not in stats
+
+    assert list(tree.history.values())[-1].iteration_stats == tree.iteration_stats